@@ -0,0 +1,193 @@
+# agregados.py – sales_daily_agg mantido incrementalmente a partir do CDC
+"""
+O Dashboard e os Relatórios somavam faturamento, unidades, frete, taxa e CMV
+linha a linha em pandas a cada render. `sales_daily_agg` guarda essas medidas
+já somadas por (dia, hora, conta, level1, level2, tipo logístico, status,
+faixa de preço), então o custo do render depende do número de dias, não de
+pedidos. Custo FLEX e margem de contribuição são somados do resultado por
+pedido (sales_pnl, ver pnl.py).
+
+A atualização é consumidora do CDC (cdc.consumir): para cada lote de mudanças
+em sales — ingestão, reconcile, reaplicação de SKU, ajuste manual — descobre
+os dias tocados e recalcula só esses dias, na mesma transação do cursor. Na
+primeira execução (sem cursor) reconstrói tudo. Dias que alcançam meses já
+arquivados (arquivo.py) nunca são refeitos: as vendas deles saíram de sales e
+as linhas somadas antes do arquivamento continuam valendo.
+
+    python agregados.py              # atualiza o que mudou
+    python agregados.py --reconstruir
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, Iterable, List, Set
+
+from sqlalchemy import text
+
+from cdc import LOTE_MAX, _salvar_cursor, consumir
+
+CONSUMIDOR = "sales_daily_agg"
+
+# mesma regra do categorizar_preco do app: preço por unidade do envio
+_SQL_FAIXA = """
+    CASE
+        WHEN s.order_cost IS NULL OR s.quantity IS NULL OR s.quantity = 0 THEN 'outros'
+        WHEN s.order_cost / s.quantity < 79 THEN 'low'
+        ELSE 'high'
+    END
+"""
+
+_SQL_AGREGAR = f"""
+    INSERT INTO sales_daily_agg (
+        dia, hora, ml_user_id, level1, level2, logistic_type, status, faixa_preco,
+        vendas, faturamento, unidades, frete, taxa_ml, cmv, custo_flex, margem_contribuicao
+    )
+    SELECT CAST(s.date_adjusted AS date),
+           CAST(EXTRACT(hour FROM s.date_adjusted) AS smallint),
+           s.ml_user_id, s.level1, s.level2, s.shipment_logistic_type, s.status,
+           {_SQL_FAIXA},
+           COUNT(*),
+           COALESCE(SUM(s.total_amount), 0),
+           COALESCE(SUM(s.quantity_sku * s.quantity), 0),
+           COALESCE(SUM(s.frete_adjust), 0),
+           COALESCE(SUM(s.ml_fee), 0),
+           COALESCE(SUM(s.quantity_sku * s.quantity * COALESCE(s.custo_unitario, 0)), 0),
+           COALESCE(SUM(p.custo_flex), 0),
+           COALESCE(SUM(p.margem_contribuicao), 0)
+    FROM sales s
+    LEFT JOIN sales_pnl p ON p.order_id = s.order_id
+    WHERE {{filtro}}
+    GROUP BY 1, 2, 3, 4, 5, 6, 7, 8
+"""
+
+
+def _dia(valor: Any) -> date | None:
+    if not valor:
+        return None
+    return date.fromisoformat(str(valor)[:10])
+
+
+def dias_afetados(conn, mudancas: List[Dict[str, Any]]) -> Set[date]:
+    """
+    Dias (date_adjusted) tocados pelas mudanças. Updates só trazem as colunas
+    alteradas: se date_adjusted não mudou, o dia vem da própria venda.
+    """
+    dias: Set[date] = set()
+    sem_data: Set[int] = set()
+    for m in mudancas:
+        encontrados = {_dia((m.get(lado) or {}).get("date_adjusted")) for lado in ("old", "new")} - {None}
+        if encontrados:
+            dias |= encontrados
+        else:
+            sem_data.add(m["order_id"])
+    if sem_data:
+        dias |= set(conn.execute(text(
+            "SELECT DISTINCT CAST(date_adjusted AS date) FROM sales WHERE order_id = ANY(:ids)"
+        ), {"ids": list(sem_data)}).scalars())
+    return dias
+
+
+def _sql_dia_vivo(dia: str) -> str:
+    """
+    Condição SQL: o dia (date_adjusted) não alcança mês arquivado. O dia D cobre
+    date_closed de D 03:00 a D+1 03:00, então o último dia antes de um mês vivo
+    também fica de fora. As linhas desses dias foram somadas enquanto o mês
+    estava em sales e não podem ser refeitas só com o que sobrou nele.
+    """
+    return f"""NOT EXISTS (
+        SELECT 1 FROM sales_arquivo a
+        WHERE a.mes < {dia} + interval '1 day 3 hours'
+          AND a.mes + interval '1 month' > {dia} + interval '3 hours'
+    )"""
+
+
+def dias_vivos(conn, dias: Iterable[date]) -> List[date]:
+    """Os dias que podem ser recalculados de sales (ver _sql_dia_vivo), em ordem."""
+    dias = sorted(set(dias))
+    if not dias:
+        return []
+    return list(conn.execute(text(f"""
+        SELECT d FROM unnest(CAST(:dias AS date[])) AS d
+        WHERE {_sql_dia_vivo("d")}
+        ORDER BY d
+    """), {"dias": dias}).scalars())
+
+
+def recalcular_dias(conn, dias: Iterable[date]) -> int:
+    """
+    Apaga e refaz as linhas do agregado dos dias indicados; retorna quantas
+    linhas gravou. Dias que alcançam meses arquivados ficam como estão.
+    """
+    pedidos = set(dias)
+    dias = dias_vivos(conn, pedidos)
+    if len(dias) < len(pedidos):
+        logging.info(f"🧊 {len(pedidos) - len(dias)} dias em meses arquivados mantidos no agregado")
+    if not dias:
+        return 0
+    conn.execute(text("DELETE FROM sales_daily_agg WHERE dia = ANY(:dias)"), {"dias": dias})
+    # date_adjusted = date_closed - 3h: a faixa em date_closed deixa o planner podar as partições
+    res = conn.execute(text(_SQL_AGREGAR.format(filtro="""
+        s.date_closed >= :ini AND s.date_closed < :fim
+        AND CAST(s.date_adjusted AS date) = ANY(:dias)
+    """)), {
+        # datetime: date + timedelta(hours=3) descarta as horas
+        "ini": datetime.combine(dias[0], time(3)),
+        "fim": datetime.combine(dias[-1] + timedelta(days=1), time(3)),
+        "dias": dias,
+    })
+    return res.rowcount or 0
+
+
+def _processar(conn, mudancas: List[Dict[str, Any]]) -> None:
+    dias = dias_afetados(conn, mudancas)
+    linhas = recalcular_dias(conn, dias)
+    logging.info(f"📈 Agregado diário: {len(dias)} dias recalculados ({linhas} linhas)")
+
+
+def reconstruir() -> int:
+    """
+    Refaz o agregado (menos os dias de meses arquivados, ver _sql_dia_vivo) e
+    posiciona o cursor do CDC no snapshot atual.
+    """
+    from db import engine
+    with engine.begin() as conn:
+        # xmin antes do INSERT: o que terminar depois disso será relido pelo CDC (idempotente)
+        xmin = conn.execute(text("SELECT txid_snapshot_xmin(txid_current_snapshot())")).scalar()
+        seq = conn.execute(text("SELECT COALESCE(MAX(seq), 0) FROM sales_changes")).scalar()
+        # meses arquivados não estão mais em sales: as linhas desses dias ficam
+        conn.execute(text(f"DELETE FROM sales_daily_agg WHERE {_sql_dia_vivo('dia')}"))
+        linhas = conn.execute(text(_SQL_AGREGAR.format(
+            filtro=_sql_dia_vivo("CAST(s.date_adjusted AS date)")
+        ))).rowcount or 0
+        _salvar_cursor(conn, CONSUMIDOR, xmin, seq)
+    logging.info(f"📈 Agregado diário reconstruído: {linhas} linhas")
+    return linhas
+
+
+def atualizar(max_lotes: int = 20) -> int:
+    """Aplica as mudanças pendentes do CDC; reconstrói na primeira vez. Retorna mudanças processadas."""
+    from db import engine
+    with engine.connect() as conn:
+        existe = conn.execute(text("SELECT 1 FROM cdc_cursors WHERE consumer = :c"), {"c": CONSUMIDOR}).first()
+    if not existe:
+        reconstruir()
+    total = 0
+    for _ in range(max_lotes):
+        n = consumir(CONSUMIDOR, _processar)
+        total += n
+        if n < LOTE_MAX:
+            break
+    return total
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--reconstruir", action="store_true", help="refaz o agregado inteiro")
+    args = ap.parse_args()
+    if args.reconstruir:
+        reconstruir()
+    else:
+        print(f"{atualizar()} mudanças aplicadas ao agregado.")
@@ -1,22 +1,38 @@
-import os
-from fastapi import FastAPI, HTTPException, Query, Body
+from contextlib import asynccontextmanager
+
+import httpx
+from fastapi import FastAPI, HTTPException, Query, Body, Request
 from fastapi.responses import RedirectResponse
 from fastapi.middleware.cors import CORSMiddleware
-from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
 
-from oauth import get_auth_url, exchange_code, renovar_access_token
+from db import fechar_async
+from oauth import get_auth_url, exchange_code_async, renovar_access_token_async
 from sales import get_full_sales as get_sales
+from settings import settings
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # variáveis obrigatórias conferidas ao subir o servidor, não ao importar o módulo
+    cfg = settings().exigir("frontend_url", "db_url", "ml_client_id", "ml_client_secret", "backend_url")
+    # conexões HTTP ao ML compartilhadas por todas as requisições do worker
+    limite = cfg.api_http_conexoes
+    app.state.http = httpx.AsyncClient(
+        timeout=httpx.Timeout(15.0),
+        limits=httpx.Limits(max_connections=limite, max_keepalive_connections=limite // 2),
+    )
+    try:
+        yield
+    finally:
+        await app.state.http.aclose()
+        await fechar_async()
 
-# Carrega variáveis de ambiente
-load_dotenv()
-FRONTEND_URL = os.getenv("FRONTEND_URL")
-if not FRONTEND_URL:
-    raise RuntimeError("❌ FRONTEND_URL deve estar definido no .env")
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
-# Configura CORS para permitir apenas o front-end
-default_origins = [FRONTEND_URL]
+# Configura CORS para permitir apenas o front-end (FRONTEND_URL vazio falha no lifespan)
+default_origins = [settings().frontend_url or ""]
 app.add_middleware(
     CORSMiddleware,
     allow_origins=default_origins,
@@ -26,22 +42,22 @@ app.add_middleware(
 )
 
 @app.get("/")
-def home():
+async def home():
     return {"message": "Nexus API rodando perfeitamente!"}
 
 @app.get("/health")
-def health_check():
+async def health_check():
     return {"status": "ok"}
 
 @app.get("/ml-login")
-def mercado_livre_login():
+async def mercado_livre_login():
     """
     Redireciona o usuário para a página de login do Mercado Livre.
     """
     return RedirectResponse(get_auth_url())
 
 @app.get("/auth/callback")
-def auth_callback(code: str = Query(None)):
+async def auth_callback(request: Request, code: str = Query(None)):
     """
     Recebe o callback de autorização do Mercado Livre, realiza a troca do code pelo access token
     e persiste as vendas no banco de dados.
@@ -52,7 +68,7 @@ def auth_callback(code: str = Query(None)):
 
     # 2️⃣ troca o code pelo token e persiste no banco de tokens
     try:
-        token_payload = exchange_code(code)
+        token_payload = await exchange_code_async(code, request.app.state.http)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao trocar code: {e}")
 
@@ -62,7 +78,8 @@ def auth_callback(code: str = Query(None)):
         access_token  = token_payload["access_token"]
 
         # 🔄 Aqui chamamos a versão paginada que criamos
-        vendas_coletadas = get_sales(ml_user_id, access_token)
+        # (ingestão é síncrona e longa: roda numa thread, o event loop segue livre)
+        vendas_coletadas = await run_in_threadpool(get_sales, ml_user_id, access_token)
 
         # 🔍 Log para saber quantas foram coletadas
         print(f"✅ Vendas salvas com sucesso: {vendas_coletadas}")
@@ -71,17 +88,17 @@ def auth_callback(code: str = Query(None)):
         print(f"⚠️ Erro ao buscar e persistir vendas históricas: {e}")
 
     # 4️⃣ redireciona de volta ao dashboard autenticado
-    return RedirectResponse(f"{FRONTEND_URL}/?nexus_auth=success")
+    return RedirectResponse(f"{settings().frontend_url}/?nexus_auth=success")
 
 @app.post("/auth/refresh")
-def auth_refresh(payload: dict = Body(...)):
+async def auth_refresh(request: Request, payload: dict = Body(...)):
     """
     Recebe uma requisição para renovação do access token.
     """
     ml_user_id = payload.get("user_id")
     if not ml_user_id:
         raise HTTPException(status_code=400, detail="user_id não fornecido")
-    token = renovar_access_token(int(ml_user_id))
+    token = await renovar_access_token_async(int(ml_user_id), request.app.state.http)
     if not token:
         raise HTTPException(status_code=404, detail="Falha na renovação do token")
     return {"access_token": token}
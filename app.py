@@ -10,17 +10,18 @@ import logging
 logging.getLogger("streamlit").setLevel(logging.ERROR)
 
 
-from dotenv import load_dotenv
 from streamlit_cookies_manager import EncryptedCookieManager
 import locale
 
-# 1) Carrega .env antes de tudo
-load_dotenv()
-COOKIE_SECRET = os.getenv("COOKIE_SECRET") or "nexussecret"
-BACKEND_URL    = os.getenv("BACKEND_URL")  or ""
-FRONTEND_URL   = os.getenv("FRONTEND_URL") or ""
-DB_URL         = os.getenv("DB_URL")       or ""
-ML_CLIENT_ID   = os.getenv("ML_CLIENT_ID") or ""
+from settings import settings
+
+# 1) Configuração (settings.py lê o .env)
+_cfg = settings()
+COOKIE_SECRET = _cfg.cookie_secret or "nexussecret"
+BACKEND_URL    = _cfg.backend_url  or ""
+FRONTEND_URL   = _cfg.frontend_url or ""
+DB_URL         = _cfg.db_url       or ""
+ML_CLIENT_ID   = _cfg.ml_client_id or ""
 
 
 # 2) Agora sim importe o Streamlit e configure a página _antes_ de qualquer outra chamada st.*
@@ -88,7 +89,7 @@ with st.sidebar:
 
 
 # 3) Depois de set_page_config, importe tudo o mais que precisar
-from sales import sync_all_accounts, get_full_sales, revisar_banco_de_dados, get_incremental_sales, traduzir_status
+from sales import sync_all_accounts, get_full_sales, revisar_banco_de_dados, get_incremental_sales, traduzir_status, ML_API_URL
 import pandas as pd
 import plotly.express as px
 import requests
@@ -102,10 +103,27 @@ from sklearn.cluster import KMeans
 from textblob import TextBlob
 import io
 from datetime import datetime, timedelta
-from utils import engine, DATA_INICIO, buscar_ml_fee
+from utils import DATA_INICIO, buscar_ml_fee
+# Leituras das páginas do Streamlit usam o pool "ui" (ver db.PERFIS)
+from db import engine_ui as engine, engine_analitico, leitura
 from reconcile import reconciliar_vendas
+from cdc import versao_vendas, cursor as cursor_cdc
+from arquivo import versao_arquivo
+from consultas import (
+    COLUNAS_AGREGADO, Consulta, ativar_copy_on_write, congelar, ler_agregado, ler_vendas, limites, vista,
+)
+from escrita import copiar, copiar_df
+from sessoes import gestor as gestor_sessoes, sessao_atual
+from agregados import CONSUMIDOR as CONSUMIDOR_AGREGADO, atualizar as atualizar_agregado
+from sku_reaplicar import (
+    marcar_todos as marcar_skus_pendentes,
+    reaplicar_pendentes as reaplicar_skus_pendentes,
+    reaplicar_em_segundo_plano as reaplicar_skus_em_segundo_plano,
+)
 from dateutil.relativedelta import relativedelta
 
+# as páginas recebem vistas da base de vendas compartilhada (carregar_vendas)
+ativar_copy_on_write()
 
 
 # 4) Configuração de locale
@@ -203,88 +221,148 @@ def salvar_tokens_no_banco(data: dict):
         st.error(f"❌ Erro ao salvar tokens no banco: {e}")
 
 # ----------------- Carregamento de Vendas -----------------
-@st.cache_data(ttl=300)
-def carregar_vendas(conta_id: Optional[str] = None) -> pd.DataFrame:
-    if conta_id:
-        sql = text("""
-            SELECT s.order_id,
-                   s.date_adjusted,
-                   s.item_id,
-                   s.item_title,
-                   s.status,
-                   s.quantity,
-                   s.unit_price,
-                   s.total_amount,
-                   s.ml_user_id,
-                   s.buyer_nickname,
-                   s.seller_sku,
-                   s.custo_unitario,
-                   s.quantity_sku,
-                   s.ml_fee,
-                   s.level1,
-                   s.level2,
-                   s.ads,
-                   s.payment_id,
-                   s.shipment_status,
-                   s.shipment_substatus,
-                   s.shipment_last_updated,
-                   s.shipment_mode,
-                   s.shipment_logistic_type,
-                   s.shipment_list_cost,
-                   s.shipment_delivery_type,
-                   s.shipment_receiver_name,
-                   s.shipment_delivery_sla,
-                   s.order_cost,
-                   s.base_cost,
-                   s.shipment_cost,
-                   s.frete_adjust,
-                   u.nickname
-              FROM sales s
-              LEFT JOIN user_tokens u ON s.ml_user_id = u.ml_user_id
-             WHERE s.ml_user_id = :uid
-        """)
-        df = pd.read_sql(sql, engine, params={"uid": conta_id})
+# Cada página pede só o recorte que usa (colunas, período, contas, status; ver
+# consultas.py): filtros e colunas vão para o SQL e o recorte é a chave do cache.
+def carregar_vendas(consulta: Consulta) -> pd.DataFrame:
+    # a versão (cursores do CDC + mudanças comitadas que eles ainda não leram;
+    # ver cdc.versao_vendas) entra na chave do cache: alteração em sales
+    # invalida assim que a transação termina, sem esperar o ttl, e medir custa
+    # o atraso dos consumidores, não o log inteiro
+    # versão e dados vêm do mesmo servidor (réplica ou primário), senão o cache
+    # guardaria dados atrasados sob a versão nova
+    eng = leitura("analitico")
+    try:
+        versao = versao_vendas(eng)
+    except Exception:
+        versao = None
+    # meses antigos movidos para Parquet (arquivo.py) entram de volta na leitura
+    try:
+        versao_arq = versao_arquivo(eng)
+    except Exception:
+        versao_arq = None
+    return vista(_carregar_vendas(consulta, versao, versao_arq, eng))
+
+# uma base por processo e recorte, sem pickle: st.cache_data devolvia uma cópia
+# deserializada a cada execução de cada sessão. Nunca alterar o retorno daqui.
+# A chave é só o recorte e a versão fica ao lado (sessoes.GestorSessoes): a base
+# nova substitui a superada em vez de ficar junto dela até o ttl, e o total fica
+# no LRU de SESSOES_LIMITE_MB, visível em mostrar_memoria_sessoes.
+def _carregar_vendas(consulta: Consulta, versao: Optional[tuple], versao_arq: Optional[str] = None,
+                     _eng=engine_analitico) -> pd.DataFrame:
+    return gestor_sessoes().compartilhado(
+        ("vendas", consulta),
+        lambda: congelar(ler_vendas(consulta, _eng, arquivo=bool(versao_arq))),
+        versao=(versao, versao_arq),
+    )
+
+# colunas que a tabela e os filtros de Relatórios usam
+COLUNAS_RELATORIO = (
+    "order_id", "nickname", "date_adjusted", "item_title", "seller_sku", "level1", "level2",
+    "shipment_logistic_type", "order_cost", "quantity", "total_amount",
+    "unidades", "taxa_plataforma", "custo_frete", "custo_flex", "cmv", "margem_contribuicao",
+)
+# Expedição filtra por data de venda e data limite de envio no próprio painel
+COLUNAS_EXPEDICAO = (
+    "order_id", "date_adjusted", "status", "quantity", "quantity_sku", "ml_user_id", "nickname",
+    "level1", "level2", "shipment_status", "shipment_logistic_type", "shipment_receiver_name",
+    "shipment_delivery_sla",
+)
+
+def contas_cadastradas() -> pd.DataFrame:
+    """ml_user_id e nickname das contas, para os filtros de conta das páginas."""
+    return pd.read_sql(text("SELECT ml_user_id, nickname FROM user_tokens ORDER BY nickname"), leitura())
+
+def ids_das_contas(contas_df: pd.DataFrame, selecionadas) -> Optional[tuple]:
+    """Nicknames marcados -> ml_user_ids para o filtro no SQL; nada marcado = todas as contas."""
+    if not selecionadas:
+        return None
+    return tuple(contas_df.loc[contas_df["nickname"].astype(str).isin(selecionadas), "ml_user_id"])
+
+def limites_vendas(contas=None, agregado: bool = False):
+    """(primeiro, último) dia com venda, para montar os seletores de período antes da leitura."""
+    eng = leitura("analitico")
+    if agregado:
+        versao = _versao_agregado(eng)
     else:
-        sql = text("""
-            SELECT s.order_id,
-                   s.date_adjusted,
-                   s.item_id,
-                   s.item_title,
-                   s.status,
-                   s.quantity,
-                   s.unit_price,
-                   s.total_amount,
-                   s.ml_user_id,
-                   s.buyer_nickname,
-                   s.seller_sku,
-                   s.custo_unitario,
-                   s.quantity_sku,
-                   s.ml_fee,
-                   s.level1,
-                   s.level2,
-                   s.ads,
-                   s.payment_id,
-                   s.shipment_status,
-                   s.shipment_substatus,
-                   s.shipment_last_updated,
-                   s.shipment_mode,
-                   s.shipment_logistic_type,
-                   s.shipment_list_cost,
-                   s.shipment_delivery_type,
-                   s.shipment_receiver_name,
-                   s.shipment_delivery_sla,
-                   s.order_cost,
-                   s.base_cost,
-                   s.shipment_cost,
-                   s.frete_adjust,
-                   u.nickname
-              FROM sales s
-              LEFT JOIN user_tokens u ON s.ml_user_id = u.ml_user_id
-        """)
-        df = pd.read_sql(sql, engine)
+        try:
+            versao = (versao_vendas(eng), versao_arquivo(eng))
+        except Exception:
+            versao = None
+    return _limites_vendas(contas, agregado, versao, eng)
+
+@st.cache_data(ttl=3600)
+def _limites_vendas(contas: Optional[tuple], agregado: bool, versao, _eng=engine_analitico):
+    return limites(contas, agregado=agregado, engine=_eng)
 
+# ----------------- Agregado Diário (sales_daily_agg) -----------------
+FAIXAS_PRECO = {"low": "LOW TICKET (< R$79)", "high": "HIGH TICKET (> R$79)", "outros": "outros"}
+
+def carregar_agregado(desde=None, ate=None, contas=None) -> pd.DataFrame:
+    """Linhas do agregado no período/contas pedidos (filtro no SQL)."""
+    eng = leitura("analitico")
+    consulta = Consulta(tuple(COLUNAS_AGREGADO), desde, ate, contas)
+    return _carregar_agregado(consulta, _versao_agregado(eng), eng)
+
+def _versao_agregado(eng) -> Optional[int]:
+    # invalida a cada lote que o consumidor do CDC aplica (agregados.atualizar);
+    # last_seq não serve: é gravado com GREATEST e não muda com seq fora de ordem
+    try:
+        with eng.connect() as conn:
+            return cursor_cdc(CONSUMIDOR_AGREGADO, conn)["versao"]
+    except Exception:
+        return None
+
+@st.cache_data(ttl=3600)
+def _carregar_agregado(consulta: Consulta, versao: Optional[int], _eng=engine_analitico) -> pd.DataFrame:
+    df = ler_agregado(consulta, _eng)
+    for c in ["faturamento", "unidades", "frete", "taxa_ml", "cmv", "custo_flex", "margem_contribuicao"]:
+        df[c] = df[c].astype(float)
+    # início da hora no horário de Brasília: os gráficos de período/dia/hora usam isso
+    df["date_adjusted"] = pd.to_datetime(df["dia"]) + pd.to_timedelta(df["hora"], unit="h")
+    df["Categoria de Preço"] = df["faixa_preco"].map(FAIXAS_PRECO)
+    df["status"] = df["status"].map(traduzir_status)
     return df
 
+def kpis_agregado(agg: pd.DataFrame) -> dict:
+    """Indicadores dos cards a partir das linhas já filtradas do agregado."""
+    total_valor = agg["faturamento"].sum()
+    total_vendas = int(agg["vendas"].sum())
+    total_itens = agg["unidades"].sum()
+    frete = agg["frete"].sum()
+    taxa_mktplace = -agg["taxa_ml"].sum()
+    cmv = -agg["cmv"].sum()
+    return {
+        "total_vendas": total_vendas,
+        "total_valor": total_valor,
+        "total_itens": total_itens,
+        "ticket_venda": total_valor / total_vendas if total_vendas else 0,
+        "ticket_unidade": total_valor / total_itens if total_itens else 0,
+        "frete": frete,
+        "taxa_mktplace": taxa_mktplace,
+        "cmv": cmv,
+        # prontos do resultado por pedido (sales_pnl): FLEX com o custo vigente na data
+        "margem_operacional": agg["margem_contribuicao"].sum(),
+        "flex": agg["custo_flex"].sum(),
+    }
+
+def contar_sku_incompleto(ml_user_ids) -> int:
+    eng = leitura("analitico")
+    try:
+        versao = versao_vendas(eng)
+    except Exception:
+        versao = None
+    return _contar_sku_incompleto(tuple(sorted(int(u) for u in ml_user_ids)), versao, eng)
+
+@st.cache_data(ttl=3600)
+def _contar_sku_incompleto(ml_user_ids: tuple, versao: Optional[tuple], _eng=engine_analitico) -> int:
+    return pd.read_sql(text("""
+        SELECT COUNT(DISTINCT seller_sku) AS n
+          FROM sales
+         WHERE seller_sku IS NOT NULL
+           AND (level1 IS NULL OR level2 IS NULL OR custo_unitario IS NULL OR quantity_sku IS NULL)
+           AND ml_user_id = ANY(:uids)
+    """), _eng, params={"uids": list(ml_user_ids)})["n"].iloc[0]
+
 # ----------------- Componentes de Interface -----------------
 def render_add_account_button():
     # agora com ML_CLIENT_ID e redirect_uri completos
@@ -387,8 +465,32 @@ def render_sidebar():
         )
 
     st.session_state["page"] = selected
+    with st.sidebar.expander("🧠 Memória das sessões"):
+        mostrar_memoria_sessoes()
     return selected
 
+def mostrar_memoria_sessoes():
+    """Administração: sessões abertas neste processo, da maior para a menor (ver sessoes.py)."""
+    g = gestor_sessoes()
+    minha = sessao_atual()
+    linhas = g.resumo()
+    if not linhas:
+        st.caption("Nenhuma sessão registrada.")
+        return
+    st.dataframe(pd.DataFrame([{
+        "Sessão": ("➡️ " if l["sessao"] == minha else "") + l["sessao"][:8],
+        "Usuário": l["usuario"],
+        "MB": round(l["bytes"] / 1e6, 1),
+        "Chaves": l["chaves"],
+        "Maiores": ", ".join(f"{c} ({b / 1e6:.1f} MB)" for c, b in l["maiores"][:3]),
+        "Descartadas": l["descartadas"],
+        "Ociosa (min)": int(l["ocioso_s"] // 60),
+    } for l in linhas]), hide_index=True, use_container_width=True)
+    comp = g.compartilhados()
+    if comp:
+        st.caption("Compartilhados (uma cópia por processo): " + ", ".join(
+            f"{c['chave']} {c['bytes'] / 1e6:.1f} MB" for c in comp))
+
 # ----------------- Telas -----------------
 import io  # no topo do seu script
 
@@ -402,6 +504,10 @@ def mostrar_dashboard():
     if "vendas_sincronizadas" not in st.session_state:
         with st.spinner("🔄 Sincronizando vendas..."):
             count = sync_all_accounts()
+            try:
+                atualizar_agregado()
+            except Exception as e:
+                logging.warning(f"Agregado diário não atualizado: {e}")
             st.cache_data.clear()
         placeholder = st.empty()
         with placeholder:
@@ -410,15 +516,11 @@ def mostrar_dashboard():
         placeholder.empty()
         st.session_state["vendas_sincronizadas"] = True
 
-    # --- carrega todos os dados ---
-    df_full = carregar_vendas(None)
-    if df_full.empty:
+    # --- primeiro/último dia do agregado: o período escolhido é lido direto do SQL ---
+    data_min, data_max = limites_vendas(agregado=True)
+    if data_min is None:
         st.warning("Nenhuma venda cadastrada.")
         return
-        
-    # ✅ TRADUZ STATUS AQUI
-    from sales import traduzir_status
-    df_full["status"] = df_full["status"].map(traduzir_status)
 
     # --- CSS para compactar inputs e remover espaços ---
     st.markdown(
@@ -442,7 +544,7 @@ def mostrar_dashboard():
     )
 
     # --- Filtro de contas fixo com checkboxes lado a lado + botão selecionar todos ---
-    contas_df = pd.read_sql(text("SELECT nickname FROM user_tokens ORDER BY nickname"), engine)
+    contas_df = contas_cadastradas()
     contas_lst = contas_df["nickname"].astype(str).tolist()
     
     st.markdown("**🧾 Contas Mercado Livre:**")
@@ -464,9 +566,12 @@ def mostrar_dashboard():
         if colunas_contas[i % 8].checkbox(conta, key=key):
             selecionadas.append(conta)
     
-    # Aplica filtro
-    if selecionadas:
-        df_full = df_full[df_full["nickname"].isin(selecionadas)]
+    # Aplica filtro (no SQL)
+    ids_contas = ids_das_contas(contas_df, selecionadas)
+    if ids_contas is not None:
+        min_contas, max_contas = limites_vendas(ids_contas, agregado=True)
+        if min_contas is not None:
+            data_min, data_max = min_contas, max_contas
 
 
     # --- Linha única de filtros: Rápido | De | Até | Status | Tipo de Envio | Categoria de Preço ---
@@ -490,8 +595,6 @@ def mostrar_dashboard():
     
     import pytz
     hoje = pd.Timestamp.now(tz="America/Sao_Paulo").date()
-    data_min = df_full["date_adjusted"].dt.date.min()
-    data_max = df_full["date_adjusted"].dt.date.max()
     
     if filtro_rapido == "Hoje":
         de = ate = min(hoje, data_max)
@@ -516,6 +619,9 @@ def mostrar_dashboard():
     with col3:
         ate = st.date_input("Até", value=ate, min_value=data_min, max_value=data_max, disabled=not custom, key="ate_q")
     
+    # --- agregado só do período e das contas escolhidos ---
+    df_full = carregar_agregado(de, ate, ids_contas)
+    
     with col4:
         status_options = df_full["status"].dropna().unique().tolist()
         status_opcoes = ["Todos"] + status_options
@@ -533,34 +639,19 @@ def mostrar_dashboard():
             case 'me2': return 'Envio Padrão'
             case _: return 'outros'
     
-    df_full["Tipo de Envio"] = df_full["shipment_logistic_type"].apply(mapear_tipo)
+    df_full["Tipo de Envio"] = df_full["logistic_type"].apply(mapear_tipo)
     
     with col5:
         envio_opcoes = ["Todos"] + sorted(df_full["Tipo de Envio"].dropna().unique())
         tipo_envio_sel = st.selectbox("Tipo de Envio", envio_opcoes, index=0, key="tipo_envio_q")
     
-    # === Novo filtro: Categoria de Preço ===
-    def categorizar_preco(linha):
-        try:
-            preco_unitario = linha["order_cost"] / linha["quantity"]
-            if preco_unitario < 79:
-                return "LOW TICKET (< R$79)"
-            else:
-                return "HIGH TICKET (> R$79)"
-        except:
-            return "outros"
-    
-    df_full["Categoria de Preço"] = df_full.apply(categorizar_preco, axis=1)
-    
+    # === Novo filtro: Categoria de Preço (faixa calculada no agregado) ===
     with col6:
         preco_opcoes = ["Todos"] + df_full["Categoria de Preço"].dropna().unique().tolist()
         preco_sel = st.selectbox("Categoria de Preço", preco_opcoes, index=0, key="preco_q")
     
-    # --- Aplicação dos filtros ---
-    df = df_full[
-        (df_full["date_adjusted"].dt.date >= de) &
-        (df_full["date_adjusted"].dt.date <= ate)
-    ]
+    # --- Aplicação dos filtros (período e contas já vieram do SQL) ---
+    df = df_full
     if status_selecionado != "Todos":
         df = df[df["status"] == status_selecionado]
     if tipo_envio_sel != "Todos":
@@ -672,29 +763,14 @@ def mostrar_dashboard():
             </div>
         """, unsafe_allow_html=True)
     
-    # === Cálculos ===
-    total_vendas        = len(df)
-    total_valor         = df["total_amount"].sum()
-    total_itens         = (df["quantity_sku"] * df["quantity"]).sum()
-    ticket_venda        = total_valor / total_vendas if total_vendas else 0
-    ticket_unidade      = total_valor / total_itens if total_itens else 0
-    frete               = df["frete_adjust"].fillna(0).sum()
-    taxa_mktplace       = -df["ml_fee"].fillna(0).sum()
-    cmv                 = -((df["quantity_sku"] * df["quantity"]) * df["custo_unitario"].fillna(0)).sum()
-    margem_operacional  = total_valor + frete + taxa_mktplace + cmv
-    
-    # Custo de FLEX (fallback se a coluna não vier do banco)
-    if "shipment_flex_cost" not in df.columns:
-        df["shipment_flex_cost"] = (
-            df["shipment_logistic_type"].fillna("").str.lower().eq("self_service").astype(float) * 12.97
-        )
-    flex = -df["shipment_flex_cost"].fillna(0).sum()
-    
-    colunas_chk = ["level1", "level2", "custo_unitario", "quantity_sku"]
-    df_faltantes = df_full[
-        df_full["seller_sku"].notnull() & df_full[colunas_chk].isnull().any(axis=1)
-    ]
-    sku_incompleto = df_faltantes["seller_sku"].nunique()
+    # === Cálculos (somas do agregado) ===
+    k = kpis_agregado(df)
+    total_vendas, total_valor, total_itens = k["total_vendas"], k["total_valor"], k["total_itens"]
+    ticket_venda, ticket_unidade = k["ticket_venda"], k["ticket_unidade"]
+    frete, taxa_mktplace, cmv, flex = k["frete"], k["taxa_mktplace"], k["cmv"], k["flex"]
+    margem_operacional = k["margem_operacional"]
+
+    sku_incompleto = contar_sku_incompleto(ids_contas if ids_contas is not None else contas_df["ml_user_id"])
     
     # >>> Percentual para o título (agora único)
     pct_val = lambda v: f"{(v / total_valor * 100):.1f}%" if total_valor else "0%"
@@ -814,7 +890,7 @@ def mostrar_dashboard():
     
     # Detecta qual coluna de origem existe para o tipo de envio
     col_tipo_envio_origem = None
-    for cand in ["shipment_logistic_type", "shipping_type", "logistics_type", "shipping_mode"]:
+    for cand in ["logistic_type", "shipment_logistic_type", "shipping_type", "logistics_type", "shipping_mode"]:
         if cand in df_plot.columns:
             col_tipo_envio_origem = cand
             break
@@ -864,13 +940,13 @@ def mostrar_dashboard():
     # Série principal (linha)
     if group_col:
         vendas_por_data = (
-            df_plot.groupby(["date_bucket", group_col])["total_amount"]
+            df_plot.groupby(["date_bucket", group_col])["faturamento"]
             .sum()
             .reset_index(name="Valor Total")
         )
     else:
         vendas_por_data = (
-            df_plot.groupby("date_bucket")["total_amount"]
+            df_plot.groupby("date_bucket")["faturamento"]
             .sum()
             .reset_index(name="Valor Total")
         )
@@ -882,7 +958,7 @@ def mostrar_dashboard():
     
     if group_col:
         total_por_grupo = (
-            df_plot.groupby(group_col)["total_amount"]
+            df_plot.groupby(group_col)["faturamento"]
             .sum()
             .reset_index(name="total")
             .sort_values("total", ascending=False)
@@ -920,21 +996,20 @@ def mostrar_dashboard():
     
         if metrica_barra == "Faturamento":
             base = (
-                df_plot.groupby(group_col)["total_amount"]
+                df_plot.groupby(group_col)["faturamento"]
                 .sum()
                 .reset_index(name="valor")
             )
         elif metrica_barra == "Qtd. Vendas":
             base = (
-                df_plot.groupby(group_col)
-                .size()
+                df_plot.groupby(group_col)["vendas"]
+                .sum()
                 .reset_index(name="valor")
             )
-        else:  # Qtd. Unidades
-            # quantity_total = quantity_sku * quantity
+        else:  # Qtd. Unidades (quantity_sku * quantity, já somado no agregado)
             base = (
-                df_plot.groupby(group_col)
-                .apply(lambda x: (x.get("quantity_sku", 1) * x.get("quantity", 1)).sum())
+                df_plot.groupby(group_col)["unidades"]
+                .sum()
                 .reset_index(name="valor")
             )
     
@@ -1000,18 +1075,18 @@ def mostrar_dashboard():
     df["data"] = df["date_adjusted"].dt.date
     
     # Soma o total vendido por dia (independente da hora)
-    total_por_data = df.groupby(["dia_semana", "data"])["total_amount"].sum().reset_index()
+    total_por_data = df.groupby(["dia_semana", "data"])["faturamento"].sum().reset_index()
     
     # Agora calcula a média por dia da semana
-    media_por_dia = total_por_data.groupby("dia_semana")["total_amount"].mean().reindex(dias).reset_index()
+    media_por_dia = total_por_data.groupby("dia_semana")["faturamento"].mean().reindex(dias).reset_index()
     
     # Plota o gráfico de barras
     fig_bar = px.bar(
         media_por_dia,
         x="dia_semana",
-        y="total_amount",
+        y="faturamento",
         text_auto=".2s",
-        labels={"dia_semana": "Dia da Semana", "total_amount": "Média Vendida (R$)"},
+        labels={"dia_semana": "Dia da Semana", "faturamento": "Média Vendida (R$)"},
         color_discrete_sequence=["#27ae60"]
     )
     
@@ -1028,7 +1103,7 @@ def mostrar_dashboard():
     df["data"] = df["date_adjusted"].dt.date
     
     # Soma o total vendido por hora e por dia
-    vendas_por_dia_e_hora = df.groupby(["data", "hora"])["total_amount"].sum().reset_index()
+    vendas_por_dia_e_hora = df.groupby(["data", "hora"])["faturamento"].sum().reset_index()
     
     # Garante que todas as horas estejam presentes para todos os dias
     todos_dias = vendas_por_dia_e_hora["data"].unique()
@@ -1037,7 +1112,7 @@ def mostrar_dashboard():
     vendas_completa = vendas_por_dia_e_hora.set_index(["data", "hora"]).reindex(malha_completa, fill_value=0).reset_index()
     
     # Acumula por hora dentro de cada dia
-    vendas_completa["acumulado_dia"] = vendas_completa.groupby("data")["total_amount"].cumsum()
+    vendas_completa["acumulado_dia"] = vendas_completa.groupby("data")["faturamento"].cumsum()
     
     # Agora calcula a média acumulada por hora (entre os dias)
     media_acumulada_por_hora = (
@@ -1055,7 +1130,7 @@ def mostrar_dashboard():
         hora_atual = pd.Timestamp.now(tz="America/Sao_Paulo").hour
         df_hoje = df[df["data"] == hoje]
         vendas_hoje_por_hora = (
-            df_hoje.groupby("hora")["total_amount"].sum().reindex(range(24), fill_value=0)
+            df_hoje.groupby("hora")["faturamento"].sum().reindex(range(24), fill_value=0)
             .cumsum()
             .reset_index(name="Valor Médio Acumulado")
             .rename(columns={"index": "hora"})
@@ -1069,7 +1144,7 @@ def mostrar_dashboard():
     
     else:
         # Para histórico, adiciona o ponto final às 23h com média total diária
-        media_final = df.groupby("data")["total_amount"].sum().mean()
+        media_final = df.groupby("data")["faturamento"].sum().mean()
         ponto_final = pd.DataFrame([{
             "hora": 23,
             "Valor Médio Acumulado": media_final
@@ -1098,7 +1173,7 @@ import pandas as pd
 import streamlit as st
 from sqlalchemy import text
 
-from db import engine
+from db import engine_ui as engine
 from reconcile import reconciliar_vendas
 
 def mostrar_contas_cadastradas():
@@ -1203,6 +1278,58 @@ def mostrar_contas_cadastradas():
         progresso.empty()
         st.success(f"✅ Concluído: {atualizadas} atualizações, {erros} erros.")
 
+    # — 5) Amostragem de drift: reconcilia só onde a amostra mostrar divergência —
+    if st.button("🎯 Amostrar divergências (estratificado)", use_container_width=True):
+        if not contas_selecionadas:
+            st.warning("⚠️ Nenhuma conta selecionada.")
+            return
+        from drift_sampling import amostrar_e_agendar
+
+        if modo == "Período":
+            desde = datetime.combine(data_inicio, datetime.min.time())
+            ate   = datetime.combine(data_fim,   datetime.max.time())
+        else:
+            desde = datetime.combine(data_unica, datetime.min.time())
+            ate   = datetime.combine(data_unica, datetime.max.time())
+
+        ids = [contas_dict[n] for n in contas_selecionadas]
+        with st.spinner("Checando amostra por conta, mês e status..."):
+            res = amostrar_e_agendar(ids, desde=desde, ate=ate)
+
+        if not res["estratos"]:
+            st.info("Nenhuma venda no período.")
+        else:
+            apelidos = {v: k for k, v in contas_dict.items()}
+            df_drift = pd.DataFrame(res["estratos"])
+            df_drift["conta"] = df_drift["ml_user_id"].map(apelidos)
+            df_drift["mes"] = pd.to_datetime(df_drift["mes"]).dt.strftime("%m/%Y")
+            for c in ("taxa", "lim_inf", "lim_sup"):
+                df_drift[c] = (df_drift[c] * 100).round(1)
+            st.dataframe(
+                df_drift[["conta", "mes", "status", "total", "amostra", "divergentes",
+                          "taxa", "lim_inf", "lim_sup", "drift", "colunas"]],
+                use_container_width=True, hide_index=True,
+            )
+            st.success(
+                f"✅ {res['checados']} pedidos checados; {int(df_drift['drift'].sum())} estratos com drift "
+                f"→ {res['agendados']} pedidos agendados para reconciliação."
+            )
+
+    # — 6) Fila de pedidos com falha (dead-letter) —
+    from dead_letter import contar_pendentes, reprocessar_falhas
+    pendentes = contar_pendentes()
+    if pendentes:
+        st.info(f"♻️ {pendentes} pedidos com falha aguardando reprocessamento.")
+        if st.button("♻️ Reprocessar pedidos com falha", use_container_width=True):
+            with st.spinner("Reprocessando apenas os pedidos da fila..."):
+                res = reprocessar_falhas()
+            st.success(f"✅ {res['reprocessadas']} reprocessados, {res['falhas']} ainda com falha.")
+
+    # — 7) Uso dos pools de conexão deste processo —
+    with st.expander("📊 Pools de conexão (ui / ingestao / analitico)"):
+        from db import metricas_pools
+        st.dataframe(pd.DataFrame(metricas_pools()), use_container_width=True, hide_index=True)
+
     # --- Seção por conta individual ---
     for row in df.itertuples(index=False):
         with st.expander(f"🔗 Conta ML: {row.nickname}"):
@@ -1229,22 +1356,21 @@ def mostrar_anuncios():
     )
 
     st.header("🎯 Análise de Anúncios")
-    df = carregar_vendas()
+    data_min, data_max = limites_vendas()
 
-    if df.empty:
+    if data_min is None:
         st.warning("Nenhum dado para exibir.")
         return
 
-    df['date_adjusted'] = pd.to_datetime(df['date_adjusted'])
-
     # ========== FILTROS ==========
-    data_ini = st.date_input("De:",  value=df['date_adjusted'].min().date())
-    data_fim = st.date_input("Até:", value=df['date_adjusted'].max().date())
+    data_ini = st.date_input("De:",  value=data_min)
+    data_fim = st.date_input("Até:", value=data_max)
 
-    df_filt = df.loc[
-    (df['date_adjusted'].dt.date >= data_ini) &
-    (df['date_adjusted'].dt.date <= data_fim)
-    ]
+    # só o período e as colunas que a página usa
+    df_filt = carregar_vendas(Consulta(
+        ("date_adjusted", "item_id", "item_title", "total_amount", "quantity"), data_ini, data_fim
+    ))
+    df_filt['date_adjusted'] = pd.to_datetime(df_filt['date_adjusted'])
 
     if df_filt.empty:
         st.warning("Sem registros para os filtros escolhidos.")
@@ -1307,6 +1433,8 @@ def mostrar_anuncios():
 
     # 5️⃣ Faturamento por Comprimento de Título
     st.subheader("4️⃣ 📏 Faturamento por Comprimento de Título (nº de palavras)")
+    # todo o histórico, não só o período: basta título e faturamento
+    df = carregar_vendas(Consulta((title_col, faturamento_col)))
     df['title_len'] = df[title_col].str.split().apply(len)
     df_len_fat = (
         df
@@ -1379,7 +1507,6 @@ def mostrar_anuncios():
 def mostrar_relatorios():
 
     import pytz
-    from sales import traduzir_status
 
     # --- CSS de espaçamento ---
     st.markdown("""
@@ -1424,27 +1551,14 @@ def mostrar_relatorios():
 
     st.header("📋 Relatórios de Vendas")
 
-    # --- carga e tradução de status ---
-    df_full = carregar_vendas(None)
-    # Garantir coluna shipment_flex_cost (fallback se não vier do banco)
-    if "shipment_flex_cost" not in df_full.columns:
-        df_full["shipment_flex_cost"] = (
-            df_full["shipment_logistic_type"]
-            .fillna("")
-            .str.lower()
-            .eq("self_service")
-            .astype(float) * 12.97
-        )
-
-    if df_full.empty:
+    # --- primeiro/último dia com venda: período, contas e status vão para o SQL ---
+    data_min, data_max = limites_vendas()
+    if data_min is None:
         st.warning("Nenhum dado encontrado.")
         return
 
-    df_full["status"] = df_full["status"].map(traduzir_status)
-    df_full["date_adjusted"] = pd.to_datetime(df_full["date_adjusted"])
-
     # --- Filtro de Contas Lado a Lado ---
-    contas_df   = pd.read_sql(text("SELECT nickname FROM user_tokens ORDER BY nickname"), engine)
+    contas_df   = contas_cadastradas()
     contas_lst  = contas_df["nickname"].tolist()
     st.markdown("**🧾 Contas Mercado Livre:**")
     if "todas_contas_marcadas" not in st.session_state:
@@ -1457,14 +1571,15 @@ def mostrar_relatorios():
             st.session_state[key] = st.session_state["todas_contas_marcadas"]
         if cols[i % 8].checkbox(conta, key=key):
             selecionadas.append(conta)
-    if selecionadas:
-        df_full = df_full[df_full["nickname"].isin(selecionadas)]
+    ids_contas = ids_das_contas(contas_df, selecionadas)
+    if ids_contas is not None:
+        min_contas, max_contas = limites_vendas(ids_contas)
+        if min_contas is not None:
+            data_min, data_max = min_contas, max_contas
 
     # --- Filtro Rápido | De | Até | Status | Tipo de Envio | Categoria de Preço ---
     col1, col2, col3, col4, col5, col6 = st.columns([1.5, 1.2, 1.2, 1.5, 1.5, 1.8])
     hoje      = pd.Timestamp.now(tz="America/Sao_Paulo").date()
-    data_min  = df_full["date_adjusted"].dt.date.min()
-    data_max  = df_full["date_adjusted"].dt.date.max()
     
     # === Mapeamentos e cálculos iniciais ===
     def mapear_tipo(valor):
@@ -1477,8 +1592,6 @@ def mostrar_relatorios():
             case 'me2': return 'Envio Padrão'
             case _: return 'outros'
     
-    df_full["Tipo de Envio"] = df_full["shipment_logistic_type"].apply(mapear_tipo)
-    
     # --- Categoria de Preço ---
     def categorizar_preco(linha):
         try:
@@ -1489,8 +1602,6 @@ def mostrar_relatorios():
                 return "HIGH TICKET (> R$79)"
         except:
             return "outros"
-    
-    df_full["Categoria de Preço"] = df_full.apply(categorizar_preco, axis=1)
 
     
     # --- Filtros ---
@@ -1521,24 +1632,29 @@ def mostrar_relatorios():
         de = st.date_input("De", value=de, min_value=data_min, max_value=data_max, disabled=not custom, key="rel_de")
     with col3:
         ate = st.date_input("Até", value=ate, min_value=data_min, max_value=data_max, disabled=not custom, key="rel_ate")
+
+    # agregado do mesmo período e contas: opções de status/envio aqui e os cards abaixo
+    agg = carregar_agregado(de, ate, ids_contas)
     with col4:
-        opts = ["Todos"] + df_full["status"].dropna().unique().tolist()
+        opts = ["Todos"] + agg["status"].dropna().unique().tolist()
         idx = opts.index("Pago") if "Pago" in opts else 0
         status_sel = st.selectbox("Status", opts, index=idx, key="rel_status")
+
+    # --- vendas do recorte (período, contas, status), só com as colunas usadas abaixo ---
+    df = carregar_vendas(Consulta(COLUNAS_RELATORIO, de, ate, ids_contas,
+                                  None if status_sel == "Todos" else status_sel))
+    df["date_adjusted"] = pd.to_datetime(df["date_adjusted"])
+    df["Tipo de Envio"] = df["shipment_logistic_type"].apply(mapear_tipo)
+    df["Categoria de Preço"] = df.apply(categorizar_preco, axis=1) if not df.empty else pd.Series(dtype=object)
+
     with col5:
-        envio_opts = ["Todos"] + sorted(df_full["Tipo de Envio"].dropna().unique())
+        envio_opts = ["Todos"] + sorted(agg["logistic_type"].apply(mapear_tipo).dropna().unique())
         tipo_envio_sel = st.selectbox("Tipo de Envio", envio_opts, index=0, key="rel_tipo_envio")
     with col6:
-        preco_opts = ["Todos"] + df_full["Categoria de Preço"].unique().tolist()
+        preco_opts = ["Todos"] + df["Categoria de Preço"].unique().tolist()
         preco_sel = st.selectbox("Categoria de Preço", preco_opts, index=0, key="rel_cat_preco")
     
-    # --- Aplicação dos filtros ---
-    df = df_full[
-        (df_full["date_adjusted"].dt.date >= de) &
-        (df_full["date_adjusted"].dt.date <= ate)
-    ]
-    if status_sel != "Todos":
-        df = df[df["status"] == status_sel]
+    # --- Aplicação dos filtros (período, contas e status já vieram do SQL) ---
     if tipo_envio_sel != "Todos":
         df = df[df["Tipo de Envio"] == tipo_envio_sel]
     if preco_sel != "Todos":
@@ -1611,22 +1727,25 @@ def mostrar_relatorios():
             </div>
         """, unsafe_allow_html=True)
 
-    total_vendas        = len(df)
-    total_valor         = df["total_amount"].sum()
-    total_itens         = (df["quantity_sku"] * df["quantity"]).sum()
-    ticket_venda        = total_valor / total_vendas if total_vendas else 0
-    ticket_unidade      = total_valor / total_itens if total_itens else 0
-    frete               = df["frete_adjust"].fillna(0).sum()
-    taxa_mktplace       = -df["ml_fee"].fillna(0).sum()
-    cmv                 = -((df["quantity_sku"] * df["quantity"]) * df["custo_unitario"].fillna(0)).sum()
-    margem_operacional  = total_valor + frete + taxa_mktplace + cmv
-    flex                = -df["shipment_flex_cost"].fillna(0).sum()
-
-    df_faltantes = df_full[
-        df_full["seller_sku"].notnull() &
-        df_full[["level1", "level2", "custo_unitario", "quantity_sku"]].isnull().any(axis=1)
-    ]
-    sku_incompleto = df_faltantes["seller_sku"].nunique()
+    # cards a partir do agregado diário, com os mesmos filtros da tabela
+    if status_sel != "Todos":
+        agg = agg[agg["status"] == status_sel]
+    if tipo_envio_sel != "Todos":
+        agg = agg[agg["logistic_type"].apply(mapear_tipo) == tipo_envio_sel]
+    if preco_sel != "Todos":
+        agg = agg[agg["Categoria de Preço"] == preco_sel]
+    if sel1:
+        agg = agg[agg["level1"].isin(sel1)]
+    if sel2:
+        agg = agg[agg["level2"].isin(sel2)]
+
+    k = kpis_agregado(agg)
+    total_vendas, total_valor, total_itens = k["total_vendas"], k["total_valor"], k["total_itens"]
+    ticket_venda, ticket_unidade = k["ticket_venda"], k["ticket_unidade"]
+    frete, taxa_mktplace, cmv, flex = k["frete"], k["taxa_mktplace"], k["cmv"], k["flex"]
+    margem_operacional = k["margem_operacional"]
+
+    sku_incompleto = contar_sku_incompleto(ids_contas if ids_contas is not None else contas_df["ml_user_id"])
 
     pct_val = lambda v: f"{(v / total_valor * 100):.1f}%" if total_valor else "0%"
 
@@ -1658,23 +1777,14 @@ def mostrar_relatorios():
     df["SKU DO PRODUTO"]         = df["seller_sku"]
     df["HIERARQUIA 1"]           = df["level1"]
     df["HIERARQUIA 2"]           = df["level2"]
-    df["QUANTIDADE"]             = df["quantity_sku"] * df["quantity"]
+    # resultado já calculado por pedido (sales_pnl); custos negativos
+    df["QUANTIDADE"]             = df["unidades"]
     df["VALOR DA VENDA"]         = df["total_amount"]
-    df["TAXA DA PLATAFORMA"]     = df["ml_fee"].fillna(0) * -1
-    df["CUSTO DE FRETE"]         = df["frete_adjust"].fillna(0) 
-    df["CUSTO DE FLEX"]          = df["shipment_flex_cost"].fillna(0) * -1
-    df["CMV"]                    = (
-        df["quantity_sku"].fillna(0)
-        * df["quantity"].fillna(0)
-        * df["custo_unitario"].fillna(0)
-    ) * -1
-    df["MARGEM DE CONTRIBUIÇÃO"] = (
-        df["VALOR DA VENDA"]
-        + df["TAXA DA PLATAFORMA"]
-        + df["CUSTO DE FRETE"]
-        + df["CUSTO DE FLEX"]
-        + df["CMV"]
-    )
+    df["TAXA DA PLATAFORMA"]     = df["taxa_plataforma"]
+    df["CUSTO DE FRETE"]         = df["custo_frete"]
+    df["CUSTO DE FLEX"]          = df["custo_flex"]
+    df["CMV"]                    = df["cmv"]
+    df["MARGEM DE CONTRIBUIÇÃO"] = df["margem_contribuicao"]
 
     cols_final = [
         "ID DA VENDA","CONTA","Data","TÍTULO DO ANÚNCIO","SKU DO PRODUTO",
@@ -1711,36 +1821,11 @@ def mostrar_gestao_sku():
         if st.button("🧮 Reconciliar SKU"):
             try:
                 with st.spinner("Atualizando vendas com os dados históricos corretos..."):
-                    with engine.begin() as conn:
-                        # Aplica a versão vigente do SKU NA DATA DA VENDA e conta linhas afetadas
-                        total_atualizadas = conn.execute(text("""
-                            WITH updated AS (
-                                UPDATE sales s
-                                SET
-                                    level1         = k.level1,
-                                    level2         = k.level2,
-                                    custo_unitario = k.custo_unitario,
-                                    quantity_sku   = k.quantity
-                                FROM (
-                                    SELECT s.id AS sale_id, k.*
-                                    FROM sales s
-                                    JOIN LATERAL (
-                                        SELECT *
-                                        FROM sku k
-                                        WHERE k.sku = s.seller_sku
-                                          AND k.date_created <= s.date_adjusted
-                                        ORDER BY k.date_created DESC
-                                        LIMIT 1
-                                    ) k ON TRUE
-                                    WHERE s.seller_sku IS NOT NULL
-                                ) k
-                                WHERE s.id = k.sale_id
-                                RETURNING s.id
-                            )
-                            SELECT COUNT(*) FROM updated;
-                        """)).scalar()
+                    # Marca todos os SKUs e reaplica só onde a versão vigente na data da venda mudou
+                    marcar_skus_pendentes()
+                    res = reaplicar_skus_pendentes()
     
-                st.success(f"✅ Conciliação concluída! Vendas atualizadas: {total_atualizadas}")
+                st.success(f"✅ Conciliação concluída! SKUs: {res['skus']} | Vendas atualizadas: {res['vendas']}")
                 st.session_state["atualizar_gestao_sku"] = True
                 st.rerun()
     
@@ -1749,10 +1834,8 @@ def mostrar_gestao_sku():
 
 
     # === Carregamento dos dados (todas as versões + últimas por SKU) ===
-    if st.session_state.get("atualizar_gestao_sku", False) \
-       or "df_sku_all_versions" not in st.session_state \
-       or "df_sku_latest" not in st.session_state:
-
+    # iguais para todas as sessões: uma cópia por processo (sessoes.py), não duas por sessão
+    def carregar_skus():
         # 1) Todas as versões de SKU (para permitir filtrar 'Ultrapassado')
         df_all = pd.read_sql(text("""
             WITH vendas AS (
@@ -1787,13 +1870,15 @@ def mostrar_gestao_sku():
         idx_latest = df_all.groupby("seller_sku")["date_created"].idxmax().dropna()
         df_latest = df_all.loc[idx_latest].copy().sort_values(["seller_sku"])
 
-        # Guarda em sessão
-        st.session_state["df_sku_all_versions"] = df_all
-        st.session_state["df_sku_latest"] = df_latest
-        st.session_state["atualizar_gestao_sku"] = False
+        return df_all, df_latest
 
-    df_all = st.session_state["df_sku_all_versions"].copy()
-    df_latest = st.session_state["df_sku_latest"].copy()
+    # "Recarregar"/"Reconciliar" (e as gravações abaixo) recarregam para todas as sessões
+    base_all, base_latest = gestor_sessoes().compartilhado(
+        "gestao_sku", carregar_skus, renovar=st.session_state.get("atualizar_gestao_sku", False))
+    st.session_state["atualizar_gestao_sku"] = False
+
+    df_all = vista(base_all)
+    df_latest = vista(base_latest)
 
     # === Métricas ===
     with engine.begin() as conn:
@@ -1933,9 +2018,7 @@ def mostrar_gestao_sku():
                     ultimo = conn.execute(text("""
                         SELECT custo_unitario
                         FROM sku
-                        WHERE sku = :sku
-                        ORDER BY date_created DESC
-                        LIMIT 1
+                        WHERE sku = :sku AND upper_inf(valid_during)
                     """), {"sku": sku}).fetchone()
 
                     def custo_diferente(c1, c2, eps=1e-6):
@@ -1949,11 +2032,10 @@ def mostrar_gestao_sku():
                             return True
 
                     if (not ultimo) or custo_diferente(ultimo.custo_unitario, novo_custo):
-                        # Nova versão ativa se custo mudou ou SKU inexistente
+                        # Nova versão se custo mudou ou SKU inexistente (fecha a vigente e abre a nova)
                         conn.execute(text("""
-                            UPDATE sku SET is_active = FALSE WHERE sku = :sku;
-                            INSERT INTO sku (sku, level1, level2, custo_unitario, quantity, date_created, is_active)
-                            VALUES (:sku, :level1, :level2, :custo, :quantidade, NOW(), TRUE);
+                            SELECT sku_nova_versao(:sku, :level1, :level2,
+                                                   CAST(:custo AS numeric), CAST(:quantidade AS integer))
                         """), {
                             "sku": sku,
                             "level1": level1_val,
@@ -1968,10 +2050,7 @@ def mostrar_gestao_sku():
                             SET level1 = :level1,
                                 level2 = :level2,
                                 quantity = :quantidade
-                            WHERE sku = :sku
-                              AND date_created = (
-                                  SELECT MAX(date_created) FROM sku WHERE sku = :sku
-                              )
+                            WHERE sku = :sku AND upper_inf(valid_during)
                         """), {
                             "sku": sku,
                             "level1": level1_val,
@@ -1979,30 +2058,9 @@ def mostrar_gestao_sku():
                             "quantidade": q_val
                         })
 
-                # Atualiza tabela de vendas com os dados históricos corretos
-                conn.execute(text("""
-                    UPDATE sales s
-                    SET
-                        level1 = sku.level1,
-                        level2 = sku.level2,
-                        custo_unitario = sku.custo_unitario,
-                        quantity_sku = sku.quantity
-                    FROM (
-                        SELECT s.id AS sale_id, sku.*
-                        FROM sales s
-                        JOIN LATERAL (
-                            SELECT *
-                            FROM sku
-                            WHERE sku.sku = s.seller_sku
-                              AND sku.date_created <= s.date_adjusted
-                            ORDER BY date_created DESC
-                            LIMIT 1
-                        ) sku ON true
-                    ) sku
-                    WHERE s.id = sku.sale_id
-                """))
-
-            st.success("✅ Alterações salvas com sucesso!")
+            # vendas dos SKUs alterados são atualizadas em lotes, sem segurar a tela
+            reaplicar_skus_em_segundo_plano()
+            st.success("✅ Alterações salvas com sucesso! Vendas dos SKUs alterados sendo atualizadas em segundo plano.")
             st.session_state["atualizar_gestao_sku"] = True
             st.rerun()
 
@@ -2055,9 +2113,7 @@ def mostrar_gestao_sku():
                         SELECT *
                         FROM sku
                         WHERE sku = :seller_sku
-                          AND date_created <= :data_venda
-                        ORDER BY date_created DESC
-                        LIMIT 1
+                          AND valid_during @> CAST(:data_venda AS timestamptz)
                     """), {
                         "seller_sku": str(sku_fill).strip(),
                         "data_venda": row["Data do Pedido"]
@@ -2071,7 +2127,8 @@ def mostrar_gestao_sku():
                                 level1        = :level1,
                                 level2        = :level2,
                                 custo_unitario= :custo_unitario,
-                                quantity_sku  = :quantity
+                                quantity_sku  = :quantity,
+                                row_hash      = NULL
                             WHERE item_id = :item_id
                         """), {
                             "seller_sku": str(sku_fill).strip(),
@@ -2125,51 +2182,35 @@ def mostrar_gestao_sku():
                     df_novo = df_novo.replace({"": None})
                     df_novo = df_novo[df_novo["seller_sku"].notna() & (df_novo["seller_sku"].astype(str).str.strip() != "")]
 
+                    # planilha inteira num COPY binário para uma tabela temporária e um único
+                    # SELECT que abre versão só para as linhas sem versão idêntica no cadastro
                     with engine.begin() as conn:
-                        for _, row in df_novo.iterrows():
-                            row_dict = row.to_dict()
-                            exists = conn.execute(text("""
-                                SELECT 1 FROM sku
-                                WHERE sku = :seller_sku
-                                  AND COALESCE(TRIM(level1), '') = COALESCE(TRIM(:level1), '')
-                                  AND COALESCE(TRIM(level2), '') = COALESCE(TRIM(:level2), '')
-                                  AND ROUND(CAST(custo_unitario AS numeric), 2) = ROUND(CAST(:custo_unitario AS numeric), 2)
-                                  AND quantity = :quantity
-                                LIMIT 1
-                            """), row_dict).fetchone()
-
-                            if exists is None:
-                                conn.execute(text("""
-                                    UPDATE sku SET is_active = FALSE WHERE sku = :seller_sku;
-                                    INSERT INTO sku (sku, level1, level2, custo_unitario, quantity, date_created, is_active)
-                                    VALUES (:seller_sku, :level1, :level2, :custo_unitario, :quantity, NOW(), TRUE);
-                                """), row_dict)
-
-                        # Atualiza vendas com versão válida até a data do pedido
                         conn.execute(text("""
-                            UPDATE sales s
-                            SET
-                                level1 = sku.level1,
-                                level2 = sku.level2,
-                                custo_unitario = sku.custo_unitario,
-                                quantity_sku = sku.quantity
-                            FROM (
-                                SELECT s.id AS sale_id, sku.*
-                                FROM sales s
-                                JOIN LATERAL (
-                                    SELECT *
-                                    FROM sku
-                                    WHERE sku.sku = s.seller_sku
-                                      AND sku.date_created <= s.date_adjusted
-                                    ORDER BY date_created DESC
-                                    LIMIT 1
-                                ) sku ON true
-                            ) sku
-                            WHERE s.id = sku.sale_id
+                            CREATE TEMP TABLE _sku_planilha (
+                                ordem integer, seller_sku text, level1 text, level2 text,
+                                custo_unitario numeric, quantity integer
+                            ) ON COMMIT DROP
+                        """))
+                        colunas = ["seller_sku", "level1", "level2", "custo_unitario", "quantity"]
+                        copiar(conn, "_sku_planilha", ["ordem"] + colunas,
+                               ([i] + list(r) for i, r in enumerate(df_novo[colunas].itertuples(index=False))))
+                        conn.execute(text("""
+                            SELECT sku_nova_versao(p.seller_sku, p.level1, p.level2, p.custo_unitario, p.quantity)
+                            FROM _sku_planilha p
+                            WHERE NOT EXISTS (
+                                SELECT 1 FROM sku
+                                WHERE sku = p.seller_sku
+                                  AND COALESCE(TRIM(level1), '') = COALESCE(TRIM(p.level1), '')
+                                  AND COALESCE(TRIM(level2), '') = COALESCE(TRIM(p.level2), '')
+                                  AND ROUND(CAST(custo_unitario AS numeric), 2) = ROUND(p.custo_unitario, 2)
+                                  AND quantity = p.quantity
+                            )
+                            ORDER BY p.ordem
                         """))
 
+                    reaplicar_skus_em_segundo_plano()
                     st.session_state["atualizar_gestao_sku"] = True
-                    st.success("✅ Planilha importada, vendas atualizadas, métricas e tabela recarregadas!")
+                    st.success("✅ Planilha importada! Vendas dos SKUs alterados sendo atualizadas em segundo plano.")
                     st.rerun()
                 except Exception as e:
                     st.error(f"❌ Erro ao processar: {e}")
@@ -2194,9 +2235,8 @@ def mostrar_gestao_sku():
                     try:
                         with engine.begin() as conn:
                             conn.execute(text("""
-                                UPDATE sku SET is_active = FALSE WHERE sku = :sku;
-                                INSERT INTO sku (sku, level1, level2, custo_unitario, quantity, date_created, is_active)
-                                VALUES (:sku, :level1, :level2, :custo, :quantidade, NOW(), TRUE);
+                                SELECT sku_nova_versao(:sku, :level1, :level2,
+                                                       CAST(:custo AS numeric), CAST(:quantidade AS integer))
                             """), {
                                 "sku": seller_sku_manual.strip(),
                                 "level1": level1_manual.strip() or None,
@@ -2205,28 +2245,7 @@ def mostrar_gestao_sku():
                                 "quantidade": int(quantity_manual)
                             })
 
-                            conn.execute(text("""
-                                UPDATE sales s
-                                SET
-                                    level1 = sku.level1,
-                                    level2 = sku.level2,
-                                    custo_unitario = sku.custo_unitario,
-                                    quantity_sku = sku.quantity
-                                FROM (
-                                    SELECT s.id AS sale_id, sku.*
-                                    FROM sales s
-                                    JOIN LATERAL (
-                                        SELECT *
-                                        FROM sku
-                                        WHERE sku.sku = s.seller_sku
-                                          AND sku.date_created <= s.date_adjusted
-                                        ORDER BY date_created DESC
-                                        LIMIT 1
-                                    ) sku ON true
-                                ) sku
-                                WHERE s.id = sku.sale_id
-                            """))
-
+                        reaplicar_skus_em_segundo_plano()
                         st.success("✅ SKU adicionado com sucesso!")
                         st.session_state["atualizar_gestao_sku"] = True
                         st.rerun()
@@ -2567,7 +2586,7 @@ def mostrar_expedicao_logistica(df: pd.DataFrame):
     from db import SessionLocal
     
     # Helpers de token por usuário (lendo de user_tokens)
-    BACKEND_URL = os.getenv("BACKEND_URL")
+    BACKEND_URL = settings().backend_url
     
     @st.cache_data(ttl=300, show_spinner=False)
     def _get_token_db(ml_user_id: int) -> str | None:
@@ -2622,7 +2641,7 @@ def mostrar_expedicao_logistica(df: pd.DataFrame):
         token = get_access_token_for_user(uid)
         if not token:
             return None
-        url = f"https://api.mercadolibre.com/orders/{order_id}?access_token={token}"
+        url = f"{ML_API_URL}/orders/{order_id}?access_token={token}"
         try:
             r = requests.get(url, timeout=15)
             if not r.ok:
@@ -2693,7 +2712,7 @@ def mostrar_expedicao_logistica(df: pd.DataFrame):
         if not token:
             return "—", "—"
     
-        base = "https://api.mercadolibre.com/shipment_labels"
+        base = f"{ML_API_URL}/shipment_labels"
         
         # Garantir que shipment_id seja inteiro e sem ".0"
         sid = str(sid).split('.')[0]  # Remove qualquer parte decimal (".0")
@@ -3041,7 +3060,7 @@ from sqlalchemy import text
 import streamlit as st
 import pandas as pd
 from datetime import datetime
-from utils import engine  # 🔥 usa seu engine já configurado
+from db import engine_ui as engine  # pool "ui" das páginas
 
 def mostrar_painel_metas():
     from datetime import datetime
@@ -3056,11 +3075,11 @@ def mostrar_painel_metas():
     ano_mes_atual = hoje.strftime("%Y-%m")
 
     # ======== Carregar Pessoas ========
-    with engine.connect() as conn:
+    with leitura().connect() as conn:
         pessoas_df = pd.read_sql("SELECT * FROM pessoas ORDER BY nome", conn)
 
     # ======== Carregar Metas ========
-    with engine.connect() as conn:
+    with leitura().connect() as conn:
         df_metas = pd.read_sql(
             text("""
                 SELECT p.id, p.nome, m.meta_unidades
@@ -3073,7 +3092,7 @@ def mostrar_painel_metas():
         )
 
     # ======== Carregar Produção ========
-    with engine.connect() as conn:
+    with leitura().connect() as conn:
         df_producao = pd.read_sql(
             text("""
                 SELECT p.id, p.nome, d.data, d.quantidade
@@ -3543,7 +3562,7 @@ def mostrar_supply_chain():
 
 def get_fornecedores():
     query = "SELECT empresa_nome FROM fornecedores ORDER BY empresa_nome"
-    df = pd.read_sql(query, engine)
+    df = pd.read_sql(query, leitura())
     return df["empresa_nome"].tolist()
 
 def get_insumos_df():
@@ -3552,7 +3571,7 @@ def get_insumos_df():
         FROM insumos
         ORDER BY descricao
     """
-    return pd.read_sql(query, engine)
+    return pd.read_sql(query, leitura())
 
 def get_compras(fornecedor, insumo, data_inicio, data_fim, entrega_inicio, entrega_fim):
     query = """
@@ -3592,12 +3611,12 @@ def get_compras(fornecedor, insumo, data_inicio, data_fim, entrega_inicio, entre
         query += " AND i.descricao = :insumo"
         params["insumo"] = insumo_descricao
 
-    return pd.read_sql(text(query), engine, params=params)
+    return pd.read_sql(text(query), leitura(), params=params)
 
 # === Helpers COM ID (fora de get_compras) ===
 def get_fornecedores_df():
     query = "SELECT id, empresa_nome FROM fornecedores ORDER BY empresa_nome"
-    return pd.read_sql(query, engine)
+    return pd.read_sql(query, leitura())
 
 def get_insumos_df_full():
     query = """
@@ -3605,7 +3624,7 @@ def get_insumos_df_full():
         FROM insumos
         ORDER BY descricao
     """
-    return pd.read_sql(query, engine)
+    return pd.read_sql(query, leitura())
 
 def mostrar_gerenciar_cadastros():
     import streamlit as st
@@ -3648,7 +3667,9 @@ def mostrar_gerenciar_cadastros():
 
     def importar_excel(table_name, df_upload):
         try:
-            df_upload.to_sql(table_name, con=engine, if_exists="append", index=False)
+            # COPY binário (psycopg3) em vez de to_sql: uma carga só, não um INSERT por linha
+            with engine.begin() as conn:
+                copiar_df(conn, table_name, df_upload)
             st.success("✅ Dados importados com sucesso!")
             st.rerun()
         except Exception as e:
@@ -3900,7 +3921,7 @@ def mostrar_calculadora_custos():
     import pandas as pd
     from sqlalchemy import text
     from datetime import datetime
-    from utils import engine
+    from db import engine_ui as engine
     from io import BytesIO
 
     st.markdown("""
@@ -4064,7 +4085,8 @@ def mostrar_calculadora_custos():
 if "code" in st.query_params:
     ml_callback()
 
-df_vendas = carregar_vendas()
+# mede o estado desta sessão e tira frames se passou do limite (sessoes.py)
+gestor_sessoes().registrar(sessao_atual(), st.session_state, st.session_state.get("app_user"))
 
 pagina = render_sidebar()
 if pagina == "Dashboard":
@@ -4074,7 +4096,7 @@ elif pagina == "Contas Cadastradas":
 elif pagina == "Relatórios":
     mostrar_relatorios()
 elif pagina == "Expedição":
-    mostrar_expedicao_logistica(df_vendas)
+    mostrar_expedicao_logistica(carregar_vendas(Consulta(COLUNAS_EXPEDICAO)))
 elif pagina == "Gestão de SKU":
     mostrar_gestao_sku()
 elif pagina == "Painel de Metas":
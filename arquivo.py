@@ -0,0 +1,281 @@
+# arquivo.py – histórico frio de sales em Parquet, com leitura unificada
+"""
+Meses fechados mais antigos que o horizonte (ARQUIVO_HORIZONTE_MESES) saem de
+`sales` para arquivos Parquet comprimidos, um por conta e mês:
+
+    <ARQUIVO_URI>/ml_user_id=<conta>/mes=<AAAA-MM>/vendas.parquet
+
+O mês é lido da partição, gravado e conferido; depois, numa transação só, a
+partição é desanexada e apagada e o manifesto `sales_arquivo` é gravado
+(migrations/0008). Se alguma venda do mês mudou durante a cópia (sales_changes),
+nada é apagado e o mês fica para a próxima execução. O sales_daily_agg e o
+sales_pnl não são tocados, então Dashboard e Relatórios agregados continuam
+cobrindo o arquivo; o resultado de cada pedido também é gravado no Parquet.
+
+Leitores no estilo carregar_vendas chamam unir_arquivo(): se o intervalo pedido
+alcança meses arquivados, as linhas do Parquet são somadas às do Postgres.
+
+ARQUIVO_URI aceita caminho local ou qualquer URI do pyarrow (s3://, gs://).
+
+    python arquivo.py --arquivar             # meses além do horizonte
+    python arquivo.py --mes 2024-05          # um mês específico
+    python arquivo.py --listar
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import text
+
+from particoes import _engine, nome_particao
+from pnl import COLUNAS as COLUNAS_PNL
+from settings import settings
+
+# ---- Config ----
+# ARQUIVO_URI e ARQUIVO_HORIZONTE_MESES: ver settings.Settings
+URI_PADRAO      = str(Path(__file__).resolve().parent / "arquivo")
+COMPRESSAO      = "zstd"
+SEM_CONTA       = 0            # pasta das vendas sem ml_user_id
+
+
+def caminho(ml_user_id: Optional[int], mes: date) -> str:
+    return f"ml_user_id={ml_user_id if ml_user_id is not None else SEM_CONTA}/mes={mes:%Y-%m}/vendas.parquet"
+
+
+def _fs(uri: Optional[str] = None):
+    from pyarrow import fs
+    uri = uri or settings().arquivo_uri or URI_PADRAO
+    if "://" not in uri:
+        Path(uri).mkdir(parents=True, exist_ok=True)
+        return fs.LocalFileSystem(), uri.rstrip("/")
+    return fs.FileSystem.from_uri(uri)
+
+
+# ----------------- Escrita -----------------
+def escrever_mes(df: pd.DataFrame, mes: date, uri: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Grava um Parquet por conta do mês; retorna as entradas do manifesto (sem gravar no banco)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sistema, base = _fs(uri)
+    entradas = []
+    # esquema do mês inteiro: coluna nula numa conta não vira tipo "null" só naquele arquivo
+    esquema = pa.Schema.from_pandas(df, preserve_index=False)
+    contas = df["ml_user_id"].fillna(SEM_CONTA).astype("int64")
+    for conta, parte in df.groupby(contas, sort=True):
+        rel = caminho(int(conta), mes)
+        sistema.create_dir(f"{base}/{rel.rsplit('/', 1)[0]}", recursive=True)
+        tabela = pa.Table.from_pandas(parte.reset_index(drop=True), schema=esquema, preserve_index=False)
+        pq.write_table(tabela, f"{base}/{rel}", filesystem=sistema, compression=COMPRESSAO)
+        entradas.append({
+            "mes": mes, "ml_user_id": int(conta), "linhas": len(parte), "caminho": rel,
+            "bytes": sistema.get_file_info(f"{base}/{rel}").size,
+        })
+    return entradas
+
+
+def _linhas_gravadas(entradas: Iterable[Dict[str, Any]], uri: Optional[str] = None) -> int:
+    import pyarrow.parquet as pq
+
+    sistema, base = _fs(uri)
+    return sum(pq.ParquetFile(f"{base}/{e['caminho']}", filesystem=sistema).metadata.num_rows for e in entradas)
+
+
+# ----------------- Leitura -----------------
+def ler_arquivos(
+    caminhos: List[str],
+    colunas: Optional[List[str]] = None,
+    desde: Optional[date] = None,
+    ate: Optional[date] = None,
+    uri: Optional[str] = None,
+) -> pd.DataFrame:
+    """Lê os Parquet indicados, filtrando date_adjusted em [desde, ate]; numeric vira float como no read_sql."""
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+
+    if not caminhos:
+        return pd.DataFrame(columns=colunas or [])
+    sistema, base = _fs(uri)
+    arquivos = [f"{base}/{c}" for c in caminhos]
+    # meses gravados em épocas diferentes podem divergir (coluna nova, decimal mais largo)
+    esquema = pa.unify_schemas([pq.read_schema(a, filesystem=sistema) for a in arquivos],
+                               promote_options="permissive")
+    dataset = ds.dataset(arquivos, schema=esquema, filesystem=sistema, format="parquet")
+    filtro = None
+    if desde is not None:
+        filtro = ds.field("date_adjusted") >= pd.Timestamp(desde)
+    if ate is not None:
+        ate_f = ds.field("date_adjusted") < pd.Timestamp(ate + timedelta(days=1))
+        filtro = ate_f if filtro is None else filtro & ate_f
+    if colunas is not None:
+        colunas = [c for c in colunas if c in dataset.schema.names]
+    tabela = dataset.to_table(columns=colunas, filter=filtro)
+    for i, campo in enumerate(tabela.schema):
+        if pa.types.is_decimal(campo.type):
+            tabela = tabela.set_column(i, campo.name, tabela.column(i).cast(pa.float64()))
+    return tabela.to_pandas()
+
+
+def manifesto(
+    ml_user_ids: Optional[Iterable[int]] = None,
+    desde: Optional[date] = None,
+    ate: Optional[date] = None,
+    engine=None,
+) -> List[Dict[str, Any]]:
+    """Entradas do manifesto que podem ter vendas do intervalo (por mês de date_closed)."""
+    filtros, params = ["TRUE"], {}
+    if ml_user_ids is not None:
+        filtros.append("ml_user_id = ANY(:uids)")
+        params["uids"] = [int(u) for u in ml_user_ids]
+    if desde is not None:
+        filtros.append("mes >= :mes_ini")
+        params["mes_ini"] = desde.replace(day=1)
+    if ate is not None:
+        # date_closed = date_adjusted + 3h: o último dia pode cair no mês seguinte
+        filtros.append("mes <= :mes_fim")
+        params["mes_fim"] = (ate + timedelta(days=1)).replace(day=1)
+    with _engine(engine).connect() as conn:
+        rows = conn.execute(text(f"""
+            SELECT mes, ml_user_id, linhas, bytes, caminho, arquivado_em
+            FROM sales_arquivo WHERE {' AND '.join(filtros)}
+            ORDER BY mes, ml_user_id
+        """), params).mappings().all()
+    return [dict(r) for r in rows]
+
+
+def versao_arquivo(engine=None) -> Optional[str]:
+    """Muda quando um mês é arquivado; entra na chave de cache junto com a versão de sales."""
+    with _engine(engine).connect() as conn:
+        n, ultimo = conn.execute(text("SELECT COUNT(*), MAX(arquivado_em) FROM sales_arquivo")).one()
+    return f"{n}:{ultimo}" if n else None
+
+
+def unir_arquivo(
+    df_quente: pd.DataFrame,
+    ml_user_ids: Optional[Iterable[int]] = None,
+    desde: Optional[date] = None,
+    ate: Optional[date] = None,
+    engine=None,
+    status: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    Soma ao resultado do Postgres as vendas arquivadas do mesmo recorte (contas,
+    período e status como exibido por traduzir_status), com as mesmas colunas.
+    `nickname`, se pedido, vem de user_tokens.
+    """
+    entradas = manifesto(ml_user_ids, desde, ate, engine)
+    if not entradas:
+        return df_quente
+    colunas = [c for c in df_quente.columns if c != "nickname"]
+    ler = colunas + ["status"] if status and "status" not in colunas else colunas
+    frio = ler_arquivos([e["caminho"] for e in entradas], ler, desde, ate)
+    if status and not frio.empty:
+        from sales import traduzir_status
+        frio = frio[frio["status"].fillna("").map(traduzir_status) == status]
+    if frio.empty:
+        return df_quente
+    if "nickname" in df_quente.columns:
+        with _engine(engine).connect() as conn:
+            apelidos = dict(conn.execute(text("SELECT ml_user_id, nickname FROM user_tokens")).all())
+        frio["nickname"] = frio["ml_user_id"].map(apelidos)
+    return pd.concat([df_quente, frio.reindex(columns=df_quente.columns)], ignore_index=True)
+
+
+# ----------------- Arquivamento -----------------
+def meses_arquivaveis(horizonte_meses: Optional[int] = None, engine=None) -> List[date]:
+    """Partições mensais de sales anteriores ao horizonte (meses fechados, mais antigo primeiro)."""
+    if horizonte_meses is None:
+        horizonte_meses = settings().arquivo_horizonte_meses
+    limite = date.today().replace(day=1) - relativedelta(months=horizonte_meses)
+    with _engine(engine).connect() as conn:
+        nomes = conn.execute(text("""
+            SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass('sales') AND c.relname ~ '^sales_p[0-9]{6}$'
+        """)).scalars().all()
+    meses = sorted(date(int(n[7:11]), int(n[11:13]), 1) for n in nomes)
+    return [m for m in meses if m < limite]
+
+
+def arquivar_mes(mes: date, uri: Optional[str] = None, engine=None) -> Dict[str, Any]:
+    """Move um mês de sales para Parquet e apaga a partição. Retorna linhas e bytes gravados."""
+    eng = _engine(engine)
+    nome = nome_particao(mes)
+    # REPEATABLE READ: xmin e as linhas lidas vêm do mesmo snapshot. Toda mudança
+    # com txid < xmin já estava comitada e está no df; o que pode faltar tem
+    # txid >= xmin (seq não serve: não segue a ordem de commit)
+    with eng.connect() as conn, conn.execution_options(isolation_level="REPEATABLE READ").begin():
+        xmin = conn.execute(text("SELECT txid_snapshot_xmin(txid_current_snapshot())")).scalar()
+        colunas = conn.execute(text("""
+            SELECT column_name FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = 'sales'
+            ORDER BY ordinal_position
+        """)).scalars().all()
+        # o resultado do pedido (sales_pnl) vai junto: leitores do arquivo recebem os números prontos
+        df = pd.read_sql(text(f"""
+            SELECT {", ".join(f"s.{c}" for c in colunas)}, {", ".join(f"p.{c}" for c in COLUNAS_PNL)}
+            FROM "{nome}" s
+            LEFT JOIN sales_pnl p ON p.order_id = s.order_id
+        """), conn, coerce_float=False)
+
+    entradas = escrever_mes(df, mes, uri) if not df.empty else []
+    gravadas = _linhas_gravadas(entradas, uri)
+    if gravadas != len(df):
+        raise RuntimeError(f"{nome}: {len(df)} linhas lidas, {gravadas} gravadas no Parquet")
+
+    with eng.begin() as conn:
+        conn.execute(text("SET LOCAL lock_timeout = '10s'"))
+        conn.execute(text(f'ALTER TABLE sales DETACH PARTITION "{nome}"'))
+        # desanexada, a partição não recebe mais escrita: o que mudou desde a leitura aparece aqui
+        mudou = conn.execute(text(f"""
+            SELECT EXISTS (
+                SELECT 1 FROM sales_changes c
+                WHERE c.txid >= :xmin AND c.order_id IN (SELECT order_id FROM "{nome}")
+            )
+        """), {"xmin": xmin}).scalar()
+        if mudou:
+            raise RuntimeError(f"{nome}: vendas alteradas durante a cópia; tente de novo")
+        for e in entradas:
+            conn.execute(text("""
+                INSERT INTO sales_arquivo (mes, ml_user_id, linhas, bytes, caminho)
+                VALUES (:mes, :ml_user_id, :linhas, :bytes, :caminho)
+                ON CONFLICT (mes, ml_user_id) DO UPDATE SET
+                    linhas = EXCLUDED.linhas, bytes = EXCLUDED.bytes,
+                    caminho = EXCLUDED.caminho, arquivado_em = now()
+            """), e)
+        conn.execute(text(f'DROP TABLE "{nome}"'))
+
+    total_bytes = sum(e["bytes"] for e in entradas)
+    logging.info(f"🧊 {nome}: {len(df)} vendas em {len(entradas)} arquivos ({total_bytes / 1e6:.1f} MB)")
+    return {"mes": f"{mes:%Y-%m}", "linhas": len(df), "arquivos": len(entradas), "bytes": total_bytes}
+
+
+def arquivar(horizonte_meses: Optional[int] = None, engine=None) -> List[Dict[str, Any]]:
+    """Arquiva todos os meses além do horizonte, do mais antigo ao mais novo; para no primeiro erro."""
+    return [arquivar_mes(m, engine=engine) for m in meses_arquivaveis(horizonte_meses, engine)]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--arquivar", action="store_true", help="arquiva os meses além do horizonte")
+    ap.add_argument("--horizonte", type=int, help="meses mantidos no Postgres (padrão: ARQUIVO_HORIZONTE_MESES)")
+    ap.add_argument("--mes", metavar="AAAA-MM", help="arquiva um mês específico")
+    ap.add_argument("--listar", action="store_true", help="mostra o manifesto")
+    args = ap.parse_args()
+
+    if args.mes:
+        ano, mes = (int(p) for p in args.mes.split("-"))
+        print(arquivar_mes(date(ano, mes, 1)))
+    if args.arquivar:
+        for r in arquivar(args.horizonte):
+            print(r)
+    if args.listar:
+        for e in manifesto():
+            print(f"{e['mes']:%Y-%m} {e['ml_user_id']:>12} {e['linhas']:>9} {e['bytes'] / 1e6:>8.1f} MB  {e['caminho']}")
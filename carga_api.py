@@ -0,0 +1,141 @@
+# carga_api.py – teste de carga do /auth/refresh (teto de concorrência da API)
+"""
+Dispara renovações de token simultâneas contra a API, em níveis crescentes de
+concorrência, e mostra vazão, p50/p95 e erros por nível. O teto é o maior
+nível sem erro e com p95 <= --p95-max. Cada requisição é de uma conta
+diferente, para medir a API e não a deduplicação de renovações.
+
+Montagem (ML simulado pelo stand-in, com latência de rede):
+    STANDIN_LATENCIA_MS=150 uvicorn ml_standin:app --port 8600
+    ML_API_URL=http://localhost:8600 uvicorn api:app --port 8501
+    python carga_api.py --semear 2000 --niveis 10,50,100,200,400,800
+
+As contas sintéticas (ml_user_id a partir de USER_ID_BASE) vão para a
+user_tokens do DB_URL, a mesma que o scheduler percorre. Ao fim da medição
+elas são apagadas (--manter as deixa para uma segunda rodada); depois de uma
+execução interrompida, `python carga_api.py --limpar` remove as que sobraram.
+De preferência, aponte API e carga para um banco descartável.
+
+Para o "antes", rode a mesma medição com a api.py síncrona (commit anterior).
+Lá cada renovação segura uma conexão do pool de ingestão (12 + 4) durante a
+chamada ao ML, então as requisições em voo param em ~16, abaixo até do
+threadpool do Starlette (40), e o p95 cresce linearmente acima disso.
+Com o ML lento (STANDIN_LATENCIA_MS=1000, --p95-max 2) o teto medido foi 10
+no síncrono (~15 req/s) e 40 no async (~46 req/s); com 150 ms, numa máquina
+de 1 vCPU com tudo junto, os dois ficam presos na CPU (~60 req/s).
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Dict, List
+
+import httpx
+
+USER_ID_BASE = 900_000_000      # contas sintéticas da carga (fora da faixa real do ML)
+
+
+def semear(n: int) -> None:
+    """Cria/renova n contas sintéticas em user_tokens com refresh_token aceito pelo stand-in."""
+    from datetime import datetime, timedelta
+
+    from sqlalchemy import text
+
+    from db import engine
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO user_tokens (ml_user_id, access_token, refresh_token, expires_at, nickname)
+            SELECT :base + i, 'APP_USR-carga', 'TG-' || (:base + i) || '-0', :exp, 'carga-' || i
+            FROM generate_series(0, :n - 1) AS i
+            ON CONFLICT (ml_user_id) DO UPDATE SET refresh_token = EXCLUDED.refresh_token
+        """), {"base": USER_ID_BASE, "n": n, "exp": datetime.utcnow() + timedelta(hours=6)})
+    print(f"🌱 {n} contas sintéticas prontas")
+
+
+def limpar() -> int:
+    """Apaga as contas sintéticas criadas por semear(); retorna quantas saíram."""
+    from sqlalchemy import text
+
+    from db import engine
+    with engine.begin() as conn:
+        n = conn.execute(text(
+            "DELETE FROM user_tokens WHERE ml_user_id >= :base AND ml_user_id < :base + 100000000"
+        ), {"base": USER_ID_BASE}).rowcount or 0
+    print(f"🧹 {n} contas sintéticas removidas")
+    return n
+
+
+async def _nivel(api: str, concorrencia: int, total: int, contas: int, timeout: float) -> Dict[str, float]:
+    latencias: List[float] = []
+    erros = 0
+    fila = asyncio.Queue()
+    for i in range(total):
+        fila.put_nowait(USER_ID_BASE + i % contas)
+
+    limites = httpx.Limits(max_connections=concorrencia, max_keepalive_connections=concorrencia)
+    async with httpx.AsyncClient(base_url=api, timeout=timeout, limits=limites) as http:
+        async def trabalhador():
+            nonlocal erros
+            while not fila.empty():
+                uid = fila.get_nowait()
+                t0 = time.perf_counter()
+                try:
+                    r = await http.post("/auth/refresh", json={"user_id": uid})
+                    if r.status_code != 200:
+                        erros += 1
+                except httpx.HTTPError:
+                    erros += 1
+                latencias.append(time.perf_counter() - t0)
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(trabalhador() for _ in range(concorrencia)))
+        duracao = time.perf_counter() - inicio
+
+    latencias.sort()
+    return {
+        "concorrencia": concorrencia,
+        "req_s": total / duracao,
+        "p50": statistics.median(latencias),
+        "p95": latencias[int(len(latencias) * 0.95) - 1],
+        "erros": erros,
+    }
+
+
+async def medir(api: str, niveis: List[int], por_nivel: int, contas: int, p95_max: float, timeout: float) -> int:
+    teto = 0
+    print(f"{'concorr.':>9} {'req/s':>9} {'p50 (s)':>9} {'p95 (s)':>9} {'erros':>7}")
+    for c in niveis:
+        r = await _nivel(api, c, max(por_nivel, c), contas, timeout)
+        print(f"{r['concorrencia']:>9} {r['req_s']:>9.1f} {r['p50']:>9.3f} {r['p95']:>9.3f} {r['erros']:>7}")
+        if r["erros"] == 0 and r["p95"] <= p95_max:
+            teto = c
+    print(f"🏁 Teto: {teto} requisições simultâneas (p95 <= {p95_max}s, sem erros)")
+    return teto
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--api", default="http://localhost:8501")
+    ap.add_argument("--semear", type=int, metavar="N", help="cria N contas sintéticas antes de medir")
+    ap.add_argument("--manter", action="store_true", help="não apaga as contas semeadas ao terminar")
+    ap.add_argument("--limpar", action="store_true", help="só apaga as contas sintéticas e sai")
+    ap.add_argument("--contas", type=int, default=2000, help="contas sintéticas usadas na carga")
+    ap.add_argument("--niveis", default="10,50,100,200,400", help="concorrências a medir")
+    ap.add_argument("--por-nivel", type=int, default=1000, help="requisições por nível")
+    ap.add_argument("--p95-max", type=float, default=1.0, help="p95 aceito no teto (s)")
+    ap.add_argument("--timeout", type=float, default=30.0)
+    args = ap.parse_args()
+
+    if args.limpar:
+        limpar()
+        raise SystemExit(0)
+    if args.semear:
+        semear(args.semear)
+    try:
+        asyncio.run(medir(args.api, [int(n) for n in args.niveis.split(",")], args.por_nivel,
+                          args.contas, args.p95_max, args.timeout))
+    finally:
+        if args.semear and not args.manter:
+            limpar()
@@ -0,0 +1,146 @@
+# cdc.py – leitura incremental do log de mudanças de vendas (sales_changes)
+"""
+O trigger `sales_cdc` (migrations/0002_sales_cdc.sql) grava em `sales_changes` toda
+inserção, alteração (só colunas que mudaram, valores antigo/novo) e remoção
+em `sales`, com `seq` crescente e o `txid` da transação.
+
+Consumidores (cache do app, agregados) guardam a posição em `cdc_cursors` e
+avançam só sobre o que mudou. A janela de leitura é por txid: `txid < xmin`
+do snapshot atual garante que todas aquelas transações já terminaram, então
+uma transação longa que pegou um `seq` baixo e comitou tarde não é pulada.
+
+    def aplicar(conn, mudancas):
+        ...                                   # mesma transação do cursor
+    consumir("agregado_diario", aplicar)
+"""
+from __future__ import annotations
+
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+
+LOTE_MAX = 50_000      # mudanças por chamada de consumir(); o resto fica para a próxima
+
+
+def versao_vendas(eng=None) -> Tuple[int, int, int]:
+    """
+    Versão de sales para chave de cache, sem varrer o log inteiro. Abaixo do
+    maior `last_txid` dos cursores tudo já comitou e não muda mais; a janela
+    acima dele, até o xmin atual (a mesma de consumir()), é só o que os
+    consumidores ainda não leram. A chave é (soma das versões dos cursores,
+    quantidade, maior seq da janela): uma mudança que termina de comitar
+    sempre cai na janela e altera a contagem (MAX(seq) sozinho não é ordem
+    de commit), e o piso só passa por mudanças que algum consumidor aplicou,
+    o que avança a versão dele. Rodada de consumidor sem mudanças não altera
+    a chave; com mudanças, invalida mais uma vez o que elas já invalidaram.
+    """
+    if eng is None:
+        from db import engine as eng
+    with eng.connect() as conn:
+        versao, qtd, seq = conn.execute(text("""
+            SELECT p.versao, COUNT(c.seq), COALESCE(MAX(c.seq), 0)
+            FROM (SELECT COALESCE(MAX(last_txid), 0) AS txid, COALESCE(SUM(versao), 0) AS versao
+                  FROM cdc_cursors) p
+            LEFT JOIN sales_changes c
+                   ON c.txid >= p.txid AND c.txid < txid_snapshot_xmin(txid_current_snapshot())
+            GROUP BY p.versao
+        """)).one()
+    return int(versao), int(qtd), int(seq)
+
+
+def cursor(consumidor: str, conn=None) -> Dict[str, int]:
+    from db import engine
+    q = text("SELECT last_txid, last_seq, versao FROM cdc_cursors WHERE consumer = :c")
+    if conn is None:
+        with engine.connect() as c:
+            row = c.execute(q, {"c": consumidor}).first()
+    else:
+        row = conn.execute(q, {"c": consumidor}).first()
+    if not row:
+        return {"last_txid": 0, "last_seq": 0, "versao": 0}
+    return {"last_txid": row.last_txid, "last_seq": row.last_seq, "versao": row.versao}
+
+
+def _salvar_cursor(conn, consumidor: str, last_txid: int, last_seq: int, aplicou: bool = True) -> None:
+    """Grava a posição; `versao` avança quando o consumidor aplicou algo (chave de cache de quem lê)."""
+    conn.execute(text("""
+        INSERT INTO cdc_cursors (consumer, last_txid, last_seq, versao, updated_at)
+        VALUES (:c, :txid, :seq, :passo, NOW())
+        ON CONFLICT (consumer) DO UPDATE SET
+            last_txid  = EXCLUDED.last_txid,
+            last_seq   = GREATEST(cdc_cursors.last_seq, EXCLUDED.last_seq),
+            versao     = cdc_cursors.versao + EXCLUDED.versao,
+            updated_at = NOW()
+    """), {"c": consumidor, "txid": last_txid, "seq": last_seq, "passo": int(aplicou)})
+
+
+def consumir(
+    consumidor: str,
+    processar: Callable[[Any, List[Dict[str, Any]]], None],
+    limite: int = LOTE_MAX,
+) -> int:
+    """
+    Entrega a `processar(conn, mudancas)` as mudanças ainda não consumidas, em
+    ordem de seq, e avança o cursor na MESMA transação — se `processar` falhar,
+    nada é confirmado e a próxima chamada relê a mesma janela.
+    Retorna a quantidade de mudanças processadas.
+    """
+    from db import engine
+    with engine.begin() as conn:
+        atual = conn.execute(text(
+            "SELECT last_txid, last_seq FROM cdc_cursors WHERE consumer = :c FOR UPDATE"
+        ), {"c": consumidor}).first()
+        de_txid = atual.last_txid if atual else 0
+        ate_txid = conn.execute(text("SELECT txid_snapshot_xmin(txid_current_snapshot())")).scalar()
+
+        rows = conn.execute(text("""
+            SELECT seq, txid, changed_at, op, order_id, ml_user_id, changed, old, new
+            FROM sales_changes
+            WHERE txid >= :de AND txid < :ate
+            ORDER BY txid, seq
+            LIMIT :lim
+        """), {"de": de_txid, "ate": ate_txid, "lim": limite + 1}).mappings().all()
+
+        if len(rows) > limite:
+            # corta numa fronteira de transação para não entregar uma pela metade
+            corte = rows[limite]["txid"]
+            rows = [r for r in rows[:limite] if r["txid"] < corte]
+            if not rows:
+                # uma única transação maior que o limite: entrega inteira
+                rows = conn.execute(text("""
+                    SELECT seq, txid, changed_at, op, order_id, ml_user_id, changed, old, new
+                    FROM sales_changes WHERE txid = :t ORDER BY seq
+                """), {"t": corte}).mappings().all()
+            ate_txid = corte if rows[-1]["txid"] < corte else corte + 1
+
+        mudancas = [dict(r) for r in rows]
+        if mudancas:
+            processar(conn, mudancas)
+        ultimo_seq = max((m["seq"] for m in mudancas), default=atual.last_seq if atual else 0)
+        _salvar_cursor(conn, consumidor, ate_txid, ultimo_seq, aplicou=bool(mudancas))
+
+    if mudancas:
+        logging.info(f"CDC {consumidor}: {len(mudancas)} mudanças (até seq {ultimo_seq})")
+    return len(mudancas)
+
+
+def pedidos_alterados(mudancas: List[Dict[str, Any]], colunas: Optional[set] = None) -> set:
+    """order_ids tocados; com `colunas`, só os updates que mexeram nelas (I/D sempre entram)."""
+    return {
+        m["order_id"] for m in mudancas
+        if m["op"] != "U" or colunas is None or colunas.intersection(m["changed"] or ())
+    }
+
+
+def podar(manter_dias: int = 30) -> int:
+    """Remove mudanças antigas já consumidas por todos os consumidores registrados."""
+    from db import engine
+    with engine.begin() as conn:
+        res = conn.execute(text("""
+            DELETE FROM sales_changes
+            WHERE changed_at < NOW() - make_interval(days => :dias)
+              AND txid < COALESCE((SELECT MIN(last_txid) FROM cdc_cursors), 0)
+        """), {"dias": manter_dias})
+        return res.rowcount or 0
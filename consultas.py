@@ -0,0 +1,279 @@
+# consultas.py – leituras de vendas com filtros e colunas empurrados para o SQL
+"""
+As páginas liam todas as colunas de todas as vendas de todas as contas
+(carregar_vendas no topo do app.py, a cada execução do script) e filtravam
+período, conta e status no pandas. Aqui cada página descreve o recorte que
+vai usar numa `Consulta` (colunas, período, contas, status) e recebe só
+essas linhas e colunas:
+
+    c = Consulta(("order_id", "date_adjusted", "total_amount"),
+                 desde=date(2025, 6, 1), ate=date(2025, 6, 30), contas=(123,), status="Pago")
+    sql, params = sql_vendas(c)
+    df = ler_vendas(c, engine)              # + meses arquivados em Parquet (arquivo.py)
+    agg = ler_agregado(c, engine)           # o mesmo recorte em sales_daily_agg
+
+`Consulta` é imutável e comparável: o app.py usa ela (mais a versão do CDC)
+como chave do cache. O período é em date_adjusted (Brasília); em sales ele
+também vira faixa em date_closed para o planner podar as partições.
+
+O resultado fica uma vez por processo (st.cache_resource), em vez de uma
+cópia deserializada por sessão a cada execução (st.cache_data): `congelar`
+monta a base com os textos em Arrow e `vista` entrega às páginas um DataFrame
+que compartilha os buffers dela (copy-on-write: escrever copia só a coluna).
+
+    python consultas.py --colunas order_id,total_amount --desde 2025-06-01 --ate 2025-06-07
+    python consultas.py --desde 2025-01-01 --sessoes 8     # tempo e RSS: pickle x vista
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import os
+import pickle
+import time
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from sqlalchemy import text
+
+from pnl import COLUNAS as COLUNAS_PNL
+
+# ---- Config ----
+FUSO_H = 3              # date_adjusted = date_closed - 3h (coluna gerada em sales)
+
+# nome no DataFrame -> expressão; o prefixo da expressão decide a junção
+COLUNAS_VENDAS: Dict[str, str] = {
+    **{c: f"s.{c}" for c in [
+        "order_id", "date_adjusted", "item_id", "item_title", "status", "quantity", "unit_price",
+        "total_amount", "ml_user_id", "buyer_nickname", "seller_sku", "custo_unitario", "quantity_sku",
+        "ml_fee", "level1", "level2", "ads", "payment_id", "shipment_status", "shipment_substatus",
+        "shipment_last_updated", "shipment_mode", "shipment_logistic_type", "shipment_list_cost",
+        "shipment_delivery_type", "shipment_receiver_name", "shipment_delivery_sla", "order_cost",
+        "base_cost", "shipment_cost", "frete_adjust",
+    ]},
+    **{c: f"p.{c}" for c in COLUNAS_PNL},          # resultado por pedido (pnl.py)
+    "nickname": "u.nickname",
+}
+COLUNAS_AGREGADO: Dict[str, str] = {
+    **{c: f"a.{c}" for c in [
+        "dia", "hora", "ml_user_id", "level1", "level2", "logistic_type", "status", "faixa_preco",
+        "vendas", "faturamento", "unidades", "frete", "taxa_ml", "cmv", "custo_flex", "margem_contribuicao",
+    ]},
+    "nickname": "u.nickname",
+}
+
+_JUNCOES = {
+    "p": "LEFT JOIN sales_pnl p ON p.order_id = s.order_id",
+    "u": "LEFT JOIN user_tokens u ON u.ml_user_id = {alias}.ml_user_id",
+}
+
+# traduzir_status (sales.py) em SQL, para o filtro de status ir para o banco
+_STATUS_SQL = {
+    "Pago":         "lower({col}) = 'paid'",
+    "Cancelado":    "COALESCE({col}, '') <> '' AND lower({col}) <> 'paid'",
+    "Desconhecido": "COALESCE({col}, '') = ''",
+}
+
+
+@dataclass(frozen=True)
+class Consulta:
+    """Recorte pedido por uma página. `status` usa os nomes exibidos (traduzir_status)."""
+    colunas: Tuple[str, ...]
+    desde: Optional[date] = None       # inclusivo
+    ate: Optional[date] = None         # inclusivo
+    contas: Optional[Tuple[int, ...]] = None
+    status: Optional[str] = None
+
+    def __post_init__(self):
+        # formas equivalentes viram a mesma chave de cache
+        object.__setattr__(self, "colunas", tuple(dict.fromkeys(self.colunas)))
+        if self.contas is not None:
+            object.__setattr__(self, "contas", tuple(sorted({int(c) for c in self.contas})))
+        if self.status is not None and self.status not in _STATUS_SQL:
+            raise ValueError(f"Status desconhecido: {self.status} (use {', '.join(_STATUS_SQL)})")
+
+
+def _montar(c: Consulta, colunas: Dict[str, str], origem: str, alias: str,
+            periodo: List[str]) -> Tuple[str, Dict]:
+    faltando = [n for n in c.colunas if n not in colunas]
+    if faltando:
+        raise ValueError(f"Colunas desconhecidas: {', '.join(faltando)}")
+    exprs = [colunas[n] for n in c.colunas]
+    juncoes = [_JUNCOES[j].format(alias=alias) for j in _JUNCOES if any(e.startswith(f"{j}.") for e in exprs)]
+
+    where: List[str] = []
+    params: Dict = {}
+    if c.desde is not None:
+        params["desde"] = c.desde
+    if c.ate is not None:
+        params["ate_fim"] = c.ate + timedelta(days=1)
+    where += [p for p in periodo if any(f":{k}" in p for k in params)]
+    if c.contas is not None:
+        where.append(f"{alias}.ml_user_id = ANY(:contas)")
+        params["contas"] = list(c.contas)
+    if c.status is not None:
+        where.append(_STATUS_SQL[c.status].format(col=f"{alias}.status"))
+
+    sql = (f"SELECT {', '.join(f'{e} AS {n}' for n, e in zip(c.colunas, exprs))}\n"
+           f"  FROM {origem}\n" + "".join(f"  {j}\n" for j in juncoes))
+    if where:
+        sql += " WHERE " + "\n   AND ".join(where)
+    return sql, params
+
+
+def sql_vendas(c: Consulta) -> Tuple[str, Dict]:
+    """SELECT em sales só com as colunas e filtros da consulta."""
+    return _montar(c, COLUNAS_VENDAS, "sales s", "s", [
+        # date_closed (chave de partição) poda os meses; date_adjusted corta as bordas
+        f"s.date_closed >= CAST(:desde AS timestamp) + interval '{FUSO_H} hours'",
+        f"s.date_closed < CAST(:ate_fim AS timestamp) + interval '{FUSO_H} hours'",
+        "s.date_adjusted >= :desde",
+        "s.date_adjusted < :ate_fim",
+    ])
+
+
+def sql_agregado(c: Consulta) -> Tuple[str, Dict]:
+    """O mesmo recorte em sales_daily_agg (dia já é a data em Brasília)."""
+    return _montar(c, COLUNAS_AGREGADO, "sales_daily_agg a", "a", [
+        "a.dia >= :desde",
+        "a.dia < :ate_fim",
+    ])
+
+
+def _engine(engine=None):
+    if engine is None:
+        from db import engine_analitico as engine
+    return engine
+
+
+def ler_vendas(c: Consulta, engine=None, arquivo: bool = True) -> pd.DataFrame:
+    """Vendas do recorte; meses arquivados (arquivo.py) entram com o mesmo recorte e colunas."""
+    from arquivo import unir_arquivo
+
+    eng = _engine(engine)
+    sql, params = sql_vendas(c)
+    df = pd.read_sql(text(sql), eng, params=params)
+    if not arquivo:
+        return df
+    return unir_arquivo(df, c.contas, c.desde, c.ate, engine=eng, status=c.status)
+
+
+def ler_agregado(c: Consulta, engine=None) -> pd.DataFrame:
+    sql, params = sql_agregado(c)
+    return pd.read_sql(text(sql), _engine(engine), params=params)
+
+
+def limites(contas: Optional[Iterable[int]] = None, agregado: bool = False,
+            engine=None) -> Tuple[Optional[date], Optional[date]]:
+    """Primeiro e último dia com venda (Brasília), para os seletores de período antes da leitura."""
+    params = {"contas": sorted(int(u) for u in contas)} if contas is not None else {}
+    filtro = "WHERE ml_user_id = ANY(:contas)" if contas is not None else ""
+    if agregado:
+        sql = f"SELECT MIN(dia), MAX(dia) FROM sales_daily_agg {filtro}"
+    else:
+        # date_closed usa o índice por partição; do arquivo, o manifesto tem o mês de date_closed
+        sql = f"""
+            SELECT LEAST(CAST(MIN(date_closed) - interval '{FUSO_H} hours' AS date),
+                         (SELECT CAST(MIN(mes) - interval '{FUSO_H} hours' AS date) FROM sales_arquivo {filtro})),
+                   CAST(MAX(date_closed) - interval '{FUSO_H} hours' AS date)
+              FROM sales {filtro}
+        """
+    with _engine(engine).connect() as conn:
+        return tuple(conn.execute(text(sql), params).one())
+
+
+# ----------------- Base compartilhada entre sessões -----------------
+def ativar_copy_on_write() -> None:
+    """pandas 2.x: liga o copy-on-write (padrão no 3.x); sem ele, `vista` escreveria na base."""
+    if int(pd.__version__.split(".")[0]) < 3:
+        pd.set_option("mode.copy_on_write", True)
+
+
+def _texto_arrow():
+    # NaN como nulo, como nas colunas object que as páginas já tratam (pd.NA quebraria `match`/`if`)
+    try:
+        return pd.StringDtype("pyarrow", na_value=np.nan)      # pandas >= 2.3
+    except TypeError:
+        return pd.StringDtype("pyarrow_numpy")                 # pandas 2.1/2.2
+
+
+def congelar(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Base para st.cache_resource: passa pela tabela Arrow e volta com os textos
+    em buffers Arrow (um bloco por coluna, não um str por célula); números e
+    datas seguem em numpy. Não deve ser alterada: as páginas usam `vista`.
+    """
+    try:
+        tabela = pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return df           # coluna com tipos misturados: fica como veio
+    texto = _texto_arrow()
+    return tabela.to_pandas(
+        types_mapper=lambda t: texto if pa.types.is_string(t) or pa.types.is_large_string(t) else None)
+
+
+def vista(base: pd.DataFrame) -> pd.DataFrame:
+    """DataFrame da página sobre os buffers da base; com copy-on-write, alterar copia só o que mudou."""
+    return base.copy(deep=False)
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3     # pico, não atual
+
+
+def medir_sessoes(df: pd.DataFrame, sessoes: int) -> Dict[str, Dict[str, float]]:
+    """
+    Custo por execução do script com `sessoes` sessões abertas: st.cache_data
+    (pickle.loads do valor guardado, uma cópia por sessão) x base única + vista.
+    Cada sessão ainda cria uma coluna, como as páginas fazem.
+    """
+    ativar_copy_on_write()
+    guardado = pickle.dumps(df)
+    resultado = {}
+    for nome, preparar, entregar in [
+        ("cache_resource", lambda: congelar(df), vista),
+        ("cache_data", lambda: guardado, pickle.loads),
+    ]:
+        gc.collect()
+        rss0 = _rss_mb()
+        valor = preparar()
+        t0 = time.perf_counter()
+        abertas = [entregar(valor) for _ in range(sessoes)]
+        ms = (time.perf_counter() - t0) * 1000 / sessoes
+        for d in abertas:
+            d["_pagina"] = 1
+        resultado[nome] = {"ms_por_sessao": ms, "rss_mb": _rss_mb() - rss0}
+        del abertas, valor
+    return resultado
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--colunas", default="order_id,date_adjusted,total_amount")
+    ap.add_argument("--desde", type=date.fromisoformat)
+    ap.add_argument("--ate", type=date.fromisoformat)
+    ap.add_argument("--contas", help="ml_user_ids separados por vírgula")
+    ap.add_argument("--status", choices=list(_STATUS_SQL))
+    ap.add_argument("--agregado", action="store_true", help="lê sales_daily_agg em vez de sales")
+    ap.add_argument("--sessoes", type=int, help="mede tempo por execução e RSS com N sessões")
+    args = ap.parse_args()
+
+    c = Consulta(tuple(args.colunas.split(",")), args.desde, args.ate,
+                 tuple(int(u) for u in args.contas.split(",")) if args.contas else None, args.status)
+    sql, params = (sql_agregado if args.agregado else sql_vendas)(c)
+    print(sql, params, sep="\n")
+    df = (ler_agregado if args.agregado else ler_vendas)(c)
+    print(f"{len(df)} linhas, {df.memory_usage(deep=True).sum() / 1e6:.1f} MB")
+    if args.sessoes:
+        for nome, m in medir_sessoes(df, args.sessoes).items():
+            print(f"⏱️ {nome}: {m['ms_por_sessao']:.1f} ms por sessão, +{m['rss_mb']:.1f} MB RSS "
+                  f"({args.sessoes} sessões)")
@@ -1,33 +1,214 @@
-# database/db.py (otimizado)
-import os
-from sqlalchemy import create_engine
+# database/db.py – conexão única com pools por tipo de carga (ui / ingestao / analitico) e réplica de leitura
+import threading
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, scoped_session
-from dotenv import load_dotenv
-from models import Base
-
-# Carrega variáveis de ambiente
-load_dotenv()
-DATABASE_URL = os.getenv("DB_URL")
-if not DATABASE_URL:
-    raise RuntimeError("❌ A variável de ambiente DB_URL não está definida.")
-
-# Criação do engine com otimização de pool
-engine = create_engine(
-    DATABASE_URL,
-    pool_size=20,            # Número máximo de conexões abertas
-    max_overflow=0,          # Número de conexões extras permitidas
-    pool_pre_ping=True,      # Verifica se a conexão está ativa antes de usá-la
-    pool_timeout=30          # Tempo máximo de espera por uma conexão (segundos)
-)
-
-# SessionLocal agora é uma sessão "scoped" para melhor gerenciamento em multithreading
-SessionLocal = scoped_session(
-    sessionmaker(autocommit=False, autoflush=False, bind=engine)
-)
-
-def init_db():
-    """Cria as tabelas no banco de dados."""
-    Base.metadata.create_all(bind=engine)
-
-# Inicializa as tabelas ao importar
-init_db()
+
+from replica import RoteadorLeitura, eh_escrita
+from settings import settings
+
+# Nada aqui conecta nem lê o ambiente ao importar: engines, pools e sessões são
+# criados no primeiro acesso (db.engine, from db import SessionLocal, ...), via
+# __getattr__ do módulo. O schema não é mais criado no import: `python migrate.py`
+# (start.sh roda antes de subir os serviços) aplica migrações e partições.
+
+# ----------------- Pools por tipo de carga -----------------
+# Cada carga tem pool, statement_timeout e application_name próprios: um backfill
+# esgota só o pool de ingestão, nunca o que o Dashboard usa, e as conexões
+# aparecem separadas em pg_stat_activity.
+def _perfis(cfg) -> Dict[str, Dict[str, int]]:
+    return {
+        # leituras interativas do Streamlit: respostas rápidas ou erro
+        "ui":        {"pool_size": cfg.db_pool_ui,        "max_overflow": 4,
+                      "statement_timeout_ms": cfg.db_timeout_ui_ms},
+        # sync, reconcile, scheduler, dead-letter: escritas em lote
+        "ingestao":  {"pool_size": cfg.db_pool_ingestao,  "max_overflow": 4,
+                      "statement_timeout_ms": cfg.db_timeout_ingestao_ms},
+        # cargas grandes (carregar_vendas completo, relatórios): poucas e longas
+        "analitico": {"pool_size": cfg.db_pool_analitico, "max_overflow": 2,
+                      "statement_timeout_ms": cfg.db_timeout_analitico_ms},
+    }
+
+
+_metricas: Dict[str, Dict[str, float]] = {}
+_metricas_lock = threading.Lock()
+
+
+def _instrumentar(perfil: str, eng: Engine, chave: Optional[str] = None) -> None:
+    m = _metricas.setdefault(chave or perfil, {"checkouts": 0, "em_uso": 0, "em_uso_max": 0, "no_limite": 0})
+    limite = PERFIS[perfil]["pool_size"] + PERFIS[perfil]["max_overflow"]
+
+    @event.listens_for(eng, "checkout")
+    def _checkout(*_args):
+        with _metricas_lock:
+            m["checkouts"] += 1
+            m["em_uso"] += 1
+            m["em_uso_max"] = max(m["em_uso_max"], m["em_uso"])
+            if m["em_uso"] >= limite:       # próximo pedido de conexão vai esperar
+                m["no_limite"] += 1
+
+    @event.listens_for(eng, "checkin")
+    def _checkin(*_args):
+        with _metricas_lock:
+            m["em_uso"] = max(m["em_uso"] - 1, 0)
+
+
+def url_psycopg(url: str) -> str:
+    """postgresql://... -> postgresql+psycopg://... (dialeto psycopg3, sync e async)."""
+    return "postgresql+psycopg://" + url.split("://", 1)[1]
+
+
+def _criar_engine(perfil: str, url: str, sufixo: str = "") -> Engine:
+    cfg = PERFIS[perfil]
+    # psycopg3: pipeline mode e COPY binário nas escritas em lote (ver escrita.py)
+    eng = create_engine(
+        url_psycopg(url),
+        pool_size=cfg["pool_size"],
+        max_overflow=cfg["max_overflow"],
+        pool_pre_ping=True,      # Verifica se a conexão está ativa antes de usá-la
+        pool_timeout=30,         # Tempo máximo de espera por uma conexão (segundos)
+        pool_recycle=1800,
+        connect_args={
+            "application_name": f"nexus-{perfil}{sufixo}",
+            "options": f"-c statement_timeout={cfg['statement_timeout_ms']}",
+        },
+    )
+    _instrumentar(perfil, eng, f"{perfil}{sufixo}")
+    return eng
+
+
+_iniciar_lock = threading.Lock()
+
+# nomes criados sob demanda (ver __getattr__ no fim do módulo)
+_SYNC = {"DATABASE_URL", "REPLICA_URL", "PERFIS", "engines", "engine_ui", "engine_ingestao",
+         "engine_analitico", "engine", "replicas", "roteadores", "SessionLocal"}
+_ASYNC = {"POOL_API", "engine_api", "AsyncSessionLocal"}
+
+
+def _iniciar() -> None:
+    """Cria os engines síncronos (sem abrir conexão) na primeira vez que um deles é pedido."""
+    global DATABASE_URL, REPLICA_URL, PERFIS, engines, engine_ui, engine_ingestao, engine_analitico
+    global engine, replicas, roteadores, SessionLocal
+    with _iniciar_lock:
+        if "SessionLocal" in globals():
+            return
+        cfg = settings().exigir("db_url")
+        DATABASE_URL = cfg.db_url
+        REPLICA_URL = cfg.db_replica_url
+        PERFIS = _perfis(cfg)
+
+        engines = {perfil: _criar_engine(perfil, DATABASE_URL) for perfil in PERFIS}
+        engine_ui        = engines["ui"]
+        engine_ingestao  = engines["ingestao"]
+        engine_analitico = engines["analitico"]
+
+        # `engine` continua sendo o de escrita (jobs, ingestão, reconcile)
+        engine = engine_ingestao
+
+        # ----------------- Réplica de leitura -----------------
+        # Só os perfis de leitura de página ganham pool na réplica; escrita é sempre no primário.
+        replicas = (
+            {perfil: _criar_engine(perfil, REPLICA_URL, "@replica") for perfil in ("ui", "analitico")}
+            if REPLICA_URL else {}
+        )
+        roteadores = {
+            perfil: RoteadorLeitura(engines[perfil], replicas.get(perfil)) for perfil in ("ui", "analitico")
+        }
+        if replicas:
+            for _eng in engines.values():
+                event.listen(_eng, "after_cursor_execute", _fixar_primario_apos_escrita)
+
+        # SessionLocal agora é uma sessão "scoped" para melhor gerenciamento em multithreading
+        SessionLocal = scoped_session(
+            sessionmaker(autocommit=False, autoflush=False, bind=engine_ingestao)
+        )
+
+
+def leitura(perfil: str = "ui") -> Engine:
+    """Engine para consultas só de leitura: réplica se configurada e em dia, senão o primário."""
+    _iniciar()
+    return roteadores[perfil].engine()
+
+
+def _fixar_primario_apos_escrita(_conn, _cursor, statement, *_args):
+    if eh_escrita(statement):
+        for r in roteadores.values():
+            r.fixar_primario()
+
+
+# ----------------- Async (api.py) -----------------
+# A API atende callbacks e renovações de token concorrentes num único worker:
+# asyncio em vez de threadpool. Mesmo banco e driver, pool próprio.
+def _iniciar_async() -> None:
+    global POOL_API, engine_api, AsyncSessionLocal
+    with _iniciar_lock:
+        if "AsyncSessionLocal" in globals():
+            return
+        cfg = settings().exigir("db_url")
+        POOL_API = cfg.db_pool_api
+        engine_api = create_async_engine(
+            url_psycopg(cfg.db_url),
+            pool_size=POOL_API,
+            max_overflow=POOL_API,
+            pool_pre_ping=True,
+            pool_recycle=1800,
+            connect_args={
+                "application_name": "nexus-api",
+                "options": "-c statement_timeout=30000",
+            },
+        )
+        AsyncSessionLocal = async_sessionmaker(engine_api, expire_on_commit=False)
+
+
+async def fechar_async() -> None:
+    """Fecha o pool async se ele chegou a ser criado (shutdown da API)."""
+    if "engine_api" in globals():
+        await engine_api.dispose()
+
+
+def metricas_pools() -> List[Dict[str, object]]:
+    """Uso de cada pool: tamanho, em uso agora/máximo, checkouts e vezes que chegou ao limite."""
+    _iniciar()
+    saida = []
+    todos = list(engines.items()) + [(f"{p}@replica", e) for p, e in replicas.items()]
+    for nome, eng in todos:
+        perfil = nome.split("@")[0]
+        m = _metricas.get(nome, {})
+        saida.append({
+            "pool": nome,
+            "tamanho": eng.pool.size(),
+            "overflow_max": PERFIS[perfil]["max_overflow"],
+            "em_uso": eng.pool.checkedout(),
+            "ociosas": eng.pool.checkedin(),
+            "em_uso_max": m.get("em_uso_max", 0),
+            "checkouts": m.get("checkouts", 0),
+            "no_limite": m.get("no_limite", 0),
+            "statement_timeout_ms": PERFIS[perfil]["statement_timeout_ms"],
+        })
+    return saida
+
+def init_db() -> List[str]:
+    """
+    Aplica as migrações pendentes (migrations/, ver migrate.py) e garante as
+    partições de sales. Não roda mais no import: `python migrate.py`.
+    """
+    from migrate import aplicar_migracoes
+    from particoes import garantir_particoes
+    _iniciar()
+    feitas = aplicar_migracoes(engine)
+    garantir_particoes(engine=engine)
+    return feitas
+
+
+def __getattr__(nome: str) -> Any:
+    # só chega aqui enquanto o nome ainda não existe no módulo; depois de criado é atributo comum
+    if nome in _SYNC:
+        _iniciar()
+    elif nome in _ASYNC:
+        _iniciar_async()
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {nome!r}")
+    return globals()[nome]
@@ -0,0 +1,196 @@
+# dead_letter.py – fila de pedidos com falha e reprocessamento direcionado
+"""
+Pedidos que falham em get_full_sales, get_incremental_sales,
+revisar_banco_de_dados ou reconciliar_vendas são gravados em `failed_orders`
+com a etapa, o status HTTP e o horário da próxima tentativa. O worker
+`reprocessar_falhas` busca e grava apenas esses pedidos, com backoff
+exponencial, em vez de repetir uma importação completa do período.
+
+    python dead_letter.py          # processa uma rodada de pendências
+"""
+from __future__ import annotations
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import requests
+from sqlalchemy import text
+
+
+# ---- Config ----
+BASE_RETRY_S   = 60            # 1ª nova tentativa após 1 min
+MAX_RETRY_S    = 6 * 3600      # teto do backoff
+MAX_TENTATIVAS = 8             # depois disso o pedido fica parado para análise manual
+API_TIMEOUT    = 12
+
+
+def intervalo_retry(tentativas: int) -> Optional[int]:
+    """
+    Segundos até a próxima tentativa depois de `tentativas` falhas seguidas:
+    60s, 120s, 240s... até MAX_RETRY_S. None a partir de MAX_TENTATIVAS — o
+    pedido fica parado para análise manual.
+    """
+    if tentativas >= MAX_TENTATIVAS:
+        return None
+    return min(MAX_RETRY_S, BASE_RETRY_S * 2 ** (tentativas - 1))
+
+
+def registrar_falha(
+    ml_user_id: str | int,
+    order_id: str | int,
+    etapa: str,
+    http_status: Optional[int] = None,
+    erro: Optional[str] = None,
+) -> None:
+    """
+    Grava (ou incrementa) a falha do pedido na etapa, com próxima tentativa
+    conforme `intervalo_retry`. Usa conexão própria para não depender do
+    commit/rollback da sessão de quem chamou, e nunca levanta exceção — a
+    ingestão não pode parar por causa da fila.
+    """
+    from db import engine
+    try:
+        with engine.begin() as conn:
+            # o upsert trava a linha até o fim da transação: o UPDATE abaixo usa a contagem certa
+            tentativas = conn.execute(text("""
+                INSERT INTO failed_orders
+                    (order_id, ml_user_id, stage, http_status, error, attempts,
+                     first_failed_at, last_failed_at, resolved_at)
+                VALUES
+                    (:oid, :uid, :etapa, :status, :erro, 1, NOW(), NOW(), NULL)
+                ON CONFLICT (order_id, stage) DO UPDATE SET
+                    http_status    = EXCLUDED.http_status,
+                    error          = EXCLUDED.error,
+                    attempts       = CASE WHEN failed_orders.resolved_at IS NULL
+                                          THEN failed_orders.attempts + 1 ELSE 1 END,
+                    last_failed_at = NOW(),
+                    resolved_at    = NULL
+                RETURNING attempts
+            """), {
+                "oid": int(order_id),
+                "uid": int(ml_user_id),
+                "etapa": etapa,
+                "status": http_status,
+                "erro": (erro or "")[:500] or None,
+            }).scalar()
+            # espera None (MAX_TENTATIVAS) deixa next_retry_at NULL: sai da fila automática
+            espera = intervalo_retry(tentativas)
+            conn.execute(text("""
+                UPDATE failed_orders
+                   SET next_retry_at = NOW() + make_interval(secs => CAST(:espera AS integer))
+                 WHERE order_id = :oid AND stage = :etapa
+            """), {"oid": int(order_id), "etapa": etapa, "espera": espera})
+    except Exception as e:
+        print(f"⚠️ Falha ao registrar pedido {order_id} na fila de reprocessamento: {e}")
+
+
+def marcar_resolvido(order_id: str | int) -> None:
+    """Marca como resolvidas todas as falhas pendentes do pedido (qualquer etapa)."""
+    from db import engine
+    with engine.begin() as conn:
+        conn.execute(text("""
+            UPDATE failed_orders
+               SET resolved_at = NOW()
+             WHERE order_id = :oid AND resolved_at IS NULL
+        """), {"oid": int(order_id)})
+
+
+def contar_pendentes(ml_user_id: str | int | None = None) -> int:
+    from db import engine
+    q = "SELECT COUNT(DISTINCT order_id) FROM failed_orders WHERE resolved_at IS NULL"
+    params = {}
+    if ml_user_id is not None:
+        q += " AND ml_user_id = :uid"
+        params["uid"] = int(ml_user_id)
+    with engine.connect() as conn:
+        return conn.execute(text(q), params).scalar() or 0
+
+
+def _pendentes_devidos(limite: int) -> List[Dict]:
+    """Pedidos com nova tentativa vencida (um registro por pedido)."""
+    from db import engine
+    with engine.connect() as conn:
+        rows = conn.execute(text("""
+            SELECT DISTINCT ON (order_id) order_id, ml_user_id, stage, attempts
+              FROM failed_orders
+             WHERE resolved_at IS NULL
+               AND attempts < :max_tentativas
+               AND next_retry_at <= NOW()
+             ORDER BY order_id, next_retry_at
+             LIMIT :limite
+        """), {"max_tentativas": MAX_TENTATIVAS, "limite": limite}).mappings().all()
+    return [dict(r) for r in rows]
+
+
+def _reprocessar_pedido(item: Dict, access_token: str) -> bool:
+    from db import SessionLocal
+    from sales import ML_API_URL, _order_to_sale, _upsert_sale
+
+    oid = str(item["order_id"])
+    uid = str(item["ml_user_id"])
+    try:
+        resp = requests.get(
+            f"{ML_API_URL}/orders/{oid}",
+            headers={"Authorization": f"Bearer {access_token}"},
+            timeout=API_TIMEOUT,
+        )
+    except requests.RequestException as e:
+        registrar_falha(uid, oid, item["stage"], None, str(e))
+        return False
+    if not resp.ok:
+        registrar_falha(uid, oid, item["stage"], resp.status_code, resp.text[:200])
+        return False
+
+    db = SessionLocal()
+    try:
+        nova_venda = _order_to_sale(resp.json(), uid, access_token, db)
+        _upsert_sale(db, nova_venda)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        registrar_falha(uid, oid, item["stage"], None, str(e))
+        return False
+    finally:
+        db.close()
+
+    marcar_resolvido(oid)
+    return True
+
+
+def reprocessar_falhas(limite: int = 500, max_workers: int = 8) -> Dict[str, int]:
+    """
+    Reprocessa apenas os pedidos da fila cuja próxima tentativa já venceu.
+    Retorna: {"reprocessadas": X, "falhas": Y}
+    """
+    from oauth import token_valido
+
+    itens = _pendentes_devidos(limite)
+    if not itens:
+        logging.info("Fila de reprocessamento vazia.")
+        return {"reprocessadas": 0, "falhas": 0}
+
+    por_conta: Dict[int, List[Dict]] = {}
+    for it in itens:
+        por_conta.setdefault(it["ml_user_id"], []).append(it)
+
+    ok = falhas = 0
+    for ml_user_id, lista in por_conta.items():
+        token = token_valido(int(ml_user_id))
+        if not token:
+            logging.warning(f"Conta {ml_user_id} sem token; {len(lista)} pedidos continuam na fila.")
+            falhas += len(lista)
+            continue
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            resultados = list(pool.map(lambda it: _reprocessar_pedido(it, token), lista))
+        ok += sum(resultados)
+        falhas += len(resultados) - sum(resultados)
+        logging.info(f"♻️ {ml_user_id} — {sum(resultados)}/{len(lista)} pedidos reprocessados")
+
+    return {"reprocessadas": ok, "falhas": falhas}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    logging.info(f"Resumo: {reprocessar_falhas()}")
@@ -0,0 +1,8 @@
+#!/bin/bash
+# Roda uma vez na criação do primário (docker-entrypoint-initdb.d): usuário de
+# replicação e liberação no pg_hba para o standby fazer pg_basebackup/streaming.
+set -e
+psql -v ON_ERROR_STOP=1 --username "$POSTGRES_USER" --dbname "$POSTGRES_DB" <<-SQL
+    CREATE ROLE replicador WITH REPLICATION LOGIN PASSWORD 'replicador';
+SQL
+echo "host replication replicador all scram-sha-256" >> "$PGDATA/pg_hba.conf"
@@ -0,0 +1,222 @@
+# drift_sampling.py – amostragem estratificada de divergências DB × API
+"""
+Em vez de reconciliar 180 dias de todas as contas às cegas, re-checa contra a
+API uma amostra aleatória de pedidos por estrato (conta, mês, status), estima
+a taxa de divergência de cada estrato com intervalo de Wilson e agenda a
+reconciliação completa (reconcile_schedule vencido agora) só dos estratos em
+que o limite inferior do intervalo passa de LIMIAR_DRIFT — ou seja, onde há
+evidência de drift, não só ruído de amostra pequena.
+
+Só lê: nada é gravado em sales; a correção fica com o reconcile por tier.
+
+    python drift_sampling.py            # todas as contas, últimos 180 dias
+"""
+from __future__ import annotations
+
+import logging
+import math
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import select, text
+
+from models import Sale
+
+# ---- Config ----
+AMOSTRA_POR_ESTRATO = 20
+LIMIAR_DRIFT        = 0.01      # agenda se o limite inferior da taxa passar disso
+Z_CONFIANCA         = 1.96      # 95%
+MAX_WORKERS         = 8
+
+
+def intervalo_wilson(divergentes: int, n: int, z: float = Z_CONFIANCA) -> Tuple[float, float]:
+    """Intervalo de Wilson para a proporção divergentes/n (bom com n pequeno e p perto de 0)."""
+    if n <= 0:
+        return 0.0, 1.0
+    p = divergentes / n
+    den = 1 + z * z / n
+    centro = (p + z * z / (2 * n)) / den
+    meia = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / den
+    return max(0.0, centro - meia), min(1.0, centro + meia)
+
+
+def _comparavel(coluna: str, valor: Any) -> Any:
+    """
+    Valor da coluna no formato em que o banco o devolve, já normalizado como no
+    fingerprint. O Sale montado da API traz tipos do JSON (shipping_id int,
+    datas com fuso): sem converter, toda venda amostrada sairia divergente.
+    """
+    from reconcile import _normalize
+    if valor is None:
+        return None
+    try:
+        tipo = Sale.__table__.c[coluna].type.python_type
+    except (KeyError, NotImplementedError):
+        return _normalize(valor)
+    if tipo is str and not isinstance(valor, str):
+        valor = str(valor)
+    elif tipo is int and isinstance(valor, (str, float)):
+        valor = int(valor)
+    return _normalize(valor)
+
+
+def colunas_divergentes(db_row: Any, api_sale: Any, cols) -> List[str]:
+    """Colunas em que a venda gravada difere da montada a partir da API."""
+    return sorted(
+        c for c in cols
+        if _comparavel(c, getattr(db_row, c, None)) != _comparavel(c, getattr(api_sale, c, None))
+    )
+
+
+def _amostra(ml_user_id: str, desde: datetime, ate: datetime, n: int) -> List[Dict[str, Any]]:
+    """Até `n` pedidos aleatórios por (mês, status), com o tamanho de cada estrato."""
+    from db import engine
+    with engine.connect() as conn:
+        rows = conn.execute(text("""
+            SELECT order_id, mes, status, total
+            FROM (
+                SELECT order_id,
+                       date_trunc('month', date_closed) AS mes,
+                       status,
+                       row_number() OVER w AS rn,
+                       count(*)     OVER (PARTITION BY date_trunc('month', date_closed), status) AS total
+                FROM sales
+                WHERE ml_user_id = :uid AND date_closed BETWEEN :desde AND :ate
+                WINDOW w AS (PARTITION BY date_trunc('month', date_closed), status ORDER BY random())
+            ) x
+            WHERE rn <= :n
+        """), {"uid": int(ml_user_id), "desde": desde, "ate": ate, "n": n}).mappings().all()
+    return [dict(r) for r in rows]
+
+
+def _token(ml_user_id: str) -> Optional[str]:
+    from oauth import token_valido
+    return token_valido(int(ml_user_id))
+
+
+def amostrar_conta(
+    ml_user_id: str,
+    desde: datetime | None = None,
+    ate: datetime | None = None,
+    n_por_estrato: int = AMOSTRA_POR_ESTRATO,
+    limiar: float = LIMIAR_DRIFT,
+) -> List[Dict[str, Any]]:
+    """
+    Checa a amostra da conta contra a API e devolve um resumo por estrato:
+    total, amostra, divergentes, taxa, lim_inf, lim_sup, drift (bool) e colunas mais divergentes.
+    Pedidos que falham no fetch ficam fora da conta (não contam como iguais).
+    """
+    from db import SessionLocal
+    from reconcile import _build_http_session, _fetch_full_order, colunas_reconciliaveis
+    from sales import _order_to_sale
+
+    ate = ate or datetime.now(timezone.utc)
+    desde = desde or ate - timedelta(days=180)
+    amostra = _amostra(ml_user_id, desde, ate, n_por_estrato)
+    if not amostra:
+        return []
+
+    token = _token(ml_user_id)
+    if not token:
+        raise RuntimeError(f"Usuário {ml_user_id} sem token.")
+    http = _build_http_session(token)
+    cols = colunas_reconciliaveis()
+
+    with SessionLocal() as db:
+        salvas = {
+            s.order_id: s for s in db.execute(
+                select(Sale).where(Sale.order_id.in_([a["order_id"] for a in amostra]))
+            ).scalars()
+        }
+
+    def checar(item) -> Optional[List[str]]:
+        data, _status = _fetch_full_order(str(item["order_id"]), http)
+        db_row = salvas.get(item["order_id"])
+        if data is None or db_row is None:
+            return None
+        api_sale = _order_to_sale(data, ml_user_id, token)
+        return colunas_divergentes(db_row, api_sale, cols)
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        resultados = list(pool.map(checar, amostra))
+
+    estratos: Dict[Tuple[Any, Any], Dict[str, Any]] = {}
+    for item, diff in zip(amostra, resultados):
+        e = estratos.setdefault((item["mes"], item["status"]), {
+            "ml_user_id": str(ml_user_id), "mes": item["mes"], "status": item["status"],
+            "total": item["total"], "amostra": 0, "divergentes": 0, "falhas": 0, "colunas": Counter(),
+        })
+        if diff is None:
+            e["falhas"] += 1
+            continue
+        e["amostra"] += 1
+        if diff:
+            e["divergentes"] += 1
+            e["colunas"].update(diff)
+
+    resumo = []
+    for e in estratos.values():
+        lim_inf, lim_sup = intervalo_wilson(e["divergentes"], e["amostra"])
+        e["taxa"] = e["divergentes"] / e["amostra"] if e["amostra"] else None
+        e["lim_inf"], e["lim_sup"] = lim_inf, lim_sup
+        e["drift"] = e["amostra"] > 0 and lim_inf > limiar
+        e["divergentes_estimados"] = round((e["taxa"] or 0) * e["total"])
+        e["colunas"] = ", ".join(c for c, _ in e["colunas"].most_common(3))
+        resumo.append(e)
+    resumo.sort(key=lambda e: (e["mes"], e["status"] or ""))
+    return resumo
+
+
+def agendar_estratos(estratos: List[Dict[str, Any]]) -> int:
+    """Vence agora, na agenda por tier, todos os pedidos dos estratos com drift."""
+    from db import engine
+    from reconcile_tiers import sincronizar_agenda
+
+    total = 0
+    for uid in {e["ml_user_id"] for e in estratos if e["drift"]}:
+        sincronizar_agenda(uid)
+    with engine.begin() as conn:
+        for e in estratos:
+            if not e["drift"]:
+                continue
+            res = conn.execute(text("""
+                UPDATE reconcile_schedule rs
+                   SET next_check_at = NOW()
+                  FROM sales s
+                 WHERE rs.order_id = s.order_id
+                   AND s.ml_user_id = :uid
+                   AND s.date_closed >= :mes AND s.date_closed < :mes + interval '1 month'
+                   AND s.status IS NOT DISTINCT FROM :status
+                   AND rs.next_check_at > NOW()
+            """), {"uid": int(e["ml_user_id"]), "mes": e["mes"], "status": e["status"]})
+            total += res.rowcount or 0
+    return total
+
+
+def amostrar_e_agendar(ml_user_ids: List[str], desde: datetime | None = None,
+                       ate: datetime | None = None) -> Dict[str, Any]:
+    """Amostra todas as contas e agenda o reconcile dos estratos com drift."""
+    estratos: List[Dict[str, Any]] = []
+    for uid in ml_user_ids:
+        try:
+            estratos += amostrar_conta(uid, desde, ate)
+        except Exception as e:
+            logging.exception(f"❌ Amostragem {uid}: {e}")
+    agendados = agendar_estratos(estratos)
+    checados = sum(e["amostra"] for e in estratos)
+    cobertos = sum(e["total"] for e in estratos)
+    logging.info(
+        f"Drift: {checados} pedidos checados de {cobertos} | "
+        f"{sum(e['drift'] for e in estratos)}/{len(estratos)} estratos com drift | {agendados} pedidos agendados"
+    )
+    return {"estratos": estratos, "agendados": agendados, "checados": checados}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    from db import engine
+    with engine.connect() as conn:
+        contas = [str(u) for u in conn.execute(text("SELECT DISTINCT ml_user_id FROM user_tokens")).scalars()]
+    amostrar_e_agendar(contas)
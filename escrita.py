@@ -0,0 +1,186 @@
+# escrita.py – escrita em lote com psycopg3: pipeline mode e COPY binário
+"""
+Caminhos de escrita pesada (fees pendentes, reconcile, importação de planilhas,
+planilha de SKU) gastavam uma ida e volta ao banco por linha. Aqui ficam os
+dois atalhos do psycopg3 que eles usam:
+
+    executar_em_lote(conn, sql, linhas)   mesmo comando para N linhas num único
+                                          pipeline (os comandos vão sem esperar
+                                          a resposta do anterior)
+    copiar(conn, tabela, colunas, linhas) COPY ... FROM STDIN (FORMAT BINARY)
+
+Os dois recebem a Connection do SQLAlchemy e rodam na transação dela; o SQL do
+executar_em_lote usa os mesmos :parametros do text().
+
+Benchmark (tabela temporária, não toca em dados):
+    python escrita.py --bench 10000,100000
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+# ---- Config ----
+BENCH_TABELA = "_bench_escrita"
+
+_INTEIROS = {"int2", "int4", "int8"}
+_REAIS    = {"float4", "float8"}
+_TEXTOS   = {"text", "varchar", "bpchar"}
+
+
+def _vazio(v: Any) -> bool:
+    # NaN/NaT vindos do pandas são diferentes de si mesmos
+    return v is None or (not isinstance(v, (str, bytes)) and v != v)
+
+
+def _coagir(v: Any, tipo: str) -> Any:
+    """Valor no tipo Python que o dumper binário da coluna espera (COPY binário não converte)."""
+    if _vazio(v):
+        return None
+    if tipo in _INTEIROS:
+        return int(v)
+    if tipo == "numeric":
+        return v if isinstance(v, Decimal) else Decimal(str(v))
+    if tipo in _REAIS:
+        return float(v)
+    if tipo in _TEXTOS:
+        return v if isinstance(v, str) else str(v)
+    if tipo == "bool":
+        return bool(v)
+    # o dumper binário não faz a conversão que o servidor faria com um literal:
+    # datetime sem fuso é tratado como UTC (TimeZone do banco) e vice-versa
+    if tipo == "timestamptz" and isinstance(v, datetime) and v.tzinfo is None:
+        return v.replace(tzinfo=timezone.utc)
+    if tipo == "timestamp" and isinstance(v, datetime) and v.tzinfo is not None:
+        return v.astimezone(timezone.utc).replace(tzinfo=None)
+    if tipo == "date" and isinstance(v, datetime):
+        return v.date()
+    if hasattr(v, "item"):              # escalares numpy
+        return v.item()
+    return v
+
+
+def _avisar_escrita(conn: Connection, cur, sql: str, muitos: bool) -> None:
+    # o cursor é do driver: dispara o evento do SQLAlchemy para os listeners
+    # (ex.: db.py fixa as leituras no primário depois de uma escrita)
+    conn.dispatch.after_cursor_execute(conn, cur, sql, (), None, muitos)
+
+
+def executar_em_lote(conn: Connection, sql: str, linhas: Sequence[Mapping[str, Any]]) -> int:
+    """Executa `sql` (com :parametros) uma vez por linha num pipeline. Retorna as linhas afetadas."""
+    if not linhas:
+        return 0
+    compilado = str(text(sql).compile(dialect=conn.dialect))
+    raw = conn.connection.driver_connection
+    with raw.cursor() as cur, raw.pipeline() as pipeline:
+        cur.executemany(compilado, linhas)
+        pipeline.sync()                 # traz os resultados (e erros) antes de ler rowcount
+        afetadas = max(cur.rowcount, 0)
+    _avisar_escrita(conn, cur, compilado, True)
+    return afetadas
+
+
+def tipos_colunas(conn: Connection, tabela: str) -> Dict[str, str]:
+    """Nome do tipo (pg_type.typname) de cada coluna de `tabela` (tabelas temporárias inclusive)."""
+    rows = conn.execute(text("""
+        SELECT a.attname, t.typname
+        FROM pg_attribute a
+        JOIN pg_type t ON t.oid = a.atttypid
+        WHERE a.attrelid = CAST(:tabela AS regclass) AND a.attnum > 0 AND NOT a.attisdropped
+    """), {"tabela": tabela})
+    return {r.attname: r.typname for r in rows}
+
+
+def copiar(conn: Connection, tabela: str, colunas: Sequence[str],
+           linhas: Iterable[Sequence[Any]], tipos: Optional[Dict[str, str]] = None) -> int:
+    """COPY binário de `linhas` (tuplas na ordem de `colunas`) para `tabela`. Retorna quantas foram."""
+    tipos = tipos or tipos_colunas(conn, tabela)
+    faltando = [c for c in colunas if c not in tipos]
+    if faltando:
+        raise ValueError(f"Colunas inexistentes em {tabela}: {', '.join(faltando)}")
+    nomes = [tipos[c] for c in colunas]
+
+    sql = f"COPY {tabela} ({', '.join(colunas)}) FROM STDIN (FORMAT BINARY)"
+    raw = conn.connection.driver_connection
+    n = 0
+    with raw.cursor() as cur:
+        with cur.copy(sql) as cp:
+            cp.set_types(nomes)
+            for linha in linhas:
+                cp.write_row([_coagir(v, t) for v, t in zip(linha, nomes)])
+                n += 1
+    _avisar_escrita(conn, cur, sql, False)
+    return n
+
+
+def copiar_df(conn: Connection, tabela: str, df) -> int:
+    """COPY binário de um DataFrame (colunas = colunas da tabela; NaN/NaT viram NULL)."""
+    return copiar(conn, tabela, [str(c) for c in df.columns],
+                  df.astype(object).itertuples(index=False, name=None))
+
+
+# ---- Benchmark ----
+def _bench(eng, n: int) -> List[Dict[str, Any]]:
+    from datetime import timedelta
+
+    import pandas as pd
+
+    t0 = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    linhas = [(i, 2_000_000_000 + i, Decimal(i % 997) / 10, f"SKU-{i % 500}", t0 + timedelta(minutes=i))
+              for i in range(n)]
+    colunas = ["id", "order_id", "ml_fee", "seller_sku", "date_closed"]
+    fees = [{"fee": Decimal(i % 313) / 10, "oid": 2_000_000_000 + i} for i in range(n)]
+    ddl = f"""
+        CREATE TEMP TABLE {BENCH_TABELA} (id bigint PRIMARY KEY, order_id bigint, ml_fee numeric(12,2),
+                                          seller_sku varchar(100), date_closed timestamptz)
+        ON COMMIT DROP
+    """
+    atualizar = f"UPDATE {BENCH_TABELA} SET ml_fee = :fee WHERE id = :oid - 2000000000"
+    resultados = []
+
+    def medir(nome, fn, carregada=False):
+        with eng.begin() as conn:
+            conn.execute(text(ddl))
+            if carregada:               # UPDATEs medem só a atualização, com a tabela já cheia
+                copiar(conn, BENCH_TABELA, colunas, linhas)
+            inicio = time.perf_counter()
+            fn(conn)
+            resultados.append({"n": n, "caminho": nome, "s": time.perf_counter() - inicio})
+
+    def inserir_por_linha(conn):
+        for l in linhas:
+            conn.execute(text(f"INSERT INTO {BENCH_TABELA} VALUES (:a, :b, :c, :d, :e)"),
+                         dict(zip("abcde", l)))
+
+    def inserir_to_sql(conn):
+        df = pd.DataFrame(linhas, columns=colunas).astype({"ml_fee": float})
+        df.to_sql(BENCH_TABELA, con=conn, if_exists="append", index=False)
+
+    def atualizar_por_linha(conn):
+        for f in fees:
+            conn.execute(text(atualizar), f)
+
+    medir("INSERT linha a linha", inserir_por_linha)
+    medir("pandas to_sql", inserir_to_sql)
+    medir("COPY binário", lambda conn: copiar(conn, BENCH_TABELA, colunas, linhas))
+    medir("UPDATE linha a linha", atualizar_por_linha, carregada=True)
+    medir("UPDATE pipeline", lambda conn: executar_em_lote(conn, atualizar, fees), carregada=True)
+    return resultados
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--bench", default="10000,100000", help="tamanhos (linhas) a medir")
+    args = ap.parse_args()
+
+    from db import engine
+    print(f"{'linhas':>8}  {'caminho':<22} {'s':>8} {'linhas/s':>10}")
+    for n in [int(x) for x in args.bench.split(",")]:
+        for r in _bench(engine, n):
+            print(f"{r['n']:>8}  {r['caminho']:<22} {r['s']:>8.2f} {r['n'] / r['s']:>10.0f}")
@@ -0,0 +1,147 @@
+# migrate.py – migrações SQL versionadas (migrations/NNNN_nome.sql)
+"""
+Substitui o `create_all` + lista de DDL solta do db.py. Cada arquivo em
+migrations/ é aplicado uma única vez, em ordem de número, e registrado em
+`schema_migrations` com checksum e duração. Um advisory lock impede que app,
+API e scheduler subindo juntos apliquem a mesma migração em paralelo.
+
+Arquivos que começam com `-- migrate: no-transaction` (CREATE INDEX
+CONCURRENTLY, por exemplo) rodam comando a comando em autocommit; os demais
+rodam inteiros numa transação junto com o registro em schema_migrations.
+
+É o comando explícito de schema: importar db não cria nada (start.sh roda
+este script antes de subir API, scheduler e Streamlit).
+
+    python migrate.py              # aplica o que falta e garante as partições de sales
+    python migrate.py --status     # lista aplicadas / pendentes
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import logging
+import re
+import time
+from pathlib import Path
+from typing import Dict, List, NamedTuple
+
+from sqlalchemy.engine import Engine
+
+PASTA = Path(__file__).resolve().parent / "migrations"
+SEM_TRANSACAO = "-- migrate: no-transaction"
+_LOCK = 7_310_037          # chave do pg_advisory_lock das migrações
+
+_DDL_CONTROLE = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version     INTEGER PRIMARY KEY,
+        name        VARCHAR NOT NULL,
+        checksum    VARCHAR(64) NOT NULL,
+        applied_at  TIMESTAMPTZ NOT NULL DEFAULT now(),
+        duration_ms INTEGER
+    )
+"""
+
+
+class Migracao(NamedTuple):
+    versao: int
+    nome: str
+    sql: str
+    checksum: str
+
+    @property
+    def sem_transacao(self) -> bool:
+        return self.sql.lstrip().startswith(SEM_TRANSACAO)
+
+
+def carregar(pasta: Path = PASTA) -> List[Migracao]:
+    """Migrações do diretório, em ordem de versão (prefixo numérico do arquivo)."""
+    migracoes = []
+    for arq in sorted(pasta.glob("*.sql")):
+        m = re.match(r"(\d+)_(.+)\.sql$", arq.name)
+        if not m:
+            raise ValueError(f"Nome de migração inválido: {arq.name} (esperado NNNN_nome.sql)")
+        sql = arq.read_text(encoding="utf-8")
+        migracoes.append(Migracao(int(m.group(1)), m.group(2), sql, hashlib.sha256(sql.encode()).hexdigest()))
+    versoes = [m.versao for m in migracoes]
+    if len(versoes) != len(set(versoes)):
+        raise ValueError(f"Versões de migração repetidas em {pasta}")
+    return migracoes
+
+
+def _comandos(sql: str) -> List[str]:
+    """Divide um arquivo sem transação em comandos (não suporta `;` dentro de $$ ... $$)."""
+    sem_comentarios = "\n".join(l for l in sql.splitlines() if not l.strip().startswith("--"))
+    return [c.strip() for c in sem_comentarios.split(";") if c.strip()]
+
+
+def _executar(conn, sql: str) -> None:
+    """
+    Roda um script de migração direto no cursor do driver e sem parâmetros: o
+    psycopg3 então não trata `%` (RAISE '... %', LIKE 'x%') como marcador.
+    """
+    with conn.connection.driver_connection.cursor() as cur:
+        cur.execute(sql)
+
+
+def aplicadas(engine: Engine) -> Dict[int, str]:
+    with engine.begin() as conn:
+        conn.exec_driver_sql(_DDL_CONTROLE)
+        return {v: c for v, c in conn.exec_driver_sql("SELECT version, checksum FROM schema_migrations")}
+
+
+def aplicar_migracoes(engine: Engine, pasta: Path = PASTA) -> List[str]:
+    """Aplica as migrações pendentes; retorna os nomes aplicadas nesta chamada."""
+    migracoes = carregar(pasta)
+    feitas: List[str] = []
+    with engine.connect() as lock_conn:
+        lock_conn.exec_driver_sql(f"SELECT pg_advisory_lock({_LOCK})")
+        lock_conn.commit()
+        try:
+            ja = aplicadas(engine)
+            for m in migracoes:
+                if m.versao in ja:
+                    if ja[m.versao] != m.checksum:
+                        logging.warning(f"⚠️ Migração {m.versao:04d}_{m.nome} foi alterada depois de aplicada.")
+                    continue
+                inicio = time.perf_counter()
+                if m.sem_transacao:
+                    with engine.connect() as conn:
+                        conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+                        for comando in _comandos(m.sql):
+                            _executar(conn, comando)
+                    with engine.begin() as conn:
+                        _registrar(conn, m, inicio)
+                else:
+                    with engine.begin() as conn:
+                        _executar(conn, m.sql)
+                        _registrar(conn, m, inicio)
+                logging.info(f"🧱 Migração {m.versao:04d}_{m.nome} aplicada")
+                feitas.append(f"{m.versao:04d}_{m.nome}")
+        finally:
+            lock_conn.exec_driver_sql(f"SELECT pg_advisory_unlock({_LOCK})")
+            lock_conn.commit()
+    return feitas
+
+
+def _registrar(conn, m: Migracao, inicio: float) -> None:
+    conn.exec_driver_sql(
+        "INSERT INTO schema_migrations (version, name, checksum, duration_ms) VALUES (%s, %s, %s, %s)",
+        (m.versao, m.nome, m.checksum, int((time.perf_counter() - inicio) * 1000)),
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--status", action="store_true", help="lista migrações aplicadas e pendentes")
+    args = ap.parse_args()
+
+    import db
+    if args.status:
+        ja = aplicadas(db.engine)
+        for m in carregar():
+            marca = "✅" if m.versao in ja else "⏳"
+            alterada = "  (alterada!)" if m.versao in ja and ja[m.versao] != m.checksum else ""
+            print(f"{marca} {m.versao:04d}_{m.nome}{alterada}")
+    else:
+        print("\n".join(db.init_db()) or "Nada a aplicar.")
@@ -0,0 +1,210 @@
+-- 0001 – esquema base
+-- Tudo que já existia em produção (create_all + tabelas criadas à mão pelas
+-- páginas do Streamlit), escrito de forma idempotente: num banco existente só
+-- completa o que faltar; num banco vazio cria o esquema inteiro.
+
+CREATE TABLE IF NOT EXISTS user_tokens (
+    id            BIGSERIAL PRIMARY KEY,
+    ml_user_id    BIGINT,
+    access_token  VARCHAR NOT NULL,
+    refresh_token VARCHAR NOT NULL,
+    expires_at    TIMESTAMP NOT NULL,
+    nickname      VARCHAR
+);
+ALTER TABLE user_tokens ADD COLUMN IF NOT EXISTS nickname VARCHAR;
+CREATE UNIQUE INDEX IF NOT EXISTS ix_user_tokens_ml_user_id ON user_tokens (ml_user_id);
+CREATE INDEX IF NOT EXISTS ix_user_tokens_id ON user_tokens (id);
+
+CREATE TABLE IF NOT EXISTS sales (
+    id                     BIGSERIAL PRIMARY KEY,
+    order_id               BIGINT NOT NULL,
+    ml_user_id             BIGINT NOT NULL,
+    buyer_id               BIGINT,
+    buyer_nickname         VARCHAR,
+    total_amount           FLOAT,
+    status                 VARCHAR,
+    date_closed            TIMESTAMP NOT NULL,
+    item_id                VARCHAR,
+    item_title             VARCHAR,
+    quantity               INTEGER,
+    unit_price             FLOAT,
+    shipping_id            VARCHAR,
+    seller_sku             VARCHAR,
+    quantity_sku           INTEGER,
+    custo_unitario         NUMERIC(10, 2),
+    level1                 VARCHAR,
+    level2                 VARCHAR,
+    ads                    NUMERIC(10, 2),
+    ml_fee                 NUMERIC(10, 2),
+    payment_id             BIGINT,
+    shipment_status        VARCHAR,
+    shipment_substatus     VARCHAR,
+    shipment_last_updated  TIMESTAMP,
+    shipment_mode          VARCHAR,
+    shipment_logistic_type VARCHAR,
+    shipment_list_cost     FLOAT,
+    shipment_delivery_type VARCHAR,
+    shipment_receiver_name VARCHAR,
+    shipment_delivery_sla  TIMESTAMPTZ,
+    order_cost             NUMERIC(10, 2),
+    base_cost              NUMERIC(10, 2),
+    shipment_cost          NUMERIC(10, 2)
+);
+-- date_closed é gravado em UTC; date_adjusted é o mesmo instante no horário de Brasília
+ALTER TABLE sales ADD COLUMN IF NOT EXISTS date_adjusted TIMESTAMP
+    GENERATED ALWAYS AS (date_closed - interval '3 hours') STORED;
+ALTER TABLE sales ADD COLUMN IF NOT EXISTS frete_adjust NUMERIC(10, 2);
+ALTER TABLE sales ADD COLUMN IF NOT EXISTS row_hash VARCHAR(32);
+CREATE UNIQUE INDEX IF NOT EXISTS ix_sales_order_id ON sales (order_id);
+CREATE INDEX IF NOT EXISTS ix_sales_ml_user_id ON sales (ml_user_id);
+CREATE INDEX IF NOT EXISTS ix_sales_id ON sales (id);
+CREATE INDEX IF NOT EXISTS ix_sales_shipment_open ON sales (shipment_status, shipment_delivery_sla);
+
+CREATE TABLE IF NOT EXISTS failed_orders (
+    id              BIGSERIAL PRIMARY KEY,
+    order_id        BIGINT NOT NULL,
+    ml_user_id      BIGINT NOT NULL,
+    stage           VARCHAR NOT NULL,
+    http_status     INTEGER,
+    error           VARCHAR,
+    attempts        INTEGER NOT NULL DEFAULT 1,
+    next_retry_at   TIMESTAMPTZ,
+    first_failed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    last_failed_at  TIMESTAMPTZ NOT NULL DEFAULT now(),
+    resolved_at     TIMESTAMPTZ,
+    CONSTRAINT uq_failed_orders_order_stage UNIQUE (order_id, stage)
+);
+CREATE INDEX IF NOT EXISTS ix_failed_orders_id ON failed_orders (id);
+CREATE INDEX IF NOT EXISTS ix_failed_orders_ml_user_id ON failed_orders (ml_user_id);
+CREATE INDEX IF NOT EXISTS ix_failed_orders_next_retry_at ON failed_orders (next_retry_at);
+
+CREATE TABLE IF NOT EXISTS reconcile_schedule (
+    order_id        BIGINT PRIMARY KEY,
+    ml_user_id      BIGINT NOT NULL,
+    tier            VARCHAR(8) NOT NULL,
+    next_check_at   TIMESTAMPTZ NOT NULL,
+    last_checked_at TIMESTAMPTZ
+);
+CREATE INDEX IF NOT EXISTS ix_reconcile_schedule_user_next ON reconcile_schedule (ml_user_id, next_check_at);
+
+CREATE TABLE IF NOT EXISTS job_runs (
+    id          BIGSERIAL PRIMARY KEY,
+    job         VARCHAR NOT NULL,
+    ml_user_id  BIGINT,
+    status      VARCHAR(10) NOT NULL,
+    started_at  TIMESTAMPTZ NOT NULL,
+    finished_at TIMESTAMPTZ,
+    duration_s  FLOAT,
+    detail      TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_job_runs_job_started ON job_runs (job, started_at);
+
+CREATE TABLE IF NOT EXISTS sales_changes (
+    seq        BIGSERIAL PRIMARY KEY,
+    txid       BIGINT NOT NULL DEFAULT txid_current(),
+    changed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    op         VARCHAR(1) NOT NULL,
+    order_id   BIGINT NOT NULL,
+    ml_user_id BIGINT,
+    changed    TEXT[],
+    "old"      JSONB,
+    "new"      JSONB
+);
+CREATE INDEX IF NOT EXISTS ix_sales_changes_txid ON sales_changes (txid);
+CREATE INDEX IF NOT EXISTS ix_sales_changes_order_id ON sales_changes (order_id);
+
+CREATE TABLE IF NOT EXISTS cdc_cursors (
+    consumer   VARCHAR PRIMARY KEY,
+    last_txid  BIGINT NOT NULL DEFAULT 0,
+    last_seq   BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- ---- Tabelas das páginas de gestão (antes criadas à mão) ----
+CREATE TABLE IF NOT EXISTS sku (
+    id             BIGSERIAL PRIMARY KEY,
+    sku            VARCHAR NOT NULL,
+    level1         VARCHAR,
+    level2         VARCHAR,
+    custo_unitario NUMERIC(10, 2),
+    quantity       INTEGER,
+    date_created   TIMESTAMPTZ NOT NULL DEFAULT now(),
+    is_active      BOOLEAN NOT NULL DEFAULT TRUE
+);
+
+CREATE TABLE IF NOT EXISTS estoque_registros (
+    id            BIGSERIAL PRIMARY KEY,
+    produto       VARCHAR NOT NULL,
+    quantidade    FLOAT NOT NULL,
+    observacao    TEXT,
+    data_registro TIMESTAMP NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS fornecedores (
+    id                BIGSERIAL PRIMARY KEY,
+    empresa_nome      VARCHAR NOT NULL,
+    cnpj              VARCHAR,
+    referencia_nome   VARCHAR,
+    whatsapp          VARCHAR,
+    endereco_completo TEXT,
+    tipo_insumo       VARCHAR
+);
+
+CREATE TABLE IF NOT EXISTS insumos (
+    id             BIGSERIAL PRIMARY KEY,
+    descricao      VARCHAR NOT NULL,
+    categoria      VARCHAR,
+    classificacao  VARCHAR,
+    unidade_medida VARCHAR,
+    medida         VARCHAR,
+    cores          VARCHAR,
+    observacao     TEXT
+);
+
+CREATE TABLE IF NOT EXISTS compras_insumos (
+    id                    BIGSERIAL PRIMARY KEY,
+    fornecedor_id         BIGINT REFERENCES fornecedores (id),
+    insumo_id             BIGINT REFERENCES insumos (id),
+    quantidade            NUMERIC(12, 2),
+    preco_unitario        NUMERIC(12, 2),
+    total_compra          NUMERIC(12, 2),
+    data_compra           DATE NOT NULL,
+    data_entrega_esperada DATE,
+    observacoes           TEXT
+);
+
+CREATE TABLE IF NOT EXISTS stakeholders (
+    id         BIGSERIAL PRIMARY KEY,
+    relacao    VARCHAR,
+    nome       VARCHAR NOT NULL,
+    whatsapp   VARCHAR,
+    observacao TEXT
+);
+
+CREATE TABLE IF NOT EXISTS pessoas (
+    id   BIGSERIAL PRIMARY KEY,
+    nome VARCHAR NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS meta_mensal_pessoas (
+    id            BIGSERIAL PRIMARY KEY,
+    pessoa_id     BIGINT NOT NULL REFERENCES pessoas (id) ON DELETE CASCADE,
+    ano_mes       VARCHAR(7) NOT NULL,
+    meta_unidades INTEGER NOT NULL DEFAULT 0,
+    CONSTRAINT uq_meta_mensal_pessoa_mes UNIQUE (pessoa_id, ano_mes)
+);
+
+CREATE TABLE IF NOT EXISTS producao_diaria_pessoas (
+    id         BIGSERIAL PRIMARY KEY,
+    pessoa_id  BIGINT NOT NULL REFERENCES pessoas (id) ON DELETE CASCADE,
+    data       DATE NOT NULL,
+    quantidade INTEGER NOT NULL DEFAULT 0,
+    CONSTRAINT uq_producao_pessoa_data UNIQUE (pessoa_id, data)
+);
+
+CREATE TABLE IF NOT EXISTS cotacoes (
+    id             BIGSERIAL PRIMARY KEY,
+    data_simulacao TIMESTAMP NOT NULL DEFAULT now(),
+    produto        VARCHAR NOT NULL,
+    custo_unitario NUMERIC(12, 2)
+);
@@ -0,0 +1,41 @@
+-- 0002 – CDC de sales
+-- Cada INSERT/UPDATE/DELETE em sales vira uma linha em sales_changes (ver cdc.py).
+-- row_hash fica fora do diff — é metadado do reconcile, não dado da venda.
+
+CREATE OR REPLACE FUNCTION sales_cdc() RETURNS trigger LANGUAGE plpgsql AS $$
+DECLARE
+    o jsonb; n jsonb; cols text[]; ov jsonb; nv jsonb;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO sales_changes (op, order_id, ml_user_id, new)
+        VALUES ('I', NEW.order_id, NEW.ml_user_id, to_jsonb(NEW) - 'row_hash');
+        RETURN NEW;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO sales_changes (op, order_id, ml_user_id, old)
+        VALUES ('D', OLD.order_id, OLD.ml_user_id, to_jsonb(OLD) - 'row_hash');
+        RETURN OLD;
+    END IF;
+
+    o := to_jsonb(OLD) - 'row_hash';
+    n := to_jsonb(NEW) - 'row_hash';
+    SELECT array_agg(k ORDER BY k), jsonb_object_agg(k, o -> k), jsonb_object_agg(k, n -> k)
+      INTO cols, ov, nv
+      FROM jsonb_object_keys(n) AS k
+     WHERE o -> k IS DISTINCT FROM n -> k;
+    IF cols IS NOT NULL THEN
+        INSERT INTO sales_changes (op, order_id, ml_user_id, changed, old, new)
+        VALUES ('U', NEW.order_id, NEW.ml_user_id, cols, ov, nv);
+    END IF;
+    RETURN NEW;
+END $$;
+
+DO $$ BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'trg_sales_cdc_ins_del' AND tgrelid = 'sales'::regclass) THEN
+        CREATE TRIGGER trg_sales_cdc_ins_del AFTER INSERT OR DELETE ON sales
+            FOR EACH ROW EXECUTE FUNCTION sales_cdc();
+    END IF;
+    IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'trg_sales_cdc_upd' AND tgrelid = 'sales'::regclass) THEN
+        CREATE TRIGGER trg_sales_cdc_upd AFTER UPDATE ON sales
+            FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*) EXECUTE FUNCTION sales_cdc();
+    END IF;
+END $$;
@@ -0,0 +1,28 @@
+-- migrate: no-transaction
+-- 0003 – índices das consultas quentes
+-- CONCURRENTLY não bloqueia escrita em sales durante a criação, mas não roda
+-- dentro de transação: o migrate.py executa este arquivo comando a comando.
+-- tests/test_query_plans.py confere com EXPLAIN que cada consulta usa o seu.
+
+-- período por conta: reconcile, carregar_vendas(conta), relatórios
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_sales_user_date_closed
+    ON sales (ml_user_id, date_closed);
+
+-- vigência de SKU por data do pedido (JOIN LATERAL com sku)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_sales_sku_date_adjusted
+    ON sales (seller_sku, date_adjusted);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_sales_item_id
+    ON sales (item_id);
+
+-- backfill de taxas (sales.atualizar_fees_pendentes)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_sales_fee_pendente
+    ON sales (ml_user_id, date_closed) WHERE ml_fee IS NULL;
+
+-- SKU vigente: ORDER BY date_created DESC LIMIT 1
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_sku_sku_date_created
+    ON sku (sku, date_created DESC);
+
+-- Gestão de compras filtra por data da compra / entrega esperada
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_compras_insumos_datas
+    ON compras_insumos (data_compra, data_entrega_esperada);
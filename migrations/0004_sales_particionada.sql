@@ -0,0 +1,131 @@
+-- 0004 – sales particionada por mês de date_closed
+-- Cria a estrutura nova ao lado da atual; a cópia das linhas existentes e a
+-- troca de nomes são feitas online pelo particoes.py --migrar. Num banco sem
+-- vendas a troca acontece aqui mesmo.
+--
+-- Em tabela particionada toda unicidade precisa incluir a chave de partição,
+-- então a PK vira (id, date_closed) e a unicidade global de order_id passa
+-- para sales_order_keys, mantida por trigger.
+
+CREATE TABLE IF NOT EXISTS sales_order_keys (
+    order_id    BIGINT PRIMARY KEY,
+    date_closed TIMESTAMP NOT NULL
+);
+
+CREATE OR REPLACE FUNCTION sales_order_keys_sync() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        DELETE FROM sales_order_keys WHERE order_id = OLD.order_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        -- pedido repetido estoura a PK aqui e desfaz o INSERT em sales
+        INSERT INTO sales_order_keys (order_id, date_closed) VALUES (NEW.order_id, NEW.date_closed);
+        RETURN NEW;
+    END IF;
+    RETURN OLD;
+END $$;
+
+-- Partições mensais sales_pAAAAMM de `desde` até `meses_a_frente` meses depois
+-- do mês atual. Mês cujas linhas já caíram na partição default é pulado com
+-- aviso (criar a partição falharia); por isso o scheduler mantém meses à frente.
+CREATE OR REPLACE FUNCTION garantir_particoes_sales(desde date, meses_a_frente int DEFAULT 3)
+RETURNS int LANGUAGE plpgsql AS $$
+DECLARE
+    pai     text := CASE WHEN (SELECT relkind FROM pg_class WHERE oid = to_regclass('sales')) = 'p'
+                         THEN 'sales' ELSE 'sales_particionada' END;
+    mes     date := date_trunc('month', desde)::date;
+    ate     date := (date_trunc('month', now()) + make_interval(months => meses_a_frente))::date;
+    nome    text;
+    criadas int  := 0;
+BEGIN
+    WHILE mes <= ate LOOP
+        nome := 'sales_p' || to_char(mes, 'YYYYMM');
+        IF to_regclass(nome) IS NULL THEN
+            IF EXISTS (SELECT 1 FROM sales_p_default
+                        WHERE date_closed >= mes AND date_closed < mes + interval '1 month') THEN
+                RAISE WARNING 'sales_p_default tem linhas de %; partição % não criada', to_char(mes, 'YYYY-MM'), nome;
+            ELSE
+                EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                               nome, pai, mes, (mes + interval '1 month')::date);
+                criadas := criadas + 1;
+            END IF;
+        END IF;
+        mes := (mes + interval '1 month')::date;
+    END LOOP;
+    RETURN criadas;
+END $$;
+
+DO $$ BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = to_regclass('sales')) = 'p' THEN
+        RETURN;
+    END IF;
+    -- mesmas colunas (inclusive a gerada date_adjusted) e o mesmo sales_id_seq
+    CREATE TABLE IF NOT EXISTS sales_particionada (
+        LIKE sales INCLUDING DEFAULTS INCLUDING GENERATED,
+        CONSTRAINT pt_sales_pkey PRIMARY KEY (id, date_closed)
+    ) PARTITION BY RANGE (date_closed);
+    CREATE TABLE IF NOT EXISTS sales_p_default PARTITION OF sales_particionada DEFAULT;
+
+    -- nomes provisórios pt_*; sales_trocar_particionada() tira o prefixo
+    CREATE INDEX IF NOT EXISTS pt_ix_sales_order_id ON sales_particionada (order_id);
+    CREATE INDEX IF NOT EXISTS pt_ix_sales_ml_user_id ON sales_particionada (ml_user_id);
+    CREATE INDEX IF NOT EXISTS pt_ix_sales_shipment_open ON sales_particionada (shipment_status, shipment_delivery_sla);
+    CREATE INDEX IF NOT EXISTS pt_ix_sales_user_date_closed ON sales_particionada (ml_user_id, date_closed);
+    CREATE INDEX IF NOT EXISTS pt_ix_sales_sku_date_adjusted ON sales_particionada (seller_sku, date_adjusted);
+    CREATE INDEX IF NOT EXISTS pt_ix_sales_item_id ON sales_particionada (item_id);
+    CREATE INDEX IF NOT EXISTS pt_ix_sales_fee_pendente ON sales_particionada (ml_user_id, date_closed) WHERE ml_fee IS NULL;
+
+    IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'trg_sales_order_keys'
+                                              AND tgrelid = 'sales_particionada'::regclass) THEN
+        CREATE TRIGGER trg_sales_order_keys AFTER INSERT OR DELETE OR UPDATE OF order_id, date_closed
+            ON sales_particionada FOR EACH ROW EXECUTE FUNCTION sales_order_keys_sync();
+    END IF;
+END $$;
+
+-- Troca sales (comum) pela particionada, sob lock exclusivo: a antiga vira
+-- sales_legado (com índices *_legado) e o CDC passa para a nova. Exige que a
+-- cópia esteja completa — o particoes.py mantém as duas em sincronia até aqui.
+CREATE OR REPLACE FUNCTION sales_trocar_particionada() RETURNS void LANGUAGE plpgsql AS $$
+DECLARE
+    r record;
+    n_antiga bigint;
+    n_nova   bigint;
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = to_regclass('sales')) = 'p' THEN
+        RETURN;
+    END IF;
+    LOCK TABLE sales IN ACCESS EXCLUSIVE MODE;
+    SELECT count(*) INTO n_antiga FROM sales;
+    SELECT count(*) INTO n_nova FROM sales_particionada;
+    IF n_antiga <> n_nova THEN
+        RAISE EXCEPTION 'sales tem % linhas e sales_particionada %; cópia incompleta', n_antiga, n_nova;
+    END IF;
+
+    DROP TRIGGER IF EXISTS trg_sales_sync_particionada ON sales;
+    DROP TRIGGER IF EXISTS trg_sales_cdc_ins_del ON sales;
+    DROP TRIGGER IF EXISTS trg_sales_cdc_upd ON sales;
+    ALTER TABLE sales RENAME TO sales_legado;
+    FOR r IN SELECT indexname FROM pg_indexes
+              WHERE schemaname = current_schema() AND tablename = 'sales_legado' LOOP
+        EXECUTE format('ALTER INDEX %I RENAME TO %I', r.indexname, r.indexname || '_legado');
+    END LOOP;
+
+    ALTER TABLE sales_particionada RENAME TO sales;
+    FOR r IN SELECT indexname FROM pg_indexes
+              WHERE schemaname = current_schema() AND tablename = 'sales' AND indexname LIKE 'pt\_%' LOOP
+        EXECUTE format('ALTER INDEX %I RENAME TO %I', r.indexname, substr(r.indexname, 4));
+    END LOOP;
+    ALTER SEQUENCE sales_id_seq OWNED BY sales.id;
+
+    CREATE TRIGGER trg_sales_cdc_ins_del AFTER INSERT OR DELETE ON sales
+        FOR EACH ROW EXECUTE FUNCTION sales_cdc();
+    CREATE TRIGGER trg_sales_cdc_upd AFTER UPDATE ON sales
+        FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*) EXECUTE FUNCTION sales_cdc();
+END $$;
+
+DO $$ BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = to_regclass('sales')) <> 'p'
+       AND NOT EXISTS (SELECT 1 FROM sales) THEN
+        PERFORM sales_trocar_particionada();
+    END IF;
+END $$;
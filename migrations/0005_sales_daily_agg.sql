@@ -0,0 +1,24 @@
+-- 0005 – agregado diário de vendas
+-- Medidas já somadas por dia/hora (horário de Brasília, date_adjusted) e pelas
+-- dimensões que o Dashboard e os Relatórios filtram. Mantido pelo agregados.py
+-- a partir do CDC: só os dias tocados são recalculados.
+
+CREATE TABLE IF NOT EXISTS sales_daily_agg (
+    id            BIGSERIAL PRIMARY KEY,
+    dia           DATE NOT NULL,
+    hora          SMALLINT NOT NULL,
+    ml_user_id    BIGINT NOT NULL,
+    level1        VARCHAR,
+    level2        VARCHAR,
+    logistic_type VARCHAR,
+    status        VARCHAR,
+    faixa_preco   VARCHAR(6) NOT NULL,
+    vendas        INTEGER NOT NULL,
+    faturamento   NUMERIC(14, 2) NOT NULL,
+    unidades      BIGINT NOT NULL,
+    frete         NUMERIC(14, 2) NOT NULL,
+    taxa_ml       NUMERIC(14, 2) NOT NULL,
+    cmv           NUMERIC(14, 2) NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_sales_daily_agg_dia ON sales_daily_agg (dia);
+CREATE INDEX IF NOT EXISTS ix_sales_daily_agg_user_dia ON sales_daily_agg (ml_user_id, dia);
@@ -0,0 +1,29 @@
+-- 0006 – SKUs pendentes de reaplicação nas vendas
+-- Toda escrita em sku (editor, planilha, cadastro manual, Gerenciar Cadastros)
+-- marca o código aqui; o sku_reaplicar.py atualiza só as vendas desses SKUs
+-- cuja versão vigente mudou, em lotes, fora da transação da tela.
+
+CREATE TABLE IF NOT EXISTS sku_pendentes (
+    sku        VARCHAR PRIMARY KEY,
+    marcado_em TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE OR REPLACE FUNCTION sku_marcar_pendente() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO sku_pendentes (sku) VALUES (OLD.sku)
+        ON CONFLICT (sku) DO UPDATE SET marcado_em = EXCLUDED.marcado_em;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.sku IS NOT NULL THEN
+        INSERT INTO sku_pendentes (sku) VALUES (NEW.sku)
+        ON CONFLICT (sku) DO UPDATE SET marcado_em = EXCLUDED.marcado_em;
+    END IF;
+    RETURN NULL;
+END $$;
+
+DO $$ BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'trg_sku_pendentes' AND tgrelid = 'sku'::regclass) THEN
+        CREATE TRIGGER trg_sku_pendentes AFTER INSERT OR UPDATE OR DELETE ON sku
+            FOR EACH ROW EXECUTE FUNCTION sku_marcar_pendente();
+    END IF;
+END $$;
@@ -0,0 +1,75 @@
+-- 0007 – vigência explícita das versões de SKU
+-- Cada versão guarda o intervalo em que vale (valid_during), em vez de ser
+-- deduzida por "maior date_created <= data" com ORDER BY ... LIMIT 1. A
+-- restrição de exclusão impede duas versões do mesmo SKU valendo ao mesmo
+-- tempo, então "versão na data da venda" vira um JOIN comum por
+-- k.valid_during @> s.date_adjusted, resolvido pelo índice GiST da restrição.
+-- is_active deixa de ser mantido à mão: é a versão com intervalo aberto.
+
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+ALTER TABLE sku ADD COLUMN IF NOT EXISTS valid_during TSTZRANGE;
+
+-- histórico existente: cada versão vale até a próxima do mesmo SKU
+UPDATE sku k
+SET valid_during = tstzrange(k.date_created, p.fim)
+FROM (
+    SELECT id, lead(date_created) OVER (PARTITION BY sku ORDER BY date_created, id) AS fim
+    FROM sku
+) p
+WHERE p.id = k.id AND k.valid_during IS NULL;
+
+ALTER TABLE sku ALTER COLUMN valid_during SET DEFAULT tstzrange(now(), NULL);
+ALTER TABLE sku ALTER COLUMN valid_during SET NOT NULL;
+
+DO $$ BEGIN
+    IF EXISTS (SELECT 1 FROM information_schema.columns
+                WHERE table_schema = current_schema() AND table_name = 'sku'
+                  AND column_name = 'is_active' AND is_generated = 'NEVER') THEN
+        ALTER TABLE sku DROP COLUMN is_active;
+        ALTER TABLE sku ADD COLUMN is_active BOOLEAN GENERATED ALWAYS AS (upper_inf(valid_during)) STORED;
+    END IF;
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'ex_sku_vigencia'
+                                                 AND conrelid = 'sku'::regclass) THEN
+        ALTER TABLE sku ADD CONSTRAINT ex_sku_vigencia
+            EXCLUDE USING gist (sku WITH =, valid_during WITH &&);
+    END IF;
+END $$;
+
+-- versão vigente (ingestão, edição): no máximo uma aberta por SKU
+CREATE UNIQUE INDEX IF NOT EXISTS ux_sku_vigente ON sku (sku) WHERE upper_inf(valid_during);
+
+DROP INDEX IF EXISTS ix_sku_sku_date_created;
+
+-- Fecha a versão aberta em p_inicio e abre a nova, na mesma transação. O lock
+-- por SKU serializa dois salvamentos simultâneos do mesmo código. Uma segunda
+-- versão no mesmo instante (mesma transação) corrige a que acabou de abrir.
+CREATE OR REPLACE FUNCTION sku_nova_versao(
+    p_sku      varchar,
+    p_level1   varchar,
+    p_level2   varchar,
+    p_custo    numeric,
+    p_quantity integer,
+    p_inicio   timestamptz DEFAULT now()
+) RETURNS bigint LANGUAGE plpgsql AS $$
+DECLARE
+    v_id bigint;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('sku:' || p_sku));
+
+    UPDATE sku SET level1 = p_level1, level2 = p_level2, custo_unitario = p_custo, quantity = p_quantity
+    WHERE sku = p_sku AND valid_during = tstzrange(p_inicio, NULL)
+    RETURNING id INTO v_id;
+    IF FOUND THEN
+        RETURN v_id;
+    END IF;
+
+    UPDATE sku SET valid_during = tstzrange(lower(valid_during), p_inicio)
+    WHERE sku = p_sku AND upper_inf(valid_during) AND lower(valid_during) < p_inicio;
+
+    -- versão aberta começando depois de p_inicio estoura ex_sku_vigencia aqui
+    INSERT INTO sku (sku, level1, level2, custo_unitario, quantity, date_created, valid_during)
+    VALUES (p_sku, p_level1, p_level2, p_custo, p_quantity, p_inicio, tstzrange(p_inicio, NULL))
+    RETURNING id INTO v_id;
+    RETURN v_id;
+END $$;
@@ -0,0 +1,14 @@
+-- 0008 – manifesto do histórico arquivado em Parquet (arquivo.py)
+-- Um registro por (mês de date_closed, conta): o arquivo só passa a existir
+-- para os leitores quando entra aqui, na mesma transação que tira o mês de
+-- sales. Arquivo gravado sem registro (job interrompido) é ignorado.
+
+CREATE TABLE IF NOT EXISTS sales_arquivo (
+    mes          DATE NOT NULL,
+    ml_user_id   BIGINT NOT NULL,
+    linhas       INTEGER NOT NULL,
+    bytes        BIGINT NOT NULL,
+    caminho      TEXT NOT NULL,
+    arquivado_em TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (mes, ml_user_id)
+);
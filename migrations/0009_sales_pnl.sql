@@ -0,0 +1,132 @@
+-- 0009 – resultado por pedido (sales_pnl) e parâmetros de custo com vigência
+-- Receita, taxa, frete, custo FLEX, CMV, margem de contribuição e unidades de
+-- cada pedido, gravados por trigger na mesma transação da escrita em sales
+-- (ingestão, reconcile, reaplicação de SKU, ajustes manuais). Custos ficam com
+-- sinal negativo, como na tabela dos Relatórios: margem = soma das colunas.
+--
+-- Custos que não vêm do pedido (ex.: envio FLEX) ficam em custos_parametros,
+-- versionados por data: vale a versão mais recente com vigente_desde <= dia do
+-- pedido. Uma versão nova é gravada e aplicada pelo pnl.py.
+
+CREATE TABLE IF NOT EXISTS custos_parametros (
+    nome          VARCHAR NOT NULL,
+    vigente_desde DATE NOT NULL,
+    valor         NUMERIC(12, 4) NOT NULL,
+    criado_em     TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (nome, vigente_desde)
+);
+-- custo fixo por envio FLEX (self_service) que o app usava
+INSERT INTO custos_parametros (nome, vigente_desde, valor)
+VALUES ('flex_envio', DATE '2000-01-01', 12.97)
+ON CONFLICT DO NOTHING;
+
+CREATE OR REPLACE FUNCTION custo_parametro(p_nome varchar, p_dia date) RETURNS numeric
+LANGUAGE sql STABLE AS $$
+    SELECT valor FROM custos_parametros
+    WHERE nome = p_nome AND vigente_desde <= p_dia
+    ORDER BY vigente_desde DESC
+    LIMIT 1
+$$;
+
+CREATE TABLE IF NOT EXISTS sales_pnl (
+    order_id            BIGINT PRIMARY KEY,
+    ml_user_id          BIGINT NOT NULL,
+    dia                 DATE NOT NULL,                  -- date_adjusted (Brasília)
+    receita             NUMERIC(14, 2) NOT NULL,
+    taxa_plataforma     NUMERIC(14, 2) NOT NULL,
+    custo_frete         NUMERIC(14, 2) NOT NULL,
+    custo_flex          NUMERIC(14, 2) NOT NULL,
+    cmv                 NUMERIC(14, 2) NOT NULL,
+    margem_contribuicao NUMERIC(14, 2) NOT NULL,
+    unidades            INTEGER NOT NULL,
+    atualizado_em       TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS ix_sales_pnl_dia ON sales_pnl (dia);
+
+-- única definição das contas: usada pelo trigger e pelos recálculos em lote (pnl.py)
+CREATE OR REPLACE FUNCTION sales_pnl_valores(
+    p_total_amount    numeric,
+    p_ml_fee          numeric,
+    p_frete_adjust    numeric,
+    p_logistic_type   varchar,
+    p_quantity        integer,
+    p_quantity_sku    integer,
+    p_custo_unitario  numeric,
+    p_dia             date
+) RETURNS TABLE (
+    receita numeric, taxa_plataforma numeric, custo_frete numeric, custo_flex numeric,
+    cmv numeric, margem_contribuicao numeric, unidades integer
+) LANGUAGE sql STABLE AS $$
+    SELECT v.receita, v.taxa, v.frete, v.flex, v.cmv,
+           v.receita + v.taxa + v.frete + v.flex + v.cmv,
+           v.unidades
+    FROM (SELECT
+            COALESCE(p_total_amount, 0) AS receita,
+            -COALESCE(p_ml_fee, 0) AS taxa,
+            COALESCE(p_frete_adjust, 0) AS frete,
+            CASE WHEN lower(p_logistic_type) = 'self_service'
+                 THEN -COALESCE(custo_parametro('flex_envio', p_dia), 0) ELSE 0 END AS flex,
+            -(COALESCE(p_quantity_sku, 0) * COALESCE(p_quantity, 0) * COALESCE(p_custo_unitario, 0)) AS cmv,
+            COALESCE(p_quantity_sku * p_quantity, 0) AS unidades
+         ) v
+$$;
+
+CREATE OR REPLACE FUNCTION sales_pnl_sync() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM sales_pnl WHERE order_id = OLD.order_id;
+        RETURN NULL;
+    ELSIF TG_OP = 'UPDATE' AND OLD.order_id <> NEW.order_id THEN
+        DELETE FROM sales_pnl WHERE order_id = OLD.order_id;
+    END IF;
+    INSERT INTO sales_pnl (order_id, ml_user_id, dia, receita, taxa_plataforma, custo_frete,
+                           custo_flex, cmv, margem_contribuicao, unidades)
+    SELECT NEW.order_id, NEW.ml_user_id, CAST(NEW.date_adjusted AS date), v.*
+    FROM sales_pnl_valores(NEW.total_amount::numeric, NEW.ml_fee, NEW.frete_adjust,
+                           NEW.shipment_logistic_type, NEW.quantity, NEW.quantity_sku,
+                           NEW.custo_unitario, CAST(NEW.date_adjusted AS date)) v
+    ON CONFLICT (order_id) DO UPDATE SET
+        ml_user_id = EXCLUDED.ml_user_id, dia = EXCLUDED.dia, receita = EXCLUDED.receita,
+        taxa_plataforma = EXCLUDED.taxa_plataforma, custo_frete = EXCLUDED.custo_frete,
+        custo_flex = EXCLUDED.custo_flex, cmv = EXCLUDED.cmv,
+        margem_contribuicao = EXCLUDED.margem_contribuicao, unidades = EXCLUDED.unidades,
+        atualizado_em = now();
+    RETURN NULL;
+END $$;
+
+-- só as colunas que entram nas contas disparam o recálculo
+DO $$
+DECLARE
+    t text;
+BEGIN
+    -- sales ainda não migrada para a particionada (particoes.py --migrar): o
+    -- trigger vai nas duas, senão se perde na troca de nomes
+    FOREACH t IN ARRAY ARRAY['sales', 'sales_particionada'] LOOP
+        IF to_regclass(t) IS NOT NULL AND NOT EXISTS (
+            SELECT 1 FROM pg_trigger WHERE tgname = 'trg_sales_pnl' AND tgrelid = to_regclass(t)
+        ) THEN
+            EXECUTE format($f$
+                CREATE TRIGGER trg_sales_pnl
+                AFTER INSERT OR DELETE OR UPDATE OF order_id, ml_user_id, date_closed, total_amount,
+                    ml_fee, frete_adjust, shipment_logistic_type, quantity, quantity_sku, custo_unitario
+                ON %I FOR EACH ROW EXECUTE FUNCTION sales_pnl_sync()
+            $f$, t);
+        END IF;
+    END LOOP;
+END $$;
+
+-- carga inicial; depois disso o trigger mantém
+INSERT INTO sales_pnl (order_id, ml_user_id, dia, receita, taxa_plataforma, custo_frete,
+                       custo_flex, cmv, margem_contribuicao, unidades)
+SELECT s.order_id, s.ml_user_id, CAST(s.date_adjusted AS date), v.*
+FROM sales s
+CROSS JOIN LATERAL sales_pnl_valores(s.total_amount::numeric, s.ml_fee, s.frete_adjust,
+                                     s.shipment_logistic_type, s.quantity, s.quantity_sku,
+                                     s.custo_unitario, CAST(s.date_adjusted AS date)) v
+ON CONFLICT (order_id) DO NOTHING;
+
+-- agregado diário ganha custo FLEX e margem (lidos do sales_pnl); sem cursor,
+-- o agregados.py reconstrói tudo na próxima execução
+ALTER TABLE sales_daily_agg ADD COLUMN IF NOT EXISTS custo_flex NUMERIC(14, 2) NOT NULL DEFAULT 0;
+ALTER TABLE sales_daily_agg ADD COLUMN IF NOT EXISTS margem_contribuicao NUMERIC(14, 2) NOT NULL DEFAULT 0;
+DELETE FROM cdc_cursors WHERE consumer = 'sales_daily_agg';
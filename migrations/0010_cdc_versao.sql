@@ -0,0 +1,7 @@
+-- 0010 – versão por consumidor do CDC (cdc._salvar_cursor)
+-- last_seq é gravado com GREATEST e não muda quando o lote aplicado tem seq
+-- menor que um já visto (transação longa que comitou tarde). `versao` soma 1
+-- a cada lote não vazio aplicado (e a cada reconstrução): é a chave de cache
+-- de quem lê o resultado do consumidor, como o agregado diário no app.
+
+ALTER TABLE cdc_cursors ADD COLUMN IF NOT EXISTS versao BIGINT NOT NULL DEFAULT 0;
@@ -0,0 +1,167 @@
+# ml_replay.py – gravação e reprodução do tráfego HTTP da API do Mercado Livre
+"""
+Captura as chamadas feitas com `requests` (get_full_sales, _order_to_sale,
+reconciliar_vendas, buscar_ml_fee...) em arquivos "cassette" JSON e permite
+reproduzi-las depois sem credenciais nem rede.
+
+    with usar_cassette("cassettes/conta_123.json", modo="gravar"):
+        get_full_sales("123", token)
+
+    with usar_cassette("cassettes/conta_123.json", modo="reproduzir"):
+        reconciliar_vendas("123")
+
+Os cassettes também podem ser servidos pelo stand-in local (ml_standin.py).
+"""
+from __future__ import annotations
+
+import json
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+ML_HOSTS = ("api.mercadolibre.com",)
+PARAMS_IGNORADOS = {"access_token"}      # nunca entram na chave nem no arquivo
+HEADERS_GRAVADOS = ("Content-Type", "Retry-After")
+
+
+class CassetteAusente(requests.ConnectionError):
+    """Requisição sem resposta gravada no cassette (modo reproduzir)."""
+
+
+def chave_requisicao(method: str, url: str) -> str:
+    """Chave estável: método + path + query ordenada, sem host e sem token."""
+    partes = urlsplit(url)
+    query = sorted(
+        (k, v) for k, v in parse_qsl(partes.query, keep_blank_values=True)
+        if k not in PARAMS_IGNORADOS
+    )
+    path = partes.path.rstrip("/") or "/"
+    return f"{method.upper()} {path}" + (f"?{urlencode(query)}" if query else "")
+
+
+class Cassette:
+    """Conjunto de interações gravadas, indexadas por `chave_requisicao`."""
+
+    def __init__(self, path: str | Path | None = None):
+        self.path = Path(path) if path else None
+        self._interacoes: Dict[str, List[dict]] = {}
+        self._cursor: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        if self.path and self.path.exists():
+            self.carregar(self.path)
+
+    def __len__(self) -> int:
+        return sum(len(v) for v in self._interacoes.values())
+
+    def carregar(self, path: str | Path) -> None:
+        dados = json.loads(Path(path).read_text(encoding="utf-8"))
+        for it in dados.get("interacoes", []):
+            self._interacoes.setdefault(it["chave"], []).append(it)
+
+    def salvar(self, path: str | Path | None = None) -> None:
+        destino = Path(path or self.path)
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            interacoes = [it for lst in self._interacoes.values() for it in lst]
+        destino.write_text(
+            json.dumps({"versao": 1, "interacoes": interacoes}, ensure_ascii=False, indent=1),
+            encoding="utf-8",
+        )
+
+    def gravar(self, method: str, url: str, status: int, headers: dict, body: str) -> None:
+        chave = chave_requisicao(method, url)
+        it = {
+            "chave": chave,
+            "status": status,
+            "headers": {h: headers[h] for h in HEADERS_GRAVADOS if h in headers},
+            "body": body,
+        }
+        with self._lock:
+            self._interacoes.setdefault(chave, []).append(it)
+
+    def buscar(self, method: str, url: str) -> dict | None:
+        """
+        Retorna a próxima resposta gravada para a requisição. Chamadas repetidas
+        percorrem as gravações em ordem e repetem a última quando acabam.
+        """
+        chave = chave_requisicao(method, url)
+        with self._lock:
+            lst = self._interacoes.get(chave)
+            if not lst:
+                return None
+            i = self._cursor.get(chave, 0)
+            self._cursor[chave] = i + 1
+            return lst[min(i, len(lst) - 1)]
+
+    def chaves(self) -> List[str]:
+        return list(self._interacoes)
+
+
+def _resposta(req: requests.PreparedRequest, it: dict) -> requests.Response:
+    resp = requests.Response()
+    resp.status_code = it["status"]
+    resp.headers = CaseInsensitiveDict(it.get("headers") or {})
+    resp._content = (it.get("body") or "").encode("utf-8")
+    resp.encoding = "utf-8"
+    resp.url = req.url
+    resp.request = req
+    resp.reason = "OK" if resp.status_code < 400 else "Recorded error"
+    return resp
+
+
+def _intercepta(url: str, hosts: Tuple[str, ...]) -> bool:
+    return (urlsplit(url).hostname or "") in hosts
+
+
+@contextmanager
+def usar_cassette(
+    path: str | Path,
+    modo: str = "reproduzir",
+    hosts: Tuple[str, ...] | None = None,
+) -> Iterator[Cassette]:
+    """
+    Substitui temporariamente `requests.Session.send` (usado também por
+    `requests.get`) para gravar ou reproduzir as chamadas aos hosts do ML.
+
+    modo="gravar"     → chama a API real e grava a resposta (salva ao sair).
+    modo="reproduzir" → responde do cassette; requisição sem gravação levanta
+                        CassetteAusente (tratada como erro de rede pelo código).
+    """
+    if modo not in ("gravar", "reproduzir"):
+        raise ValueError(f"Modo de cassette inválido: {modo}")
+
+    if hosts is None:
+        from settings import settings
+        hosts = ML_HOSTS + (urlsplit(settings().ml_api_url).hostname or "",)
+
+    cassette = Cassette(path if modo == "reproduzir" else None)
+    cassette.path = Path(path)
+    original_send = requests.Session.send
+
+    def send(self, request, **kwargs):
+        if not _intercepta(request.url, hosts):
+            return original_send(self, request, **kwargs)
+        if modo == "reproduzir":
+            it = cassette.buscar(request.method, request.url)
+            if it is None:
+                raise CassetteAusente(
+                    f"Sem gravação para {chave_requisicao(request.method, request.url)}",
+                    request=request,
+                )
+            return _resposta(request, it)
+        resp = original_send(self, request, **kwargs)
+        cassette.gravar(request.method, request.url, resp.status_code, resp.headers, resp.text)
+        return resp
+
+    requests.Session.send = send
+    try:
+        yield cassette
+    finally:
+        requests.Session.send = original_send
+        if modo == "gravar":
+            cassette.salvar()
@@ -0,0 +1,306 @@
+# ml_standin.py – stand-in local da API do Mercado Livre
+"""
+Serve orders/search, orders, payments, shipments, SLA, etiquetas e oauth/token a partir de
+dados sintéticos (determinísticos pela seed) ou de um cassette gravado com
+ml_replay.usar_cassette. Permite injetar latência e respostas 429 para medir
+ingestão e reconciliação offline e de forma reprodutível.
+
+    STANDIN_PEDIDOS=5000 STANDIN_LATENCIA_MS=80 STANDIN_TAXA_429=0.02 \\
+        uvicorn ml_standin:app --port 8600
+    ML_API_URL=http://localhost:8600 python reconcile_daily.py
+
+Variáveis:
+    STANDIN_SELLER      ml_user_id do vendedor sintético (padrão 123456)
+    STANDIN_PEDIDOS     quantidade de pedidos sintéticos (padrão 500)
+    STANDIN_DIAS        janela de datas dos pedidos em dias (padrão 180)
+    STANDIN_SEED        seed do gerador (padrão 42)
+    STANDIN_LATENCIA_MS latência média por requisição (padrão 0)
+    STANDIN_TAXA_429    fração de requisições respondidas com 429 (padrão 0)
+    STANDIN_CASSETTE    cassette JSON servido antes dos dados sintéticos
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import random
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from fastapi import FastAPI, Form, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response
+
+from ml_replay import Cassette
+
+SKUS = [f"SKU-{i:03d}" for i in range(1, 41)]
+LOGISTICAS = ["fulfillment", "self_service", "drop_off", "xd_drop_off", "cross_docking"]
+FLUXO_ENVIO = ["ready_to_ship", "shipped", "delivered"]
+
+
+# ----------------- Dados sintéticos -----------------
+class DadosSinteticos:
+    def __init__(self, seller_id: int, n_pedidos: int, dias: int, seed: int):
+        self.seller_id = seller_id
+        self.rng = random.Random(seed)
+        self.pedidos: Dict[int, dict] = {}
+        self.envios: Dict[int, dict] = {}
+        agora = datetime.now(timezone.utc).replace(microsecond=0)
+        for i in range(n_pedidos):
+            self._gerar_pedido(2_000_000_000 + i, agora - timedelta(seconds=self.rng.randint(0, dias * 86400)))
+
+    def _gerar_pedido(self, order_id: int, fechado: datetime) -> None:
+        rng = self.rng
+        sku = rng.choice(SKUS)
+        qtd = rng.choice([1, 1, 1, 2, 3])
+        preco = round(rng.uniform(19.9, 249.9), 2)
+        total = round(preco * qtd, 2)
+        status = "cancelled" if rng.random() < 0.08 else "paid"
+        shipment_id = 4_000_000_000 + (order_id - 2_000_000_000)
+        sale_fee = round(preco * 0.14, 2)
+
+        idade = datetime.now(timezone.utc) - fechado
+        if status == "cancelled":
+            envio_status = "cancelled"
+        elif idade > timedelta(days=10):
+            envio_status = "delivered"
+        else:
+            envio_status = rng.choice(FLUXO_ENVIO)
+
+        self.pedidos[order_id] = {
+            "id": order_id,
+            "status": status,
+            "date_created": fechado.isoformat(),
+            "date_closed": fechado.isoformat(),
+            "total_amount": total,
+            "buyer": {"id": rng.randint(10**8, 10**9), "nickname": f"COMPRADOR{order_id % 10000}"},
+            "seller": {"id": self.seller_id},
+            "order_items": [{
+                "item": {
+                    "id": f"MLB{3_000_000_000 + SKUS.index(sku)}",
+                    "title": f"Produto {sku}",
+                    "seller_sku": sku,
+                },
+                "quantity": qtd,
+                "unit_price": preco,
+                "sale_fee": sale_fee,
+            }],
+            "payments": [{
+                "id": 9_000_000_000 + (order_id - 2_000_000_000),
+                "status": "approved" if status == "paid" else "refunded",
+                "transaction_amount": total,
+                "marketplace_fee": round(sale_fee * qtd, 2),
+            }],
+            "shipping": {"id": shipment_id},
+        }
+        self.envios[shipment_id] = {
+            "id": shipment_id,
+            "order_id": order_id,
+            "status": envio_status,
+            "substatus": "printed" if envio_status == "ready_to_ship" and rng.random() < 0.5 else None,
+            "last_updated": fechado.isoformat(),
+            "mode": "me2",
+            "logistic_type": rng.choice(LOGISTICAS),
+            "order_cost": total,
+            "base_cost": round(rng.uniform(15, 40), 2),
+            "shipping_option": {
+                "cost": round(rng.uniform(0, 25), 2),
+                "list_cost": round(rng.uniform(15, 40), 2),
+                "delivery_type": "estimated",
+            },
+            "receiver_address": {"receiver_name": f"Cliente {order_id % 10000}"},
+        }
+
+    def mutar(self, n: int) -> List[int]:
+        """Avança envios e altera valores de `n` pedidos — simula drift para reconcile."""
+        alterados = []
+        for oid in self.rng.sample(list(self.pedidos), min(n, len(self.pedidos))):
+            p = self.pedidos[oid]
+            env = self.envios[p["shipping"]["id"]]
+            if env["status"] in FLUXO_ENVIO[:-1]:
+                env["status"] = FLUXO_ENVIO[FLUXO_ENVIO.index(env["status"]) + 1]
+                env["substatus"] = None
+            else:
+                p["total_amount"] = round(p["total_amount"] * 0.9, 2)
+            env["last_updated"] = datetime.now(timezone.utc).isoformat()
+            alterados.append(oid)
+        return alterados
+
+
+def _config_inicial() -> dict:
+    return {
+        "latencia_ms": float(os.getenv("STANDIN_LATENCIA_MS", "0")),
+        "taxa_429": float(os.getenv("STANDIN_TAXA_429", "0")),
+    }
+
+
+app = FastAPI(title="Mercado Livre stand-in")
+_config = _config_inicial()
+_stats: Counter = Counter()
+_rng_falhas = random.Random(int(os.getenv("STANDIN_SEED", "42")))
+_dados = DadosSinteticos(
+    seller_id=int(os.getenv("STANDIN_SELLER", "123456")),
+    n_pedidos=int(os.getenv("STANDIN_PEDIDOS", "500")),
+    dias=int(os.getenv("STANDIN_DIAS", "180")),
+    seed=int(os.getenv("STANDIN_SEED", "42")),
+)
+_cassette: Optional[Cassette] = Cassette(os.getenv("STANDIN_CASSETTE")) if os.getenv("STANDIN_CASSETTE") else None
+
+
+@app.middleware("http")
+async def _latencia_e_429(request: Request, call_next):
+    if request.url.path.startswith("/__"):
+        return await call_next(request)
+
+    _stats["requisicoes"] += 1
+    if _config["latencia_ms"] > 0:
+        # jitter de ±50% em torno da média configurada
+        await asyncio.sleep(_config["latencia_ms"] * _rng_falhas.uniform(0.5, 1.5) / 1000)
+    if _config["taxa_429"] > 0 and _rng_falhas.random() < _config["taxa_429"]:
+        _stats["429"] += 1
+        return JSONResponse({"message": "Too Many Requests", "status": 429}, status_code=429,
+                            headers={"Retry-After": "1"})
+
+    if _cassette is not None:
+        url = request.url.path + (f"?{request.url.query}" if request.url.query else "")
+        it = _cassette.buscar(request.method, url)
+        if it is not None:
+            _stats["cassette"] += 1
+            return Response(content=it.get("body") or "", status_code=it["status"],
+                            headers=it.get("headers") or {})
+    return await call_next(request)
+
+
+# ----------------- Controle -----------------
+@app.get("/__stats")
+def stats():
+    return {"config": _config, "contadores": dict(_stats), "pedidos": len(_dados.pedidos)}
+
+
+@app.post("/__config")
+def configurar(latencia_ms: Optional[float] = None, taxa_429: Optional[float] = None):
+    if latencia_ms is not None:
+        _config["latencia_ms"] = latencia_ms
+    if taxa_429 is not None:
+        _config["taxa_429"] = taxa_429
+    return _config
+
+
+@app.post("/__mutar")
+def mutar(n: int = 10):
+    return {"alterados": _dados.mutar(n)}
+
+
+# ----------------- API ML -----------------
+def _parse_data(valor: Optional[str]) -> Optional[datetime]:
+    if not valor:
+        return None
+    dt = datetime.fromisoformat(valor.replace("Z", "+00:00"))
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+@app.get("/orders/search")
+def orders_search(
+    seller: int = Query(...),
+    offset: int = 0,
+    limit: int = 50,
+    sort: str = "date_desc",
+    date_from: Optional[str] = Query(None, alias="order.date_closed.from"),
+    date_to: Optional[str] = Query(None, alias="order.date_closed.to"),
+):
+    _stats["orders_search"] += 1
+    if seller != _dados.seller_id:
+        return {"results": [], "paging": {"total": 0, "offset": offset, "limit": limit}}
+    de, ate = _parse_data(date_from), _parse_data(date_to)
+    pedidos = [
+        p for p in _dados.pedidos.values()
+        if (de is None or _parse_data(p["date_closed"]) >= de)
+        and (ate is None or _parse_data(p["date_closed"]) <= ate)
+    ]
+    pedidos.sort(key=lambda p: p["date_closed"], reverse=(sort == "date_desc"))
+    pagina = pedidos[offset:offset + limit]
+    return {
+        "results": [{"id": p["id"], "status": p["status"], "date_closed": p["date_closed"]} for p in pagina],
+        "paging": {"total": len(pedidos), "offset": offset, "limit": limit},
+    }
+
+
+def _pedido(order_id: int) -> dict:
+    p = _dados.pedidos.get(order_id)
+    if p is None:
+        raise HTTPException(status_code=404, detail=f"Order {order_id} not found")
+    return p
+
+
+@app.get("/orders/{order_id}")
+def order(order_id: int):
+    _stats["orders"] += 1
+    return _pedido(order_id)
+
+
+@app.get("/orders/{order_id}/payments")
+def payments(order_id: int):
+    _stats["payments"] += 1
+    return _pedido(order_id)["payments"]
+
+
+@app.get("/shipments/{shipment_id}")
+def shipment(shipment_id: int):
+    _stats["shipments"] += 1
+    env = _dados.envios.get(shipment_id)
+    if env is None:
+        raise HTTPException(status_code=404, detail=f"Shipment {shipment_id} not found")
+    return env
+
+
+@app.get("/shipments/{shipment_id}/sla")
+def shipment_sla(shipment_id: int):
+    _stats["sla"] += 1
+    env = _dados.envios.get(shipment_id)
+    if env is None:
+        raise HTTPException(status_code=404, detail=f"Shipment {shipment_id} not found")
+    base = _parse_data(env["last_updated"]) or datetime.now(timezone.utc)
+    return {"status": "on_time", "expected_date": (base + timedelta(days=1)).isoformat()}
+
+
+@app.get("/shipment_labels")
+def shipment_labels(shipment_ids: str, response_type: str = "pdf"):
+    _stats["labels"] += 1
+    ids = [s for s in shipment_ids.split(",") if s]
+    if any(int(s) not in _dados.envios for s in ids):
+        raise HTTPException(status_code=404, detail="Shipment not found")
+    if response_type.startswith("zpl"):
+        corpo = "".join(f"^XA^FO50,50^A0N,40,40^FDShipment {s}^FS^XZ\n" for s in ids)
+        return Response(content=corpo, media_type="text/plain")
+    pdf = b"%PDF-1.4\n% stand-in label " + ",".join(ids).encode() + b"\n%%EOF\n"
+    return Response(content=pdf, media_type="application/pdf")
+
+
+@app.post("/oauth/token")
+def oauth_token(
+    grant_type: str = Form(...),
+    code: Optional[str] = Form(None),
+    refresh_token: Optional[str] = Form(None),
+):
+    """
+    Troca de code e renovação. code numérico vira o user_id (várias contas
+    sintéticas para teste de carga); o refresh_token carrega o user_id
+    (TG-<user_id>-<n>) e qualquer um nesse formato é aceito.
+    """
+    _stats["oauth"] += 1
+    if grant_type == "authorization_code" and code:
+        user_id = int(code) if code.isdigit() else _dados.seller_id
+    elif grant_type == "refresh_token" and refresh_token and refresh_token.startswith("TG-"):
+        try:
+            user_id = int(refresh_token.split("-")[1])
+        except (IndexError, ValueError):
+            raise HTTPException(status_code=400, detail="invalid_grant")
+    else:
+        raise HTTPException(status_code=400, detail="invalid_grant")
+    n = _stats["oauth"]
+    return {
+        "access_token": f"APP_USR-{user_id}-{n}",
+        "token_type": "bearer",
+        "expires_in": 21600,
+        "user_id": user_id,
+        "refresh_token": f"TG-{user_id}-{n}",
+    }
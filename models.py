@@ -1,4 +1,9 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float, BigInteger, Numeric
+from sqlalchemy import (
+    Column, Integer, SmallInteger, String, DateTime, Date, Float, BigInteger, Numeric, Boolean, Text,
+    UniqueConstraint, Index, ForeignKey, Computed,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, TSTZRANGE, ExcludeConstraint
+from sqlalchemy.sql import func, text
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
@@ -10,18 +15,35 @@ class UserToken(Base):
     access_token  = Column(String, nullable=False)
     refresh_token = Column(String, nullable=False)
     expires_at    = Column(DateTime, nullable=False)
+    nickname      = Column(String, nullable=True)
 
 class Sale(Base):
     __tablename__ = "sales"
+    # criados/alterados via migrations/ (migrate.py); manter os dois em sincronia
+    __table_args__ = (
+        # envios em aberto para a Expedição e o shipment_refresh.py
+        Index("ix_sales_shipment_open", "shipment_status", "shipment_delivery_sla"),
+        # período por conta: reconcile, carregar_vendas(conta), relatórios
+        Index("ix_sales_user_date_closed", "ml_user_id", "date_closed"),
+        # vigência de SKU por data do pedido (JOIN LATERAL com sku)
+        Index("ix_sales_sku_date_adjusted", "seller_sku", "date_adjusted"),
+        Index("ix_sales_item_id", "item_id"),
+        # backfill de taxas (sales.atualizar_fees_pendentes)
+        Index("ix_sales_fee_pendente", "ml_user_id", "date_closed", postgresql_where="ml_fee IS NULL"),
+    )
 
-    id               = Column(BigInteger, primary_key=True, index=True)
-    order_id         = Column(BigInteger, unique=True, index=True, nullable=False)
+    # particionada por mês de date_closed (particoes.py): no banco a PK é (id, date_closed)
+    # e a unicidade de order_id é garantida por sales_order_keys
+    id               = Column(BigInteger, primary_key=True)
+    order_id         = Column(BigInteger, index=True, nullable=False)
     ml_user_id       = Column(BigInteger, index=True, nullable=False)
     buyer_id         = Column(BigInteger, nullable=True)
     buyer_nickname   = Column(String, nullable=True)
     total_amount     = Column(Float, nullable=True)
     status           = Column(String, nullable=True)
     date_closed      = Column(DateTime, nullable=False)
+    # horário de Brasília (date_closed é gravado em UTC); coluna gerada pelo banco
+    date_adjusted    = Column(DateTime, Computed("date_closed - interval '3 hours'", persisted=True))
     item_id          = Column(String, nullable=True)
     item_title       = Column(String, nullable=True)
     quantity         = Column(Integer, nullable=True)
@@ -53,5 +75,271 @@ class Sale(Base):
     order_cost    = Column(Numeric(10, 2), nullable=True)
     base_cost     = Column(Numeric(10, 2), nullable=True)
     shipment_cost = Column(Numeric(10, 2), nullable=True)
+    frete_adjust  = Column(Numeric(10, 2), nullable=True)      # ajuste manual de frete
 
+    # 🔽 Hash do conteúdo reconciliável (reconcile._fingerprint);
+    #    quem altera a venda fora da ingestão/reconcile grava NULL aqui
+    row_hash      = Column(String(32), nullable=True)
 
+
+class FailedOrder(Base):
+    """Dead-letter de pedidos que falharam na ingestão/reconciliação (ver dead_letter.py)."""
+    __tablename__ = "failed_orders"
+    __table_args__ = (UniqueConstraint("order_id", "stage", name="uq_failed_orders_order_stage"),)
+
+    id              = Column(BigInteger, primary_key=True, index=True)
+    order_id        = Column(BigInteger, nullable=False)
+    ml_user_id      = Column(BigInteger, index=True, nullable=False)
+    stage           = Column(String, nullable=False)      # full_sales | incremental | revisao | reconcile
+    http_status     = Column(Integer, nullable=True)
+    error           = Column(String, nullable=True)
+    attempts        = Column(Integer, nullable=False, default=1)
+    next_retry_at   = Column(DateTime(timezone=True), index=True, nullable=True)
+    first_failed_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    last_failed_at  = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    resolved_at     = Column(DateTime(timezone=True), nullable=True)
+
+
+class ReconcileSchedule(Base):
+    """Agenda de reconciliação por pedido: tier pelo ciclo de vida e próxima checagem (ver reconcile_tiers.py)."""
+    __tablename__ = "reconcile_schedule"
+    __table_args__ = (Index("ix_reconcile_schedule_user_next", "ml_user_id", "next_check_at"),)
+
+    order_id        = Column(BigInteger, primary_key=True, autoincrement=False)
+    ml_user_id      = Column(BigInteger, nullable=False)
+    tier            = Column(String(8), nullable=False)    # hot | warm | cold
+    next_check_at   = Column(DateTime(timezone=True), nullable=False)
+    last_checked_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class JobRun(Base):
+    """Histórico de execuções do scheduler.py (uma linha por job e conta)."""
+    __tablename__ = "job_runs"
+    __table_args__ = (Index("ix_job_runs_job_started", "job", "started_at"),)
+
+    id          = Column(BigInteger, primary_key=True)
+    job         = Column(String, nullable=False)
+    ml_user_id  = Column(BigInteger, nullable=True)       # NULL = execução do job inteiro
+    status      = Column(String(10), nullable=False)      # ok | erro | pulado
+    started_at  = Column(DateTime(timezone=True), nullable=False)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    duration_s  = Column(Float, nullable=True)
+    detail      = Column(Text, nullable=True)
+
+
+class SaleChange(Base):
+    """Log append-only de mudanças em `sales`, preenchido pelo trigger sales_cdc (ver cdc.py)."""
+    __tablename__ = "sales_changes"
+
+    seq         = Column(BigInteger, primary_key=True)            # BIGSERIAL, cresce a cada mudança
+    txid        = Column(BigInteger, nullable=False, index=True, server_default=text("txid_current()"))
+    changed_at  = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    op          = Column(String(1), nullable=False)               # I | U | D
+    order_id    = Column(BigInteger, nullable=False, index=True)
+    ml_user_id  = Column(BigInteger, nullable=True)
+    changed     = Column(ARRAY(Text), nullable=True)              # colunas alteradas (só em U)
+    old         = Column(JSONB, nullable=True)
+    new         = Column(JSONB, nullable=True)
+
+
+class CdcCursor(Base):
+    """Posição de cada consumidor do sales_changes."""
+    __tablename__ = "cdc_cursors"
+
+    consumer    = Column(String, primary_key=True)
+    last_txid   = Column(BigInteger, nullable=False, default=0)   # limite exclusivo (xmin) já consumido
+    last_seq    = Column(BigInteger, nullable=False, default=0)
+    versao      = Column(BigInteger, nullable=False, default=0)   # +1 a cada lote aplicado (migrations/0010)
+    updated_at  = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+
+# ----------------- Cadastros / operação (páginas do Streamlit) -----------------
+class Sku(Base):
+    """Versões de custo/hierarquia por SKU; cada uma vale em valid_during, sem sobreposição."""
+    __tablename__ = "sku"
+    __table_args__ = (
+        # versão na data da venda: JOIN por valid_during @> date_adjusted (índice GiST da restrição)
+        ExcludeConstraint(("sku", "="), ("valid_during", "&&"), name="ex_sku_vigencia", using="gist"),
+        Index("ux_sku_vigente", "sku", unique=True, postgresql_where=text("upper_inf(valid_during)")),
+    )
+
+    id             = Column(BigInteger, primary_key=True)
+    sku            = Column(String, nullable=False)
+    level1         = Column(String, nullable=True)
+    level2         = Column(String, nullable=True)
+    custo_unitario = Column(Numeric(10, 2), nullable=True)
+    quantity       = Column(Integer, nullable=True)
+    date_created   = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    valid_during   = Column(TSTZRANGE, nullable=False, server_default=text("tstzrange(now(), NULL)"))
+    is_active      = Column(Boolean, Computed("upper_inf(valid_during)", persisted=True))
+
+
+class EstoqueRegistro(Base):
+    __tablename__ = "estoque_registros"
+
+    id            = Column(BigInteger, primary_key=True)
+    produto       = Column(String, nullable=False)
+    quantidade    = Column(Float, nullable=False)
+    observacao    = Column(Text, nullable=True)
+    data_registro = Column(DateTime, nullable=False, server_default=func.now())
+
+
+class Fornecedor(Base):
+    __tablename__ = "fornecedores"
+
+    id                = Column(BigInteger, primary_key=True)
+    empresa_nome      = Column(String, nullable=False)
+    cnpj              = Column(String, nullable=True)
+    referencia_nome   = Column(String, nullable=True)
+    whatsapp          = Column(String, nullable=True)
+    endereco_completo = Column(Text, nullable=True)
+    tipo_insumo       = Column(String, nullable=True)
+
+
+class Insumo(Base):
+    __tablename__ = "insumos"
+
+    id             = Column(BigInteger, primary_key=True)
+    descricao      = Column(String, nullable=False)
+    categoria      = Column(String, nullable=True)
+    classificacao  = Column(String, nullable=True)
+    unidade_medida = Column(String, nullable=True)
+    medida         = Column(String, nullable=True)
+    cores          = Column(String, nullable=True)
+    observacao     = Column(Text, nullable=True)
+
+
+class CompraInsumo(Base):
+    __tablename__ = "compras_insumos"
+    __table_args__ = (Index("ix_compras_insumos_datas", "data_compra", "data_entrega_esperada"),)
+
+    id                    = Column(BigInteger, primary_key=True)
+    fornecedor_id         = Column(BigInteger, ForeignKey("fornecedores.id"), nullable=True)
+    insumo_id             = Column(BigInteger, ForeignKey("insumos.id"), nullable=True)
+    quantidade            = Column(Numeric(12, 2), nullable=True)
+    preco_unitario        = Column(Numeric(12, 2), nullable=True)
+    total_compra          = Column(Numeric(12, 2), nullable=True)
+    data_compra           = Column(Date, nullable=False)
+    data_entrega_esperada = Column(Date, nullable=True)
+    observacoes           = Column(Text, nullable=True)
+
+
+class Stakeholder(Base):
+    __tablename__ = "stakeholders"
+
+    id         = Column(BigInteger, primary_key=True)
+    relacao    = Column(String, nullable=True)
+    nome       = Column(String, nullable=False)
+    whatsapp   = Column(String, nullable=True)
+    observacao = Column(Text, nullable=True)
+
+
+class Pessoa(Base):
+    __tablename__ = "pessoas"
+
+    id   = Column(BigInteger, primary_key=True)
+    nome = Column(String, nullable=False)
+
+
+class MetaMensalPessoa(Base):
+    __tablename__ = "meta_mensal_pessoas"
+    __table_args__ = (UniqueConstraint("pessoa_id", "ano_mes", name="uq_meta_mensal_pessoa_mes"),)
+
+    id            = Column(BigInteger, primary_key=True)
+    pessoa_id     = Column(BigInteger, ForeignKey("pessoas.id", ondelete="CASCADE"), nullable=False)
+    ano_mes       = Column(String(7), nullable=False)      # AAAA-MM
+    meta_unidades = Column(Integer, nullable=False, default=0)
+
+
+class ProducaoDiariaPessoa(Base):
+    __tablename__ = "producao_diaria_pessoas"
+    __table_args__ = (UniqueConstraint("pessoa_id", "data", name="uq_producao_pessoa_data"),)
+
+    id         = Column(BigInteger, primary_key=True)
+    pessoa_id  = Column(BigInteger, ForeignKey("pessoas.id", ondelete="CASCADE"), nullable=False)
+    data       = Column(Date, nullable=False)
+    quantidade = Column(Integer, nullable=False, default=0)
+
+
+class Cotacao(Base):
+    __tablename__ = "cotacoes"
+
+    id             = Column(BigInteger, primary_key=True)
+    data_simulacao = Column(DateTime, nullable=False, server_default=func.now())
+    produto        = Column(String, nullable=False)
+    custo_unitario = Column(Numeric(12, 2), nullable=True)
+
+
+class SalesDailyAgg(Base):
+    """Medidas pré-somadas por dia/hora e dimensões de filtro (agregados.py)."""
+    __tablename__ = "sales_daily_agg"
+    __table_args__ = (
+        Index("ix_sales_daily_agg_dia", "dia"),
+        Index("ix_sales_daily_agg_user_dia", "ml_user_id", "dia"),
+    )
+
+    id            = Column(BigInteger, primary_key=True)
+    dia           = Column(Date, nullable=False)                 # date_adjusted (Brasília)
+    hora          = Column(SmallInteger, nullable=False)
+    ml_user_id    = Column(BigInteger, nullable=False)
+    level1        = Column(String, nullable=True)
+    level2        = Column(String, nullable=True)
+    logistic_type = Column(String, nullable=True)                # shipment_logistic_type cru
+    status        = Column(String, nullable=True)                # status cru (traduzido no app)
+    faixa_preco   = Column(String(6), nullable=False)            # low | high | outros
+    vendas        = Column(Integer, nullable=False)
+    faturamento   = Column(Numeric(14, 2), nullable=False)
+    unidades      = Column(BigInteger, nullable=False)
+    frete         = Column(Numeric(14, 2), nullable=False)
+    taxa_ml       = Column(Numeric(14, 2), nullable=False)
+    cmv           = Column(Numeric(14, 2), nullable=False)
+    custo_flex          = Column(Numeric(14, 2), nullable=False, server_default="0")   # somas do sales_pnl
+    margem_contribuicao = Column(Numeric(14, 2), nullable=False, server_default="0")
+
+
+class SkuPendente(Base):
+    """SKU alterado cujas vendas ainda não receberam a versão nova (sku_reaplicar.py)."""
+    __tablename__ = "sku_pendentes"
+
+    sku        = Column(String, primary_key=True)
+    marcado_em = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+
+class SalesArquivo(Base):
+    """Manifesto dos meses de sales movidos para Parquet (arquivo.py)."""
+    __tablename__ = "sales_arquivo"
+
+    mes          = Column(Date, primary_key=True)                 # 1º dia do mês de date_closed
+    ml_user_id   = Column(BigInteger, primary_key=True, autoincrement=False)
+    linhas       = Column(Integer, nullable=False)
+    bytes        = Column(BigInteger, nullable=False)
+    caminho      = Column(Text, nullable=False)                   # relativo a ARQUIVO_URI
+    arquivado_em = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+
+class CustoParametro(Base):
+    """Custo configurável (ex.: envio FLEX) com vigência por data (pnl.py)."""
+    __tablename__ = "custos_parametros"
+
+    nome          = Column(String, primary_key=True)
+    vigente_desde = Column(Date, primary_key=True)
+    valor         = Column(Numeric(12, 4), nullable=False)
+    criado_em     = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+
+class SalesPnl(Base):
+    """Resultado de cada pedido, mantido pelo trigger sales_pnl_sync; custos negativos (pnl.py)."""
+    __tablename__ = "sales_pnl"
+    __table_args__ = (Index("ix_sales_pnl_dia", "dia"),)
+
+    order_id            = Column(BigInteger, primary_key=True, autoincrement=False)
+    ml_user_id          = Column(BigInteger, nullable=False)
+    dia                 = Column(Date, nullable=False)                 # date_adjusted (Brasília)
+    receita             = Column(Numeric(14, 2), nullable=False)
+    taxa_plataforma     = Column(Numeric(14, 2), nullable=False)
+    custo_frete         = Column(Numeric(14, 2), nullable=False)
+    custo_flex          = Column(Numeric(14, 2), nullable=False)
+    cmv                 = Column(Numeric(14, 2), nullable=False)
+    margem_contribuicao = Column(Numeric(14, 2), nullable=False)
+    unidades            = Column(Integer, nullable=False)
+    atualizado_em       = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
@@ -1,26 +1,35 @@
 # oauth.py
 
-import os
+import asyncio
 import requests
-from dotenv import load_dotenv
+import httpx
 from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import select, text, update
+from sqlalchemy.dialects.postgresql import insert
 
-from db import SessionLocal
 from models import UserToken
+from settings import settings
+
+# ---- Config ----
+MARGEM_RENOVACAO = timedelta(minutes=10)    # renova quem vence antes disso
+TIMEOUT_ML = 15
+
+
+def _credenciais():
+    """Configuração do app no ML; as variáveis só são exigidas quando há troca de token."""
+    return settings().exigir("ml_client_id", "ml_client_secret", "backend_url")
 
-# 1) Carregar .env e variáveis obrigatórias
-load_dotenv()
-CLIENT_ID     = os.getenv("ML_CLIENT_ID")
-CLIENT_SECRET = os.getenv("ML_CLIENT_SECRET")
-BACKEND_URL   = os.getenv("BACKEND_URL")
-if not all([CLIENT_ID, CLIENT_SECRET, BACKEND_URL]):
-    raise RuntimeError("⚠️ ML_CLIENT_ID, ML_CLIENT_SECRET e BACKEND_URL devem estar definidos no .env")
 
-# 2) Seu endpoint de callback no backend
-REDIRECT_URI = f"{BACKEND_URL}/auth/callback"
+def _redirect_uri() -> str:
+    # endpoint de callback no backend
+    return f"{_credenciais().backend_url}/auth/callback"
 
-# 3) URL para trocar code por token
-TOKEN_URL = "https://api.mercadolibre.com/oauth/token"
+
+def _token_url() -> str:
+    # URL para trocar code por token (ML_API_URL permite usar o stand-in local)
+    return f"{settings().ml_api_url}/oauth/token"
 
 
 def get_auth_url() -> str:
@@ -31,24 +40,39 @@ def get_auth_url() -> str:
     return (
         "https://auth.mercadolivre.com.br/authorization"
         f"?response_type=code"
-        f"&client_id={CLIENT_ID}"
-        f"&redirect_uri={REDIRECT_URI}"
+        f"&client_id={_credenciais().ml_client_id}"
+        f"&redirect_uri={_redirect_uri()}"
     )
 
 
+def _payload_code(code: str) -> dict:
+    cfg = _credenciais()
+    return {
+        "grant_type":    "authorization_code",
+        "client_id":     cfg.ml_client_id,
+        "client_secret": cfg.ml_client_secret,
+        "code":          code,
+        "redirect_uri":  _redirect_uri(),
+    }
+
+
+def _payload_refresh(refresh_token: str) -> dict:
+    cfg = _credenciais()
+    return {
+        "grant_type":    "refresh_token",
+        "client_id":     cfg.ml_client_id,
+        "client_secret": cfg.ml_client_secret,
+        "refresh_token": refresh_token,
+    }
+
+
 def exchange_code(code: str) -> dict:
     """
     Troca o authorization_code por access_token e refresh_token,
     faz upsert em user_tokens e retorna o payload completo.
     """
-    payload = {
-        "grant_type":    "authorization_code",
-        "client_id":     CLIENT_ID,
-        "client_secret": CLIENT_SECRET,
-        "code":          code,
-        "redirect_uri":  REDIRECT_URI,
-    }
-    resp = requests.post(TOKEN_URL, data=payload)
+    from db import SessionLocal
+    resp = requests.post(_token_url(), data=_payload_code(code))
     data = resp.json()
     if resp.status_code != 200:
         raise Exception(f"Erro ao trocar code por token: {data}")
@@ -85,40 +109,169 @@ def exchange_code(code: str) -> dict:
     return data
 
 
-def renovar_access_token(ml_user_id: int) -> str | None:
+def renovar_access_token(
+    ml_user_id: int,
+    margem: Optional[timedelta] = None,
+    recusado: Optional[str] = None,
+) -> str | None:
     """
-    Renova o token usando o refresh_token gravado no banco.
-    Retorna o novo access_token ou None em caso de falha.
+    Renova o token usando o refresh_token gravado no banco. O refresh_token do
+    ML é de uso único: a renovação de cada conta roda sob
+    pg_advisory_xact_lock(ml_user_id) e grava com compare-and-swap no
+    refresh_token, então jobs e processos simultâneos não trocam o mesmo token
+    duas vezes. Dentro do lock, devolve o token gravado sem chamar o ML se
+    outro já renovou: ele vale por mais que `margem`, ou difere de `recusado`
+    (o token que acabou de levar 401).
+    Retorna o access_token ou None em caso de falha.
     """
-    db = SessionLocal()
+    from db import engine
+    uid = int(ml_user_id)
     try:
-        token = db.query(UserToken).filter_by(ml_user_id=ml_user_id).first()
-        if not token:
-            print(f"⚠️ Usuário {ml_user_id} não encontrado no banco.")
-            return None
-
-        payload = {
-            "grant_type":    "refresh_token",
-            "client_id":     CLIENT_ID,
-            "client_secret": CLIENT_SECRET,
-            "refresh_token": token.refresh_token,
-        }
-        resp = requests.post(TOKEN_URL, data=payload)
-        data = resp.json()
-        if resp.status_code != 200:
-            print(f"⚠️ Erro ao renovar token: {data}")
-            return None
-
-        token.access_token  = data["access_token"]
-        token.refresh_token = data["refresh_token"]
-        token.expires_at    = datetime.utcnow() + timedelta(seconds=data["expires_in"])
-        db.commit()
-        return token.access_token
+        with engine.begin() as conn:
+            conn.execute(text("SELECT pg_advisory_xact_lock(:uid)"), {"uid": uid})
+            atual = conn.execute(text("""
+                SELECT access_token, refresh_token, expires_at FROM user_tokens WHERE ml_user_id = :uid
+            """), {"uid": uid}).first()
+            if not atual:
+                print(f"⚠️ Usuário {ml_user_id} não encontrado no banco.")
+                return None
+            if recusado is not None and atual.access_token != recusado:
+                return atual.access_token
+            if margem is not None and atual.expires_at and atual.expires_at > datetime.utcnow() + margem:
+                return atual.access_token
+
+            resp = requests.post(_token_url(), data=_payload_refresh(atual.refresh_token), timeout=TIMEOUT_ML)
+            data = resp.json()
+            if resp.status_code != 200:
+                print(f"⚠️ Erro ao renovar token: {data}")
+                return None
+
+            conn.execute(text("""
+                UPDATE user_tokens
+                   SET access_token = :access, refresh_token = :refresh, expires_at = :expira
+                 WHERE ml_user_id = :uid AND refresh_token = :anterior
+            """), {
+                "uid": uid,
+                "access": data["access_token"],
+                "refresh": data["refresh_token"],
+                "expira": datetime.utcnow() + timedelta(seconds=data["expires_in"]),
+                "anterior": atual.refresh_token,
+            })
+            return data["access_token"]
 
     except Exception as e:
-        db.rollback()
         print(f"❌ Erro na renovação do token: {e}")
         return None
 
+
+def token_valido(ml_user_id: int, margem: timedelta = MARGEM_RENOVACAO) -> str | None:
+    """
+    access_token para usar agora: o gravado enquanto vale por mais que `margem`
+    (uma leitura, sem chamar o ML); perto de vencer, renovado. None se não há
+    token utilizável.
+    """
+    from db import engine
+    with engine.connect() as conn:
+        atual = conn.execute(text(
+            "SELECT access_token, expires_at FROM user_tokens WHERE ml_user_id = :uid"
+        ), {"uid": int(ml_user_id)}).first()
+    if not atual:
+        return None
+    agora = datetime.utcnow()
+    if atual.expires_at and atual.expires_at > agora + margem:
+        return atual.access_token
+    novo = renovar_access_token(ml_user_id, margem=margem)
+    if novo:
+        return novo
+    # renovação falhou: o gravado ainda serve se não venceu
+    return atual.access_token if atual.expires_at and atual.expires_at > agora else None
+
+
+# ----------------- Versões async (api.py) -----------------
+# Nenhuma conexão fica presa durante a chamada ao ML: lê o refresh_token,
+# solta a conexão, chama o ML e grava numa segunda transação curta.
+_renovacoes: Dict[int, asyncio.Future] = {}
+
+
+async def exchange_code_async(code: str, http: httpx.AsyncClient) -> dict:
+    """exchange_code sem bloquear o event loop (httpx + sessão async)."""
+    from db import AsyncSessionLocal
+    resp = await http.post(_token_url(), data=_payload_code(code))
+    data = resp.json()
+    if resp.status_code != 200:
+        raise Exception(f"Erro ao trocar code por token: {data}")
+
+    expires_at = datetime.utcnow() + timedelta(seconds=data["expires_in"])
+    stmt = insert(UserToken).values(
+        ml_user_id    = data["user_id"],
+        access_token  = data["access_token"],
+        refresh_token = data["refresh_token"],
+        expires_at    = expires_at,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UserToken.ml_user_id],
+        set_={
+            "access_token":  stmt.excluded.access_token,
+            "refresh_token": stmt.excluded.refresh_token,
+            "expires_at":    stmt.excluded.expires_at,
+        },
+    )
+    async with AsyncSessionLocal() as db:
+        async with db.begin():
+            await db.execute(stmt)
+    return data
+
+
+async def _renovar_async(ml_user_id: int, http: httpx.AsyncClient) -> str | None:
+    from db import AsyncSessionLocal
+    async with AsyncSessionLocal() as db:
+        refresh_token = (await db.execute(
+            select(UserToken.refresh_token).where(UserToken.ml_user_id == ml_user_id)
+        )).scalar()
+    if not refresh_token:
+        print(f"⚠️ Usuário {ml_user_id} não encontrado no banco.")
+        return None
+
+    resp = await http.post(_token_url(), data=_payload_refresh(refresh_token))
+    data = resp.json()
+    if resp.status_code != 200:
+        print(f"⚠️ Erro ao renovar token: {data}")
+        return None
+
+    async with AsyncSessionLocal() as db:
+        async with db.begin():
+            # só grava se ninguém (outro processo) trocou o refresh_token no meio
+            await db.execute(
+                update(UserToken)
+                .where(UserToken.ml_user_id == ml_user_id, UserToken.refresh_token == refresh_token)
+                .values(
+                    access_token  = data["access_token"],
+                    refresh_token = data["refresh_token"],
+                    expires_at    = datetime.utcnow() + timedelta(seconds=data["expires_in"]),
+                )
+            )
+    return data["access_token"]
+
+
+async def renovar_access_token_async(ml_user_id: int, http: httpx.AsyncClient) -> str | None:
+    """
+    renovar_access_token async. Pedidos simultâneos para a mesma conta esperam
+    a mesma renovação: o refresh_token do ML é de uso único, e uma segunda
+    troca com o mesmo token falharia.
+    """
+    em_andamento = _renovacoes.get(ml_user_id)
+    if em_andamento is not None:
+        return await asyncio.shield(em_andamento)
+
+    futuro = asyncio.get_running_loop().create_future()
+    _renovacoes[ml_user_id] = futuro
+    token = None
+    try:
+        token = await _renovar_async(ml_user_id, http)
+    except Exception as e:
+        print(f"❌ Erro na renovação do token: {e}")
     finally:
-        db.close()
+        # mesmo cancelado, quem está esperando recebe resposta
+        _renovacoes.pop(ml_user_id, None)
+        futuro.set_result(token)
+    return token
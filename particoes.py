@@ -0,0 +1,203 @@
+# particoes.py – partições mensais de sales (migração online, criação e arquivamento)
+"""
+`sales` é particionada por RANGE(date_closed), uma partição por mês
+(sales_pAAAAMM) mais a sales_p_default para o que cair fora delas. Consultas
+com filtro em date_closed só leem os meses do intervalo (partition pruning),
+então a janela recente custa o mesmo com 1 ou 5 anos de histórico, e um mês
+antigo sai da tabela com um DETACH em vez de um DELETE.
+
+Estrutura e troca de nomes: migrations/0004_sales_particionada.sql.
+
+    python particoes.py --migrar          # copia sales -> sales_particionada online e troca
+    python particoes.py --garantir        # cria os meses que faltam (também é job do scheduler)
+    python particoes.py --listar
+    python particoes.py --desanexar 2024-05
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import time
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+
+# ---- Config ----
+MESES_A_FRENTE = 3          # partições criadas antes de chegar venda no mês
+LOTE_COPIA     = 20_000     # linhas por transação na cópia online
+
+
+def nome_particao(mes: date) -> str:
+    return f"sales_p{mes:%Y%m}"
+
+
+def _engine(engine=None):
+    if engine is None:
+        from db import engine
+    return engine
+
+
+def particionada(engine=None) -> bool:
+    with _engine(engine).connect() as conn:
+        return conn.execute(text(
+            "SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass('sales')"
+        )).scalar() or False
+
+
+def garantir_particoes(meses_a_frente: int = MESES_A_FRENTE, desde: Optional[date] = None, engine=None) -> int:
+    """
+    Cria as partições mensais que faltam, de `desde` até meses à frente. O padrão
+    é utils.DATA_INICIO ou, se já houver histórico arquivado (arquivo.py), o mês
+    seguinte ao último arquivado — senão o mês apagado voltaria vazio.
+    """
+    with _engine(engine).begin() as conn:
+        if desde is None:
+            from utils import DATA_INICIO
+            desde = DATA_INICIO.date()
+            ultimo = conn.execute(text("SELECT MAX(mes) FROM sales_arquivo")).scalar()
+            if ultimo is not None:
+                desde = max(desde, (ultimo.replace(day=28) + timedelta(days=4)).replace(day=1))
+        criadas = conn.execute(
+            text("SELECT garantir_particoes_sales(:desde, :meses)"), {"desde": desde, "meses": meses_a_frente}
+        ).scalar()
+    if criadas:
+        logging.info(f"🗂️ {criadas} partições de sales criadas")
+    return criadas
+
+
+def listar_particoes(engine=None) -> List[Dict[str, Any]]:
+    """Partições de sales com limites, linhas estimadas e tamanho."""
+    with _engine(engine).connect() as conn:
+        rows = conn.execute(text("""
+            SELECT c.relname AS particao,
+                   pg_get_expr(c.relpartbound, c.oid) AS limites,
+                   c.reltuples::bigint AS linhas_estimadas,
+                   pg_size_pretty(pg_total_relation_size(c.oid)) AS tamanho
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass('sales')
+            ORDER BY c.relname
+        """)).mappings().all()
+    return [dict(r) for r in rows]
+
+
+def desanexar_mes(ano: int, mes: int, engine=None) -> str:
+    """
+    Tira o mês de `sales` sem apagar nada: a partição vira uma tabela comum com
+    o mesmo nome (para arquivar e depois dropar). Os pedidos continuam
+    reservados em sales_order_keys; a ingestão e o reprocessamento pulam pedido
+    reservado sem linha viva (sales._pedidos_arquivados) em vez de reinseri-lo.
+    """
+    nome = nome_particao(date(ano, mes, 1))
+    with _engine(engine).begin() as conn:
+        conn.execute(text(f'ALTER TABLE sales DETACH PARTITION "{nome}"'))
+    logging.info(f"📦 {nome} desanexada de sales")
+    return nome
+
+
+# ----------------- Migração online -----------------
+def _colunas_copiaveis(conn) -> List[str]:
+    """Colunas de sales menos as geradas (date_adjusted é recalculada pelo banco)."""
+    return list(conn.execute(text("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'sales' AND is_generated = 'NEVER'
+        ORDER BY ordinal_position
+    """)).scalars())
+
+
+def _instalar_sincronia(conn, cols: List[str]) -> None:
+    """Trigger na sales antiga que espelha cada escrita na particionada enquanto a cópia anda."""
+    lista = ", ".join(cols)
+    novos = ", ".join(f"NEW.{c}" for c in cols)
+    conn.execute(text(f"""
+        CREATE OR REPLACE FUNCTION sales_sync_particionada() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                DELETE FROM sales_particionada WHERE id = OLD.id AND date_closed = OLD.date_closed;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO sales_particionada ({lista}) VALUES ({novos});
+                RETURN NEW;
+            END IF;
+            RETURN OLD;
+        END $$
+    """))
+    conn.execute(text("""
+        DO $$ BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'trg_sales_sync_particionada'
+                                                      AND tgrelid = 'sales'::regclass) THEN
+                CREATE TRIGGER trg_sales_sync_particionada AFTER INSERT OR UPDATE OR DELETE ON sales
+                    FOR EACH ROW EXECUTE FUNCTION sales_sync_particionada();
+            END IF;
+        END $$
+    """))
+
+
+def migrar_online(lote: int = LOTE_COPIA, engine=None) -> Dict[str, int]:
+    """
+    Copia a sales atual para a particionada sem parar a ingestão:
+    1. cria as partições de todo o intervalo de date_closed existente;
+    2. instala o trigger de sincronia (escritas novas já vão para as duas);
+    3. copia por faixas de id, uma transação curta por lote;
+    4. troca os nomes sob lock exclusivo (sales_trocar_particionada()).
+    Pode ser interrompida e rodada de novo: linhas já copiadas são puladas.
+    """
+    eng = _engine(engine)
+    if particionada(eng):
+        logging.info("sales já é particionada.")
+        return {"copiadas": 0}
+
+    with eng.connect() as conn:
+        minimo = conn.execute(text("SELECT MIN(date_closed) FROM sales")).scalar()
+    # partições antes da sincronia, senão as escritas novas caem na default
+    garantir_particoes(desde=(minimo.date() if minimo else None), engine=eng)
+    with eng.begin() as conn:
+        cols = _colunas_copiaveis(conn)
+        _instalar_sincronia(conn, cols)
+    # lido depois do trigger: todo id acima disso já chega pela sincronia
+    with eng.connect() as conn:
+        id_max = conn.execute(text("SELECT MAX(id) FROM sales")).scalar()
+
+    lista = ", ".join(cols)
+    copiadas, inicio, de = 0, time.perf_counter(), 0
+    while id_max is not None and de < id_max:
+        ate = de + lote
+        with eng.begin() as conn:
+            res = conn.execute(text(f"""
+                INSERT INTO sales_particionada ({lista})
+                SELECT {lista} FROM sales s
+                WHERE s.id > :de AND s.id <= :ate
+                  AND NOT EXISTS (SELECT 1 FROM sales_order_keys k WHERE k.order_id = s.order_id)
+                ON CONFLICT DO NOTHING
+            """), {"de": de, "ate": ate})
+            copiadas += res.rowcount or 0
+        logging.info(f"🚚 Cópia até id {ate}/{id_max} | {copiadas} linhas | {time.perf_counter() - inicio:.0f}s")
+        de = ate
+
+    with eng.begin() as conn:
+        conn.execute(text("SET LOCAL lock_timeout = '10s'"))
+        conn.execute(text("SELECT sales_trocar_particionada()"))
+    logging.info(f"✅ sales particionada: {copiadas} linhas copiadas; tabela antiga em sales_legado")
+    return {"copiadas": copiadas}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--migrar", action="store_true", help="migração online para a tabela particionada")
+    ap.add_argument("--garantir", action="store_true", help="cria as partições que faltam")
+    ap.add_argument("--listar", action="store_true", help="lista partições")
+    ap.add_argument("--desanexar", metavar="AAAA-MM", help="desanexa o mês de sales")
+    args = ap.parse_args()
+
+    if args.migrar:
+        migrar_online()
+    if args.garantir:
+        garantir_particoes()
+    if args.desanexar:
+        ano, mes = (int(p) for p in args.desanexar.split("-"))
+        desanexar_mes(ano, mes)
+    if args.listar:
+        for p in listar_particoes():
+            print(f"{p['particao']:18} {p['limites']:70} {p['linhas_estimadas']:>10} {p['tamanho']:>10}")
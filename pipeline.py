@@ -0,0 +1,250 @@
+# pipeline.py – pipeline produtor/consumidor com filas limitadas
+"""
+Encadeia estágios em threads ligados por filas limitadas (backpressure):
+quando um estágio lento enche a fila de entrada, o anterior bloqueia em vez de
+acumular memória. Cada estágio expõe vazão, tempo ocupado e profundidade da
+fila, para que o gargalo fique visível no log.
+
+    pipe = Pipeline("reconcile")
+    pipe.fonte(ids)                                   # produtor
+    pipe.estagio("fetch", buscar, workers=12)         # item -> item | None
+    pipe.estagio("map", mapear, workers=4)
+    pipe.lote("write", gravar, tamanho=200)           # list[item] -> None
+    metricas = pipe.executar()
+
+Retornar None descarta o item. Exceção num estágio conta como erro e descarta
+o item; com `fatal=True` aborta o pipeline e é relançada por `executar()`.
+"""
+from __future__ import annotations
+
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+_FIM = object()
+
+
+@dataclass
+class MetricasEstagio:
+    nome: str
+    workers: int
+    capacidade: int
+    entrada: int = 0
+    saida: int = 0
+    erros: int = 0
+    ocupado_s: float = 0.0
+    fila_max: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def registrar(self, ok: bool, produziu: int, dt: float, qtd: int = 1) -> None:
+        with self._lock:
+            self.entrada += qtd
+            self.saida += produziu
+            self.erros += 0 if ok else 1
+            self.ocupado_s += dt
+
+    def resumo(self, elapsed: float, fila_atual: int) -> Dict[str, Any]:
+        elapsed = max(elapsed, 1e-9)
+        return {
+            "entrada": self.entrada,
+            "saida": self.saida,
+            "erros": self.erros,
+            "itens_s": round(self.entrada / elapsed, 1),
+            "ocupacao": round(self.ocupado_s / (elapsed * self.workers), 2),
+            "fila": fila_atual,
+            "fila_max": self.fila_max,
+            "capacidade": self.capacidade,
+        }
+
+
+class _Estagio:
+    def __init__(self, nome: str, funcao: Callable, workers: int, capacidade: int,
+                 fatal: bool, lote: Optional[int] = None, espera_max: float = 1.0,
+                 finalizar: Optional[Callable[[], None]] = None):
+        self.nome = nome
+        self.funcao = funcao
+        self.workers = workers
+        self.fatal = fatal
+        self.lote = lote
+        self.espera_max = espera_max
+        self.finalizar = finalizar
+        self.entrada: queue.Queue = queue.Queue(maxsize=capacidade)
+        self.metricas = MetricasEstagio(nome, workers, capacidade)
+        self._ativos = workers
+        self._lock = threading.Lock()
+
+    def put(self, item: Any) -> None:
+        self.entrada.put(item)
+        depth = self.entrada.qsize()
+        if depth > self.metricas.fila_max:
+            self.metricas.fila_max = depth
+
+    def worker_terminou(self) -> bool:
+        """True para o último worker do estágio a terminar."""
+        with self._lock:
+            self._ativos -= 1
+            return self._ativos == 0
+
+
+class Pipeline:
+    def __init__(self, nome: str, log_intervalo: float = 10.0):
+        self.nome = nome
+        self.log_intervalo = log_intervalo
+        self._fonte: Iterable[Any] = ()
+        self._estagios: List[_Estagio] = []
+        self._abortar = threading.Event()
+        self._erro_fatal: Optional[BaseException] = None
+        self._produzidos = 0
+        self._t0 = 0.0
+
+    # ---- montagem ----
+    def fonte(self, itens: Iterable[Any]) -> "Pipeline":
+        self._fonte = itens
+        return self
+
+    def estagio(self, nome: str, funcao: Callable[[Any], Any], workers: int = 1,
+                capacidade: int = 500, fatal: bool = False,
+                finalizar: Optional[Callable[[], None]] = None) -> "Pipeline":
+        self._estagios.append(_Estagio(nome, funcao, workers, capacidade, fatal, finalizar=finalizar))
+        return self
+
+    def lote(self, nome: str, funcao: Callable[[List[Any]], Any], tamanho: int = 200,
+             espera_max: float = 1.0, workers: int = 1, capacidade: int = 1000,
+             fatal: bool = True, finalizar: Optional[Callable[[], None]] = None) -> "Pipeline":
+        """Estágio que recebe listas de até `tamanho` itens (ou o que chegou em `espera_max` s)."""
+        self._estagios.append(_Estagio(nome, funcao, workers, capacidade, fatal, tamanho,
+                                       espera_max, finalizar))
+        return self
+
+    # ---- execução ----
+    def _emitir(self, idx: int, item: Any) -> None:
+        if idx < len(self._estagios):
+            self._estagios[idx].put(item)
+
+    def _encerrar(self, idx: int) -> None:
+        if idx < len(self._estagios):
+            for _ in range(self._estagios[idx].workers):
+                self._estagios[idx].entrada.put(_FIM)
+
+    def _falhou(self, est: _Estagio, e: BaseException) -> None:
+        logging.warning(f"[{self.nome}:{est.nome}] erro: {e}")
+        if est.fatal and not self._abortar.is_set():
+            self._erro_fatal = e
+            self._abortar.set()
+
+    def _produtor(self) -> None:
+        try:
+            for item in self._fonte:
+                if self._abortar.is_set():
+                    break
+                self._emitir(0, item)
+                self._produzidos += 1
+        except BaseException as e:
+            self._erro_fatal = e
+            self._abortar.set()
+        finally:
+            self._encerrar(0)
+
+    def _rodar_item(self, idx: int, est: _Estagio, item: Any) -> None:
+        t = time.perf_counter()
+        try:
+            out = est.funcao(item)
+        except Exception as e:
+            est.metricas.registrar(False, 0, time.perf_counter() - t)
+            self._falhou(est, e)
+            return
+        est.metricas.registrar(True, 0 if out is None else 1, time.perf_counter() - t)
+        if out is not None:
+            self._emitir(idx + 1, out)
+
+    def _rodar_lote(self, est: _Estagio, itens: List[Any]) -> None:
+        t = time.perf_counter()
+        try:
+            est.funcao(itens)
+            est.metricas.registrar(True, len(itens), time.perf_counter() - t, qtd=len(itens))
+        except Exception as e:
+            est.metricas.registrar(False, 0, time.perf_counter() - t, qtd=len(itens))
+            self._falhou(est, e)
+
+    def _worker(self, idx: int, est: _Estagio) -> None:
+        pendentes: List[Any] = []
+        limite = time.monotonic() + est.espera_max
+        try:
+            while True:
+                if est.lote:
+                    try:
+                        item = est.entrada.get(timeout=max(limite - time.monotonic(), 0.01))
+                    except queue.Empty:
+                        item = None
+                    if item is not _FIM and item is not None:
+                        pendentes.append(item)
+                    cheio = len(pendentes) >= est.lote
+                    if pendentes and (cheio or item is _FIM or time.monotonic() >= limite):
+                        if not self._abortar.is_set():
+                            self._rodar_lote(est, pendentes)
+                        pendentes = []
+                    if time.monotonic() >= limite or cheio:
+                        limite = time.monotonic() + est.espera_max
+                    if item is _FIM:
+                        break
+                    continue
+
+                item = est.entrada.get()
+                if item is _FIM:
+                    break
+                if self._abortar.is_set():
+                    continue          # só drena a fila até o fim
+                self._rodar_item(idx, est, item)
+        finally:
+            if est.finalizar:
+                try:
+                    est.finalizar()
+                except Exception as e:
+                    logging.warning(f"[{self.nome}:{est.nome}] erro ao finalizar worker: {e}")
+            if est.worker_terminou():
+                self._encerrar(idx + 1)
+
+    def metricas(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self._t0
+        return {
+            "segundos": round(elapsed, 2),
+            "produzidos": self._produzidos,
+            "estagios": {e.nome: e.metricas.resumo(elapsed, e.entrada.qsize()) for e in self._estagios},
+        }
+
+    def _log_metricas(self) -> None:
+        m = self.metricas()
+        partes = [
+            f"{nome}: {r['entrada']} it ({r['itens_s']}/s) ocup={r['ocupacao']:.0%} "
+            f"fila={r['fila']}/{r['capacidade']}"
+            for nome, r in m["estagios"].items()
+        ]
+        logging.info(f"[{self.nome}] {m['segundos']:.0f}s | produzidos={m['produzidos']} | " + " | ".join(partes))
+
+    def executar(self) -> Dict[str, Any]:
+        if not self._estagios:
+            raise ValueError("Pipeline sem estágios.")
+        self._t0 = time.perf_counter()
+        threads = [threading.Thread(target=self._produtor, name=f"{self.nome}-fonte", daemon=True)]
+        for idx, est in enumerate(self._estagios):
+            for w in range(est.workers):
+                threads.append(threading.Thread(target=self._worker, args=(idx, est),
+                                                name=f"{self.nome}-{est.nome}-{w}", daemon=True))
+        for t in threads:
+            t.start()
+
+        proximo_log = time.monotonic() + self.log_intervalo
+        for t in threads:
+            while t.is_alive():
+                t.join(timeout=max(proximo_log - time.monotonic(), 0.05))
+                if time.monotonic() >= proximo_log:
+                    self._log_metricas()
+                    proximo_log = time.monotonic() + self.log_intervalo
+
+        self._log_metricas()
+        if self._erro_fatal is not None:
+            raise self._erro_fatal
+        return self.metricas()
@@ -0,0 +1,146 @@
+# pnl.py – resultado por pedido (sales_pnl) e parâmetros de custo versionados
+"""
+Dashboard e Relatórios recalculavam a margem a cada render, em pandas, com o
+custo FLEX fixo no código. Agora cada pedido tem seu resultado em `sales_pnl`
+(migrations/0009), gravado pelo trigger de sales na mesma transação de quem
+escreve a venda; as páginas só leem.
+
+Custos que não vêm do pedido ficam em `custos_parametros`, com vigência por
+data. Gravar uma versão nova recalcula os pedidos a partir da vigência (por
+mês, para podar as partições) e os dias correspondentes do sales_daily_agg.
+
+    python pnl.py --listar
+    python pnl.py --parametro flex_envio 13.50 --desde 2025-07-01
+    python pnl.py --recalcular [--desde 2025-01-01]
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import text
+
+# ---- Config ----
+PARAMETROS = {
+    "flex_envio": "custo por envio FLEX (self_service), R$",
+}
+# colunas de resultado que acompanham a venda nas leituras (e no arquivo Parquet)
+COLUNAS = ["taxa_plataforma", "custo_frete", "custo_flex", "cmv", "margem_contribuicao", "unidades"]
+
+# mesma conta do trigger (sales_pnl_valores), para uma faixa de date_closed
+_SQL_RECALCULAR = """
+    INSERT INTO sales_pnl (order_id, ml_user_id, dia, receita, taxa_plataforma, custo_frete,
+                           custo_flex, cmv, margem_contribuicao, unidades)
+    SELECT s.order_id, s.ml_user_id, CAST(s.date_adjusted AS date), v.*
+    FROM sales s
+    CROSS JOIN LATERAL sales_pnl_valores(CAST(s.total_amount AS numeric), s.ml_fee, s.frete_adjust,
+                                         s.shipment_logistic_type, s.quantity, s.quantity_sku,
+                                         s.custo_unitario, CAST(s.date_adjusted AS date)) v
+    WHERE s.date_closed >= :ini AND s.date_closed < :fim
+    ON CONFLICT (order_id) DO UPDATE SET
+        ml_user_id = EXCLUDED.ml_user_id, dia = EXCLUDED.dia, receita = EXCLUDED.receita,
+        taxa_plataforma = EXCLUDED.taxa_plataforma, custo_frete = EXCLUDED.custo_frete,
+        custo_flex = EXCLUDED.custo_flex, cmv = EXCLUDED.cmv,
+        margem_contribuicao = EXCLUDED.margem_contribuicao, unidades = EXCLUDED.unidades,
+        atualizado_em = now()
+"""
+
+
+def parametros(engine=None) -> List[Dict[str, Any]]:
+    """Todas as versões de todos os parâmetros, da mais nova para a mais antiga."""
+    if engine is None:
+        from db import engine
+    with engine.connect() as conn:
+        rows = conn.execute(text("""
+            SELECT nome, vigente_desde, valor, criado_em
+            FROM custos_parametros
+            ORDER BY nome, vigente_desde DESC
+        """)).mappings().all()
+    return [dict(r) for r in rows]
+
+
+def _meses(desde: date, ate: date):
+    mes = desde.replace(day=1)
+    while mes <= ate:
+        yield mes
+        mes += relativedelta(months=1)
+
+
+def recalcular(desde: Optional[date] = None, ate: Optional[date] = None, engine=None) -> int:
+    """
+    Refaz sales_pnl (e o agregado diário dos mesmos dias) das vendas com
+    date_adjusted entre `desde` e `ate`, um mês por transação. Retorna pedidos gravados.
+    """
+    from agregados import recalcular_dias
+    if engine is None:
+        from db import engine
+    eng = engine
+    with eng.connect() as conn:
+        minimo, maximo = conn.execute(text(
+            "SELECT CAST(MIN(date_adjusted) AS date), CAST(MAX(date_adjusted) AS date) FROM sales"
+        )).one()
+    if minimo is None:
+        return 0
+    desde = max(desde or minimo, minimo)
+    ate = min(ate or maximo, maximo)
+
+    total = 0
+    for mes in _meses(desde, ate):
+        ini = max(mes, desde)
+        fim = min(mes + relativedelta(months=1) - timedelta(days=1), ate)
+        with eng.begin() as conn:
+            # date_adjusted = date_closed - 3h: a faixa em date_closed poda as partições
+            # (datetime: date + timedelta(hours=3) descarta as horas)
+            n = conn.execute(text(_SQL_RECALCULAR), {
+                "ini": datetime.combine(ini, time(3)),
+                "fim": datetime.combine(fim + timedelta(days=1), time(3)),
+            }).rowcount or 0
+            recalcular_dias(conn, [ini + timedelta(days=d) for d in range((fim - ini).days + 1)])
+        total += n
+        logging.info(f"💹 Resultado por pedido: {ini:%Y-%m} recalculado ({n} pedidos)")
+    return total
+
+
+def definir_parametro(nome: str, valor: Decimal, vigente_desde: date, engine=None) -> int:
+    """Grava a versão do parâmetro válida a partir de `vigente_desde` e recalcula os pedidos afetados."""
+    if nome not in PARAMETROS:
+        raise ValueError(f"Parâmetro desconhecido: {nome} (conhecidos: {', '.join(PARAMETROS)})")
+    if engine is None:
+        from db import engine
+    eng = engine
+    with eng.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO custos_parametros (nome, vigente_desde, valor)
+            VALUES (:nome, :desde, :valor)
+            ON CONFLICT (nome, vigente_desde) DO UPDATE SET valor = EXCLUDED.valor, criado_em = now()
+        """), {"nome": nome, "desde": vigente_desde, "valor": valor})
+        # a versão vale até a próxima; depois dela nada muda
+        proxima = conn.execute(text("""
+            SELECT MIN(vigente_desde) FROM custos_parametros
+            WHERE nome = :nome AND vigente_desde > :desde
+        """), {"nome": nome, "desde": vigente_desde}).scalar()
+    logging.info(f"⚙️ {nome} = {valor} a partir de {vigente_desde}")
+    return recalcular(vigente_desde, proxima - timedelta(days=1) if proxima else None, eng)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--listar", action="store_true", help="mostra as versões dos parâmetros")
+    ap.add_argument("--parametro", nargs=2, metavar=("NOME", "VALOR"), help="grava uma versão nova")
+    ap.add_argument("--desde", type=date.fromisoformat, help="início da vigência / do recálculo (AAAA-MM-DD)")
+    ap.add_argument("--recalcular", action="store_true", help="refaz sales_pnl a partir de --desde")
+    args = ap.parse_args()
+
+    if args.parametro:
+        nome, valor = args.parametro
+        print(f"{definir_parametro(nome, Decimal(valor), args.desde or date.today())} pedidos recalculados.")
+    if args.recalcular:
+        print(f"{recalcular(args.desde)} pedidos recalculados.")
+    if args.listar:
+        for p in parametros():
+            print(f"{p['nome']:<14} {p['vigente_desde']} {p['valor']:>10}  {PARAMETROS.get(p['nome'], '')}")
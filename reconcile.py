@@ -2,36 +2,44 @@
 from __future__ import annotations
 
 import time
+import json
+import threading
+import hashlib
 import logging
 import random
 from datetime import datetime, timezone
-from typing import Dict, List, Any, Iterable
+from typing import Dict, List, Any, Iterable, Iterator, Tuple
 from decimal import Decimal
 
 import requests
 from dateutil.relativedelta import relativedelta
-from sqlalchemy import text, select, inspect
-from sqlalchemy.orm import Session
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from sqlalchemy import text, inspect, DateTime, Float, Integer, Numeric, String
+from sqlalchemy.dialects import postgresql
 from urllib3.util.retry import Retry
 from requests.adapters import HTTPAdapter
 
-from db import SessionLocal
-from models import Sale, UserToken
-from oauth import renovar_access_token
+from dead_letter import registrar_falha
+from escrita import copiar
+from models import Sale
+from oauth import token_valido
+from pipeline import Pipeline
 from sales import _order_to_sale
+from settings import settings
 
 # ---- Config ----
 MAX_WORKERS      = 12        # reduza p/ 6–8 se tiver muitos 429
-CHUNK_SIZE       = 1_000
+CHUNK_SIZE       = 1_000     # página do produtor de ids
+MAP_WORKERS      = 6         # _order_to_sale ainda faz chamadas de shipment/SLA
+WRITE_BATCH      = 1_000     # vendas por COPY + UPDATE
+FILA_MAX         = 500       # capacidade de cada fila entre estágios (backpressure)
 NUM_TOL          = 0.01
 API_TIMEOUT      = 12
 BASE_BACKOFF     = 1.5
 MAX_RETRIES      = 5
 POOL_MAXSIZE     = 100
 
-API_ORDER = "https://api.mercadolibre.com/orders/{}"
-EXCLUDE_COLS = {"id", "order_id", "ml_user_id", "seller_sku"}  # nunca atualiza
+# nunca atualiza (date_adjusted é gerada pelo banco; frete_adjust é ajuste manual)
+EXCLUDE_COLS = {"id", "order_id", "ml_user_id", "seller_sku", "row_hash", "date_adjusted", "frete_adjust"}
 
 # ---- Comparação segura ----
 def _is_different(a: Any, b: Any, tol: float = NUM_TOL) -> bool:
@@ -45,6 +53,37 @@ def _is_different(a: Any, b: Any, tol: float = NUM_TOL) -> bool:
         return abs(float(a) - float(b)) > tol
     return a != b
 
+# ---- Fingerprint da linha ----
+def _normalize(v: Any) -> Any:
+    """Mesmas regras do _is_different: strings sem espaços nas pontas e números na tolerância."""
+    if v is None:
+        return None
+    if isinstance(v, str):
+        return v.strip()
+    if isinstance(v, (int, float, Decimal)) and not isinstance(v, bool):
+        return f"{float(v):.2f}"
+    if isinstance(v, datetime):
+        # naive é gravado em UTC pelo banco; aware é convertido para comparar igual
+        if v.tzinfo is not None:
+            v = v.astimezone(timezone.utc).replace(tzinfo=None)
+        return v.isoformat()
+    return str(v)
+
+
+def _fingerprint(obj: Any, cols: Iterable[str]) -> str:
+    """
+    Hash do conteúdo reconciliável da venda. Hash igual ⇒ nenhuma coluna difere
+    por _is_different; hash diferente cai no diff coluna a coluna.
+    """
+    payload = json.dumps([[c, _normalize(getattr(obj, c, None))] for c in sorted(cols)],
+                         separators=(",", ":"), ensure_ascii=False)
+    return hashlib.md5(payload.encode("utf-8")).hexdigest()
+
+
+def colunas_reconciliaveis() -> set:
+    # somente colunas reais (evita relacionamentos)
+    return {c.key for c in inspect(Sale).mapper.columns} - EXCLUDE_COLS
+
 # ---- HTTP session com retry/backoff ----
 def _build_http_session(token: str) -> requests.Session:
     s = requests.Session()
@@ -74,132 +113,214 @@ def _respect_retry_after(resp: requests.Response) -> None:
         sleep_s = BASE_BACKOFF + random.random() * BASE_BACKOFF
     time.sleep(sleep_s)
 
-def _fetch_full_order(order_id: str, http: requests.Session) -> dict | None:
-    url = API_ORDER.format(order_id)
+def _fetch_full_order(order_id: str, http: requests.Session) -> Tuple[dict | None, int | None]:
+    """Retorna (order, status HTTP da última tentativa); order=None em caso de falha."""
+    url = f"{settings().ml_api_url}/orders/{order_id}"
+    status = None
     for attempt in range(MAX_RETRIES):
         try:
             r = http.get(url, timeout=API_TIMEOUT)
+            status = r.status_code
             if r.ok:
-                return r.json()
+                return r.json(), status
             if r.status_code in (429, 500, 502, 503, 504):
                 _respect_retry_after(r)
                 continue
             logging.warning(f"Falha {r.status_code} order {order_id}: {r.text[:200]}")
-            return None
+            return None, status
         except requests.RequestException as e:
             logging.warning(f"Erro req ({order_id}) tent.{attempt+1}: {e}")
             time.sleep((BASE_BACKOFF * (2 ** attempt)) + random.random())
-    return None
+    return None, status
+
+# ---- Escrita set-based (COPY binário → staging → UPDATE único) ----
+_STAGE = "_reconcile_stage"
+
+def _tipo_stage(col: str) -> str:
+    t = Sale.__table__.c[col].type
+    # timestamp sem fuso recebe o valor aware como timestamptz e o banco converte
+    # igual ao ORM; COPY direto em timestamp descartaria o offset
+    if isinstance(t, DateTime):
+        return "timestamptz"
+    return t.compile(dialect=postgresql.dialect())
+
+def _sql_diferente(col: str) -> str:
+    """Mesma regra do _is_different, em SQL (s = sales, t = staging)."""
+    t = Sale.__table__.c[col].type
+    if isinstance(t, (Integer, Float, Numeric)):
+        return (f"(CASE WHEN s.{col} IS NULL OR t.{col} IS NULL "
+                f"THEN (s.{col} IS NULL) <> (t.{col} IS NULL) "
+                f"ELSE abs(s.{col}::float8 - t.{col}::float8) > :tol END)")
+    if isinstance(t, String):
+        return f"(btrim(s.{col}, E' \\t\\n\\r') IS DISTINCT FROM btrim(t.{col}, E' \\t\\n\\r'))"
+    return f"(s.{col} IS DISTINCT FROM t.{col})"
+
+def _aplicar_em_lote(itens: List[Tuple[Any, Sale, str]], cols: List[str]) -> int:
+    """
+    COPY binário das vendas mapeadas para uma tabela temporária e um único UPDATE ... FROM
+    que grava só as colunas diferentes (com tolerância numérica) e o row_hash.
+    Retorna quantas vendas tiveram alguma coluna alterada.
+    """
+    from db import engine
+    todas = ["order_id", "row_hash"] + cols
+    linhas = ([row.order_id, api_hash] + [getattr(api_sale, c, None) for c in cols]
+              for row, api_sale, api_hash in itens)
+
+    flags = [f"{_sql_diferente(c)} AS d_{c}" for c in cols]
+    algum = " OR ".join(f"d.d_{c}" for c in cols)
+    sets = ",\n".join(f"{c} = CASE WHEN d.d_{c} THEN d.{c} ELSE s.{c} END" for c in cols)
+
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE TEMP TABLE {_STAGE} (order_id bigint, row_hash varchar(32), "
+            + ", ".join(f"{c} {_tipo_stage(c)}" for c in cols)
+            + ") ON COMMIT DROP"
+        ))
+        copiar(conn, _STAGE, todas, linhas)
+
+        res = conn.execute(text(f"""
+            WITH d AS (
+                SELECT t.*, s.id AS sid, {", ".join(flags)}
+                FROM {_STAGE} t
+                JOIN sales s ON s.order_id = t.order_id
+            )
+            UPDATE sales s SET
+                {sets},
+                row_hash = d.row_hash
+            FROM d
+            WHERE s.id = d.sid
+              AND ({algum} OR s.row_hash IS DISTINCT FROM d.row_hash)
+            RETURNING ({algum}) AS alterada
+        """), {"tol": NUM_TOL})
+        return sum(1 for r in res if r.alterada)
 
 # ---- DB helpers ----
-def _load_sales_batch(db: Session, order_ids: Iterable[str]) -> Dict[str, Sale]:
-    rows: List[Sale] = db.execute(
-        select(Sale).where(Sale.order_id.in_(list(order_ids)))
-    ).scalars().all()
-    return {row.order_id: row for row in rows}
+def _ids_no_periodo(ml_user_id: str, desde: datetime, ate: datetime | None) -> Iterator[Any]:
+    """Produtor: (id, order_id, row_hash) do período em páginas por keyset, sem carregar Sale."""
+    from db import engine
+    ultimo_id = 0
+    while True:
+        params = {"uid": int(ml_user_id), "desde": desde, "ultimo": ultimo_id, "lim": CHUNK_SIZE}
+        q = """
+            SELECT id, order_id, row_hash
+            FROM sales
+            WHERE ml_user_id = :uid
+              AND date_closed >= :desde
+              AND id > :ultimo
+        """
+        if ate:
+            q += " AND date_closed <= :ate"
+            params["ate"] = ate
+        q += " ORDER BY id LIMIT :lim"
+
+        with engine.connect() as conn:
+            rows = conn.execute(text(q), params).all()
+        yield from rows
+        if len(rows) < CHUNK_SIZE:
+            return
+        ultimo_id = rows[-1].id
+
+def _ids_por_pedido(ml_user_id: str, order_ids: List[str]) -> Iterator[Any]:
+    """Produtor: (id, order_id, row_hash) de uma lista explícita de pedidos (agenda por tier)."""
+    from db import engine
+    for i in range(0, len(order_ids), CHUNK_SIZE):
+        bloco = [int(o) for o in order_ids[i:i + CHUNK_SIZE]]
+        with engine.connect() as conn:
+            rows = conn.execute(text("""
+                SELECT id, order_id, row_hash
+                FROM sales
+                WHERE ml_user_id = :uid AND order_id = ANY(:oids)
+                ORDER BY id
+            """), {"uid": int(ml_user_id), "oids": bloco}).all()
+        yield from rows
 
 # ---- Principal ----
 def reconciliar_vendas(
     ml_user_id: str,
     desde: datetime | None = None,
     ate: datetime | None = None,
-    max_workers: int = MAX_WORKERS
-) -> Dict[str, int]:
+    max_workers: int = MAX_WORKERS,
+    order_ids: Iterable[str] | None = None,
+) -> Dict[str, Any]:
     """
     Compara vendas no DB vs API ML e atualiza diferenças em lote.
-    Retorna: {"atualizadas": X, "erros": Y}
+
+    Pipeline com filas limitadas: ids do período → fetch concorrente da ordem →
+    mapeamento (_order_to_sale + hash) → gravação em lotes. Rede, CPU e banco
+    trabalham ao mesmo tempo e as métricas por estágio mostram o gargalo.
+    Com `order_ids`, reconcilia só esses pedidos (ignora desde/ate) — usado pela
+    agenda por tier (reconcile_tiers.py).
+    Retorna: {"atualizadas": X, "erros": Y, "iguais": Z, "metricas": {...}}
     """
     if desde is None:
         desde = datetime.now(timezone.utc) - relativedelta(months=6)
 
-    atualizadas = 0
-    erros = 0
+    # o gravado enquanto vale; só renova perto de vencer (oauth.token_valido)
+    access_token = token_valido(int(ml_user_id))
+    if not access_token:
+        raise RuntimeError(f"Usuário {ml_user_id} sem token.")
 
-    with SessionLocal() as db:
-        try:
-            # token
-            token_row: UserToken | None = db.query(UserToken).filter_by(ml_user_id=int(ml_user_id)).first()
-            if not token_row:
-                raise RuntimeError(f"Usuário {ml_user_id} sem token.")
-            access_token = token_row.access_token or ""
-            novo = renovar_access_token(int(ml_user_id))
-            if novo:
-                access_token = novo
-
-            http = _build_http_session(access_token)
-
-            # ids no período
-            params = {"uid": ml_user_id, "desde": desde}
-            q = """
-                SELECT order_id
-                FROM sales
-                WHERE ml_user_id = :uid
-                  AND date_closed >= :desde
-            """
-            if ate:
-                q += " AND date_closed <= :ate"
-                params["ate"] = ate
-
-            order_ids: List[str] = [r[0] for r in db.execute(text(q), params)]
-            if not order_ids:
-                logging.info("Nenhuma venda para reconciliar.")
-                return {"atualizadas": 0, "erros": 0}
-
-            # somente colunas reais (evita relacionamentos)
-            cols_real = {c.key for c in inspect(Sale).mapper.columns}
-            cols_to_check = cols_real - EXCLUDE_COLS
-
-            total = len(order_ids)
-            logging.info(f"Reconciliando {total} pedidos (user={ml_user_id})")
-
-            for start in range(0, total, CHUNK_SIZE):
-                batch = order_ids[start:start + CHUNK_SIZE]
-                t0 = time.time()
-
-                sales_by_oid = _load_sales_batch(db, batch)
-                if not sales_by_oid:
-                    continue
-
-                updates: List[Dict[str, Any]] = []
-
-                with ThreadPoolExecutor(max_workers=max_workers) as pool:
-                    fut_to_oid = {pool.submit(_fetch_full_order, oid, http): oid for oid in batch}
-
-                    for fut in as_completed(fut_to_oid):
-                        oid = fut_to_oid[fut]
-                        data = fut.result()
-                        if data is None:
-                            erros += 1
-                            continue
-
-                        db_row = sales_by_oid.get(oid)
-                        if db_row is None:
-                            continue
-
-                        api_sale: Sale = _order_to_sale(data, ml_user_id, access_token, db)
-
-                        diff: Dict[str, Any] = {}
-                        for col in cols_to_check:
-                            if _is_different(getattr(db_row, col, None), getattr(api_sale, col, None)):
-                                diff[col] = getattr(api_sale, col, None)
-
-                        if diff:
-                            diff["id"] = db_row.id
-                            updates.append(diff)
-
-                if updates:
-                    db.bulk_update_mappings(Sale, updates)
-                    db.commit()
-                    atualizadas += len(updates)
-
-                dt = time.time() - t0
-                logging.info(
-                    f"Lote {start//CHUNK_SIZE + 1}: {len(batch)} pedidos | "
-                    f"{len(updates)} atualizadas | erros={erros} | {dt:.1f}s"
-                )
+    http = _build_http_session(access_token)
+    cols_to_check = colunas_reconciliaveis()
+    cols_ordenadas = sorted(cols_to_check)
+    cont = {"atualizadas": 0, "erros": 0, "iguais": 0}
+    lock = threading.Lock()
+
+    def _contar(chave: str, n: int = 1) -> None:
+        with lock:
+            cont[chave] += n
+
+    def buscar(row):
+        data, status = _fetch_full_order(row.order_id, http)
+        if data is None:
+            _contar("erros")
+            registrar_falha(ml_user_id, row.order_id, "reconcile", status)
+            return None
+        return row, data
 
+    def mapear(item):
+        row, data = item
+        try:
+            api_sale: Sale = _order_to_sale(data, ml_user_id, access_token)
         except Exception as e:
-            db.rollback()
-            raise RuntimeError(f"Erro na reconciliação: {e}") from e
+            # erro de mapeamento (payload inesperado, SKU, envio): mesma fila das falhas de fetch
+            _contar("erros")
+            registrar_falha(ml_user_id, row.order_id, "reconcile", None, str(e))
+            return None
+        api_hash = _fingerprint(api_sale, cols_to_check)
+        if api_hash == row.row_hash:
+            _contar("iguais")
+            return None
+        return row, api_sale, api_hash
+
+    def gravar(itens):
+        # diff e escrita no banco, em um UPDATE por lote, só para quem divergiu no hash;
+        # o row_hash é gravado mesmo sem diff (linha antiga/sem hash) p/ o próximo ciclo pular
+        _contar("atualizadas", _aplicar_em_lote(itens, cols_ordenadas))
+
+    pipe = Pipeline(f"reconcile-{ml_user_id}")
+    if order_ids is not None:
+        order_ids = list(order_ids)
+        logging.info(f"Reconciliando {len(order_ids)} pedidos agendados (user={ml_user_id})")
+        pipe.fonte(_ids_por_pedido(ml_user_id, order_ids))
+    else:
+        logging.info(f"Reconciliando pedidos desde {desde:%Y-%m-%d} (user={ml_user_id})")
+        pipe.fonte(_ids_no_periodo(ml_user_id, desde, ate))
+    pipe.estagio("fetch", buscar, workers=max_workers, capacidade=FILA_MAX)
+    pipe.estagio("map", mapear, workers=MAP_WORKERS, capacidade=FILA_MAX)
+    pipe.lote("write", gravar, tamanho=WRITE_BATCH, espera_max=2.0, capacidade=FILA_MAX)
+    try:
+        metricas = pipe.executar()
+    except Exception as e:
+        raise RuntimeError(f"Erro na reconciliação: {e}") from e
+
+    if not metricas["produzidos"]:
+        logging.info("Nenhuma venda para reconciliar.")
+    logging.info(
+        f"Reconcile {ml_user_id}: {metricas['produzidos']} pedidos | {cont['iguais']} iguais por hash | "
+        f"{cont['atualizadas']} atualizadas | erros={cont['erros']} | {metricas['segundos']:.1f}s"
+    )
+    if cont["erros"]:
+        logging.info(f"{cont['erros']} pedidos com falha enviados à fila de reprocessamento (dead_letter.py)")
 
-    return {"atualizadas": atualizadas, "erros": erros}
+    return {**cont, "metricas": metricas}
@@ -1,9 +1,9 @@
 # reconcile_daily.py
 from datetime import datetime, timezone, timedelta
 import logging
-from db import SessionLocal
 from models import UserToken
 from reconcile import reconciliar_vendas  # importa a função que te enviei
+from reconcile_tiers import sincronizar_agenda, pedidos_devidos, marcar_verificados, resumo_agenda
 
 logging.basicConfig(
     level=logging.INFO,
@@ -11,6 +11,7 @@ logging.basicConfig(
 )
 
 def run_all_users(days:int = 15):
+    from db import SessionLocal
     ate = datetime.now(timezone.utc)
     desde = ate - timedelta(days=days)
 
@@ -31,5 +32,38 @@ def run_all_users(days:int = 15):
 
     logging.info(f"Resumo: atualizadas={total_ok} erros={total_err}")
 
+def reconciliar_conta_por_tier(ml_user_id: str, limite: int = 5000, max_workers: int = 8) -> dict:
+    """Uma rodada da agenda por tier para a conta: sincroniza, reconcilia vencidos e reagenda."""
+    uid = str(ml_user_id)
+    novos = sincronizar_agenda(uid)
+    devidos = pedidos_devidos(uid, limite=limite)
+    logging.info(f"▶️ {uid} — {len(devidos)} pedidos vencidos ({novos} entraram/mudaram de tier)")
+    if not devidos:
+        return {"checados": 0, "atualizadas": 0, "iguais": 0, "erros": 0}
+    res = reconciliar_vendas(uid, order_ids=devidos, max_workers=max_workers)
+    marcar_verificados(devidos)
+    sincronizar_agenda(uid, devidos)   # status pode ter mudado → novo tier
+    logging.info(f"✅ {uid} — atualizadas={res['atualizadas']} iguais={res['iguais']} erros={res['erros']}")
+    return {"checados": len(devidos), "atualizadas": res["atualizadas"], "iguais": res["iguais"], "erros": res["erros"]}
+
+def run_tiered(limite_por_conta: int = 5000):
+    """Reconcilia só os pedidos vencidos na agenda por tier (hot/warm/cold)."""
+    from db import SessionLocal
+    with SessionLocal() as db:
+        users = db.query(UserToken.ml_user_id).distinct().all()
+
+    total_ok = total_err = total_chk = 0
+    for (ml_user_id,) in users:
+        try:
+            res = reconciliar_conta_por_tier(str(ml_user_id), limite=limite_por_conta)
+            total_ok += res["atualizadas"]
+            total_err += res["erros"]
+            total_chk += res["checados"]
+        except Exception as e:
+            logging.exception(f"❌ {ml_user_id} — erro: {e}")
+
+    logging.info(f"Agenda: {resumo_agenda()}")
+    logging.info(f"Resumo: checados={total_chk} atualizadas={total_ok} erros={total_err}")
+
 if __name__ == "__main__":
-    run_all_users(15)
+    run_tiered()
@@ -0,0 +1,171 @@
+# reconcile_tiers.py – agenda de reconciliação por ciclo de vida do pedido
+"""
+Cada pedido recebe um tier a partir do status da ordem e do envio:
+
+    hot   envio em andamento / pagamento pendente  → checado a cada 15 min
+    warm  entregue há pouco, sem envio, reembolso   → checado 1x por dia
+    cold  cancelado ou entregue há mais de 30 dias  → checado a cada ~30 dias
+
+`reconcile_schedule` guarda tier e `next_check_at` (indexado por conta), então
+cada rodada reconcilia só os pedidos vencidos. O intervalo do cold tem jitter
+de ±50%, o que espalha os pedidos antigos e faz de cada rodada uma amostra
+deles em vez de um pico mensal.
+"""
+from __future__ import annotations
+
+from datetime import timedelta
+from typing import Iterable, List
+
+from sqlalchemy import text
+
+
+# ---- Regras ----
+STATUS_TERMINAIS = ("cancelled", "invalid")
+STATUS_QUENTES   = ("confirmed", "payment_required", "payment_in_process", "partially_paid", "pending_cancel")
+ENVIO_QUENTE     = ("pending", "handling", "ready_to_ship", "shipped")
+ENVIO_TERMINAL   = ("delivered", "not_delivered", "cancelled")
+JANELA_MORNA_DIAS = 30       # entregue há menos que isso ainda pode ter devolução/mediação
+
+INTERVALOS = {
+    "hot":  timedelta(minutes=15),
+    "warm": timedelta(days=1),
+    "cold": timedelta(days=30),
+}
+
+
+# única definição do tier (testada contra o Postgres em tests/test_reconcile_tiers.py)
+_SQL_TIER = """
+    CASE
+        WHEN s.status = ANY(:st_terminais) THEN 'cold'
+        WHEN s.status = ANY(:st_quentes) OR s.shipment_status = ANY(:envio_quente) THEN 'hot'
+        WHEN s.status = 'paid'
+         AND s.shipment_status = ANY(:envio_terminal)
+         AND COALESCE(s.shipment_last_updated, s.date_closed) < NOW() - make_interval(days => :janela)
+        THEN 'cold'
+        ELSE 'warm'
+    END
+"""
+
+# próxima checagem a partir de agora; hot/warm fixos, cold com jitter de ±50%
+_SQL_PROXIMA = """
+    NOW() + CASE {tier}
+        WHEN 'hot'  THEN make_interval(secs => :seg_hot)
+        WHEN 'warm' THEN make_interval(secs => :seg_warm)
+        ELSE make_interval(secs => :seg_cold * (0.5 + random()))
+    END
+"""
+
+
+def _params() -> dict:
+    return {
+        "st_terminais": list(STATUS_TERMINAIS),
+        "st_quentes": list(STATUS_QUENTES),
+        "envio_quente": list(ENVIO_QUENTE),
+        "envio_terminal": list(ENVIO_TERMINAL),
+        "janela": JANELA_MORNA_DIAS,
+        "seg_hot": INTERVALOS["hot"].total_seconds(),
+        "seg_warm": INTERVALOS["warm"].total_seconds(),
+        "seg_cold": INTERVALOS["cold"].total_seconds(),
+    }
+
+
+# Sem order_ids, só o que pode ter mudado sem ninguém avisar: pedidos fora da
+# agenda e warm que viram cold pelo tempo (entregues que passaram da janela).
+# Mudança de status chega pelas chamadas com order_ids (reconcile, envios). O
+# ON CONFLICT trava toda linha conflitante, mesmo as que o WHERE descarta:
+# reclassificar a conta inteira travaria a agenda dela a cada rodada.
+_SQL_CANDIDATOS = """
+    AND (
+        NOT EXISTS (SELECT 1 FROM reconcile_schedule r WHERE r.order_id = s.order_id)
+        OR (s.status = 'paid'
+            AND s.shipment_status = ANY(:envio_terminal)
+            AND COALESCE(s.shipment_last_updated, s.date_closed) < NOW() - make_interval(days => :janela)
+            AND EXISTS (SELECT 1 FROM reconcile_schedule r
+                        WHERE r.order_id = s.order_id AND r.tier = 'warm'))
+    )
+"""
+
+
+def sincronizar_agenda(ml_user_id: str | int, order_ids: Iterable[str] | None = None) -> int:
+    """
+    Insere na agenda os pedidos que ainda não estão nela e reclassifica os que
+    mudaram de tier (a próxima checagem é recalculada só quando o tier muda).
+    Sem `order_ids`, reclassifica só os warm vencidos pela janela (ver
+    _SQL_CANDIDATOS); com eles, reclassifica esses pedidos.
+    Pedidos novos entram com checagem espalhada dentro do intervalo do tier.
+    Retorna quantos registros foram inseridos/alterados.
+    """
+    from db import engine
+    params = {**_params(), "uid": int(ml_user_id)}
+    filtro = _SQL_CANDIDATOS
+    if order_ids is not None:
+        params["oids"] = [int(o) for o in order_ids]
+        filtro = "AND s.order_id = ANY(:oids)"
+
+    with engine.begin() as conn:
+        res = conn.execute(text(f"""
+            INSERT INTO reconcile_schedule (order_id, ml_user_id, tier, next_check_at)
+            SELECT t.order_id, t.ml_user_id, t.tier,
+                   CASE WHEN t.tier = 'hot' THEN NOW()
+                        ELSE NOW() + random() * (
+                            CASE t.tier WHEN 'warm' THEN make_interval(secs => :seg_warm)
+                                        ELSE make_interval(secs => :seg_cold) END)
+                   END
+            FROM (
+                SELECT s.order_id, s.ml_user_id, {_SQL_TIER} AS tier
+                FROM sales s
+                WHERE s.ml_user_id = :uid {filtro}
+            ) t
+            ON CONFLICT (order_id) DO UPDATE SET
+                tier          = EXCLUDED.tier,
+                next_check_at = LEAST(
+                    reconcile_schedule.next_check_at,
+                    {_SQL_PROXIMA.format(tier="EXCLUDED.tier")})
+            WHERE reconcile_schedule.tier IS DISTINCT FROM EXCLUDED.tier
+        """), params)
+        return res.rowcount or 0
+
+
+def pedidos_devidos(ml_user_id: str | int, limite: int = 5000) -> List[str]:
+    """Pedidos da conta com checagem vencida, mais atrasados primeiro."""
+    from db import engine
+    with engine.connect() as conn:
+        rows = conn.execute(text("""
+            SELECT order_id
+            FROM reconcile_schedule
+            WHERE ml_user_id = :uid AND next_check_at <= NOW()
+            ORDER BY next_check_at
+            LIMIT :limite
+        """), {"uid": int(ml_user_id), "limite": limite}).scalars().all()
+    return [str(o) for o in rows]
+
+
+def marcar_verificados(order_ids: Iterable[str]) -> None:
+    """Registra a checagem e agenda a próxima conforme o tier atual."""
+    from db import engine
+    oids = [int(o) for o in order_ids]
+    if not oids:
+        return
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+            UPDATE reconcile_schedule
+               SET last_checked_at = NOW(),
+                   next_check_at   = {_SQL_PROXIMA.format(tier="tier")}
+             WHERE order_id = ANY(:oids)
+        """), {**_params(), "oids": oids})
+
+
+def resumo_agenda(ml_user_id: str | int | None = None) -> List[dict]:
+    """Contagem por tier: total e vencidos agora."""
+    from db import engine
+    q = """
+        SELECT tier, COUNT(*) AS total, COUNT(*) FILTER (WHERE next_check_at <= NOW()) AS vencidos
+        FROM reconcile_schedule
+    """
+    params = {}
+    if ml_user_id is not None:
+        q += " WHERE ml_user_id = :uid"
+        params["uid"] = int(ml_user_id)
+    q += " GROUP BY tier ORDER BY tier"
+    with engine.connect() as conn:
+        return [dict(r) for r in conn.execute(text(q), params).mappings().all()]
@@ -1,7 +1,7 @@
 import streamlit as st
 from sqlalchemy import text
 from datetime import datetime
-from utils import engine  # usa sua conexão
+from db import engine_ui as engine  # pool "ui" das páginas (ver db.PERFIS)
 
 st.title("📦 Registro de Estoque")
 
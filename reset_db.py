@@ -1,9 +1,9 @@
 # -*- coding: utf-8 -*-
 
-from db import SessionLocal
 from models import Sale
 
 def reset_sales():
+    from db import SessionLocal
     db = SessionLocal()
     try:
         deleted = db.query(Sale).delete()
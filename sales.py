@@ -1,54 +1,49 @@
 import os
 import requests
 from dateutil import parser
-from db import SessionLocal
 from models import Sale
 from sqlalchemy import func, text, create_engine
-from dotenv import load_dotenv
+from sqlalchemy.orm import Session
 from dateutil.tz import tzutc
 from requests.exceptions import HTTPError
 from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, List, Set, Tuple, Optional
 import time
+from dead_letter import registrar_falha
+from oauth import renovar_access_token, token_valido
+from settings import settings
 
 
 
-# Carrega variáveis de ambiente
-load_dotenv()
-BACKEND_URL = os.getenv("BACKEND_URL")
-
-API_BASE = "https://api.mercadolibre.com/orders/search"
 FULL_PAGE_SIZE = 50
+API_TIMEOUT = 15        # chamadas ao ML em _order_to_sale
+
+
+def __getattr__(nome: str):
+    # `from sales import ML_API_URL` continua valendo, mas lido da configuração
+    # só quando pedido (ML_API_URL permite apontar para o stand-in, ml_standin.py)
+    if nome == "ML_API_URL":
+        return settings().ml_api_url
+    raise AttributeError(f"module {__name__!r} has no attribute {nome!r}")
 
-def get_incremental_sales(ml_user_id: str, access_token: str) -> int:
+
+def get_incremental_sales(ml_user_id: str, access_token: str, atualizar_fees: bool = True) -> int:
+    from db import SessionLocal
     from sales import get_full_sales, _order_to_sale
     import os
     from concurrent.futures import ThreadPoolExecutor
-    from utils import buscar_ml_fee, engine, DATA_INICIO
 
 
-    API_BASE = "https://api.mercadolibre.com/orders/search"
+    ML_API_URL = settings().ml_api_url
+    API_BASE = f"{ML_API_URL}/orders/search"
     FULL_PAGE_SIZE = 50
-    BACKEND_URL = os.getenv("BACKEND_URL")
 
     db = SessionLocal()
     total_saved = 0
 
     try:
-        # 🔁 Tenta renovar token inicialmente
-        try:
-            r = requests.post(f"{BACKEND_URL}/auth/refresh", json={"user_id": ml_user_id})
-            r.raise_for_status()
-            new_token = db.execute(
-                text("SELECT access_token FROM user_tokens WHERE ml_user_id = :uid"),
-                {"uid": ml_user_id}
-            ).scalar()
-            if new_token:
-                access_token = new_token
-        except Exception as e:
-            print(f"⚠️ Falha ao renovar token ({ml_user_id}): {e}")
-
+        # o token vem válido de quem chama (oauth.token_valido); 401 abaixo renova
         # Busca a data da última venda registrada
         last_db_date = db.query(func.max(Sale.date_closed)).filter(Sale.ml_user_id == int(ml_user_id)).scalar()
         if last_db_date is None:
@@ -72,12 +67,8 @@ def get_incremental_sales(ml_user_id: str, access_token: str) -> int:
         except HTTPError as http_err:
             if resp.status_code == 401:
                 print(f"🔐 Token expirado para {ml_user_id}, tentando renovar...")
-                r2 = requests.post(f"{BACKEND_URL}/auth/refresh", json={"user_id": ml_user_id})
-                r2.raise_for_status()
-                new_token = db.execute(
-                    text("SELECT access_token FROM user_tokens WHERE ml_user_id = :uid"),
-                    {"uid": ml_user_id}
-                ).scalar()
+                # sob o lock da conta; se outro já renovou, só devolve o novo
+                new_token = renovar_access_token(int(ml_user_id), recusado=access_token)
                 if not new_token:
                     raise RuntimeError("Falha ao obter novo access_token após refresh")
                 access_token = new_token
@@ -91,13 +82,17 @@ def get_incremental_sales(ml_user_id: str, access_token: str) -> int:
         if not orders:
             return 0
 
+        existentes = _vendas_existentes(db, [o["id"] for o in orders])
+        arquivados = _pedidos_arquivados(db, [o["id"] for o in orders], existentes)
         for o in orders:
             oid = str(o["id"])
-            existing_sale = db.query(Sale).filter_by(order_id=oid).first()
+            if int(oid) in arquivados:
+                continue
 
-            full_resp = requests.get(f"https://api.mercadolibre.com/orders/{oid}?access_token={access_token}")
+            full_resp = requests.get(f"{ML_API_URL}/orders/{oid}?access_token={access_token}")
             if not full_resp.ok:
                 print(f"⚠️ Falha ao buscar ordem completa {oid}: {full_resp.status_code}")
+                registrar_falha(ml_user_id, oid, "incremental", full_resp.status_code, full_resp.text[:200])
                 continue
 
             full_order = full_resp.json()
@@ -105,47 +100,15 @@ def get_incremental_sales(ml_user_id: str, access_token: str) -> int:
 
             print(f"📦 Incremental - ordem {oid} processada | ml_fee: {nova_venda.ml_fee}")
 
-            if not existing_sale:
-                db.add(nova_venda)
-            else:
-                for attr, value in nova_venda.__dict__.items():
-                    if attr != "_sa_instance_state":
-                        setattr(existing_sale, attr, value)
+            _upsert_sale(db, nova_venda, existentes=existentes, arquivados=arquivados)
 
             total_saved += 1
 
         db.commit()
 
-        # ✅ Atualização complementar das taxas
-        print(f"\n📊 Iniciando atualização de taxas pendentes para usuário {ml_user_id}...")
-
-        with engine.begin() as conn:
-            pedidos = conn.execute(text("""
-                SELECT order_id FROM sales
-                WHERE ml_user_id = :uid AND ml_fee IS NULL AND date_closed >= :inicio
-            """), {"uid": ml_user_id, "inicio": DATA_INICIO}).fetchall()
-
-        pedidos_ids = [row[0] for row in pedidos]
-        if not pedidos_ids:
-            print(f"📭 Nenhuma venda pendente para atualizar fees de {ml_user_id}.")
-        else:
-            print(f"📦 {len(pedidos_ids)} vendas sem fee. Atualizando com até 10 threads...")
-            with ThreadPoolExecutor(max_workers=10) as executor:
-                resultados = list(executor.map(lambda oid: buscar_ml_fee(oid, access_token), pedidos_ids))
-
-            with engine.begin() as conn:
-                atualizadas = 0
-                for i, (order_id, fee) in enumerate(resultados, 1):
-                    if fee is not None:
-                        conn.execute(text("""
-                            UPDATE sales SET ml_fee = :fee WHERE order_id = :oid
-                        """), {"fee": fee, "oid": order_id})
-                        atualizadas += 1
-                        print(f"💾 Atualizado {i}/{len(pedidos_ids)} | Pedido {order_id} | Fee R${fee}")
-                    else:
-                        print(f"⏭️ Pulado {i}/{len(pedidos_ids)} | Pedido {order_id} sem fee.")
-
-            print(f"✅ Atualização de fees concluída: {atualizadas}/{len(pedidos_ids)} vendas.")
+        # ✅ Atualização complementar das taxas (o scheduler roda isso como job próprio)
+        if atualizar_fees:
+            atualizar_fees_pendentes(ml_user_id, access_token)
 
     except Exception as e:
         db.rollback()
@@ -156,196 +119,293 @@ def get_incremental_sales(ml_user_id: str, access_token: str) -> int:
     return total_saved
 
 
-def _order_to_sale(order: dict, ml_user_id: str, access_token: str, db: Optional[SessionLocal] = None) -> Sale:
-    from sqlalchemy import text
-    from dateutil import parser, tz
-    def to_sp_datetime(value: Optional[str]):
-        if not value:
-            return None
-        return parser.isoparse(value).astimezone(tz.gettz("America/Sao_Paulo"))
+def atualizar_fees_pendentes(ml_user_id: str, access_token: str) -> int:
+    """Busca ml_fee das vendas do usuário que ainda estão sem taxa. Retorna quantas foram gravadas."""
+    from db import engine
+    from escrita import executar_em_lote
+    from utils import buscar_ml_fee, DATA_INICIO
+
+    print(f"\n📊 Iniciando atualização de taxas pendentes para usuário {ml_user_id}...")
+
+    with engine.begin() as conn:
+        pedidos = conn.execute(text("""
+            SELECT order_id, date_closed FROM sales
+            WHERE ml_user_id = :uid AND ml_fee IS NULL AND date_closed >= :inicio
+        """), {"uid": ml_user_id, "inicio": DATA_INICIO}).fetchall()
+
+    pedidos_ids = [row[0] for row in pedidos]
+    # date_closed no UPDATE deixa o planner ir direto na partição do mês
+    fechamento = {row[0]: row[1] for row in pedidos}
+    if not pedidos_ids:
+        print(f"📭 Nenhuma venda pendente para atualizar fees de {ml_user_id}.")
+        return 0
+
+    print(f"📦 {len(pedidos_ids)} vendas sem fee. Atualizando com até 10 threads...")
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        resultados = list(executor.map(lambda oid: buscar_ml_fee(oid, access_token), pedidos_ids))
+
+    lote = []
+    for i, (order_id, fee) in enumerate(resultados, 1):
+        if fee is not None:
+            lote.append({"fee": fee, "oid": order_id, "dc": fechamento[order_id]})
+        else:
+            print(f"⏭️ Pulado {i}/{len(pedidos_ids)} | Pedido {order_id} sem fee.")
+
+    # todos os UPDATEs num único pipeline do psycopg3, sem uma ida e volta por pedido
+    with engine.begin() as conn:
+        executar_em_lote(conn, """
+            UPDATE sales SET ml_fee = :fee, row_hash = NULL
+            WHERE order_id = :oid AND date_closed = :dc
+        """, lote)
+    atualizadas = len(lote)
 
-    internal_session = False
-    if db is None:
-        db = SessionLocal()
-        internal_session = True
+    print(f"✅ Atualização de fees concluída: {atualizadas}/{len(pedidos_ids)} vendas.")
+    return atualizadas
 
+
+def _vendas_existentes(db, order_ids: List) -> Dict[int, Sale]:
+    """Vendas já gravadas de uma página de pedidos, num único SELECT (em vez de um por pedido)."""
+    ids = [int(o) for o in order_ids]
+    return {s.order_id: s for s in db.query(Sale).filter(Sale.order_id.in_(ids))} if ids else {}
+
+
+def _pedidos_arquivados(db, order_ids: List, existentes: Dict[int, Sale]) -> Set[int]:
+    """
+    Pedidos reservados em sales_order_keys sem linha viva em sales (`existentes`):
+    o mês foi desanexado ou arquivado (particoes.desanexar_mes, arquivo.py).
+    Reinseri-los estouraria a PK de sales_order_keys no commit da página inteira.
+    """
+    ids = [int(o) for o in order_ids if int(o) not in existentes]
+    if not ids:
+        return set()
+    return set(db.execute(
+        text("SELECT order_id FROM sales_order_keys WHERE order_id = ANY(:ids)"), {"ids": ids}
+    ).scalars())
+
+
+def _upsert_sale(db, nova_venda: Sale, existing_sale: Optional[Sale] = None,
+                 existentes: Optional[Dict[int, Sale]] = None,
+                 arquivados: Optional[Set[int]] = None) -> Optional[Sale]:
+    """
+    Insere a venda ou copia os campos mapeados sobre a linha existente do mesmo order_id.
+    Com `existentes` (ver _vendas_existentes) a busca é no dicionário, sem ir ao banco.
+    Pedido de mês arquivado (ver _pedidos_arquivados) não é reinserido: devolve None.
+    """
+    from reconcile import _fingerprint, colunas_reconciliaveis
+    nova_venda.row_hash = _fingerprint(nova_venda, colunas_reconciliaveis())
+    if existing_sale is None and existentes is not None:
+        existing_sale = existentes.get(int(nova_venda.order_id))
+    elif existing_sale is None:
+        existing_sale = db.query(Sale).filter_by(order_id=nova_venda.order_id).first()
+    if not existing_sale:
+        if arquivados is None:
+            arquivados = _pedidos_arquivados(db, [nova_venda.order_id], {})
+        if int(nova_venda.order_id) in arquivados:
+            print(f"🗄️ Pedido {nova_venda.order_id} é de mês arquivado; não reinserido.")
+            return None
+        db.add(nova_venda)
+        return nova_venda
+    for attr, value in nova_venda.__dict__.items():
+        if attr != "_sa_instance_state":
+            setattr(existing_sale, attr, value)
+    return existing_sale
+
+
+def _to_sp_datetime(value: Optional[str]):
+    from dateutil import tz
+    if not value:
+        return None
+    return parser.isoparse(value).astimezone(tz.gettz("America/Sao_Paulo"))
+
+
+def _campos_envio(shipment_data: Optional[dict], sla_data: Optional[dict] = None) -> dict:
+    """Colunas shipment_* / custos de frete da venda a partir de /shipments/{id} e /shipments/{id}/sla."""
+    shipment_data = shipment_data or {}
+    opcao = shipment_data.get("shipping_option") or {}
+    return {
+        "shipment_status":        shipment_data.get("status"),
+        "shipment_substatus":     shipment_data.get("substatus"),
+        "shipment_last_updated":  _to_sp_datetime(shipment_data.get("last_updated")),
+        "shipment_mode":          shipment_data.get("mode"),
+        "shipment_logistic_type": shipment_data.get("logistic_type"),
+        "shipment_list_cost":     opcao.get("list_cost"),
+        "shipment_delivery_type": opcao.get("delivery_type"),
+        "shipment_receiver_name": (shipment_data.get("receiver_address") or {}).get("receiver_name"),
+        "order_cost":             shipment_data.get("order_cost"),
+        "base_cost":              shipment_data.get("base_cost"),
+        "shipment_cost":          opcao.get("cost"),
+        "shipment_delivery_sla":  _to_sp_datetime((sla_data or {}).get("expected_date")),
+    }
+
+
+def _sku_vigente(seller_sku: str, db: Optional[Session] = None):
+    """(quantity, custo_unitario, level1, level2) da versão vigente do SKU, ou None."""
+    sql = text("""
+        SELECT quantity, custo_unitario, level1, level2
+        FROM sku
+        WHERE sku = :sku AND upper_inf(valid_during)
+    """)
+    if db is not None:
+        return db.execute(sql, {"sku": seller_sku}).fetchone()
+    from db import engine
+    # conexão do pool de ingestão só durante o SELECT; SessionLocal() aqui
+    # devolveria a sessão scoped de quem chamou e o close() a derrubaria
+    with engine.connect() as conn:
+        return conn.execute(sql, {"sku": seller_sku}).fetchone()
+
+
+def _order_to_sale(order: dict, ml_user_id: str, access_token: str, db: Optional[Session] = None) -> Sale:
+    ML_API_URL = settings().ml_api_url
+    to_sp_datetime = _to_sp_datetime
+
+    order_id = order.get("id")
+
+    # 🔄 Garante dados completos da ordem
     try:
-        order_id = order.get("id")
+        resp = requests.get(
+            f"{ML_API_URL}/orders/{order_id}?access_token={access_token}",
+            timeout=API_TIMEOUT,
+        )
+        resp.raise_for_status()
+        order = resp.json()
+        print(f"📦 Order {order_id} complementada com dados completos")
+    except Exception as e:
+        print(f"⚠️ Erro ao complementar order {order_id}: {e}")
 
-        # 🔄 Garante dados completos da ordem
+    # 🔍 Fallback para buscar payments
+    payments = order.get("payments")
+    if not payments:
         try:
-            resp = requests.get(
-                f"https://api.mercadolibre.com/orders/{order_id}?access_token={access_token}"
+            pay_resp = requests.get(
+                f"{ML_API_URL}/orders/{order_id}/payments?access_token={access_token}",
+                timeout=API_TIMEOUT,
             )
-            resp.raise_for_status()
-            order = resp.json()
-            print(f"📦 Order {order_id} complementada com dados completos")
+            pay_resp.raise_for_status()
+            payments = pay_resp.json()
+            if isinstance(payments, list) and payments:
+                order["payments"] = payments
+                print(f"💳 Payments recuperados separadamente para {order_id}")
+            else:
+                print(f"⚠️ Nenhum payment encontrado para {order_id}")
         except Exception as e:
-            print(f"⚠️ Erro ao complementar order {order_id}: {e}")
+            print(f"❌ Erro ao buscar payments em fallback: {e}")
+
+    buyer = order.get("buyer", {}) or {}
+    ship = order.get("shipping") or {}
+    
+    # Novo tratamento para order_items com múltiplos formatos e seller_sku
+    order_items = order.get("order_items", [])
+    seller_sku = None
+    item_inf = {}
+    quantity = None
+    unit_price = None
+    
+    for it in order_items:
+        itm = it.get("item", {}) or {}
+    
+        # tenta pegar o SKU direto
+        sku = itm.get("seller_sku") or itm.get("seller_custom_field")
+
+    
+        # se não tiver, tenta buscar dentro de variation_attributes
+        if not sku:
+            for attr in it.get("variation_attributes", []):
+                if attr.get("name", "").upper() in {"SELLER_SKU", "SELLER_CUSTOM_FIELD"}:
+                    sku = attr.get("value") or attr.get("value_name")
+                    break
+    
+        if sku:
+            seller_sku = sku
+            item_inf = itm
+            quantity = it.get("quantity")
+            unit_price = it.get("unit_price")
+            break  # achou → sai do loop
+    
+    # fallback: se não achou nenhum item com SKU, tenta o primeiro
+    if not item_inf and order_items:
+        item_inf = order_items[0].get("item", {})
+        quantity = order_items[0].get("quantity")
+        unit_price = order_items[0].get("unit_price")
+    
+    payment_info = (order.get("payments") or [{}])[0]
+    payment_id = payment_info.get("id")
+    # captura sale_fee dos itens da ordem (ajustado pela quantidade)
+    order_items = order.get("order_items") or []
+    marketplace_fee = next(
+        (oi.get("sale_fee") * oi.get("quantity", 1)
+         for oi in order_items
+         if oi.get("sale_fee") is not None),
+        None
+    )
+
+
+    # 📦 Shipment enrichment
+    shipment_id = ship.get("id")
+    shipment_data = {}
+    sla_data = None
+
+    if shipment_id:
+        try:
+            shipment_resp = requests.get(
+                f"{ML_API_URL}/shipments/{shipment_id}?access_token={access_token}",
+                timeout=API_TIMEOUT,
+            )
+            shipment_resp.raise_for_status()
+            shipment_data = shipment_resp.json()
+            print(f"📮 Dados logísticos carregados para order {order_id}")
 
-        # 🔍 Fallback para buscar payments
-        payments = order.get("payments")
-        if not payments:
             try:
-                pay_resp = requests.get(
-                    f"https://api.mercadolibre.com/orders/{order_id}/payments?access_token={access_token}"
+                sla_resp = requests.get(
+                    f"{ML_API_URL}/shipments/{shipment_id}/sla",
+                    headers={"Authorization": f"Bearer {access_token}"},
+                    timeout=API_TIMEOUT,
                 )
-                pay_resp.raise_for_status()
-                payments = pay_resp.json()
-                if isinstance(payments, list) and payments:
-                    order["payments"] = payments
-                    print(f"💳 Payments recuperados separadamente para {order_id}")
+                if sla_resp.ok:
+                    sla_data = sla_resp.json()
+                    print(f"📦 SLA bruto retornado: {sla_data}")
+                    print(f"📅 SLA estimado: {sla_data.get('expected_date')}")
                 else:
-                    print(f"⚠️ Nenhum payment encontrado para {order_id}")
+                    print(f"⚠️ SLA não disponível para shipment {shipment_id}: {sla_resp.status_code}")
             except Exception as e:
-                print(f"❌ Erro ao buscar payments em fallback: {e}")
+                print(f"❌ Erro ao buscar SLA de shipment {shipment_id}: {e}")
 
-        buyer = order.get("buyer", {}) or {}
-        ship = order.get("shipping") or {}
-        
-        # Novo tratamento para order_items com múltiplos formatos e seller_sku
-        order_items = order.get("order_items", [])
-        seller_sku = None
-        item_inf = {}
-        quantity = None
-        unit_price = None
-        
-        for it in order_items:
-            itm = it.get("item", {}) or {}
-        
-            # tenta pegar o SKU direto
-            sku = itm.get("seller_sku") or itm.get("seller_custom_field")
-
-        
-            # se não tiver, tenta buscar dentro de variation_attributes
-            if not sku:
-                for attr in it.get("variation_attributes", []):
-                    if attr.get("name", "").upper() in {"SELLER_SKU", "SELLER_CUSTOM_FIELD"}:
-                        sku = attr.get("value") or attr.get("value_name")
-                        break
-        
-            if sku:
-                seller_sku = sku
-                item_inf = itm
-                quantity = it.get("quantity")
-                unit_price = it.get("unit_price")
-                break  # achou → sai do loop
-        
-        # fallback: se não achou nenhum item com SKU, tenta o primeiro
-        if not item_inf and order_items:
-            item_inf = order_items[0].get("item", {})
-            quantity = order_items[0].get("quantity")
-            unit_price = order_items[0].get("unit_price")
-        
-        quantity_sku = custo_unitario = level1 = level2 = None
-
-
-        if seller_sku:
-            sku_info = db.execute(text("""
-                SELECT quantity, custo_unitario, level1, level2
-                FROM sku
-                WHERE sku = :sku
-                ORDER BY date_created DESC
-                LIMIT 1
-            """), {"sku": seller_sku}).fetchone()
-
-            if sku_info:
-                quantity_sku, custo_unitario, level1, level2 = sku_info
-
-        payment_info = (order.get("payments") or [{}])[0]
-        payment_id = payment_info.get("id")
-        # captura sale_fee dos itens da ordem (ajustado pela quantidade)
-        order_items = order.get("order_items") or []
-        marketplace_fee = next(
-            (oi.get("sale_fee") * oi.get("quantity", 1)
-             for oi in order_items
-             if oi.get("sale_fee") is not None),
-            None
-        )
-
-
-        # 📦 Shipment enrichment
-        shipment_id = ship.get("id")
-        shipment_data = {}
-        shipment_delivery_sla = None  
-        order_cost = None
-        base_cost = None
-        shipment_cost = None
-
-        if shipment_id:
-            try:
-                shipment_resp = requests.get(
-                    f"https://api.mercadolibre.com/shipments/{shipment_id}?access_token={access_token}"
-                )
-                shipment_resp.raise_for_status()
-                shipment_data = shipment_resp.json()
-                order_cost    = shipment_data.get("order_cost")
-                base_cost     = shipment_data.get("base_cost")
-                shipment_cost = shipment_data.get("shipping_option", {}).get("cost")
-                print(f"📮 Dados logísticos carregados para order {order_id}")
-
-                try:
-                    sla_resp = requests.get(
-                        f"https://api.mercadolibre.com/shipments/{shipment_id}/sla",
-                        headers={"Authorization": f"Bearer {access_token}"}
-                    )
-                    if sla_resp.ok:
-                        sla_data = sla_resp.json()
-                        shipment_delivery_sla_raw = sla_data.get("expected_date")
-                        print(f"📦 SLA bruto retornado: {sla_data}")
-                        print(f"📅 SLA estimado: {shipment_delivery_sla_raw}")
-                        shipment_delivery_sla = to_sp_datetime(shipment_delivery_sla_raw)
-                    else:
-                        print(f"⚠️ SLA não disponível para shipment {shipment_id}: {sla_resp.status_code}")
-                except Exception as e:
-                    print(f"❌ Erro ao buscar SLA de shipment {shipment_id}: {e}")
-
-
-            except Exception as e:
-                print(f"⚠️ Falha ao buscar shipment {shipment_id}: {e}")
 
+        except Exception as e:
+            print(f"⚠️ Falha ao buscar shipment {shipment_id}: {e}")
+
+    # só depois das chamadas ao ML: a conexão do banco não fica presa esperando a API
+    quantity_sku = custo_unitario = level1 = level2 = None
+    sku_info = _sku_vigente(seller_sku, db) if seller_sku else None
+    if sku_info:
+        quantity_sku, custo_unitario, level1, level2 = sku_info
+
+    campos_envio = _campos_envio(shipment_data, sla_data)
+    print(f"✅ shipment_delivery_sla final (já convertido): {campos_envio['shipment_delivery_sla']}")
+    return Sale(
+        order_id         = str(order_id),
+        ml_user_id       = int(ml_user_id),
+        buyer_id         = buyer.get("id"),
+        buyer_nickname   = buyer.get("nickname"),
+        total_amount     = order.get("total_amount"),
+        status = order.get("status"),
+        date_closed      = to_sp_datetime(order.get("date_closed")),
+        item_id          = item_inf.get("id"),
+        item_title       = item_inf.get("title"),
+        quantity         = quantity,
+        unit_price       = unit_price,
+        shipping_id      = shipment_id,
+        seller_sku       = seller_sku,
+        quantity_sku     = quantity_sku,
+        custo_unitario   = custo_unitario,
+        level1           = level1,
+        level2           = level2,
+        ml_fee           = marketplace_fee,
+        payment_id       = payment_id,
         
-        print(f"✅ shipment_delivery_sla final (já convertido): {shipment_delivery_sla}")
-        return Sale(
-            order_id         = str(order_id),
-            ml_user_id       = int(ml_user_id),
-            buyer_id         = buyer.get("id"),
-            buyer_nickname   = buyer.get("nickname"),
-            total_amount     = order.get("total_amount"),
-            status = order.get("status"),
-            date_closed      = to_sp_datetime(order.get("date_closed")),
-            item_id          = item_inf.get("id"),
-            item_title       = item_inf.get("title"),
-            quantity         = quantity,
-            unit_price       = unit_price,
-            shipping_id      = shipment_id,
-            seller_sku       = seller_sku,
-            quantity_sku     = quantity_sku,
-            custo_unitario   = custo_unitario,
-            level1           = level1,
-            level2           = level2,
-            ml_fee           = marketplace_fee,
-            payment_id       = payment_id,
-            
-
-            # 🆕 Dados de envio
-            shipment_status             = shipment_data.get("status"),
-            shipment_substatus          = shipment_data.get("substatus"),
-            shipment_last_updated       = to_sp_datetime(shipment_data.get("last_updated")),
-            shipment_mode               = shipment_data.get("mode"),
-            shipment_logistic_type      = shipment_data.get("logistic_type"),
-            shipment_list_cost          = shipment_data.get("shipping_option", {}).get("list_cost"),
-            shipment_delivery_type      = shipment_data.get("shipping_option", {}).get("delivery_type"),
-            shipment_receiver_name      = shipment_data.get("receiver_address", {}).get("receiver_name"),
-            order_cost    = order_cost,
-            base_cost     = base_cost,
-            shipment_cost = shipment_cost,
-            shipment_delivery_sla = shipment_delivery_sla
-        )
 
-    finally:
-        if internal_session:
-            db.close()
+        # 🆕 Dados de envio
+        **campos_envio,
+    )
 
 
 def revisar_banco_de_dados(ml_user_id: str, access_token: str) -> Dict[str, int]:
@@ -357,6 +417,8 @@ def revisar_banco_de_dados(ml_user_id: str, access_token: str) -> Dict[str, int]
     import requests
     from db import SessionLocal
     from models import Sale
+    from reconcile import _fingerprint, colunas_reconciliaveis
+    ML_API_URL = settings().ml_api_url
 
     print(f"🔁 Iniciando revisão histórica para usuário {ml_user_id}")
     db = SessionLocal()
@@ -401,7 +463,7 @@ def revisar_banco_de_dados(ml_user_id: str, access_token: str) -> Dict[str, int]
                     "order.date_closed.to": current_end.isoformat()
                 }
                 headers = {"Authorization": f"Bearer {access_token}"}
-                resp = requests.get("https://api.mercadolibre.com/orders/search", headers=headers, params=params)
+                resp = requests.get(f"{ML_API_URL}/orders/search", headers=headers, params=params)
 
                 if not resp.ok:
                     print(f"❌ Falha ao buscar lista de orders (offset {offset}): {resp.status_code}")
@@ -416,14 +478,19 @@ def revisar_banco_de_dados(ml_user_id: str, access_token: str) -> Dict[str, int]
                 for order in orders:
                     oid = str(order["id"])
                     existing_sale = db.query(Sale).filter_by(order_id=oid).first()
+                    if not existing_sale and _pedidos_arquivados(db, [oid], {}):
+                        continue        # mês arquivado: o pedido continua reservado em sales_order_keys
 
-                    full_resp = requests.get(f"https://api.mercadolibre.com/orders/{oid}?access_token={access_token}")
+                    full_resp = requests.get(f"{ML_API_URL}/orders/{oid}?access_token={access_token}")
                     if not full_resp.ok:
                         print(f"⚠️ Falha ao buscar dados completos da venda {oid}: {full_resp.status_code}")
+                        registrar_falha(ml_user_id, oid, "revisao", full_resp.status_code, full_resp.text[:200])
                         continue
 
                     full_order = full_resp.json()
                     nova_venda = _order_to_sale(full_order, ml_user_id, access_token, db)
+                    # mesmo hash do _upsert_sale: o da linha antiga não pode sobreviver à revisão
+                    nova_venda.row_hash = _fingerprint(nova_venda, colunas_reconciliaveis())
 
                     if not existing_sale:
                         db.add(nova_venda)
@@ -434,7 +501,7 @@ def revisar_banco_de_dados(ml_user_id: str, access_token: str) -> Dict[str, int]
 
                     houve_mudanca = False
                     for attr, value in nova_venda.__dict__.items():
-                        if attr in ["_sa_instance_state", "id"]:
+                        if attr in ["_sa_instance_state", "id", "row_hash"]:
                             continue
                         from sqlalchemy.orm.attributes import flag_modified
                         
@@ -450,7 +517,7 @@ def revisar_banco_de_dados(ml_user_id: str, access_token: str) -> Dict[str, int]
                             setattr(existing_sale, attr, value)
                             flag_modified(existing_sale, attr)  # força o SQLAlchemy a reconhecer mudança
                             houve_mudanca = True
-
+                    existing_sale.row_hash = nova_venda.row_hash
 
                     if houve_mudanca:
                         atualizadas += 1
@@ -483,6 +550,7 @@ def sync_all_accounts() -> int:
     Sincroniza todas as contas cadastradas na tabela user_tokens,
     utilizando a função incremental para buscar novas vendas.
     """
+    from db import SessionLocal
     from sqlalchemy import text
     from sales import get_incremental_sales
 
@@ -497,6 +565,7 @@ def sync_all_accounts() -> int:
         for ml_user_id, access_token in rows:
             try:
                 print(f"➡️ Sincronizando conta {ml_user_id}...")
+                access_token = token_valido(ml_user_id) or access_token
                 novas_vendas = get_incremental_sales(str(ml_user_id), access_token)
                 total += novas_vendas
                 print(f"✅ Conta {ml_user_id} sincronizada: {novas_vendas} novas vendas.")
@@ -511,12 +580,14 @@ def sync_all_accounts() -> int:
     return total
 
 def get_full_sales(ml_user_id: str, access_token: str) -> int:
+    from db import SessionLocal
     from datetime import datetime, timedelta
     from dateutil.relativedelta import relativedelta
     from sales import _order_to_sale
     from sqlalchemy import func
 
-    API_BASE = "https://api.mercadolibre.com/orders/search"
+    ML_API_URL = settings().ml_api_url
+    API_BASE = f"{ML_API_URL}/orders/search"
     FULL_PAGE_SIZE = 50
 
     db = SessionLocal()
@@ -562,30 +633,30 @@ def get_full_sales(ml_user_id: str, access_token: str) -> int:
                 if not orders:
                     break
 
+                existentes = _vendas_existentes(db, [o["id"] for o in orders])
+                arquivados = _pedidos_arquivados(db, [o["id"] for o in orders], existentes)
                 for order in orders:
                     order_id = str(order["id"])
+                    if int(order_id) in arquivados:
+                        continue
                     try:
-                        full_resp = requests.get(f"https://api.mercadolibre.com/orders/{order_id}?access_token={access_token}")
+                        full_resp = requests.get(f"{ML_API_URL}/orders/{order_id}?access_token={access_token}")
                         if not full_resp.ok:
                             print(f"⚠️ Falha ao buscar ordem completa {order_id}: {full_resp.status_code}")
+                            registrar_falha(ml_user_id, order_id, "full_sales", full_resp.status_code, full_resp.text[:200])
                             continue
 
                         full_order = full_resp.json()
                         nova_venda = _order_to_sale(full_order, ml_user_id, access_token, db)
                         print(f"📦 FULL - ordem {order_id} processada | ml_fee: {nova_venda.ml_fee}")
 
-                        existing_sale = db.query(Sale).filter_by(order_id=order_id).first()
-                        if not existing_sale:
-                            db.add(nova_venda)
-                        else:
-                            for attr, value in nova_venda.__dict__.items():
-                                if attr != "_sa_instance_state":
-                                    setattr(existing_sale, attr, value)
+                        _upsert_sale(db, nova_venda, existentes=existentes, arquivados=arquivados)
 
                         total_saved += 1
 
                     except Exception as e:
                         print(f"❌ Erro ao processar venda {order_id}: {e}")
+                        registrar_falha(ml_user_id, order_id, "full_sales", None, str(e))
 
                 db.commit()
 
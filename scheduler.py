@@ -0,0 +1,309 @@
+# scheduler.py – daemon de jobs recorrentes (sync, reconcile, envios, fees, dead-letter, agregados, SKUs)
+"""
+Processo de longa duração iniciado pelo start.sh junto com uvicorn e Streamlit.
+Cada job tem um agendamento estilo cron (5 campos: minuto hora dia mês dia-da-semana)
+e roda sob `pg_try_advisory_lock`, então nunca se sobrepõe — nem a si mesmo num
+mesmo processo, nem a uma segunda cópia do scheduler em outra máquina. Jobs por
+conta processam as contas em paralelo. Cada execução (job e conta) é gravada em
+`job_runs` com status e duração.
+
+    python scheduler.py                 # loop infinito
+    python scheduler.py --agora incremental reconcile_tiers   # roda uma vez e sai
+    python scheduler.py --listar
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from sqlalchemy import text
+
+from settings import settings
+
+# ---- Config ----
+# SCHEDULER_CONTAS_PARALELAS e CRON_<JOB>: ver settings.Settings
+ZONA = timezone(timedelta(hours=-3))                                    # cron no horário de Brasília
+
+
+# ----------------- Cron -----------------
+class Cron:
+    """Expressão cron de 5 campos: `*`, listas `1,15`, faixas `1-5` e passos `*/10`, `8-18/2`."""
+
+    _LIMITES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]    # dia-da-semana: 0 e 7 = domingo
+
+    def __init__(self, expressao: str):
+        partes = expressao.split()
+        if len(partes) != 5:
+            raise ValueError(f"Cron precisa de 5 campos: {expressao!r}")
+        self.expressao = expressao
+        self.campos: List[Set[int]] = [
+            self._parse(p, lo, hi) for p, (lo, hi) in zip(partes, self._LIMITES)
+        ]
+        if 7 in self.campos[4]:
+            self.campos[4] = (self.campos[4] - {7}) | {0}
+        # semântica do cron: se dia e dia-da-semana são restritos, basta um casar
+        self._dia_livre = partes[2] == "*"
+        self._semana_livre = partes[4] == "*"
+
+    @staticmethod
+    def _parse(campo: str, lo: int, hi: int) -> Set[int]:
+        valores: Set[int] = set()
+        for item in campo.split(","):
+            faixa, _, passo = item.partition("/")
+            if faixa == "*":
+                ini, fim = lo, hi
+            elif "-" in faixa:
+                a, b = faixa.split("-", 1)
+                ini, fim = int(a), int(b)
+            else:
+                ini = fim = int(faixa)
+                if passo:
+                    fim = hi
+            if ini < lo or fim > hi or ini > fim:
+                raise ValueError(f"Campo cron fora da faixa {lo}-{hi}: {campo!r}")
+            valores.update(range(ini, fim + 1, int(passo) if passo else 1))
+        return valores
+
+    def corresponde(self, dt: datetime) -> bool:
+        minuto, hora, dia, mes, semana = self.campos
+        dia_semana = (dt.weekday() + 1) % 7       # cron: 0 = domingo
+        if dt.minute not in minuto or dt.hour not in hora or dt.month not in mes:
+            return False
+        casa_dia, casa_semana = dt.day in dia, dia_semana in semana
+        if self._dia_livre or self._semana_livre:
+            return casa_dia and casa_semana
+        return casa_dia or casa_semana
+
+    def proxima(self, apos: datetime) -> datetime:
+        dt = apos.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        for _ in range(366 * 24 * 60):
+            if self.corresponde(dt):
+                return dt
+            dt += timedelta(minutes=1)
+        raise ValueError(f"Cron sem próxima execução em 1 ano: {self.expressao!r}")
+
+
+# ----------------- Jobs -----------------
+@dataclass
+class Job:
+    nome: str
+    agenda: str                   # campo de settings.Settings com a expressão cron
+    funcao: Callable[..., Any]
+    por_conta: bool = True        # funcao(ml_user_id, access_token) para cada conta
+
+    @property
+    def cron(self) -> Cron:
+        return Cron(getattr(settings(), self.agenda))
+
+
+def _contas() -> List[int]:
+    from db import engine
+    with engine.connect() as conn:
+        return list(conn.execute(text("SELECT DISTINCT ml_user_id FROM user_tokens")).scalars())
+
+
+def _token(ml_user_id: int) -> Optional[str]:
+    # o gravado enquanto vale; só renova perto de vencer, uma vez por conta (oauth.py)
+    from oauth import token_valido
+    return token_valido(int(ml_user_id))
+
+
+def _job_incremental(ml_user_id: int, access_token: str):
+    from sales import get_incremental_sales
+    return {"novas": get_incremental_sales(str(ml_user_id), access_token, atualizar_fees=False)}
+
+
+def _job_reconcile_tiers(ml_user_id: int, access_token: str):
+    from reconcile_daily import reconciliar_conta_por_tier
+    return reconciliar_conta_por_tier(str(ml_user_id))
+
+
+def _job_fees(ml_user_id: int, access_token: str):
+    from sales import atualizar_fees_pendentes
+    return {"fees": atualizar_fees_pendentes(str(ml_user_id), access_token)}
+
+
+def _job_envios(ml_user_id: int, access_token: str):
+    from shipment_refresh import atualizar_envios
+    return atualizar_envios(ml_user_id, access_token)
+
+
+def _job_dead_letter():
+    from dead_letter import reprocessar_falhas
+    return reprocessar_falhas()
+
+
+def _job_drift():
+    from drift_sampling import amostrar_e_agendar
+    res = amostrar_e_agendar([str(u) for u in _contas()])
+    return {"checados": res["checados"], "agendados": res["agendados"]}
+
+
+def _job_particoes():
+    from particoes import garantir_particoes
+    return {"criadas": garantir_particoes()}
+
+
+def _job_arquivo():
+    from arquivo import arquivar
+    res = arquivar()
+    return {"meses": [r["mes"] for r in res], "linhas": sum(r["linhas"] for r in res)}
+
+
+def _job_agregados():
+    from agregados import atualizar
+    return {"mudancas": atualizar()}
+
+
+def _job_sku():
+    from sku_reaplicar import reaplicar_pendentes
+    return reaplicar_pendentes()
+
+
+def _job_podar_cdc():
+    from cdc import podar
+    return {"removidas": podar()}
+
+
+JOBS: List[Job] = [
+    Job("incremental",     "cron_incremental",  _job_incremental),
+    Job("reconcile_tiers", "cron_reconcile",    _job_reconcile_tiers),
+    Job("envios",          "cron_envios",       _job_envios),
+    Job("fees",            "cron_fees",         _job_fees),
+    Job("dead_letter",     "cron_dead_letter",  _job_dead_letter, por_conta=False),
+    Job("drift",           "cron_drift",        _job_drift, por_conta=False),
+    Job("agregados",       "cron_agregados",    _job_agregados, por_conta=False),
+    Job("sku",             "cron_sku",          _job_sku, por_conta=False),
+    Job("podar_cdc",       "cron_podar_cdc",    _job_podar_cdc, por_conta=False),
+    Job("particoes",       "cron_particoes",    _job_particoes, por_conta=False),
+    Job("arquivo",         "cron_arquivo",      _job_arquivo, por_conta=False),
+]
+
+
+# ----------------- Execução -----------------
+def _registrar(job: str, ml_user_id: Optional[int], status: str, inicio: datetime,
+               detalhe: Any = None) -> None:
+    from db import engine
+    fim = datetime.now(timezone.utc)
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("""
+                INSERT INTO job_runs (job, ml_user_id, status, started_at, finished_at, duration_s, detail)
+                VALUES (:job, :uid, :status, :ini, :fim, :dur, :det)
+            """), {
+                "job": job, "uid": ml_user_id, "status": status, "ini": inicio, "fim": fim,
+                "dur": (fim - inicio).total_seconds(),
+                "det": None if detalhe is None else json.dumps(detalhe, default=str)[:2000],
+            })
+    except Exception as e:
+        logging.warning(f"⚠️ Falha ao gravar job_runs ({job}): {e}")
+
+
+def _rodar_conta(job: Job, ml_user_id: int) -> bool:
+    inicio = datetime.now(timezone.utc)
+    try:
+        token = _token(ml_user_id)
+        if not token:
+            _registrar(job.nome, ml_user_id, "erro", inicio, "conta sem token")
+            return False
+        res = job.funcao(ml_user_id, token)
+        _registrar(job.nome, ml_user_id, "ok", inicio, res)
+        return True
+    except Exception as e:
+        logging.exception(f"❌ [{job.nome}] {ml_user_id}: {e}")
+        _registrar(job.nome, ml_user_id, "erro", inicio, str(e))
+        return False
+
+
+def executar_job(job: Job) -> Optional[bool]:
+    """
+    Roda o job sob advisory lock de sessão. Retorna None se outra execução já
+    segura o lock (registrado como 'pulado'), senão True/False de sucesso.
+    """
+    from db import engine
+    inicio = datetime.now(timezone.utc)
+    with engine.connect() as lock_conn:
+        ok_lock = lock_conn.execute(
+            text("SELECT pg_try_advisory_lock(hashtext(:chave))"), {"chave": f"scheduler:{job.nome}"}
+        ).scalar()
+        lock_conn.commit()
+        if not ok_lock:
+            logging.info(f"⏭️ [{job.nome}] já em execução, pulando.")
+            _registrar(job.nome, None, "pulado", inicio)
+            return None
+        try:
+            logging.info(f"▶️ [{job.nome}] iniciando")
+            if job.por_conta:
+                contas = _contas()
+                with ThreadPoolExecutor(max_workers=settings().scheduler_contas_paralelas,
+                                        thread_name_prefix=f"job-{job.nome}") as pool:
+                    resultados = list(pool.map(lambda uid: _rodar_conta(job, uid), contas))
+                ok = all(resultados)
+                detalhe: Any = {"contas": len(contas), "falhas": resultados.count(False)}
+            else:
+                try:
+                    detalhe = job.funcao()
+                    ok = True
+                except Exception as e:
+                    logging.exception(f"❌ [{job.nome}]: {e}")
+                    detalhe, ok = str(e), False
+            _registrar(job.nome, None, "ok" if ok else "erro", inicio, detalhe)
+            logging.info(f"✅ [{job.nome}] concluído em {(datetime.now(timezone.utc) - inicio).total_seconds():.1f}s")
+            from db import metricas_pools
+            logging.debug(f"Pools: {metricas_pools()}")
+            return ok
+        finally:
+            lock_conn.execute(
+                text("SELECT pg_advisory_unlock(hashtext(:chave))"), {"chave": f"scheduler:{job.nome}"}
+            )
+            lock_conn.commit()
+
+
+def loop(jobs: List[Job] = JOBS) -> None:
+    """Acorda a cada minuto e dispara, em threads, os jobs cujo cron casa com o minuto."""
+    parar = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: parar.set())
+
+    rodando: Dict[str, threading.Thread] = {}
+    logging.info("🕒 Scheduler iniciado: " + ", ".join(f"{j.nome} [{j.cron.expressao}]" for j in jobs))
+    while not parar.is_set():
+        agora = datetime.now(ZONA)
+        for job in jobs:
+            if not job.cron.corresponde(agora):
+                continue
+            t = rodando.get(job.nome)
+            if t is not None and t.is_alive():
+                logging.info(f"⏭️ [{job.nome}] execução anterior ainda ativa, pulando.")
+                continue
+            t = threading.Thread(target=executar_job, args=(job,), name=f"job-{job.nome}", daemon=True)
+            rodando[job.nome] = t
+            t.start()
+        proximo_minuto = agora.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        parar.wait(max((proximo_minuto - datetime.now(ZONA)).total_seconds(), 1))
+    logging.info("🛑 Scheduler encerrado.")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(threadName)s %(message)s")
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--agora", nargs="+", metavar="JOB", help="roda os jobs indicados uma vez e sai")
+    ap.add_argument("--listar", action="store_true", help="lista jobs e próxima execução")
+    args = ap.parse_args()
+
+    por_nome = {j.nome: j for j in JOBS}
+    if args.listar:
+        for j in JOBS:
+            print(f"{j.nome:16} {j.cron.expressao:15} próxima: {j.cron.proxima(datetime.now(ZONA)):%d/%m %H:%M}")
+    elif args.agora:
+        for nome in args.agora:
+            executar_job(por_nome[nome])
+    else:
+        loop()
@@ -0,0 +1,190 @@
+# sessoes.py – memória das sessões do Streamlit: contabilidade, LRU por tamanho e dados compartilhados
+"""
+Cada aba aberta do app é uma sessão com o seu st.session_state, e nada ali
+era liberado: a Gestão de SKU guardava dois DataFrames inteiros por sessão e
+os filtros criam uma chave por conta e por opção de hierarquia. O gestor (um
+por processo, `gestor()`):
+
+- `compartilhado` guarda uma cópia só de dados iguais para todas as sessões
+  (ex.: a tabela de SKUs), contada uma vez, num LRU por tamanho limitado a
+  SESSOES_LIMITE_MB; o que sai é recarregado no próximo pedido. Com
+  `versao`, a chave guarda só a última versão: a nova substitui a anterior
+  em vez de se somar a ela;
+- `registrar`, a cada execução do script, mede o st.session_state da sessão
+  (referências a dados compartilhados não contam) e, acima de
+  SESSAO_LIMITE_MB, tira dela os DataFrames que mudaram há mais tempo; as
+  páginas já recarregam o que não encontram no estado;
+- `resumo` lista as sessões da maior para a menor, para a visão de
+  administração; sessões sem atividade há SESSAO_TTL_MIN saem da lista.
+
+    g = gestor()
+    df_all, df_latest = g.compartilhado("gestao_sku", carregar_skus, renovar=clicou_recarregar)
+    g.registrar(sessao_atual(), st.session_state, usuario)
+    g.resumo()[:10]
+"""
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Callable, Dict, Hashable, List, MutableMapping, Optional, Tuple
+
+import pandas as pd
+
+# ---- Config ----
+MB = 1024 * 1024
+MAIORES_CHAVES = 5          # chaves mais pesadas mostradas por sessão
+
+
+def tamanho(valor: Any, _nivel: int = 0) -> int:
+    """Bytes aproximados: DataFrame/Series pelo pandas (deep), coleções somando os itens."""
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(deep=True).sum())
+    if isinstance(valor, pd.Series):
+        return int(valor.memory_usage(deep=True))
+    if _nivel < 4 and isinstance(valor, dict):
+        return sys.getsizeof(valor) + sum(tamanho(k, _nivel + 1) + tamanho(v, _nivel + 1) for k, v in valor.items())
+    if _nivel < 4 and isinstance(valor, (list, tuple, set, frozenset)):
+        return sys.getsizeof(valor) + sum(tamanho(v, _nivel + 1) for v in valor)
+    return sys.getsizeof(valor)
+
+
+def _frames(valor: Any) -> List[Any]:
+    # o valor e, se for tupla/lista, os itens: é o que `compartilhado` costuma devolver
+    itens = list(valor) if isinstance(valor, (tuple, list)) else []
+    return [valor] + itens
+
+
+@dataclass
+class _Sessao:
+    usuario: Optional[str] = None
+    chaves: int = 0
+    bytes_estado: int = 0
+    maiores: List[Tuple[str, int]] = field(default_factory=list)
+    visto_em: float = 0.0
+    # DataFrames do estado: chave -> (id do objeto, quando mudou)
+    frames: Dict[str, Tuple[int, float]] = field(default_factory=dict)
+    descartadas: int = 0
+
+
+class GestorSessoes:
+    """Um por processo; todas as sessões do Streamlit chamam das suas threads."""
+
+    def __init__(self, limite_sessao: int, limite_total: int, ttl_s: float,
+                 relogio: Callable[[], float] = time.monotonic):
+        self.limite_sessao = limite_sessao
+        self.limite_total = limite_total
+        self.ttl_s = ttl_s
+        self._relogio = relogio
+        self._lock = threading.RLock()
+        self._compartilhados: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()   # menos usado primeiro
+        self._versoes: Dict[Hashable, Hashable] = {}
+        self._sessoes: Dict[str, _Sessao] = {}
+        self.despejos = 0
+
+    # ----------------- dados compartilhados (LRU por tamanho) -----------------
+    def compartilhado(self, chave: Hashable, carregar: Callable[[], Any], renovar: bool = False,
+                      versao: Hashable = None) -> Any:
+        """
+        Mesmo objeto para todas as sessões. `renovar` recarrega para todas (ex.:
+        botão de recarregar); `versao` diferente da guardada também, e o valor
+        novo toma o lugar do antigo. Quem recebe não deve alterar: use uma
+        cópia/vista.
+        """
+        with self._lock:
+            if not renovar and chave in self._compartilhados and self._versoes.get(chave) == versao:
+                self._compartilhados.move_to_end(chave)
+                return self._compartilhados[chave][0]
+        valor = carregar()
+        with self._lock:
+            self._compartilhados[chave] = (valor, tamanho(valor))
+            self._compartilhados.move_to_end(chave)
+            self._versoes[chave] = versao
+            total = sum(b for _, b in self._compartilhados.values())
+            # o recém-carregado fica por último: só sai se sozinho passar do limite
+            while total > self.limite_total and self._compartilhados:
+                saiu, (_, b) = self._compartilhados.popitem(last=False)
+                self._versoes.pop(saiu, None)
+                total -= b
+                self.despejos += 1
+        return valor
+
+    def compartilhados(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [{"chave": str(k), "bytes": b} for k, (_, b) in reversed(self._compartilhados.items())]
+
+    # ----------------- contabilidade por sessão -----------------
+    def registrar(self, sessao: Optional[str], estado: MutableMapping, usuario: Optional[str] = None) -> List[str]:
+        """
+        Mede o estado da sessão e, acima do limite, tira os DataFrames que mudaram
+        há mais tempo. Devolve as chaves removidas.
+        """
+        if sessao is None:
+            return []
+        agora = self._relogio()
+        with self._lock:
+            ids_compartilhados = {id(f) for v, _ in self._compartilhados.values() for f in _frames(v)}
+            s = self._sessoes.setdefault(sessao, _Sessao())
+        medidas: Dict[str, int] = {}
+        frames: Dict[str, Tuple[int, float]] = {}
+        for chave, valor in list(estado.items()):
+            chave = str(chave)
+            medidas[chave] = 0 if id(valor) in ids_compartilhados else tamanho(valor)
+            if isinstance(valor, (pd.DataFrame, pd.Series)) and medidas[chave]:
+                anterior = s.frames.get(chave)
+                frames[chave] = anterior if anterior and anterior[0] == id(valor) else (id(valor), agora)
+
+        removidas: List[str] = []
+        excesso = sum(medidas.values()) - self.limite_sessao
+        for chave in sorted(frames, key=lambda c: frames[c][1]):
+            if excesso <= 0:
+                break
+            estado.pop(chave, None)
+            excesso -= medidas.pop(chave)
+            del frames[chave]
+            removidas.append(chave)
+
+        with self._lock:
+            s.usuario = usuario or s.usuario
+            s.chaves = len(medidas)
+            s.bytes_estado = sum(medidas.values())
+            s.maiores = sorted(medidas.items(), key=lambda kv: kv[1], reverse=True)[:MAIORES_CHAVES]
+            s.visto_em = agora
+            s.frames = frames
+            s.descartadas += len(removidas)
+            # sessões fechadas não avisam: some quem passou do ttl sem executar
+            for outra in [k for k, o in self._sessoes.items() if agora - o.visto_em > self.ttl_s]:
+                del self._sessoes[outra]
+        return removidas
+
+    def resumo(self) -> List[Dict[str, Any]]:
+        """Sessões ativas, da que mais ocupa para a que menos ocupa."""
+        agora = self._relogio()
+        with self._lock:
+            linhas = [{
+                "sessao": sessao,
+                "usuario": s.usuario,
+                "chaves": s.chaves,
+                "bytes": s.bytes_estado,
+                "maiores": s.maiores,
+                "descartadas": s.descartadas,
+                "ocioso_s": agora - s.visto_em,
+            } for sessao, s in self._sessoes.items() if agora - s.visto_em <= self.ttl_s]
+        return sorted(linhas, key=lambda l: l["bytes"], reverse=True)
+
+
+@lru_cache(maxsize=None)
+def gestor() -> GestorSessoes:
+    from settings import settings
+    cfg = settings()
+    return GestorSessoes(cfg.sessao_limite_mb * MB, cfg.sessoes_limite_mb * MB, cfg.sessao_ttl_min * 60)
+
+
+def sessao_atual() -> Optional[str]:
+    """id da sessão do Streamlit executando o script (None fora do Streamlit)."""
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else None
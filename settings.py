@@ -0,0 +1,148 @@
+# settings.py – configuração do processo (variáveis de ambiente / .env), lida uma vez e sob demanda
+"""
+Antes cada módulo fazia `load_dotenv()` + `os.getenv` ao ser importado, e db,
+oauth e api levantavam erro já no import se faltasse variável. Agora a
+configuração é lida na primeira chamada de `settings()` (que carrega o .env) e
+fica em cache; quem precisa de um valor obrigatório chama `exigir` na hora de
+usar, não no import.
+
+    from settings import settings
+    cfg = settings().exigir("db_url")
+    cfg.db_url
+
+    python settings.py        # mostra a configuração efetiva (segredos mascarados)
+"""
+from __future__ import annotations
+
+import argparse
+import os
+from dataclasses import dataclass, fields
+from functools import lru_cache
+from typing import Optional
+
+# campo -> variável de ambiente
+VARIAVEIS = {
+    "db_url":                  "DB_URL",
+    "db_replica_url":          "DB_REPLICA_URL",
+    "ml_client_id":            "ML_CLIENT_ID",
+    "ml_client_secret":        "ML_CLIENT_SECRET",
+    "ml_api_url":              "ML_API_URL",
+    "backend_url":             "BACKEND_URL",
+    "frontend_url":            "FRONTEND_URL",
+    "cookie_secret":           "COOKIE_SECRET",
+    "db_pool_ui":              "DB_POOL_UI",
+    "db_pool_ingestao":        "DB_POOL_INGESTAO",
+    "db_pool_analitico":       "DB_POOL_ANALITICO",
+    "db_pool_api":             "DB_POOL_API",
+    "db_timeout_ui_ms":        "DB_TIMEOUT_UI_MS",
+    "db_timeout_ingestao_ms":  "DB_TIMEOUT_INGESTAO_MS",
+    "db_timeout_analitico_ms": "DB_TIMEOUT_ANALITICO_MS",
+    "api_http_conexoes":       "API_HTTP_CONEXOES",
+    "sessao_limite_mb":        "SESSAO_LIMITE_MB",
+    "sessoes_limite_mb":       "SESSOES_LIMITE_MB",
+    "sessao_ttl_min":          "SESSAO_TTL_MIN",
+    "replica_lag_max_s":       "REPLICA_LAG_MAX_S",
+    "replica_check_s":         "REPLICA_CHECK_S",
+    "replica_recepcao_max_s":  "REPLICA_RECEPCAO_MAX_S",
+    "arquivo_uri":             "ARQUIVO_URI",
+    "arquivo_horizonte_meses": "ARQUIVO_HORIZONTE_MESES",
+    "scheduler_contas_paralelas": "SCHEDULER_CONTAS_PARALELAS",
+    "cron_incremental":        "CRON_INCREMENTAL",
+    "cron_reconcile":          "CRON_RECONCILE",
+    "cron_envios":             "CRON_ENVIOS",
+    "cron_fees":               "CRON_FEES",
+    "cron_dead_letter":        "CRON_DEAD_LETTER",
+    "cron_drift":              "CRON_DRIFT",
+    "cron_agregados":          "CRON_AGREGADOS",
+    "cron_sku":                "CRON_SKU",
+    "cron_podar_cdc":          "CRON_PODAR_CDC",
+    "cron_particoes":          "CRON_PARTICOES",
+    "cron_arquivo":            "CRON_ARQUIVO",
+}
+_SEGREDOS = {"db_url", "db_replica_url", "ml_client_secret", "cookie_secret"}
+
+
+@dataclass(frozen=True)
+class Settings:
+    db_url: Optional[str] = None
+    db_replica_url: Optional[str] = None          # réplica de leitura opcional (ver replica.py)
+    ml_client_id: Optional[str] = None
+    ml_client_secret: Optional[str] = None
+    ml_api_url: str = "https://api.mercadolibre.com"   # ou o stand-in local (ml_standin.py)
+    backend_url: Optional[str] = None
+    frontend_url: Optional[str] = None
+    cookie_secret: Optional[str] = None
+    # pools por tipo de carga (ver db.PERFIS)
+    db_pool_ui: int = 8
+    db_pool_ingestao: int = 12
+    db_pool_analitico: int = 3
+    db_pool_api: int = 10
+    db_timeout_ui_ms: int = 30_000
+    db_timeout_ingestao_ms: int = 300_000
+    db_timeout_analitico_ms: int = 900_000
+    api_http_conexoes: int = 200
+    # memória das sessões do Streamlit (ver sessoes.py)
+    sessao_limite_mb: int = 256
+    sessoes_limite_mb: int = 1024
+    sessao_ttl_min: int = 120
+    # réplica de leitura (ver replica.py)
+    replica_lag_max_s: float = 30.0         # atraso máximo aceito na réplica
+    replica_check_s: float = 5.0            # intervalo entre medições
+    # sem mensagem do primário há mais que isso = desconectada; o primário ocioso
+    # manda keepalive a cada wal_sender_timeout/2 (30 s no padrão)
+    replica_recepcao_max_s: float = 60.0
+    # meses antigos em Parquet (ver arquivo.py); vazio = pasta arquivo/ ao lado do código
+    arquivo_uri: Optional[str] = None
+    arquivo_horizonte_meses: int = 18       # meses mantidos no Postgres
+    # agendamentos do scheduler.py (cron de 5 campos, horário de Brasília)
+    scheduler_contas_paralelas: int = 3     # cada conta abre várias conexões
+    cron_incremental: str = "*/10 * * * *"
+    cron_reconcile: str = "*/15 * * * *"
+    cron_envios: str = "*/5 * * * *"
+    cron_fees: str = "5 * * * *"
+    cron_dead_letter: str = "*/30 * * * *"
+    cron_drift: str = "0 4 * * 0"
+    cron_agregados: str = "*/2 * * * *"
+    cron_sku: str = "*/5 * * * *"
+    cron_podar_cdc: str = "30 3 * * *"
+    cron_particoes: str = "0 2 * * *"
+    cron_arquivo: str = "0 4 2 * *"
+
+    @classmethod
+    def do_ambiente(cls, env=None) -> "Settings":
+        env = os.environ if env is None else env
+        valores = {}
+        for f in fields(cls):
+            bruto = env.get(VARIAVEIS[f.name])
+            if bruto in (None, ""):
+                continue
+            conversao = {"int": int, "float": float}.get(f.type, str)
+            valores[f.name] = conversao(bruto)
+        if "ml_api_url" in valores:
+            valores["ml_api_url"] = valores["ml_api_url"].rstrip("/")
+        return cls(**valores)
+
+    def exigir(self, *campos: str) -> "Settings":
+        """Levanta RuntimeError se algum dos campos estiver vazio; devolve a própria configuração."""
+        faltando = [VARIAVEIS[c] for c in campos if not getattr(self, c)]
+        if faltando:
+            raise RuntimeError(f"❌ {', '.join(faltando)} deve(m) estar definida(s) no ambiente ou no .env")
+        return self
+
+
+@lru_cache(maxsize=None)
+def settings() -> Settings:
+    """Configuração do processo; o .env é lido só na primeira chamada."""
+    from dotenv import load_dotenv
+    load_dotenv()
+    return Settings.do_ambiente()
+
+
+if __name__ == "__main__":
+    argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter).parse_args()
+    cfg = settings()
+    for f in fields(cfg):
+        valor = getattr(cfg, f.name)
+        if f.name in _SEGREDOS and valor:
+            valor = "***"
+        print(f"{VARIAVEIS[f.name]:<28} {valor}")
@@ -0,0 +1,142 @@
+# shipment_refresh.py – atualização leve só dos envios em aberto
+"""
+A Expedição depende de shipment_status, shipment_substatus e
+shipment_delivery_sla, que só eram atualizados junto com a ordem inteira
+(orders + payments + _order_to_sale). Aqui pegamos apenas os envios ainda não
+terminais (índice ix_sales_shipment_open), buscamos /shipments/{id} e /sla em
+paralelo e gravamos só as colunas de envio, num UPDATE por lote, nas linhas
+que de fato mudaram.
+
+    python shipment_refresh.py         # todas as contas, uma rodada
+"""
+from __future__ import annotations
+
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+
+from reconcile_tiers import ENVIO_QUENTE
+
+# ---- Config ----
+MAX_WORKERS = 16
+LOTE        = 500
+API_TIMEOUT = 10
+
+_COLUNAS = [
+    ("shipment_status", "text"),
+    ("shipment_substatus", "text"),
+    ("shipment_last_updated", "timestamptz"),
+    ("shipment_mode", "text"),
+    ("shipment_logistic_type", "text"),
+    ("shipment_list_cost", "float8"),
+    ("shipment_delivery_type", "text"),
+    ("shipment_receiver_name", "text"),
+    ("order_cost", "numeric"),
+    ("base_cost", "numeric"),
+    ("shipment_cost", "numeric"),
+]
+
+
+def envios_abertos(ml_user_id: str | int, limite: int = 20_000) -> List[Dict[str, Any]]:
+    """Vendas da conta com envio não terminal, SLA mais próximo primeiro."""
+    from db import engine
+    with engine.connect() as conn:
+        rows = conn.execute(text("""
+            SELECT order_id, shipping_id
+            FROM sales
+            WHERE shipment_status = ANY(:abertos)
+              AND ml_user_id = :uid
+              AND shipping_id IS NOT NULL
+            ORDER BY shipment_delivery_sla NULLS LAST
+            LIMIT :limite
+        """), {"abertos": list(ENVIO_QUENTE), "uid": int(ml_user_id), "limite": limite}).mappings().all()
+    return [dict(r) for r in rows]
+
+
+def _buscar(http, url: str) -> Optional[dict]:
+    try:
+        r = http.get(url, timeout=API_TIMEOUT)
+        return r.json() if r.ok else None
+    except Exception as e:
+        logging.warning(f"Erro req {url}: {e}")
+        return None
+
+
+def _aplicar(linhas: List[Dict[str, Any]]) -> int:
+    """UPDATE único das colunas de envio para as linhas que mudaram; retorna quantas mudaram."""
+    from db import engine
+    cols = [c for c, _ in _COLUNAS] + ["shipment_delivery_sla"]
+    definicao = ", ".join(f"{c} {t}" for c, t in _COLUNAS)
+    sets = ",\n".join(f"{c} = v.{c}" for c, _ in _COLUNAS)
+    # SLA que falhou no fetch mantém o valor atual
+    sla_novo = "CASE WHEN v.sla_ok THEN v.shipment_delivery_sla ELSE s.shipment_delivery_sla END"
+    antigos = ", ".join(f"s.{c}" for c in cols)
+    novos = ", ".join(f"v.{c}" for c, _ in _COLUNAS) + f", {sla_novo}"
+
+    with engine.begin() as conn:
+        res = conn.execute(text(f"""
+            UPDATE sales s SET
+                {sets},
+                shipment_delivery_sla = {sla_novo},
+                row_hash = NULL
+            FROM jsonb_to_recordset(CAST(:linhas AS jsonb))
+                 AS v(order_id bigint, sla_ok boolean, shipment_delivery_sla timestamptz, {definicao})
+            WHERE s.order_id = v.order_id
+              AND ({antigos}) IS DISTINCT FROM ({novos})
+        """), {"linhas": json.dumps(linhas, default=str)})
+        return res.rowcount or 0
+
+
+def atualizar_envios(ml_user_id: str | int, access_token: str) -> Dict[str, int]:
+    """
+    Atualiza os envios em aberto da conta.
+    Retorna: {"abertos": X, "alterados": Y, "falhas": Z}
+    """
+    from reconcile import _build_http_session
+    from reconcile_tiers import sincronizar_agenda
+    from sales import ML_API_URL, _campos_envio
+
+    abertos = envios_abertos(ml_user_id)
+    if not abertos:
+        return {"abertos": 0, "alterados": 0, "falhas": 0}
+
+    http = _build_http_session(access_token)
+
+    def buscar(item):
+        sid = item["shipping_id"]
+        return _buscar(http, f"{ML_API_URL}/shipments/{sid}"), _buscar(http, f"{ML_API_URL}/shipments/{sid}/sla")
+
+    alterados = falhas = 0
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        for i in range(0, len(abertos), LOTE):
+            lote = abertos[i:i + LOTE]
+            # /shipments e /sla de todo o lote em paralelo; só o UPDATE é sequencial
+            respostas = list(pool.map(buscar, lote))
+            linhas = []
+            for item, (envio, sla) in zip(lote, respostas):
+                if envio is None:
+                    falhas += 1
+                    continue
+                campos = _campos_envio(envio, sla)
+                for k in ("order_cost", "base_cost", "shipment_cost"):   # numeric(10,2) no banco
+                    if campos[k] is not None:
+                        campos[k] = round(float(campos[k]), 2)
+                linhas.append({"order_id": int(item["order_id"]), "sla_ok": sla is not None, **campos})
+            if linhas:
+                n = _aplicar(linhas)
+                alterados += n
+                if n:
+                    # envio entregue/cancelado muda o tier do reconcile
+                    sincronizar_agenda(ml_user_id, [l["order_id"] for l in linhas])
+
+    logging.info(f"📮 {ml_user_id} — {len(abertos)} envios em aberto | {alterados} alterados | {falhas} falhas")
+    return {"abertos": len(abertos), "alterados": alterados, "falhas": falhas}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    from scheduler import JOBS, executar_job
+    executar_job(next(j for j in JOBS if j.nome == "envios"))
@@ -0,0 +1,148 @@
+# sku_reaplicar.py – reaplica nas vendas só os SKUs alterados
+"""
+Antes, cada salvamento na Gestão de SKU rodava o UPDATE ... JOIN LATERAL sobre
+a tabela sales inteira, dentro da transação da tela: reescrevia todas as
+vendas e segurava locks que travavam a ingestão.
+
+Agora o trigger de `sku` (migrations/0006) marca os códigos alterados em
+`sku_pendentes`, e aqui cada SKU pendente é reaplicado só nas vendas em que a
+versão vigente na data do pedido difere do que está gravado, em lotes de
+LOTE linhas, cada lote na sua transação curta. Vendas sem versão válida até
+a data do pedido continuam como estão (mesma regra de antes).
+
+    python sku_reaplicar.py            # pendentes
+    python sku_reaplicar.py --todos    # marca todos os SKUs e reaplica
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import threading
+from typing import Dict, List
+
+from sqlalchemy import text
+
+
+# ---- Config ----
+LOTE       = 500        # vendas por UPDATE
+SKUS_POR_VEZ = 50       # SKUs pendentes reivindicados por rodada
+
+# vendas dos SKUs cuja versão vigente na data do pedido (valid_during) difere do gravado
+_SQL_LOTE = """
+    WITH alvo AS (
+        SELECT s.id, s.date_closed, k.level1, k.level2, k.custo_unitario, k.quantity
+        FROM sales s
+        JOIN sku k
+          ON k.sku = s.seller_sku
+         AND k.valid_during @> CAST(s.date_adjusted AS timestamptz)
+        WHERE s.seller_sku = ANY(:skus)
+          AND (s.level1, s.level2, s.custo_unitario, s.quantity_sku)
+              IS DISTINCT FROM (k.level1, k.level2, k.custo_unitario, k.quantity)
+        LIMIT :lote
+    )
+    UPDATE sales s SET
+        level1         = a.level1,
+        level2         = a.level2,
+        custo_unitario = a.custo_unitario,
+        quantity_sku   = a.quantity,
+        row_hash       = NULL
+    FROM alvo a
+    WHERE s.id = a.id AND s.date_closed = a.date_closed
+"""
+
+_em_segundo_plano = threading.Lock()
+
+
+def marcar_todos() -> int:
+    """Marca todos os SKUs cadastrados como pendentes (botão "Reconciliar SKU")."""
+    from db import engine
+    with engine.begin() as conn:
+        res = conn.execute(text("""
+            INSERT INTO sku_pendentes (sku)
+            SELECT DISTINCT sku FROM sku
+            ON CONFLICT (sku) DO UPDATE SET marcado_em = EXCLUDED.marcado_em
+        """))
+        return res.rowcount or 0
+
+
+def pendentes() -> int:
+    from db import engine
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT COUNT(*) FROM sku_pendentes")).scalar() or 0
+
+
+def _reaplicar_skus(skus: List[str], lote: int) -> int:
+    from db import engine
+    total = 0
+    while True:
+        with engine.begin() as conn:
+            n = conn.execute(text(_SQL_LOTE), {"skus": skus, "lote": lote}).rowcount or 0
+        total += n
+        if n < lote:
+            return total
+
+
+def reaplicar_pendentes(lote: int = LOTE) -> Dict[str, int]:
+    """
+    Processa os SKUs pendentes até esvaziar a fila. Um SKU só sai da fila se não
+    foi marcado de novo durante a reaplicação. Retorna {"skus": X, "vendas": Y};
+    se outra reaplicação já está rodando, retorna zeros sem esperar.
+    """
+    from db import engine
+    skus_total = vendas_total = 0
+    with engine.connect() as lock_conn:
+        if not lock_conn.execute(text("SELECT pg_try_advisory_lock(hashtext('sku_reaplicar'))")).scalar():
+            lock_conn.commit()
+            logging.info("⏭️ Reaplicação de SKU já em andamento.")
+            return {"skus": 0, "vendas": 0}
+        lock_conn.commit()
+        try:
+            while True:
+                with engine.connect() as conn:
+                    fila = conn.execute(text("""
+                        SELECT sku, marcado_em FROM sku_pendentes ORDER BY marcado_em LIMIT :n
+                    """), {"n": SKUS_POR_VEZ}).all()
+                if not fila:
+                    break
+                skus = [f.sku for f in fila]
+                vendas_total += _reaplicar_skus(skus, lote)
+                skus_total += len(skus)
+                with engine.begin() as conn:
+                    for f in fila:
+                        conn.execute(text(
+                            "DELETE FROM sku_pendentes WHERE sku = :sku AND marcado_em = :m"
+                        ), {"sku": f.sku, "m": f.marcado_em})
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(hashtext('sku_reaplicar'))"))
+            lock_conn.commit()
+
+    if skus_total:
+        logging.info(f"🔁 SKUs reaplicados: {skus_total} | vendas atualizadas: {vendas_total}")
+    return {"skus": skus_total, "vendas": vendas_total}
+
+
+def reaplicar_em_segundo_plano() -> bool:
+    """Dispara a reaplicação numa thread (a tela não espera). False se já há uma rodando neste processo."""
+    if not _em_segundo_plano.acquire(blocking=False):
+        return False
+
+    def rodar():
+        try:
+            reaplicar_pendentes()
+        except Exception as e:
+            logging.exception(f"❌ Reaplicação de SKU: {e}")
+        finally:
+            _em_segundo_plano.release()
+
+    threading.Thread(target=rodar, name="sku-reaplicar", daemon=True).start()
+    return True
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--todos", action="store_true", help="marca todos os SKUs antes de reaplicar")
+    args = ap.parse_args()
+    if args.todos:
+        marcar_todos()
+    print(reaplicar_pendentes())
@@ -1,7 +1,14 @@
 #!/bin/bash
+set -e
+
+# Schema antes de tudo: migrações pendentes e partições de sales (importar db não cria nada)
+python migrate.py
 
 # Inicia o FastAPI em segundo plano na porta 8501
 uvicorn api:app --host 0.0.0.0 --port 8501 &
 
+# Scheduler de jobs recorrentes (sync incremental, reconcile por tier, fees, dead-letter)
+python scheduler.py &
+
 # Inicia o Streamlit como serviço principal (na porta 8000, visível)
 streamlit run app.py --server.port 8000 --server.address=0.0.0.0 --server.enableXsrfProtection false
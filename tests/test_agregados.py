@@ -0,0 +1,113 @@
+import os
+import sys
+import uuid
+from datetime import date
+from pathlib import Path
+
+import pytest
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from agregados import dias_afetados, dias_vivos, recalcular_dias
+
+TEST_DB_URL = os.getenv("TEST_DB_URL")
+
+
+class _ConnFalsa:
+    """Responde a busca de date_adjusted por order_id com um dia fixo."""
+
+    def __init__(self, dia):
+        self.dia = dia
+        self.ids = None
+
+    def execute(self, _sql, params):
+        self.ids = params["ids"]
+        dia = self.dia
+        return type("R", (), {"scalars": lambda _self: [dia]})()
+
+
+def test_dias_afetados_usa_json_e_busca_so_o_que_falta():
+    mudancas = [
+        {"op": "I", "order_id": 1, "old": None, "new": {"date_adjusted": "2025-03-01T10:00:00"}},
+        # mudou a data: os dois dias precisam ser recalculados
+        {"op": "U", "order_id": 2, "old": {"date_adjusted": "2025-02-28T23:00:00"},
+         "new": {"date_adjusted": "2025-03-02T01:00:00"}},
+        {"op": "D", "order_id": 3, "old": {"date_adjusted": "2025-01-15T08:00:00"}, "new": None},
+        # update sem date_adjusted (só level1): o dia vem da venda
+        {"op": "U", "order_id": 4, "old": {"level1": "A"}, "new": {"level1": "B"}},
+    ]
+    conn = _ConnFalsa(date(2024, 12, 24))
+    dias = dias_afetados(conn, mudancas)
+    assert conn.ids == [4]
+    assert dias == {date(2025, 3, 1), date(2025, 2, 28), date(2025, 3, 2), date(2025, 1, 15), date(2024, 12, 24)}
+
+
+def test_dias_afetados_sem_consulta_quando_todas_tem_data():
+    conn = _ConnFalsa(None)
+    mudancas = [{"op": "I", "order_id": 1, "old": None, "new": {"date_adjusted": "2025-03-01T10:00:00"}}]
+    assert dias_afetados(conn, mudancas) == {date(2025, 3, 1)}
+    assert conn.ids is None
+
+
+def test_dias_de_mes_arquivado_e_a_fronteira_nao_sao_recalculados():
+    if not TEST_DB_URL:
+        pytest.skip("TEST_DB_URL não definida")
+    from sqlalchemy import create_engine, text
+
+    schema = f"t_agg_{uuid.uuid4().hex[:8]}"
+    eng = create_engine(TEST_DB_URL, connect_args={"options": f"-csearch_path={schema}"})
+    try:
+        with eng.begin() as conn:
+            conn.execute(text(f"CREATE SCHEMA {schema}"))
+            conn.execute(text("CREATE TABLE sales_arquivo (mes date, ml_user_id bigint)"))
+            conn.execute(text("INSERT INTO sales_arquivo VALUES ('2024-05-01', 1)"))
+            dias = [date(2024, 4, 29), date(2024, 4, 30), date(2024, 5, 15), date(2024, 5, 31), date(2024, 6, 1)]
+            # 30/04 pega date_closed de 01/05 até 03:00; 31/05 pega 01/06 até 03:00
+            assert dias_vivos(conn, dias) == [date(2024, 4, 29), date(2024, 6, 1)]
+    finally:
+        with eng.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+        eng.dispose()
+
+
+@pytest.fixture
+def migrado():
+    """Schema descartável com migrations/ aplicadas."""
+    if not TEST_DB_URL:
+        pytest.skip("TEST_DB_URL não definida")
+    from sqlalchemy import create_engine
+    from migrate import aplicar_migracoes
+
+    schema = f"t_agg_{uuid.uuid4().hex[:8]}"
+    admin = create_engine(TEST_DB_URL)
+    with admin.begin() as conn:
+        conn.exec_driver_sql(f"CREATE SCHEMA {schema}")
+    eng = create_engine(TEST_DB_URL, connect_args={"options": f"-csearch_path={schema}"})
+    try:
+        aplicar_migracoes(eng)
+        yield eng
+    finally:
+        eng.dispose()
+        with admin.begin() as conn:
+            conn.exec_driver_sql(f"DROP SCHEMA {schema} CASCADE")
+        admin.dispose()
+
+
+def test_recalcular_dias_inclui_a_noite_do_ultimo_dia(migrado):
+    from sqlalchemy import text
+
+    with migrado.begin() as conn:
+        # 10/03 12:00 e 22:00 em Brasília: a segunda fecha em 11/03 01:00 (date_closed)
+        conn.execute(text("""
+            INSERT INTO sales (order_id, ml_user_id, status, date_closed, total_amount, quantity, quantity_sku)
+            VALUES (1, 1, 'paid', TIMESTAMP '2025-03-10 15:00', 100, 1, 1),
+                   (2, 1, 'paid', TIMESTAMP '2025-03-11 01:00', 50, 1, 1),
+                   (3, 1, 'paid', TIMESTAMP '2025-03-11 04:00', 70, 1, 1)
+        """))
+        conn.execute(text("DELETE FROM sales_daily_agg"))
+        recalcular_dias(conn, [date(2025, 3, 10)])
+        somas = conn.execute(text(
+            "SELECT dia, SUM(vendas), SUM(faturamento) FROM sales_daily_agg GROUP BY dia"
+        )).all()
+    assert [(d, int(v), float(f)) for d, v, f in somas] == [(date(2025, 3, 10), 2, 150.0)]
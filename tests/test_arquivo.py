@@ -0,0 +1,61 @@
+import sys
+from datetime import date, datetime
+from decimal import Decimal
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+pytest.importorskip("pyarrow")
+
+from arquivo import caminho, escrever_mes, ler_arquivos, _linhas_gravadas
+
+
+def _mes_de_vendas():
+    return pd.DataFrame({
+        "id": [1, 2, 3, 4],
+        "order_id": [10, 11, 12, 13],
+        "ml_user_id": [7, 7, 8, None],
+        "date_adjusted": pd.to_datetime(["2024-05-01 10:00", "2024-05-15 12:00",
+                                         "2024-05-31 23:00", "2024-05-20 08:00"]),
+        "total_amount": [Decimal("10.50"), Decimal("99.90"), Decimal("1234.00"), None],
+        "ads": [None, None, None, None],
+    })
+
+
+def test_caminho_por_conta_e_mes():
+    assert caminho(7, date(2024, 5, 1)) == "ml_user_id=7/mes=2024-05/vendas.parquet"
+    assert caminho(None, date(2024, 5, 1)).startswith("ml_user_id=0/")
+
+
+def test_escreve_um_arquivo_por_conta_e_le_de_volta(tmp_path):
+    df = _mes_de_vendas()
+    entradas = escrever_mes(df, date(2024, 5, 1), uri=str(tmp_path))
+
+    assert [(e["ml_user_id"], e["linhas"]) for e in entradas] == [(0, 1), (7, 2), (8, 1)]
+    assert _linhas_gravadas(entradas, uri=str(tmp_path)) == len(df)
+
+    lido = ler_arquivos([e["caminho"] for e in entradas], ["order_id", "total_amount", "nao_existe"],
+                        uri=str(tmp_path))
+    assert sorted(lido["order_id"]) == [10, 11, 12, 13]
+    assert list(lido.columns) == ["order_id", "total_amount"]
+    assert lido["total_amount"].dtype == float
+
+
+def test_filtra_pelo_periodo_de_date_adjusted(tmp_path):
+    entradas = escrever_mes(_mes_de_vendas(), date(2024, 5, 1), uri=str(tmp_path))
+    lido = ler_arquivos([e["caminho"] for e in entradas], ["order_id", "date_adjusted"],
+                        desde=date(2024, 5, 15), ate=date(2024, 5, 20), uri=str(tmp_path))
+    assert sorted(lido["order_id"]) == [11, 13]
+    assert lido["date_adjusted"].min() >= datetime(2024, 5, 15)
+
+
+def test_meses_com_esquemas_diferentes_sao_unidos(tmp_path):
+    abril = _mes_de_vendas().assign(ads=[1.0, None, None, None])
+    e1 = escrever_mes(abril.iloc[:2], date(2024, 4, 1), uri=str(tmp_path))
+    e2 = escrever_mes(_mes_de_vendas().iloc[:2], date(2024, 5, 1), uri=str(tmp_path))
+    lido = ler_arquivos([e["caminho"] for e in e1 + e2], ["order_id", "ads"], uri=str(tmp_path))
+    assert len(lido) == 4 and lido["ads"].notna().sum() == 1
@@ -0,0 +1,127 @@
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from cdc import pedidos_alterados, versao_vendas
+
+TEST_DB_URL = os.getenv("TEST_DB_URL")
+
+MUDANCAS = [
+    {"seq": 1, "op": "I", "order_id": 10, "changed": None},
+    {"seq": 2, "op": "U", "order_id": 11, "changed": ["shipment_status", "shipment_substatus"]},
+    {"seq": 3, "op": "U", "order_id": 12, "changed": ["level1"]},
+    {"seq": 4, "op": "D", "order_id": 13, "changed": None},
+]
+
+
+def test_pedidos_alterados_filtra_updates_por_coluna():
+    assert pedidos_alterados(MUDANCAS) == {10, 11, 12, 13}
+    assert pedidos_alterados(MUDANCAS, {"level1", "level2"}) == {10, 12, 13}
+
+
+@pytest.fixture
+def eng_cdc():
+    """sales_changes e cdc_cursors mínimas num schema descartável (precisa de TEST_DB_URL)."""
+    if not TEST_DB_URL:
+        pytest.skip("TEST_DB_URL não definida")
+    from sqlalchemy import create_engine, text
+
+    schema = f"t_cdc_{uuid.uuid4().hex[:8]}"
+    eng = create_engine(TEST_DB_URL, connect_args={"options": f"-csearch_path={schema}"})
+    with eng.begin() as conn:
+        conn.execute(text(f"CREATE SCHEMA {schema}"))
+        conn.execute(text("""
+            CREATE TABLE sales_changes (
+                seq        BIGSERIAL PRIMARY KEY,
+                txid       BIGINT NOT NULL DEFAULT txid_current(),
+                changed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                op         VARCHAR(1) NOT NULL,
+                order_id   BIGINT NOT NULL,
+                ml_user_id BIGINT,
+                changed    TEXT[],
+                "old"      JSONB,
+                "new"      JSONB
+            )
+        """))
+        conn.execute(text("""
+            CREATE TABLE cdc_cursors (
+                consumer   VARCHAR PRIMARY KEY,
+                last_txid  BIGINT NOT NULL DEFAULT 0,
+                last_seq   BIGINT NOT NULL DEFAULT 0,
+                versao     BIGINT NOT NULL DEFAULT 0,
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        """))
+    yield eng
+    with eng.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+    eng.dispose()
+
+
+def test_versao_muda_quando_seq_baixo_comita_depois(eng_cdc):
+    from sqlalchemy import text
+
+    inserir = text("INSERT INTO sales_changes (op, order_id) VALUES ('I', 1)")
+    with eng_cdc.connect() as longa:
+        tx = longa.begin()
+        longa.execute(inserir)                          # pega o seq menor e fica aberta
+        with eng_cdc.begin() as curta:
+            curta.execute(inserir)                      # seq maior, comita primeiro
+        antes = versao_vendas(eng_cdc)
+        tx.commit()
+    assert versao_vendas(eng_cdc) != antes
+
+
+def test_versao_do_consumidor_avanca_a_cada_lote_aplicado(eng_cdc, monkeypatch):
+    import db
+    from sqlalchemy import text
+
+    from cdc import consumir, cursor
+
+    monkeypatch.setitem(vars(db), "engine", eng_cdc)
+    lotes = []
+    inserir = text("INSERT INTO sales_changes (op, order_id) VALUES ('I', 1)")
+
+    with eng_cdc.begin() as conn:
+        conn.execute(inserir)
+    consumir("teste", lambda conn, m: lotes.append(m))
+    with eng_cdc.connect() as longa:
+        tx = longa.begin()
+        longa.execute(inserir)                          # seq menor, comita por último
+        with eng_cdc.begin() as curta:
+            curta.execute(inserir)
+        tx.commit()
+    consumir("teste", lambda conn, m: lotes.append(m))
+    depois_de_dois = cursor("teste")
+    consumir("teste", lambda conn, m: lotes.append(m))   # nada novo: versão fica
+
+    assert len(lotes) == 2
+    assert depois_de_dois["versao"] == 2 and cursor("teste")["versao"] == 2
+
+
+def test_versao_ignora_o_que_os_consumidores_ja_leram(eng_cdc, monkeypatch):
+    import db
+    from sqlalchemy import text
+
+    from cdc import consumir
+
+    monkeypatch.setitem(vars(db), "engine", eng_cdc)
+    with eng_cdc.begin() as conn:
+        conn.execute(text("INSERT INTO sales_changes (op, order_id) SELECT 'I', g FROM generate_series(1, 3) g"))
+    antes = versao_vendas(eng_cdc)
+    assert antes[1:] == (3, 3)
+    consumir("teste", lambda conn, m: None)
+    depois = versao_vendas(eng_cdc)
+    # janela vazia acima do cursor; a versão do consumidor mantém a chave nova
+    assert depois[1] == 0 and depois != antes
+    consumir("teste", lambda conn, m: None)            # rodada sem mudanças
+    assert versao_vendas(eng_cdc) == depois
+    with eng_cdc.begin() as conn:
+        conn.execute(text("INSERT INTO sales_changes (op, order_id) VALUES ('U', 1)"))
+    assert versao_vendas(eng_cdc)[1:] == (1, 4)
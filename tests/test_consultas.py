@@ -0,0 +1,109 @@
+import sys
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from consultas import Consulta, ativar_copy_on_write, congelar, medir_sessoes, sql_agregado, sql_vendas, vista
+
+
+def test_so_as_colunas_pedidas_e_sem_juncao_desnecessaria():
+    sql, params = sql_vendas(Consulta(("order_id", "total_amount")))
+    assert "s.order_id AS order_id, s.total_amount AS total_amount" in sql
+    assert "JOIN" not in sql and "WHERE" not in sql
+    assert params == {}
+
+
+def test_juncoes_entram_so_quando_alguma_coluna_precisa():
+    sql, _ = sql_vendas(Consulta(("order_id", "nickname")))
+    assert "JOIN user_tokens u ON u.ml_user_id = s.ml_user_id" in sql
+    assert "sales_pnl" not in sql
+    sql, _ = sql_vendas(Consulta(("order_id", "margem_contribuicao")))
+    assert "LEFT JOIN sales_pnl p" in sql
+    assert "user_tokens" not in sql
+
+
+def test_periodo_poda_particoes_por_date_closed():
+    sql, params = sql_vendas(Consulta(("order_id",), desde=date(2025, 6, 1), ate=date(2025, 6, 30)))
+    assert "s.date_closed >= CAST(:desde AS timestamp) + interval '3 hours'" in sql
+    assert "s.date_closed < CAST(:ate_fim AS timestamp) + interval '3 hours'" in sql
+    assert "s.date_adjusted >= :desde" in sql
+    assert params == {"desde": date(2025, 6, 1), "ate_fim": date(2025, 7, 1)}
+
+
+def test_so_ate_nao_gera_limite_inferior():
+    sql, params = sql_vendas(Consulta(("order_id",), ate=date(2025, 6, 30)))
+    assert ":desde" not in sql
+    assert set(params) == {"ate_fim"}
+
+
+def test_contas_e_status_no_where():
+    c = Consulta(("order_id",), contas=[3, 1, 3], status="Cancelado")
+    assert c.contas == (1, 3)
+    sql, params = sql_vendas(c)
+    assert "s.ml_user_id = ANY(:contas)" in sql
+    assert "COALESCE(s.status, '') <> '' AND lower(s.status) <> 'paid'" in sql
+    assert params == {"contas": [1, 3]}
+
+
+def test_agregado_filtra_por_dia():
+    sql, params = sql_agregado(Consulta(("dia", "faturamento", "nickname"), desde=date(2025, 6, 1),
+                                        contas=(7,), status="Pago"))
+    assert "FROM sales_daily_agg a" in sql
+    assert "JOIN user_tokens u ON u.ml_user_id = a.ml_user_id" in sql
+    assert "a.dia >= :desde" in sql
+    assert "lower(a.status) = 'paid'" in sql
+    assert "date_closed" not in sql
+
+
+def test_consultas_equivalentes_sao_a_mesma_chave():
+    a = Consulta(("order_id", "status", "order_id"), contas=[2, 1])
+    b = Consulta(("order_id", "status"), contas=(1, 2))
+    assert a == b and hash(a) == hash(b)
+
+
+def test_coluna_ou_status_desconhecido():
+    with pytest.raises(ValueError, match="buyer_email"):
+        sql_vendas(Consulta(("order_id", "buyer_email")))
+    with pytest.raises(ValueError, match="Status desconhecido"):
+        Consulta(("order_id",), status="paid")
+
+
+def _vendas():
+    return pd.DataFrame({
+        "order_id": [1, 2, 3],
+        "shipment_logistic_type": ["fulfillment", None, "self_service"],
+        "total_amount": [10.0, 5.5, None],
+    })
+
+
+def test_base_congelada_tem_textos_em_arrow_com_nan():
+    base = congelar(_vendas())
+    tipo = base["shipment_logistic_type"].dtype
+    assert isinstance(tipo, pd.StringDtype) and tipo.storage == "pyarrow"
+    assert base["shipment_logistic_type"].isna().tolist() == [False, True, False]
+    assert np.isnan(base["shipment_logistic_type"].iloc[1])
+    assert base["total_amount"].dtype == np.float64
+
+
+def test_vista_nao_altera_a_base():
+    ativar_copy_on_write()
+    base = congelar(_vendas())
+    df = vista(base)
+    assert np.shares_memory(df["total_amount"].to_numpy(), base["total_amount"].to_numpy())
+    df["Tipo de Envio"] = df["shipment_logistic_type"].map({"fulfillment": "FULL"})
+    df.loc[0, "total_amount"] = 99.0
+    df = df[df["order_id"] > 1]
+    assert list(base.columns) == ["order_id", "shipment_logistic_type", "total_amount"]
+    assert base["total_amount"].iloc[0] == 10.0
+
+
+def test_medir_sessoes_compara_as_duas_formas():
+    m = medir_sessoes(_vendas(), 3)
+    assert set(m) == {"cache_data", "cache_resource"}
+    assert all(v["ms_por_sessao"] >= 0 for v in m.values())
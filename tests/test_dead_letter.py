@@ -0,0 +1,80 @@
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+import db
+import dead_letter
+from dead_letter import BASE_RETRY_S, MAX_RETRY_S, MAX_TENTATIVAS, intervalo_retry
+
+
+def test_backoff_dobra_ate_o_teto():
+    assert [intervalo_retry(n) for n in range(1, 5)] == [60, 120, 240, 480]
+    assert intervalo_retry(1) == BASE_RETRY_S
+    assert all(intervalo_retry(n) <= MAX_RETRY_S for n in range(1, MAX_TENTATIVAS))
+
+
+def test_para_em_max_tentativas():
+    assert intervalo_retry(MAX_TENTATIVAS - 1) is not None
+    assert intervalo_retry(MAX_TENTATIVAS) is None
+    assert intervalo_retry(MAX_TENTATIVAS + 3) is None
+
+
+class _Resultado:
+    def __init__(self, valor):
+        self.valor = valor
+
+    def scalar(self):
+        return self.valor
+
+
+class _Conexao:
+    def __init__(self, tentativas):
+        self.tentativas = tentativas
+        self.chamadas = []
+
+    def execute(self, sql, params):
+        self.chamadas.append((str(sql), params))
+        return _Resultado(self.tentativas)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _Engine:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def begin(self):
+        return self.conn
+
+
+def _registrar(monkeypatch, tentativas):
+    conn = _Conexao(tentativas)
+    monkeypatch.setitem(vars(db), "engine", _Engine(conn))
+    dead_letter.registrar_falha(1, 99, "incremental", 500, "erro")
+    return conn.chamadas
+
+
+def test_registrar_falha_agenda_pela_contagem_gravada(monkeypatch):
+    upsert, agenda = _registrar(monkeypatch, 3)
+    assert "RETURNING attempts" in upsert[0]
+    assert agenda[1] == {"oid": 99, "etapa": "incremental", "espera": 240}
+
+
+def test_registrar_falha_para_de_agendar_no_limite(monkeypatch):
+    _, agenda = _registrar(monkeypatch, MAX_TENTATIVAS)
+    assert agenda[1]["espera"] is None
+
+
+def test_registrar_falha_nunca_levanta(monkeypatch):
+    class Quebrado:
+        def begin(self):
+            raise RuntimeError("banco fora")
+
+    monkeypatch.setitem(vars(db), "engine", Quebrado())
+    dead_letter.registrar_falha(1, 99, "incremental")
@@ -0,0 +1,124 @@
+import os
+import sys
+import uuid
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from drift_sampling import colunas_divergentes, intervalo_wilson
+from models import Sale
+
+TEST_DB_URL = os.getenv("TEST_DB_URL")
+
+
+def test_wilson_sem_divergencia_nao_passa_do_limiar():
+    lim_inf, lim_sup = intervalo_wilson(0, 20)
+    assert lim_inf == 0.0
+    assert lim_sup == pytest.approx(0.161, abs=1e-3)
+
+
+def test_wilson_contem_a_proporcao_e_estreita_com_n():
+    lim_inf, lim_sup = intervalo_wilson(2, 20)
+    assert lim_inf < 0.1 < lim_sup
+    assert lim_inf > 0.01
+    largo = lim_sup - lim_inf
+    lim_inf2, lim_sup2 = intervalo_wilson(20, 200)
+    assert lim_sup2 - lim_inf2 < largo
+
+
+def test_wilson_sem_amostra():
+    assert intervalo_wilson(0, 0) == (0.0, 1.0)
+
+
+class _SemSku:
+    def execute(self, *_a, **_k):
+        return self
+
+    def fetchone(self):
+        return None
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def venda_api(monkeypatch):
+    """Sale montado por _order_to_sale a partir do stand-in do ML (mesmo caminho da ingestão)."""
+    from fastapi.testclient import TestClient
+
+    import ml_standin
+    import sales
+
+    cliente = TestClient(ml_standin.app)
+    base = sales.settings().ml_api_url
+    monkeypatch.setattr(sales.requests, "get",
+                        lambda url, headers=None, **_: cliente.get(url.replace(base, ""), headers=headers))
+    pedido = next(iter(ml_standin._dados.pedidos.values()))
+    return sales._order_to_sale(dict(pedido), "123456", "tok", _SemSku())
+
+
+def _como_o_banco_devolve(venda):
+    """Cópia com os tipos do psycopg: timestamp sem fuso em UTC, String como str, Numeric como Decimal."""
+    from decimal import Decimal
+    from datetime import timezone
+
+    from sqlalchemy import DateTime, Numeric, String
+
+    linha = {}
+    for col in Sale.__table__.columns:
+        v = getattr(venda, col.key, None)
+        if v is not None and isinstance(col.type, DateTime):
+            v = v.astimezone(timezone.utc)
+            v = v if col.type.timezone else v.replace(tzinfo=None)
+        elif v is not None and isinstance(col.type, Numeric) and col.type.asdecimal:
+            v = Decimal(str(v)).quantize(Decimal("0.01"))
+        elif v is not None and isinstance(col.type, String):
+            v = str(v)
+        linha[col.key] = v
+    return SimpleNamespace(**linha)
+
+
+def test_mesma_venda_no_banco_e_na_api_nao_diverge(venda_api):
+    from reconcile import colunas_reconciliaveis
+
+    gravada = _como_o_banco_devolve(venda_api)
+    assert isinstance(venda_api.shipping_id, int) and isinstance(gravada.shipping_id, str)
+    assert venda_api.date_closed.tzinfo is not None and gravada.date_closed.tzinfo is None
+    assert colunas_divergentes(gravada, venda_api, colunas_reconciliaveis()) == []
+
+    gravada.status = "cancelled"
+    assert colunas_divergentes(gravada, venda_api, colunas_reconciliaveis()) == ["status"]
+
+
+def test_ida_e_volta_pelo_postgres_nao_diverge(venda_api):
+    """Grava o Sale da API numa tabela sales descartável e compara o que volta."""
+    if not TEST_DB_URL:
+        pytest.skip("TEST_DB_URL não definida")
+    from sqlalchemy import create_engine, select, text
+    from sqlalchemy.orm import Session
+
+    from reconcile import colunas_reconciliaveis
+
+    schema = f"t_drift_{uuid.uuid4().hex[:8]}"
+    eng = create_engine(TEST_DB_URL, connect_args={"options": f"-csearch_path={schema},public -ctimezone=UTC"})
+    try:
+        with eng.begin() as conn:
+            conn.execute(text(f"CREATE SCHEMA {schema}"))
+            Sale.__table__.create(conn)
+        # cópia: o objeto da API fica fora da sessão, com os tipos do JSON
+        copia = Sale(**{c: getattr(venda_api, c) for c in colunas_reconciliaveis() | {"order_id", "ml_user_id"}})
+        with Session(eng) as s:
+            s.add(copia)
+            s.commit()
+        with Session(eng) as s:
+            gravada = s.execute(select(Sale)).scalar_one()
+        assert isinstance(gravada.shipping_id, str) and gravada.date_closed.tzinfo is None
+        assert colunas_divergentes(gravada, venda_api, colunas_reconciliaveis()) == []
+    finally:
+        with eng.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+        eng.dispose()
@@ -0,0 +1,74 @@
+import os
+import sys
+from datetime import datetime, timezone
+from decimal import Decimal
+from pathlib import Path
+
+import pytest
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from escrita import _coagir, copiar, copiar_df, executar_em_lote
+
+TEST_DB_URL = os.getenv("TEST_DB_URL")
+
+
+def test_coagir_para_o_tipo_da_coluna():
+    import numpy as np
+
+    assert _coagir(np.int64(7), "int8") == 7 and type(_coagir(np.int64(7), "int8")) is int
+    assert _coagir(10.5, "numeric") == Decimal("10.5")
+    assert _coagir(Decimal("1.10"), "numeric") == Decimal("1.10")
+    assert _coagir(12345678000190, "varchar") == "12345678000190"
+    assert _coagir(np.float64(1.5), "float8") == 1.5
+    assert _coagir(np.bool_(True), "bool") is True
+    assert _coagir(datetime(2025, 1, 1, 10), "timestamptz") == datetime(2025, 1, 1, 10, tzinfo=timezone.utc)
+    assert _coagir(datetime(2025, 1, 1, 10, tzinfo=timezone.utc), "timestamp") == datetime(2025, 1, 1, 10)
+
+
+def test_coagir_nan_e_nat_viram_null():
+    import pandas as pd
+
+    assert _coagir(float("nan"), "numeric") is None
+    assert _coagir(pd.NaT, "timestamptz") is None
+    assert _coagir(None, "text") is None
+    assert _coagir("", "text") == ""
+
+
+@pytest.fixture
+def conn():
+    if not TEST_DB_URL:
+        pytest.skip("TEST_DB_URL não definida")
+    from sqlalchemy import create_engine, text
+
+    eng = create_engine(TEST_DB_URL)
+    with eng.begin() as c:
+        c.execute(text("""
+            CREATE TEMP TABLE _t (id bigint PRIMARY KEY, fee numeric(12,2), sku varchar(20),
+                                  quando timestamptz, qtd integer) ON COMMIT DROP
+        """))
+        yield c
+    eng.dispose()
+
+
+def test_copiar_e_atualizar_em_pipeline(conn):
+    import pandas as pd
+    from sqlalchemy import text
+
+    quando = datetime(2025, 5, 1, 12, 0, tzinfo=timezone.utc)
+    assert copiar(conn, "_t", ["id", "fee", "sku", "quando"], [(1, 9.9, "A", quando), (2, None, 123, None)]) == 2
+    df = pd.DataFrame({"id": [3, 4], "fee": [1.25, float("nan")], "qtd": [2, 3]})
+    assert copiar_df(conn, "_t", df) == 2
+
+    n = executar_em_lote(conn, "UPDATE _t SET fee = :fee WHERE id = :id",
+                         [{"id": i, "fee": Decimal(i)} for i in (1, 2, 3)])
+    assert n == 3
+    linhas = conn.execute(text("SELECT id, fee, sku, quando, qtd FROM _t ORDER BY id")).all()
+    assert [(r.id, r.fee) for r in linhas] == [(1, 1), (2, 2), (3, 3), (4, None)]
+    assert linhas[1].sku == "123" and linhas[0].quando == quando and linhas[3].qtd == 3
+
+
+def test_copiar_recusa_coluna_inexistente(conn):
+    with pytest.raises(ValueError, match="nao_existe"):
+        copiar(conn, "_t", ["id", "nao_existe"], [(1, 2)])
@@ -0,0 +1,76 @@
+import sys
+from pathlib import Path
+
+import pytest
+import requests
+from fastapi.testclient import TestClient
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+import ml_standin
+from ml_replay import Cassette, CassetteAusente, chave_requisicao, usar_cassette
+
+client = TestClient(ml_standin.app)
+
+
+def test_chave_ignora_token_e_ordem_dos_params():
+    a = chave_requisicao("get", "https://api.mercadolibre.com/orders/1?access_token=x&b=2&a=1")
+    b = chave_requisicao("GET", "http://localhost:8600/orders/1?a=1&b=2")
+    assert a == b == "GET /orders/1?a=1&b=2"
+
+
+def test_reproduz_respostas_gravadas(tmp_path):
+    cassette = Cassette()
+    cassette.gravar("GET", "https://api.mercadolibre.com/orders/1?access_token=abc", 200,
+                    {"Content-Type": "application/json"}, '{"id": 1}')
+    cassette.gravar("GET", "https://api.mercadolibre.com/orders/1", 429, {"Retry-After": "1"}, "")
+    arquivo = tmp_path / "ml.json"
+    cassette.salvar(arquivo)
+    assert "abc" not in arquivo.read_text()
+
+    with usar_cassette(arquivo, modo="reproduzir", hosts=("api.mercadolibre.com",)):
+        primeira = requests.get("https://api.mercadolibre.com/orders/1?access_token=zzz")
+        segunda = requests.get("https://api.mercadolibre.com/orders/1")
+        with pytest.raises(CassetteAusente):
+            requests.get("https://api.mercadolibre.com/orders/2")
+
+    assert primeira.json() == {"id": 1}
+    assert segunda.status_code == 429
+    assert segunda.headers["Retry-After"] == "1"
+
+
+def test_standin_pagina_pedidos_do_vendedor():
+    seller = ml_standin._dados.seller_id
+    resp = client.get("/orders/search", params={"seller": seller, "limit": 50, "offset": 0})
+    assert resp.status_code == 200
+    corpo = resp.json()
+    assert len(corpo["results"]) == 50
+    assert corpo["paging"]["total"] == len(ml_standin._dados.pedidos)
+
+    oid = corpo["results"][0]["id"]
+    pedido = client.get(f"/orders/{oid}").json()
+    shipment_id = pedido["shipping"]["id"]
+    assert client.get(f"/shipments/{shipment_id}").json()["order_id"] == oid
+    assert "expected_date" in client.get(f"/shipments/{shipment_id}/sla").json()
+    assert client.get(f"/orders/{oid}/payments").json() == pedido["payments"]
+
+
+def test_standin_injeta_429():
+    client.post("/__config", params={"taxa_429": 1.0})
+    try:
+        resp = client.get("/orders/search", params={"seller": ml_standin._dados.seller_id})
+        assert resp.status_code == 429
+        assert resp.headers["Retry-After"] == "1"
+    finally:
+        client.post("/__config", params={"taxa_429": 0.0})
+
+
+def test_standin_oauth_token_troca_e_renova():
+    troca = client.post("/oauth/token", data={"grant_type": "authorization_code", "code": "777"})
+    assert troca.status_code == 200 and troca.json()["user_id"] == 777
+    renov = client.post("/oauth/token", data={"grant_type": "refresh_token",
+                                              "refresh_token": troca.json()["refresh_token"]})
+    assert renov.status_code == 200
+    assert renov.json()["user_id"] == 777 and renov.json()["refresh_token"] != troca.json()["refresh_token"]
+    assert client.post("/oauth/token", data={"grant_type": "refresh_token", "refresh_token": "x"}).status_code == 400
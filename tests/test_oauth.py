@@ -0,0 +1,116 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+import oauth
+
+
+def test_renovacoes_simultaneas_da_mesma_conta_viram_uma(monkeypatch):
+    chamadas = []
+
+    async def renovar_falso(ml_user_id, _http):
+        chamadas.append(ml_user_id)
+        await asyncio.sleep(0.01)
+        return f"token-{ml_user_id}"
+
+    monkeypatch.setattr(oauth, "_renovar_async", renovar_falso)
+
+    async def rodar():
+        return await asyncio.gather(
+            *(oauth.renovar_access_token_async(1, None) for _ in range(5)),
+            oauth.renovar_access_token_async(2, None),
+        )
+
+    tokens = asyncio.run(rodar())
+    assert tokens == ["token-1"] * 5 + ["token-2"]
+    assert sorted(chamadas) == [1, 2]
+    assert oauth._renovacoes == {}
+
+
+def test_falha_na_renovacao_libera_quem_espera(monkeypatch):
+    async def renovar_falho(_uid, _http):
+        await asyncio.sleep(0.01)
+        raise RuntimeError("ML fora")
+
+    monkeypatch.setattr(oauth, "_renovar_async", renovar_falho)
+
+    async def rodar():
+        return await asyncio.gather(*(oauth.renovar_access_token_async(3, None) for _ in range(3)))
+
+    assert asyncio.run(rodar()) == [None, None, None]
+
+
+class _Conexao:
+    def __init__(self, linha):
+        self.linha = linha
+        self.sqls = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.sqls.append(" ".join(str(sql).split()))
+        return self
+
+    def first(self):
+        return self.linha
+
+
+class _Engine:
+    def __init__(self, linha):
+        self.conexao = _Conexao(linha)
+
+    def connect(self):
+        return self.conexao
+
+    begin = connect
+
+
+class _Resposta:
+    status_code = 200
+
+    def json(self):
+        return {"access_token": "novo", "refresh_token": "r2", "expires_in": 21600}
+
+
+def _linha(minutos):
+    from datetime import datetime, timedelta
+    from types import SimpleNamespace
+    return SimpleNamespace(access_token="atual", refresh_token="r1",
+                           expires_at=datetime.utcnow() + timedelta(minutes=minutos))
+
+
+def test_token_valido_nao_chama_o_ml(monkeypatch):
+    import db
+    monkeypatch.setitem(vars(db), "engine", _Engine(_linha(60)))
+    monkeypatch.setattr(oauth, "renovar_access_token", lambda *a, **k: pytest.fail("renovou"))
+    assert oauth.token_valido(1) == "atual"
+
+
+def test_perto_de_vencer_renova_sob_lock_e_com_cas(monkeypatch):
+    import db
+    eng = _Engine(_linha(2))
+    posts = []
+    monkeypatch.setitem(vars(db), "engine", eng)
+    monkeypatch.setattr(oauth, "_payload_refresh", lambda r: {"refresh_token": r})
+    monkeypatch.setattr(oauth.requests, "post", lambda url, data, timeout: posts.append(data) or _Resposta())
+    assert oauth.token_valido(1) == "novo"
+    assert posts == [{"refresh_token": "r1"}]
+    assert any("pg_advisory_xact_lock" in s for s in eng.conexao.sqls)
+    assert any("refresh_token = :anterior" in s for s in eng.conexao.sqls)
+
+
+def test_outro_job_ja_renovou_devolve_o_gravado(monkeypatch):
+    import db
+    monkeypatch.setitem(vars(db), "engine", _Engine(_linha(60)))
+    monkeypatch.setattr(oauth.requests, "post", lambda *a, **k: pytest.fail("renovou de novo"))
+    # quem levou 401 com o token antigo recebe o que já está gravado
+    assert oauth.renovar_access_token(1, recusado="antigo") == "atual"
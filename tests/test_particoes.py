@@ -0,0 +1,24 @@
+import re
+import sys
+from datetime import date
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from migrate import PASTA
+from models import Sale
+from particoes import nome_particao
+
+
+def test_nome_particao_mensal():
+    assert nome_particao(date(2024, 5, 16)) == "sales_p202405"
+    assert nome_particao(date(2025, 12, 1)) == "sales_p202512"
+
+
+def test_particionada_tem_os_indices_do_modelo():
+    # a troca tira o prefixo pt_ dos índices da particionada; se faltar um aqui,
+    # sales perde o índice depois da migração online
+    sql = (PASTA / "0004_sales_particionada.sql").read_text(encoding="utf-8")
+    provisorios = set(re.findall(r"\bpt_(ix_sales_\w+)", sql))
+    assert {i.name for i in Sale.__table__.indexes} <= provisorios
@@ -0,0 +1,87 @@
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from pipeline import Pipeline
+
+
+def test_pipeline_processa_descarta_e_agrupa_em_lotes():
+    gravados, lotes = [], []
+
+    def gravar(itens):
+        lotes.append(len(itens))
+        gravados.extend(itens)
+
+    pipe = Pipeline("teste", log_intervalo=60)
+    pipe.fonte(range(1000))
+    pipe.estagio("dobro", lambda x: x * 2, workers=4, capacidade=10)
+    pipe.estagio("pares4", lambda x: x if x % 4 == 0 else None, workers=2, capacidade=10)
+    pipe.lote("grava", gravar, tamanho=64, espera_max=0.5)
+    m = pipe.executar()
+
+    assert sorted(gravados) == [x * 2 for x in range(1000) if (x * 2) % 4 == 0]
+    assert max(lotes) <= 64
+    assert m["produzidos"] == 1000
+    assert m["estagios"]["dobro"]["saida"] == 1000
+    assert m["estagios"]["pares4"]["saida"] == 500
+    assert m["estagios"]["dobro"]["fila_max"] <= 10
+
+
+def test_fila_limitada_segura_o_produtor():
+    liberar = threading.Event()
+    produzidos = []
+
+    def fonte():
+        for i in range(50):
+            produzidos.append(i)
+            yield i
+
+    def lento(x):
+        liberar.wait()
+        return x
+
+    pipe = Pipeline("backpressure", log_intervalo=60)
+    pipe.fonte(fonte())
+    pipe.estagio("lento", lento, workers=1, capacidade=5)
+    t = threading.Thread(target=pipe.executar)
+    t.start()
+    time.sleep(0.3)
+    # 1 item em processamento + 5 na fila + 1 bloqueado no put
+    assert len(produzidos) <= 7
+    liberar.set()
+    t.join(timeout=5)
+    assert len(produzidos) == 50
+
+
+def test_erro_fatal_aborta_e_relanca():
+    def gravar(_itens):
+        raise RuntimeError("banco fora")
+
+    pipe = Pipeline("fatal", log_intervalo=60)
+    pipe.fonte(range(10_000))
+    pipe.estagio("id", lambda x: x, workers=2, capacidade=20)
+    pipe.lote("grava", gravar, tamanho=10)
+    with pytest.raises(RuntimeError, match="banco fora"):
+        pipe.executar()
+
+
+def test_erro_nao_fatal_so_descarta_o_item():
+    def quebra_no_7(x):
+        if x == 7:
+            raise ValueError("ruim")
+        return x
+
+    saida = []
+    pipe = Pipeline("parcial", log_intervalo=60)
+    pipe.fonte(range(20))
+    pipe.estagio("f", quebra_no_7, workers=3)
+    pipe.lote("grava", saida.extend, tamanho=5)
+    m = pipe.executar()
+    assert sorted(saida) == [x for x in range(20) if x != 7]
+    assert m["estagios"]["f"]["erros"] == 1
@@ -0,0 +1,65 @@
+import os
+import sys
+import uuid
+from datetime import date
+from decimal import Decimal
+from pathlib import Path
+
+import pytest
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from pnl import _meses, definir_parametro
+
+TEST_DB_URL = os.getenv("TEST_DB_URL")
+
+
+def test_meses_cobre_o_intervalo():
+    assert list(_meses(date(2024, 11, 15), date(2025, 1, 3))) == [
+        date(2024, 11, 1), date(2024, 12, 1), date(2025, 1, 1),
+    ]
+
+
+@pytest.fixture
+def migrado():
+    """Schema descartável com migrations/ aplicadas."""
+    if not TEST_DB_URL:
+        pytest.skip("TEST_DB_URL não definida")
+    from sqlalchemy import create_engine
+    from migrate import aplicar_migracoes
+
+    schema = f"t_pnl_{uuid.uuid4().hex[:8]}"
+    admin = create_engine(TEST_DB_URL)
+    with admin.begin() as conn:
+        conn.exec_driver_sql(f"CREATE SCHEMA {schema}")
+    eng = create_engine(TEST_DB_URL, connect_args={"options": f"-csearch_path={schema}"})
+    try:
+        aplicar_migracoes(eng)
+        yield eng
+    finally:
+        eng.dispose()
+        with admin.begin() as conn:
+            conn.exec_driver_sql(f"DROP SCHEMA {schema} CASCADE")
+        admin.dispose()
+
+
+def test_parametro_novo_alcanca_a_noite_do_fim_do_mes(migrado):
+    from sqlalchemy import text
+
+    with migrado.begin() as conn:
+        # 10/05 12:00 e 31/05 23:00 em Brasília (date_closed 01/06 02:00), ambos FLEX
+        conn.execute(text("""
+            INSERT INTO sales (order_id, ml_user_id, status, date_closed, total_amount, quantity,
+                               quantity_sku, shipment_logistic_type)
+            VALUES (1, 1, 'paid', TIMESTAMP '2025-05-10 15:00', 100, 1, 1, 'self_service'),
+                   (2, 1, 'paid', TIMESTAMP '2025-06-01 02:00', 100, 1, 1, 'self_service')
+        """))
+    assert definir_parametro("flex_envio", Decimal("20"), date(2025, 5, 1), migrado) == 2
+    with migrado.connect() as conn:
+        pedidos = conn.execute(text("SELECT order_id, custo_flex FROM sales_pnl ORDER BY order_id")).all()
+        agregado = conn.execute(text(
+            "SELECT dia, SUM(custo_flex) FROM sales_daily_agg GROUP BY dia ORDER BY dia"
+        )).all()
+    assert [(o, float(c)) for o, c in pedidos] == [(1, -20.0), (2, -20.0)]
+    assert [(d, float(c)) for d, c in agregado] == [(date(2025, 5, 10), -20.0), (date(2025, 5, 31), -20.0)]
@@ -0,0 +1,271 @@
+"""
+Regressão de planos: aplica migrations/ num schema descartável, popula volume
+suficiente para o planner preferir índice e falha se alguma consulta quente
+voltar a fazer Seq Scan nas tabelas grandes.
+
+Precisa de um Postgres: TEST_DB_URL=postgresql+psycopg://... pytest tests/test_query_plans.py
+Sem TEST_DB_URL só rodam as checagens estáticas das migrações.
+"""
+import os
+import re
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from migrate import carregar, _comandos
+from models import Base
+
+TEST_DB_URL = os.getenv("TEST_DB_URL")
+TABELAS_GRANDES = {"sales", "sku", "compras_insumos", "reconcile_schedule"}
+PARTICAO_SALES = re.compile(r"^sales_p(\d{6}|_default)$")
+# consultas com filtro em date_closed: o planner tem que podar os outros meses
+COM_PODA = {"vendas_conta_periodo": 1, "fees_pendentes": 20}
+
+# consulta -> parâmetros; cada uma corresponde a um caminho quente do app/ingestão
+CONSULTAS_QUENTES = {
+    "vendas_conta_periodo": ("""
+        SELECT order_id, status, total_amount FROM sales
+        WHERE ml_user_id = :uid AND date_closed BETWEEN :desde AND :desde + interval '7 days'
+    """, {"uid": 3, "desde": "2025-03-01"}),
+    "sku_vigente": ("""
+        SELECT * FROM sku
+        WHERE sku = :sku AND valid_during @> CAST(:data AS timestamptz)
+    """, {"sku": "SKU-42", "data": "2025-06-01"}),
+    "fees_pendentes": ("""
+        SELECT order_id FROM sales
+        WHERE ml_user_id = :uid AND ml_fee IS NULL AND date_closed >= :desde
+    """, {"uid": 3, "desde": "2025-06-01"}),
+    "vendas_por_sku": ("""
+        SELECT order_id, date_adjusted FROM sales
+        WHERE seller_sku = :sku AND date_adjusted >= :desde
+        ORDER BY date_adjusted
+    """, {"sku": "SKU-42", "desde": "2025-01-01"}),
+    "reaplicacao_sku": ("""
+        SELECT s.id, s.date_closed, k.level1, k.custo_unitario
+        FROM sales s
+        JOIN sku k ON k.sku = s.seller_sku AND k.valid_during @> CAST(s.date_adjusted AS timestamptz)
+        WHERE s.seller_sku = ANY(:skus)
+    """, {"skus": ["SKU-42", "SKU-43"]}),
+    "vendas_por_anuncio": ("""
+        SELECT order_id FROM sales WHERE item_id = :item
+    """, {"item": "MLB42"}),
+    "compras_periodo": ("""
+        SELECT * FROM compras_insumos
+        WHERE data_compra BETWEEN :desde AND CAST(:desde AS date) + 15
+    """, {"desde": "2025-03-01"}),
+    "envios_abertos": ("""
+        SELECT order_id, shipping_id FROM sales
+        WHERE shipment_status = ANY(:abertos) AND ml_user_id = :uid AND shipping_id IS NOT NULL
+        ORDER BY shipment_delivery_sla NULLS LAST LIMIT 20000
+    """, {"abertos": ["pending", "handling", "ready_to_ship", "shipped"], "uid": 3}),
+    "agenda_vencida": ("""
+        SELECT order_id FROM reconcile_schedule
+        WHERE ml_user_id = :uid AND next_check_at <= NOW()
+        ORDER BY next_check_at LIMIT 5000
+    """, {"uid": 3}),
+}
+
+SEMEAR = [
+    "SELECT garantir_particoes_sales(DATE '2024-01-01', 3)",
+    "ALTER TABLE sales DISABLE TRIGGER USER",
+    """
+    INSERT INTO sales (order_id, ml_user_id, status, date_closed, item_id, seller_sku,
+                       total_amount, ml_fee, shipping_id, shipment_status, shipment_delivery_sla)
+    SELECT i, i % 20, 'paid',
+           TIMESTAMP '2024-01-01' + (i % 730) * interval '1 day' + (i % 1440) * interval '1 minute',
+           'MLB' || (i % 5000), 'SKU-' || (i % 2000),
+           100, CASE WHEN i % 100 = 0 THEN NULL ELSE 10 END,
+           i::text, CASE WHEN i % 50 = 0 THEN 'shipped' ELSE 'delivered' END,
+           NOW() + (i % 10) * interval '1 day'
+    FROM generate_series(1, 200000) AS i
+    """,
+    "ALTER TABLE sales ENABLE TRIGGER USER",
+    """
+    INSERT INTO sku (sku, level1, level2, custo_unitario, quantity, date_created, valid_during)
+    SELECT 'SKU-' || (i % 2000), 'L1', 'L2', 10, 1,
+           TIMESTAMPTZ '2024-01-01' + (i / 2000) * interval '60 days',
+           tstzrange(TIMESTAMPTZ '2024-01-01' + (i / 2000) * interval '60 days',
+                     CASE WHEN i / 2000 < 9 THEN TIMESTAMPTZ '2024-01-01' + (i / 2000 + 1) * interval '60 days' END)
+    FROM generate_series(0, 19999) AS i
+    """,
+    """
+    INSERT INTO compras_insumos (quantidade, preco_unitario, total_compra, data_compra, data_entrega_esperada)
+    SELECT 1, 1, 1, DATE '2023-01-01' + (i % 1095), DATE '2023-01-01' + (i % 1095) + 7
+    FROM generate_series(1, 50000) AS i
+    """,
+    """
+    INSERT INTO reconcile_schedule (order_id, ml_user_id, tier, next_check_at)
+    SELECT i, i % 20, 'cold',
+           NOW() + CASE WHEN i % 100 = 0 THEN -interval '1 hour' ELSE (i % 30) * interval '1 day' END
+    FROM generate_series(1, 200000) AS i
+    """,
+    "ANALYZE",
+]
+
+
+# ----------------- Estáticas (sempre rodam) -----------------
+def test_migracoes_numeradas_e_sem_transacao_divisiveis():
+    migracoes = carregar()
+    assert [m.versao for m in migracoes] == sorted(m.versao for m in migracoes)
+    for m in migracoes:
+        if m.sem_transacao:
+            comandos = _comandos(m.sql)
+            assert comandos and all("CONCURRENTLY" in c for c in comandos)
+            assert all("$$" not in c for c in comandos)
+
+
+def test_indices_do_modelo_estao_nas_migracoes():
+    sql = "\n".join(m.sql for m in carregar())
+    for tabela in Base.metadata.tables.values():
+        for indice in tabela.indexes:
+            assert indice.name in sql, f"{indice.name} está no models.py mas em nenhuma migração"
+
+
+# ----------------- Com banco (TEST_DB_URL) -----------------
+@pytest.fixture(scope="module")
+def banco():
+    if not TEST_DB_URL:
+        pytest.skip("TEST_DB_URL não definida")
+    from sqlalchemy import create_engine, text
+    from migrate import aplicar_migracoes
+
+    schema = f"plano_{uuid.uuid4().hex[:8]}"
+    admin = create_engine(TEST_DB_URL)
+    with admin.begin() as conn:
+        conn.exec_driver_sql(f"CREATE SCHEMA {schema}")
+    eng = create_engine(TEST_DB_URL, connect_args={"options": f"-c search_path={schema}"})
+    try:
+        aplicar_migracoes(eng)
+        with eng.connect() as conn:
+            conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+            for sql in SEMEAR:
+                conn.execute(text(sql))
+        yield eng, schema
+    finally:
+        eng.dispose()
+        with admin.begin() as conn:
+            conn.exec_driver_sql(f"DROP SCHEMA {schema} CASCADE")
+        admin.dispose()
+
+
+def test_esquema_migrado_cobre_o_modelo(banco):
+    from sqlalchemy import text
+
+    eng, schema = banco
+    with eng.connect() as conn:
+        existentes = {
+            (t, c) for t, c in conn.execute(text(
+                "SELECT table_name, column_name FROM information_schema.columns WHERE table_schema = :s"
+            ), {"s": schema})
+        }
+    faltando = [
+        f"{t.name}.{c.name}" for t in Base.metadata.tables.values() for c in t.columns
+        if (t.name, c.name) not in existentes
+    ]
+    assert not faltando, f"colunas do modelo sem migração: {faltando}"
+
+
+def test_migracoes_sao_idempotentes(banco):
+    from migrate import aplicar_migracoes
+
+    eng, _ = banco
+    assert aplicar_migracoes(eng) == []
+
+
+def _relacoes(no, achados):
+    """(tipo do nó, tabela) de todo scan do plano; partições de sales contam como sales."""
+    if "Relation Name" in no:
+        achados.append((no["Node Type"], no["Relation Name"]))
+    for filho in no.get("Plans", []):
+        _relacoes(filho, achados)
+    return achados
+
+
+def _eh_sales(relacao):
+    return relacao == "sales" or PARTICAO_SALES.match(relacao)
+
+
+@pytest.mark.parametrize("nome", sorted(CONSULTAS_QUENTES))
+def test_consulta_quente_usa_indice(banco, nome):
+    from sqlalchemy import text
+
+    eng, _ = banco
+    sql, params = CONSULTAS_QUENTES[nome]
+    with eng.connect() as conn:
+        plano = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"), params).scalar()
+    scans = _relacoes(plano[0]["Plan"], [])
+    seq = [r for tipo, r in scans if tipo == "Seq Scan" and (r in TABELAS_GRANDES or _eh_sales(r))]
+    assert not seq, f"{nome}: Seq Scan em {seq}\n{plano}"
+    if nome in COM_PODA:
+        meses = {r for _, r in scans if _eh_sales(r)}
+        assert len(meses) <= COM_PODA[nome], f"{nome}: sem poda de partições, leu {sorted(meses)}"
+
+
+def test_sales_e_particionada(banco):
+    from particoes import listar_particoes, particionada
+
+    eng, _ = banco
+    assert particionada(eng)
+    nomes = {p["particao"] for p in listar_particoes(eng)}
+    assert {"sales_p_default", "sales_p202403"} <= nomes
+
+
+def test_sku_nova_versao_fecha_a_vigente(banco):
+    from sqlalchemy import text
+    from sqlalchemy.exc import IntegrityError
+
+    eng, _ = banco
+    with eng.begin() as conn:
+        conn.execute(text("SELECT sku_nova_versao('SKU-T', 'A', 'B', 10, 1, TIMESTAMPTZ '2025-01-01')"))
+        conn.execute(text("SELECT sku_nova_versao('SKU-T', 'A', 'B', 12, 1, TIMESTAMPTZ '2025-02-01')"))
+        versoes = conn.execute(text("""
+            SELECT custo_unitario, is_active, upper(valid_during) AS fim
+            FROM sku WHERE sku = 'SKU-T' ORDER BY lower(valid_during)
+        """)).all()
+        vigente = conn.execute(text(
+            "SELECT custo_unitario FROM sku WHERE sku = 'SKU-T' AND valid_during @> TIMESTAMPTZ '2025-01-15'"
+        )).scalar()
+    assert [(float(v.custo_unitario), v.is_active) for v in versoes] == [(10.0, False), (12.0, True)]
+    assert versoes[0].fim is not None and float(vigente) == 10.0
+
+    # versão sobreposta é recusada pela restrição de exclusão
+    with pytest.raises(IntegrityError):
+        with eng.begin() as conn:
+            conn.execute(text("""
+                INSERT INTO sku (sku, valid_during)
+                VALUES ('SKU-T', tstzrange(TIMESTAMPTZ '2025-01-10', TIMESTAMPTZ '2025-01-20'))
+            """))
+
+
+def test_sales_pnl_acompanha_a_venda(banco):
+    from sqlalchemy import text
+
+    eng, _ = banco
+    pnl = "SELECT receita, taxa_plataforma, custo_flex, cmv, margem_contribuicao, unidades FROM sales_pnl WHERE order_id = 9000000001"
+    with eng.connect() as conn:
+        tx = conn.begin()
+        conn.execute(text("""
+            INSERT INTO custos_parametros (nome, vigente_desde, valor) VALUES ('flex_envio', DATE '2025-06-01', 15)
+        """))
+        conn.execute(text("""
+            INSERT INTO sales (order_id, ml_user_id, date_closed, total_amount, ml_fee, frete_adjust,
+                               shipment_logistic_type, quantity, quantity_sku, custo_unitario)
+            VALUES (9000000001, 1, TIMESTAMP '2025-05-10 12:00', 100, 12, -5, 'self_service', 2, 1, 20)
+        """))
+        assert [float(v) for v in conn.execute(text(pnl)).one()] == [100, -12, -12.97, -40, 30.03, 2]
+
+        # reaplicação de SKU / reconcile: o UPDATE refaz o resultado; junho usa o FLEX novo
+        conn.execute(text("""
+            UPDATE sales SET custo_unitario = 25, date_closed = TIMESTAMP '2025-06-10 12:00'
+            WHERE order_id = 9000000001
+        """))
+        assert [float(v) for v in conn.execute(text(pnl)).one()] == [100, -12, -15, -50, 18, 2]
+
+        conn.execute(text("DELETE FROM sales WHERE order_id = 9000000001"))
+        assert conn.execute(text(pnl)).first() is None
+        tx.rollback()
@@ -1,24 +1,10 @@
 from decimal import Decimal
 import sys
 from pathlib import Path
-from types import ModuleType
 
 project_root = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(project_root))
 
-# Evita dependências de banco e credenciais durante a importação de reconcile.py
-fake_db = ModuleType("db")
-fake_db.SessionLocal = None
-sys.modules["db"] = fake_db
-
-fake_oauth = ModuleType("oauth")
-fake_oauth.renovar_access_token = lambda *_args, **_kwargs: None
-sys.modules["oauth"] = fake_oauth
-
-fake_sales = ModuleType("sales")
-fake_sales._order_to_sale = lambda *_args, **_kwargs: None
-sys.modules["sales"] = fake_sales
-
 from reconcile import _is_different
 
 
@@ -36,3 +22,57 @@ def test_is_different_handles_none_values():
     assert not _is_different(None, None)
     assert _is_different(None, "algo")
     assert _is_different("algo", None)
+
+
+def test_fingerprint_segue_regras_do_is_different():
+    from datetime import datetime, timezone
+    from types import SimpleNamespace
+
+    from reconcile import _fingerprint
+
+    cols = ["status", "total_amount", "quantity", "date_closed"]
+    base = SimpleNamespace(status="paid", total_amount=Decimal("10.00"), quantity=1,
+                           date_closed=datetime(2025, 5, 1, 12, 0))
+    igual = SimpleNamespace(status=" paid ", total_amount=10.001, quantity=1.0,
+                            date_closed=datetime(2025, 5, 1, 12, 0, tzinfo=timezone.utc))
+    mudou = SimpleNamespace(status="cancelled", total_amount=Decimal("10.00"), quantity=1,
+                            date_closed=datetime(2025, 5, 1, 12, 0))
+
+    assert _fingerprint(base, cols) == _fingerprint(igual, cols)
+    assert _fingerprint(base, cols) != _fingerprint(mudou, cols)
+    assert _fingerprint(base, cols) == _fingerprint(base, reversed(cols))
+
+
+def test_sql_diferente_usa_tolerancia_e_trim():
+    from reconcile import _sql_diferente, _tipo_stage
+
+    assert "abs(s.total_amount::float8 - t.total_amount::float8) > :tol" in _sql_diferente("total_amount")
+    assert "btrim(s.item_title" in _sql_diferente("item_title")
+    assert _sql_diferente("date_closed") == "(s.date_closed IS DISTINCT FROM t.date_closed)"
+    assert _tipo_stage("date_closed") == "timestamptz"
+    assert _tipo_stage("ml_fee") == "NUMERIC(10, 2)"
+
+
+def test_erro_no_mapeamento_conta_e_vai_para_a_fila(monkeypatch):
+    from types import SimpleNamespace
+
+    import reconcile
+
+    linhas = [SimpleNamespace(id=i, order_id=100 + i, row_hash=None) for i in range(3)]
+    falhas = []
+
+    def mapear_falso(data, uid, token):
+        if data["id"] == 101:
+            raise KeyError("shipping")
+        return SimpleNamespace(**{c: None for c in reconcile.colunas_reconciliaveis()})
+
+    monkeypatch.setattr(reconcile, "token_valido", lambda uid: "tok")
+    monkeypatch.setattr(reconcile, "_ids_no_periodo", lambda *a: iter(linhas))
+    monkeypatch.setattr(reconcile, "_fetch_full_order", lambda oid, http: ({"id": oid}, 200))
+    monkeypatch.setattr(reconcile, "_order_to_sale", mapear_falso)
+    monkeypatch.setattr(reconcile, "_aplicar_em_lote", lambda itens, cols: len(itens))
+    monkeypatch.setattr(reconcile, "registrar_falha", lambda *a: falhas.append(a))
+
+    res = reconcile.reconciliar_vendas("1")
+    assert res["erros"] == 1 and res["atualizadas"] == 2
+    assert [(f[1], f[2]) for f in falhas] == [(101, "reconcile")]
@@ -0,0 +1,118 @@
+"""
+O tier é calculado só no SQL (`_SQL_TIER`), então é testado no Postgres:
+TEST_DB_URL=postgresql+psycopg://... pytest tests/test_reconcile_tiers.py
+"""
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from reconcile_tiers import _SQL_TIER, _params, sincronizar_agenda
+
+TEST_DB_URL = os.getenv("TEST_DB_URL")
+
+
+@pytest.fixture(scope="module")
+def tier():
+    if not TEST_DB_URL:
+        pytest.skip("TEST_DB_URL não definida")
+    from sqlalchemy import create_engine, text
+
+    eng = create_engine(TEST_DB_URL)
+    # uma linha com as colunas que o CASE lê; idades em dias antes de NOW()
+    sql = text(f"""
+        SELECT {_SQL_TIER} FROM (
+            SELECT CAST(:status AS varchar) AS status,
+                   CAST(:envio AS varchar) AS shipment_status,
+                   CAST(NOW() - make_interval(days => CAST(:dias_envio AS integer)) AS timestamp)
+                       AS shipment_last_updated,
+                   CAST(NOW() - make_interval(days => :dias_venda) AS timestamp) AS date_closed
+        ) s
+    """)
+
+    def classificar(status, envio, dias_envio=None, dias_venda=0):
+        with eng.connect() as conn:
+            return conn.execute(sql, {**_params(), "status": status, "envio": envio,
+                                      "dias_envio": dias_envio, "dias_venda": dias_venda}).scalar()
+
+    yield classificar
+    eng.dispose()
+
+
+def test_envio_em_andamento_e_hot(tier):
+    assert tier("paid", "ready_to_ship", 0) == "hot"
+    assert tier("paid", "shipped", 90) == "hot"
+    assert tier("payment_in_process", None) == "hot"
+
+
+def test_cancelado_e_entregue_antigo_sao_cold(tier):
+    assert tier("cancelled", "ready_to_ship", 0) == "cold"
+    assert tier("paid", "delivered", 45) == "cold"
+    # sem data do envio, vale a da venda
+    assert tier("paid", "delivered", None, dias_venda=45) == "cold"
+
+
+def test_entregue_recente_ou_sem_envio_e_warm(tier):
+    assert tier("paid", "delivered", 3) == "warm"
+    assert tier("paid", None) == "warm"
+    assert tier("partially_refunded", "delivered", 90) == "warm"
+
+
+@pytest.fixture
+def migrado(monkeypatch):
+    """Schema descartável com migrations/ aplicadas, servido como db.engine."""
+    if not TEST_DB_URL:
+        pytest.skip("TEST_DB_URL não definida")
+    import db
+    from sqlalchemy import create_engine
+    from migrate import aplicar_migracoes
+
+    schema = f"t_tier_{uuid.uuid4().hex[:8]}"
+    admin = create_engine(TEST_DB_URL)
+    with admin.begin() as conn:
+        conn.exec_driver_sql(f"CREATE SCHEMA {schema}")
+    eng = create_engine(TEST_DB_URL, connect_args={"options": f"-csearch_path={schema}"})
+    try:
+        aplicar_migracoes(eng)
+        monkeypatch.setitem(vars(db), "engine", eng)
+        yield eng
+    finally:
+        eng.dispose()
+        with admin.begin() as conn:
+            conn.exec_driver_sql(f"DROP SCHEMA {schema} CASCADE")
+        admin.dispose()
+
+
+def test_sincronizar_conta_so_toca_novos_e_warm_vencidos(migrado):
+    from sqlalchemy import text
+
+    with migrado.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO sales (order_id, ml_user_id, status, date_closed, shipment_status, shipment_last_updated)
+            VALUES (1, 7, 'paid', NOW() - interval '2 days', 'delivered', NOW() - interval '1 day'),
+                   (2, 7, 'paid', NOW() - interval '50 days', 'delivered', NOW() - interval '45 days'),
+                   (3, 7, 'paid', NOW() - interval '5 days', 'delivered', NOW() - interval '3 days'),
+                   (4, 7, 'paid', NOW() - interval '5 days', 'delivered', NOW() - interval '3 days')
+        """))
+        # 2: warm que passou da janela; 3: hot cujo envio já foi entregue; 4: em dia
+        conn.execute(text("""
+            INSERT INTO reconcile_schedule (order_id, ml_user_id, tier, next_check_at)
+            VALUES (2, 7, 'warm', NOW() + interval '1 day'),
+                   (3, 7, 'hot', NOW() + interval '1 hour'),
+                   (4, 7, 'warm', NOW() + interval '1 day')
+        """))
+
+    def tiers():
+        with migrado.connect() as conn:
+            return dict(conn.execute(text("SELECT order_id, tier FROM reconcile_schedule")).all())
+
+    assert sincronizar_agenda(7) == 2
+    assert tiers() == {1: "warm", 2: "cold", 3: "hot", 4: "warm"}
+    # mudança de status chega pela chamada direcionada (reconcile/envios)
+    assert sincronizar_agenda(7, ["3"]) == 1
+    assert tiers()[3] == "warm"
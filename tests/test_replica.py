@@ -0,0 +1,127 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from replica import RoteadorLeitura, atraso_do_estado, eh_escrita, medir_atraso
+
+PRIMARIO, REPLICA = "primario", "replica"
+
+
+class _Relogio:
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+
+def _roteador(atrasos, lag_max=10, check=5):
+    """Roteador com medições roteirizadas; exceções na lista simulam réplica fora do ar."""
+    relogio = _Relogio()
+    medicoes = []
+
+    def medir(_replica):
+        medicoes.append(relogio.t)
+        atraso = atrasos.pop(0)
+        if isinstance(atraso, Exception):
+            raise atraso
+        return atraso
+
+    r = RoteadorLeitura(PRIMARIO, REPLICA, lag_max_s=lag_max, check_s=check, medir=medir, relogio=relogio)
+    return r, relogio, medicoes
+
+
+def test_sem_replica_le_do_primario():
+    assert RoteadorLeitura(PRIMARIO).engine() == PRIMARIO
+
+
+def test_replica_em_dia_e_atrasada():
+    r, relogio, _ = _roteador([2.0, 25.0])
+    assert r.engine() == REPLICA
+    relogio.t = 6
+    assert r.engine() == PRIMARIO
+    assert r.desvios == 1
+
+
+def test_mede_no_maximo_a_cada_intervalo():
+    r, relogio, medicoes = _roteador([1.0, 1.0])
+    for t in (0, 1, 4.9, 5.0):
+        relogio.t = t
+        r.engine()
+    assert medicoes == [0, 5.0]
+
+
+def test_replica_inacessivel_volta_ao_primario():
+    r, relogio, _ = _roteador([ConnectionError("recusada"), 0.0])
+    assert r.engine() == PRIMARIO
+    relogio.t = 5
+    assert r.engine() == REPLICA
+
+
+def test_escrita_fixa_primario_pelo_limite_de_atraso():
+    r, relogio, _ = _roteador([0.0, 0.0], lag_max=10)
+    r.fixar_primario()
+    relogio.t = 9.9
+    assert r.engine() == PRIMARIO
+    relogio.t = 10
+    assert r.engine() == REPLICA
+
+
+def _estado(**kw):
+    base = {"em_recuperacao": True, "recepcao": "streaming", "sem_mensagem_s": 2.0,
+            "reaplicou_tudo": True, "replay_s": 400.0}
+    return {**base, **kw}
+
+
+def test_atraso_do_estado():
+    assert atraso_do_estado(_estado(em_recuperacao=False, recepcao=None, sem_mensagem_s=None)) == 0
+    # primário ocioso: tudo reaplicado, replay antigo não é atraso
+    assert atraso_do_estado(_estado()) == 0
+    assert atraso_do_estado(_estado(reaplicou_tudo=False, replay_s=12.5)) == 12.5
+
+
+@pytest.mark.parametrize("estado", [
+    _estado(recepcao=None, sem_mensagem_s=None),           # receiver parado ou sem pg_read_all_stats
+    _estado(recepcao="waiting"),                            # reconectando ao primário
+    _estado(sem_mensagem_s=300.0),                          # conexão muda: nada chega há 5 min
+])
+def test_receiver_desconectado_nao_conta_como_em_dia(estado):
+    assert atraso_do_estado(estado, recepcao_max_s=60) == float("inf")
+    r = RoteadorLeitura(PRIMARIO, REPLICA, medir=lambda _: atraso_do_estado(estado, 60))
+    assert r.engine() == PRIMARIO
+
+
+@pytest.mark.parametrize("sql, esperado", [
+    ("SELECT * FROM sales", False),
+    ("  insert into metas values (1)", True),
+    ("UPDATE sku SET level1 = 'x'", True),
+    ("WITH x AS (SELECT 1) SELECT * FROM x", False),
+    ("WITH alvo AS (SELECT 1) UPDATE sales SET level1 = NULL", True),
+    ("", False),
+])
+def test_eh_escrita(sql, esperado):
+    assert eh_escrita(sql) is esperado
+
+
+# Par real (docker-compose.replica.yml): TEST_DB_URL=primário, TEST_REPLICA_URL=standby
+@pytest.mark.skipif(not (os.getenv("TEST_DB_URL") and os.getenv("TEST_REPLICA_URL")),
+                    reason="TEST_DB_URL/TEST_REPLICA_URL não definidas")
+def test_standby_real_em_dia():
+    from sqlalchemy import create_engine, text
+
+    primario = create_engine(os.environ["TEST_DB_URL"])
+    replica = create_engine(os.environ["TEST_REPLICA_URL"])
+    try:
+        with replica.connect() as conn:
+            assert conn.execute(text("SELECT pg_is_in_recovery()")).scalar()
+        assert medir_atraso(primario) == 0
+        r = RoteadorLeitura(primario, replica, lag_max_s=30)
+        assert r.engine() is replica
+    finally:
+        primario.dispose()
+        replica.dispose()
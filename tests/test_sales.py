@@ -0,0 +1,145 @@
+import sys
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+import db
+import ml_standin
+import sales
+
+
+def test_order_to_sale_so_pega_conexao_depois_das_chamadas_ao_ml(monkeypatch):
+    eventos = []
+    cliente = TestClient(ml_standin.app)
+    base = sales.settings().ml_api_url
+
+    def get(url, headers=None, timeout=None):
+        assert timeout is not None
+        eventos.append("http")
+        return cliente.get(url.replace(base, ""), headers=headers)
+
+    class Conexao:
+        def __enter__(self):
+            eventos.append("abre")
+            return self
+
+        def __exit__(self, *exc):
+            eventos.append("fecha")
+            return False
+
+        def execute(self, *_):
+            eventos.append("select")
+            return self
+
+        def fetchone(self):
+            return (2, 10.5, "Kits", "Kit 2")
+
+    monkeypatch.setattr(sales.requests, "get", get)
+    monkeypatch.setitem(vars(db), "engine", type("Engine", (), {"connect": lambda self: Conexao()})())
+    pedido = next(iter(ml_standin._dados.pedidos.values()))
+
+    venda = sales._order_to_sale(dict(pedido), "123456", "tok")
+    assert eventos[-3:] == ["abre", "select", "fecha"]
+    assert "http" in eventos and "http" not in eventos[eventos.index("abre"):]
+    assert (venda.quantity_sku, venda.level1) == (2, "Kits")
+
+
+class _Sessao:
+    """Sessão falsa: sales vazia e sales_order_keys com os pedidos `reservados`."""
+
+    def __init__(self, reservados):
+        self.reservados = set(reservados)
+        self.adicionadas = []
+
+    def query(self, *_):
+        return self
+
+    def filter_by(self, **_):
+        return self
+
+    def first(self):
+        return None
+
+    def execute(self, _sql, params):
+        self.ids = params["ids"]
+        return self
+
+    def scalars(self):
+        return [i for i in self.ids if i in self.reservados]
+
+    def add(self, venda):
+        self.adicionadas.append(venda)
+
+
+def test_pedido_de_mes_arquivado_nao_e_reinserido():
+    from models import Sale
+
+    db = _Sessao(reservados={10})
+    assert sales._pedidos_arquivados(db, [10, 11, 12], {12: object()}) == {10}
+    assert db.ids == [10, 11]                     # os vivos nem vão ao banco
+
+    arquivada = Sale(order_id=10, ml_user_id=1)
+    nova = Sale(order_id=11, ml_user_id=1)
+    assert sales._upsert_sale(db, arquivada) is None
+    assert sales._upsert_sale(db, nova, existentes={}, arquivados={10}) is nova
+    assert db.adicionadas == [nova]
+
+
+class _SessaoRevisao:
+    """Sessão falsa de revisar_banco_de_dados: um mês de histórico e a venda `existente`."""
+
+    def __init__(self, existente, data):
+        self.existente = existente
+        self.data = data
+        self.commits = 0
+
+    def query(self, *_):
+        return self
+
+    def filter(self, *_):
+        return self
+
+    def filter_by(self, **_):
+        return self
+
+    def scalar(self):
+        return self.data
+
+    def first(self):
+        return self.existente
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_revisao_grava_o_hash_da_venda_revisada(monkeypatch):
+    from datetime import datetime, timezone
+    from types import SimpleNamespace
+
+    from models import Sale
+    from reconcile import _fingerprint, colunas_reconciliaveis
+
+    existente = Sale(order_id=5, ml_user_id=1, status="paid", row_hash="hash-da-versao-antiga")
+    revisada = Sale(order_id=5, ml_user_id=1, status="cancelled")
+    sessao = _SessaoRevisao(existente, datetime(2025, 3, 10, tzinfo=timezone.utc))
+
+    def get(url, headers=None, params=None, **_):
+        corpo = {"results": [{"id": 5}]} if url.endswith("/orders/search") else {"id": 5}
+        return SimpleNamespace(ok=True, status_code=200, json=lambda: corpo)
+
+    monkeypatch.setattr(sales.requests, "get", get)
+    monkeypatch.setattr(sales, "_order_to_sale", lambda *a: revisada)
+    monkeypatch.setitem(vars(db), "SessionLocal", lambda: sessao)
+
+    assert sales.revisar_banco_de_dados("1", "tok") == {"novas": 0, "atualizadas": 1}
+    assert existente.status == "cancelled" and sessao.commits == 1
+    assert existente.row_hash == _fingerprint(revisada, colunas_reconciliaveis())
@@ -0,0 +1,35 @@
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from scheduler import Cron
+
+
+def test_cron_passos_listas_e_faixas():
+    c = Cron("*/15 8-18 * * 1-5")
+    assert c.corresponde(datetime(2025, 6, 30, 8, 45))        # segunda
+    assert not c.corresponde(datetime(2025, 6, 30, 8, 50))
+    assert not c.corresponde(datetime(2025, 6, 30, 19, 0))
+    assert not c.corresponde(datetime(2025, 6, 29, 9, 0))      # domingo
+
+
+def test_cron_domingo_como_7_e_dia_ou_semana():
+    assert Cron("0 3 * * 7").corresponde(datetime(2025, 6, 29, 3, 0))
+    # dia 1 OU segunda-feira, como no cron padrão
+    c = Cron("0 0 1 * 1")
+    assert c.corresponde(datetime(2025, 7, 1, 0, 0))           # terça, dia 1
+    assert c.corresponde(datetime(2025, 7, 7, 0, 0))           # segunda
+    assert not c.corresponde(datetime(2025, 7, 8, 0, 0))
+
+
+def test_cron_proxima_execucao_e_erros():
+    assert Cron("5 * * * *").proxima(datetime(2025, 6, 30, 10, 5, 30)) == datetime(2025, 6, 30, 11, 5)
+    with pytest.raises(ValueError):
+        Cron("* * * *")
+    with pytest.raises(ValueError):
+        Cron("61 * * * *")
@@ -0,0 +1,96 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from sessoes import GestorSessoes, tamanho
+
+
+class Relogio:
+    def __init__(self):
+        self.agora = 0.0
+
+    def __call__(self):
+        return self.agora
+
+
+def _frame(linhas):
+    return pd.DataFrame({"v": np.zeros(linhas)})        # 8 bytes por linha + índice
+
+
+def test_compartilhado_carrega_uma_vez_e_renova_para_todos():
+    g = GestorSessoes(10**9, 10**9, 60)
+    cargas = []
+
+    def carregar():
+        cargas.append(1)
+        return _frame(10)
+
+    a = g.compartilhado("sku", carregar)
+    assert g.compartilhado("sku", carregar) is a
+    b = g.compartilhado("sku", carregar, renovar=True)
+    assert b is not a and len(cargas) == 2
+    assert g.compartilhado("sku", carregar) is b
+
+
+def test_versao_nova_substitui_a_anterior():
+    g = GestorSessoes(10**9, 10**9, 60)
+    v1 = g.compartilhado(("vendas", "recorte"), lambda: _frame(10), versao=(1, 1))
+    assert g.compartilhado(("vendas", "recorte"), lambda: _frame(10), versao=(1, 1)) is v1
+    v2 = g.compartilhado(("vendas", "recorte"), lambda: _frame(10), versao=(2, 5))
+    assert v2 is not v1
+    # uma entrada por chave: a versão superada não fica residente
+    assert [c["chave"] for c in g.compartilhados()] == ["('vendas', 'recorte')"]
+
+
+def test_compartilhados_saem_por_lru_quando_passam_do_limite():
+    um = tamanho(_frame(1000))
+    g = GestorSessoes(10**9, 2 * um + 100, 60)
+    g.compartilhado("a", lambda: _frame(1000))
+    g.compartilhado("b", lambda: _frame(1000))
+    g.compartilhado("a", lambda: _frame(1000))            # "a" usado por último
+    g.compartilhado("c", lambda: _frame(1000))
+    assert [c["chave"] for c in g.compartilhados()] == ["c", "a"]
+    assert g.despejos == 1
+
+
+def test_registrar_mede_e_nao_conta_dados_compartilhados():
+    g = GestorSessoes(10**9, 10**9, 60)
+    base = g.compartilhado("sku", lambda: (_frame(1000), _frame(10)))
+    estado = {"proprio": _frame(500), "sku": base[0], "conta_loja": True}
+    g.registrar("s1", estado, "admin")
+    g.registrar("s2", {"x": 1}, "admin")
+    r = g.resumo()
+    assert [l["sessao"] for l in r] == ["s1", "s2"]
+    assert r[0]["chaves"] == 3
+    assert r[0]["bytes"] < tamanho(base[0])
+    assert r[0]["maiores"][0][0] == "proprio"
+
+
+def test_acima_do_limite_sai_o_frame_que_mudou_ha_mais_tempo():
+    relogio = Relogio()
+    um = tamanho(_frame(1000))
+    g = GestorSessoes(int(2.5 * um), 10**9, 3600, relogio)
+    estado = {"antigo": _frame(1000), "filtro": "Pago"}
+    g.registrar("s1", estado)
+    relogio.agora = 10
+    estado["novo"] = _frame(1000)
+    assert g.registrar("s1", estado) == []
+    relogio.agora = 20
+    estado["outro"] = _frame(1000)
+    assert g.registrar("s1", estado) == ["antigo"]
+    assert set(estado) == {"filtro", "novo", "outro"}
+    assert g.resumo()[0]["descartadas"] == 1
+
+
+def test_sessao_ociosa_sai_do_resumo():
+    relogio = Relogio()
+    g = GestorSessoes(10**9, 10**9, 60, relogio)
+    g.registrar("velha", {"a": 1})
+    relogio.agora = 100
+    g.registrar("nova", {"a": 1})
+    assert [l["sessao"] for l in g.resumo()] == ["nova"]
@@ -0,0 +1,70 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from settings import Settings
+
+
+def test_do_ambiente_converte_e_usa_padroes():
+    cfg = Settings.do_ambiente({
+        "DB_URL": "postgresql://u@h/db",
+        "DB_POOL_UI": "4",
+        "ML_API_URL": "http://localhost:8600/",
+        "FRONTEND_URL": "",
+    })
+    assert cfg.db_url == "postgresql://u@h/db"
+    assert cfg.db_pool_ui == 4
+    assert cfg.db_pool_ingestao == 12
+    assert cfg.ml_api_url == "http://localhost:8600"
+    assert cfg.frontend_url is None
+
+
+def test_exigir_lista_as_variaveis_que_faltam():
+    cfg = Settings.do_ambiente({"DB_URL": "postgresql://u@h/db"})
+    assert cfg.exigir("db_url") is cfg
+    with pytest.raises(RuntimeError, match="ML_CLIENT_ID, BACKEND_URL"):
+        cfg.exigir("db_url", "ml_client_id", "backend_url")
+
+
+def test_importar_modulos_nao_conecta_nem_exige_ambiente():
+    # processo limpo, sem DB_URL/credenciais: importar não pode levantar nem criar engine
+    codigo = (
+        "import db, oauth, sales, reconcile, scheduler, agregados, utils, api\n"
+        "assert 'engine' not in vars(db) and 'engine_api' not in vars(db)\n"
+        "try:\n"
+        "    db.engine\n"
+        "except RuntimeError as e:\n"
+        "    assert 'DB_URL' in str(e)\n"
+        "else:\n"
+        "    raise AssertionError('db.engine sem DB_URL')\n"
+    )
+    env = {k: v for k, v in os.environ.items() if k not in {
+        "DB_URL", "DB_REPLICA_URL", "ML_CLIENT_ID", "ML_CLIENT_SECRET", "BACKEND_URL", "FRONTEND_URL"}}
+    env["PYTHONPATH"] = str(project_root)
+    r = subprocess.run([sys.executable, "-c", codigo], cwd=project_root, env=env,
+                       capture_output=True, text=True, timeout=120)
+    assert r.returncode == 0, r.stderr
+
+
+def test_replica_arquivo_e_scheduler_leem_do_settings(monkeypatch):
+    import settings as mod
+    from replica import RoteadorLeitura
+    from scheduler import JOBS
+
+    monkeypatch.setenv("REPLICA_LAG_MAX_S", "12.5")
+    monkeypatch.setenv("CRON_FEES", "0 * * * *")
+    monkeypatch.setenv("ARQUIVO_HORIZONTE_MESES", "24")
+    mod.settings.cache_clear()
+    try:
+        cfg = mod.settings()
+        assert cfg.replica_lag_max_s == 12.5 and cfg.arquivo_horizonte_meses == 24
+        assert RoteadorLeitura("primario").lag_max_s == 12.5
+        assert next(j for j in JOBS if j.nome == "fees").cron.expressao == "0 * * * *"
+    finally:
+        mod.settings.cache_clear()